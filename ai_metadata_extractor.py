@@ -1,58 +1,297 @@
 import os
+import re
 import json
 import logging
-import requests
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional
+from siliconflow_client import create_client, RateLimiter, SiliconFlowAPIError
+from metrics import stage, record_usage
+from token_budget import estimate_tokens, fit_to_budget, first_page_header, ELISION_MARKER
+from extractor_backends import MetadataExtractor
 
 # 設置日誌
 logger = logging.getLogger(__name__)
 
-class SiliconFlowQwenExtractor:
+class SiliconFlowQwenExtractor(MetadataExtractor):
     """
     使用通義千問(Qwen)模型通過SiliconFlow API從PDF文本中提取元數據
     """
-    def __init__(self):
-        """初始化提取器"""
+    name = 'siliconflow'
+    
+    def __init__(self, api_key: Optional[str] = None, api_base_url: Optional[str] = None, model: Optional[str] = None,
+                 rate_limiter: Optional[RateLimiter] = None):
+        """
+        初始化提取器
+        
+        Args:
+            api_key (str, optional): API密鑰，默認讀取 SILICONFLOW_API_KEY
+            api_base_url (str, optional): chat/completions 接口地址，默認讀取 SILICONFLOW_API_BASE_URL
+            model (str, optional): 模型名稱，默認讀取 SILICONFLOW_MODEL
+            rate_limiter (RateLimiter, optional): 限流器，默認使用按 SILICONFLOW_RPM/TPM 創建的共享限流器
+        """
         # 從環境變量獲取API密鑰
-        self.api_key = os.environ.get("SILICONFLOW_API_KEY")
+        self.api_key = api_key if api_key is not None else os.environ.get("SILICONFLOW_API_KEY")
         if not self.api_key:
             logger.warning("未設置SILICONFLOW_API_KEY環境變量")
             
         # API配置
-        self.api_base_url = "https://api.siliconflow.cn/v1/chat/completions"
-        self.model = "Qwen/Qwen2.5-7B-Instruct"  # 指定使用的模型
+        if api_base_url is None:
+            api_base_url = os.environ.get("SILICONFLOW_API_BASE_URL", "https://api.siliconflow.cn/v1/chat/completions")
+        self.api_base_url = api_base_url
+        self.model = model or os.environ.get("SILICONFLOW_MODEL", "Qwen/Qwen2.5-7B-Instruct")  # 指定使用的模型
         
-        # 設定模型上下文窗口大小
-        self.max_context_length = 30000  # 模型最大上下文窗口約32K，保守設置為30K
+        # 提示詞中PDF文本的令牌預算（模型上下文窗口約32K令牌），超出時只保留高價值區域
+        self.prompt_token_budget = int(os.environ.get("PROMPT_TOKEN_BUDGET", 4000))
+        
+        # 批量提取時每個文檔保留的字符數（元數據通常在前一兩頁）
+        self.batch_snippet_length = int(os.environ.get("BATCH_SNIPPET_CHARS", 3000))
+        
+        # 帶連接池、限流和重試的客戶端（SILICONFLOW_CLIENT_MODE=async 時使用異步客戶端）
+        self.client = create_client(self.api_key, self.api_base_url, rate_limiter=rate_limiter)
     
-    def extract_pdf_metadata(self, text: str) -> Dict[str, str]:
+    def extract_pdf_metadata(self, text: str, fetch_more: Optional[Callable[[], str]] = None) -> Dict[str, str]:
         """
         直接從PDF文本提取元數據（作者姓氏、期刊名、期刊縮寫、年份、標題、文檔類型）
         
         Args:
             text (str): PDF文本內容
+            fetch_more (Callable[[], str], optional): 返回後續頁面文本的函數，
+                僅在首次結果缺少主要字段時調用
             
         Returns:
             Dict[str, str]: 包含元數據的字典
         """
-        if not self.api_key:
-            logger.error("未設置API密鑰，無法提取元數據")
-            return {
-                'author_lastname': '',
-                'journal': '',
-                'journal_abbr': '',
-                'year': '',
-                'title': '',
-                'doc_type': 'paper'
-            }
-        
-        # 裁剪文本避免超出上下文窗口
-        if len(text) > self.max_context_length:
-            logger.info(f"文本過長 ({len(text)} 字符)，將截取前 {self.max_context_length} 字符")
-            text = text[:self.max_context_length]
+        if not self.is_available():
+            logger.error(f"{self.name} 後端不可用（未設置API密鑰或接口地址），無法提取元數據")
+            return self._empty_metadata()
+        
+        # 調用API提取元數據
+        with stage('prompt_build'):
+            prompt = self._build_prompt(text)
+        result = self._call_api(prompt)
+        
+        # 首次結果不完整時再讀取更多頁面重試
+        if not self._has_essential_fields(result) and fetch_more is not None:
+            more_text = fetch_more()
+            if more_text:
+                logger.info(f"首次提取缺少主要字段，追加 {len(more_text)} 字符後重試")
+                # 首次的文本通常已佔滿令牌預算，直接拼接會被裁剪回同樣的提示詞，
+                # 因此重試時只保留首頁頁眉，其餘預算留給新讀取的頁面
+                with stage('prompt_build'):
+                    retry_prompt = self._build_prompt(first_page_header(text) + ELISION_MARKER + more_text)
+                if retry_prompt == prompt:
+                    logger.info("追加的頁面沒有改變提示詞，不再重試")
+                else:
+                    retry_result = self._call_api(retry_prompt)
+                    for field, value in result.items():
+                        if value and not retry_result.get(field):
+                            retry_result[field] = value
+                    result = retry_result
+        
+        # 記錄結果
+        if self._has_essential_fields(result):
+            logger.info("成功從PDF提取出主要元數據")
+        else:
+            logger.warning("無法從PDF提取出完整元數據")
+            
+        return result
+    
+    async def extract_pdf_metadata_async(self, text: str) -> Dict[str, str]:
+        """
+        extract_pdf_metadata 的異步版本，需使用異步客戶端（SILICONFLOW_CLIENT_MODE=async）
+        
+        Args:
+            text (str): PDF文本內容
+            
+        Returns:
+            Dict[str, str]: 包含元數據的字典
+        """
+        if not self.is_available():
+            logger.error(f"{self.name} 後端不可用（未設置API密鑰或接口地址），無法提取元數據")
+            return self._empty_metadata()
+        
+        try:
+            response_data = await self.client.chat_completion_async(self._build_payload(self._build_prompt(text)))
+            return self._parse_response(response_data)
+        except SiliconFlowAPIError as e:
+            logger.error(str(e))
+        except Exception as e:
+            logger.error(f"調用SiliconFlow API時出錯: {e}")
+        return self._empty_metadata()
+    
+    def extract_pdf_metadata_batch(self, documents: Dict[str, str],
+                                   fetch_more: Optional[Callable[[str], str]] = None) -> Dict[str, Dict[str, str]]:
+        """
+        將多個PDF的文本片段打包到同一個請求中批量提取元數據
+        
+        每個文檔只保留前一兩頁的片段，按上下文預算分組；模型返回以文檔編號為鍵的JSON數組。
+        解析失敗或缺少主要字段的文檔會單獨用完整文本重試。
+        
+        Args:
+            documents (Dict[str, str]): 文檔ID到PDF文本的映射
+            fetch_more (Callable[[str], str], optional): 按文檔ID返回後續頁面文本的函數，單獨重試時使用
+            
+        Returns:
+            Dict[str, Dict[str, str]]: 文檔ID到元數據字典的映射
+        """
+        if not self.is_available():
+            logger.error(f"{self.name} 後端不可用（未設置API密鑰或接口地址），無法提取元數據")
+            return {doc_id: self._empty_metadata() for doc_id in documents}
+        
+        results = {}
+        for group in self._pack_documents(documents):
+            if len(group) == 1:
+                doc_id = group[0]
+                results[doc_id] = self.extract_pdf_metadata(documents[doc_id], self._bind_fetch_more(fetch_more, doc_id))
+                continue
+            
+            logger.info(f"批量提取 {len(group)} 個文檔的元數據")
+            batch_results = self._call_batch_api(group, documents)
+            for doc_id in group:
+                metadata = batch_results.get(doc_id)
+                if metadata is None or not self._has_essential_fields(metadata):
+                    logger.info(f"批量結果中文檔 {doc_id} 不完整，單獨重試")
+                    metadata = self.extract_pdf_metadata(documents[doc_id], self._bind_fetch_more(fetch_more, doc_id))
+                results[doc_id] = metadata
+        
+        return results
+    
+    def _bind_fetch_more(self, fetch_more: Optional[Callable[[str], str]], doc_id: str) -> Optional[Callable[[], str]]:
+        """將按文檔ID取文本的函數綁定到單個文檔"""
+        if fetch_more is None:
+            return None
+        return lambda: fetch_more(doc_id)
+    
+    def _trim_snippet(self, text: str) -> str:
+        """保留文本的前兩頁（不超過 batch_snippet_length 個字符）"""
+        third_page = text.find("第3頁內容:")
+        if third_page > 0:
+            text = text[:third_page]
+        return text[:self.batch_snippet_length]
+    
+    def _pack_documents(self, documents: Dict[str, str]) -> List[List[str]]:
+        """
+        按令牌預算將文檔分組
+        
+        Args:
+            documents (Dict[str, str]): 文檔ID到PDF文本的映射
+            
+        Returns:
+            List[List[str]]: 每組的文檔ID列表
+        """
+        groups = []
+        current, current_tokens = [], 0
+        for doc_id, text in documents.items():
+            tokens = estimate_tokens(self._trim_snippet(text))
+            if current and current_tokens + tokens > self.prompt_token_budget:
+                groups.append(current)
+                current, current_tokens = [], 0
+            current.append(doc_id)
+            current_tokens += tokens
+        if current:
+            groups.append(current)
+        return groups
+    
+    def _call_batch_api(self, doc_ids: List[str], documents: Dict[str, str]) -> Dict[str, Dict[str, str]]:
+        """
+        發送一個包含多個文檔的請求並按文檔拆分結果
+        
+        Args:
+            doc_ids (List[str]): 本組的文檔ID
+            documents (Dict[str, str]): 文檔ID到PDF文本的映射
+            
+        Returns:
+            Dict[str, Dict[str, str]]: 成功解析的文檔ID到元數據的映射
+        """
+        with stage('prompt_build'):
+            prompt = self._build_batch_prompt(doc_ids, documents)
+        
+        try:
+            with stage('api_wait'):
+                response_data = self.client.chat_completion(self._build_payload(prompt, max_tokens=300 * len(doc_ids)))
+            record_usage(response_data.get('usage'))
+            ai_response = response_data.get('choices', [{}])[0].get('message', {}).get('content', '')
+        except SiliconFlowAPIError as e:
+            logger.error(str(e))
+            return {}
+        except Exception as e:
+            logger.error(f"調用SiliconFlow API時出錯: {e}")
+            return {}
+        
+        with stage('response_parse'):
+            results = {}
+            for item in self._parse_json_array(ai_response):
+                if not isinstance(item, dict):
+                    continue
+                match = re.fullmatch(r'doc(\d+)', str(item.pop('id', '')).strip())
+                if match and 1 <= int(match.group(1)) <= len(doc_ids):
+                    results[doc_ids[int(match.group(1)) - 1]] = self._normalize_metadata(item)
+        return results
+    
+    def _build_batch_prompt(self, doc_ids: List[str], documents: Dict[str, str]) -> str:
+        """構建批量提取的提示詞"""
+        # 提示詞中使用簡短編號，避免把文件路徑發送給模型
+        sections = []
+        for index, doc_id in enumerate(doc_ids, 1):
+            sections.append(f"=== 文檔 doc{index} ===\n{self._trim_snippet(documents[doc_id])}")
+        
+        return f"""以下是{len(doc_ids)}個PDF文檔的開頭部分，請分別提取每個文檔的元數據，以JSON數組格式返回。
+數組中每個元素對應一個文檔，包含以下字段：
+
+- id: 文檔編號（如 "doc1"）
+- author_lastname: 第一作者的姓氏（僅姓，不含名）
+- journal: 期刊或會議的完整名稱
+- journal_abbr: 期刊或會議的標準縮寫（若不確定，請給出最可能的縮寫）
+- year: 出版年份（4位數字）
+- title: 論文完整標題
+- doc_type: 文檔類型，僅限"paper"或"book"
+
+僅返回JSON數組，無需其他解釋。若無法確定某字段，使用空字符串。
+
+{chr(10).join(sections)}"""
+    
+    def _parse_json_array(self, ai_response: str) -> List:
+        """
+        從模型回應中解析JSON數組，整體解析失敗時逐個解析其中的JSON對象
+        
+        Args:
+            ai_response (str): 模型回應文本
+            
+        Returns:
+            List: 解析出的元素
+        """
+        json_start = ai_response.find('[')
+        json_end = ai_response.rfind(']') + 1
+        if json_start >= 0 and json_end > json_start:
+            try:
+                items = json.loads(ai_response[json_start:json_end])
+                if isinstance(items, list):
+                    return items
+            except json.JSONDecodeError as e:
+                logger.warning(f"解析批量結果JSON數組時出錯: {e}，嘗試逐個解析")
+        
+        items = []
+        for match in re.finditer(r'\{[^{}]*\}', ai_response):
+            try:
+                items.append(json.loads(match.group(0)))
+            except json.JSONDecodeError:
+                logger.debug(f"跳過無法解析的條目: {match.group(0)}")
+        return items
+    
+    def _build_prompt(self, text: str) -> str:
+        """
+        構建提取元數據的提示詞
+        
+        Args:
+            text (str): PDF文本內容
+            
+        Returns:
+            str: 提示詞
+        """
+        # 按令牌預算裁剪文本，保留首頁頁眉、摘要和版權信息等區域
+        text = fit_to_budget(text, self.prompt_token_budget)
         
         # 構建提示詞
-        prompt = f"""分析以下PDF文本，提取以下關鍵元數據，以JSON格式返回：
+        return f"""分析以下PDF文本，提取以下關鍵元數據，以JSON格式返回：
 
 1. author_lastname: 第一作者的姓氏（僅姓，不含名）
 2. journal: 期刊或會議的完整名稱
@@ -65,17 +304,17 @@ class SiliconFlowQwenExtractor:
 
 PDF文本內容：
 {text}"""
-
-        # 調用API提取元數據
-        result = self._call_api(prompt)
-        
-        # 記錄結果
-        if self._has_essential_fields(result):
-            logger.info("成功從PDF提取出主要元數據")
-        else:
-            logger.warning("無法從PDF提取出完整元數據")
-            
-        return result
+    
+    def _build_payload(self, prompt: str, max_tokens: int = 1000) -> Dict:
+        """構建API請求體"""
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.1,  # 低溫度以獲得更確定性的回答
+            "max_tokens": max_tokens
+        }
     
     def _call_api(self, prompt: str) -> Dict[str, str]:
         """
@@ -88,93 +327,76 @@ PDF文本內容：
             Dict[str, str]: 提取的元數據字典
         """
         try:
-            # 準備API請求
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.api_key}"
-            }
-            
-            payload = {
-                "model": self.model,
-                "messages": [
-                    {"role": "user", "content": prompt}
-                ],
-                "temperature": 0.1,  # 低溫度以獲得更確定性的回答
-                "max_tokens": 1000
-            }
-            
-            # 發送API請求
+            # 發送API請求（連接池、限流和重試由客戶端處理）
             logger.info("發送請求到通義千問API...")
-            response = requests.post(
-                self.api_base_url,
-                headers=headers,
-                json=payload
-            )
-            
-            # 解析響應
-            if response.status_code == 200:
-                response_data = response.json()
-                logger.debug(f"API響應: {response_data}")
-                
-                # 提取生成的文本
-                ai_response = response_data.get('choices', [{}])[0].get('message', {}).get('content', '')
-                logger.info(f"獲得API響應: {ai_response[:100]}...")
-                
-                # 嘗試解析JSON響應
-                try:
-                    # 查找文本中的JSON部分
-                    json_start = ai_response.find('{')
-                    json_end = ai_response.rfind('}') + 1
-                    
-                    if json_start >= 0 and json_end > json_start:
-                        json_str = ai_response[json_start:json_end]
-                        metadata = json.loads(json_str)
-                        
-                        # 確保所有必需字段都存在
-                        expected_fields = ['author_lastname', 'journal', 'journal_abbr', 'year', 'title', 'doc_type']
-                        for field in expected_fields:
-                            if field not in metadata or metadata[field] is None:
-                                metadata[field] = ''
-                        
-                        # 確保文檔類型為'paper'或'book'
-                        if metadata.get('doc_type', '').lower() not in ['paper', 'book']:
-                            # 預設為paper
-                            metadata['doc_type'] = 'paper'
-                        
-                        return metadata
-                    else:
-                        logger.warning("無法在API響應中找到JSON數據")
-                except json.JSONDecodeError as e:
-                    logger.error(f"解析API返回的JSON時出錯: {e}")
-                    logger.debug(f"原始回應: {ai_response}")
-            else:
-                logger.error(f"API請求失敗，狀態碼: {response.status_code}, 回應: {response.text}")
-                
+            with stage('api_wait'):
+                response_data = self.client.chat_completion(self._build_payload(prompt))
+            record_usage(response_data.get('usage'))
+            with stage('response_parse'):
+                return self._parse_response(response_data)
+        except SiliconFlowAPIError as e:
+            logger.error(str(e))
         except Exception as e:
             logger.error(f"調用SiliconFlow API時出錯: {e}")
         
         # 如果提取失敗，返回空值
-        return {
-            'author_lastname': '',
-            'journal': '',
-            'journal_abbr': '',
-            'year': '',
-            'title': '',
-            'doc_type': 'paper'
-        }
+        return self._empty_metadata()
     
-    def _has_essential_fields(self, result: Dict[str, str]) -> bool:
+    def _parse_response(self, response_data: Dict) -> Dict[str, str]:
         """
-        檢查是否提取到了主要字段
+        從API響應中解析元數據JSON
         
         Args:
-            result (Dict[str, str]): 提取的元數據
+            response_data (Dict): API響應
             
         Returns:
-            bool: 如果主要字段存在則返回True
+            Dict[str, str]: 提取的元數據字典，解析失敗時返回空值
         """
-        essential_fields = ['author_lastname', 'title', 'year']
-        return all(bool(result.get(field)) for field in essential_fields)
+        logger.debug(f"API響應: {response_data}")
+        
+        # 提取生成的文本
+        ai_response = response_data.get('choices', [{}])[0].get('message', {}).get('content', '')
+        logger.info(f"獲得API響應: {ai_response[:100]}...")
+        
+        # 嘗試解析JSON響應
+        try:
+            # 查找文本中的JSON部分
+            json_start = ai_response.find('{')
+            json_end = ai_response.rfind('}') + 1
+            
+            if json_start >= 0 and json_end > json_start:
+                json_str = ai_response[json_start:json_end]
+                return self._normalize_metadata(json.loads(json_str))
+            else:
+                logger.warning("無法在API響應中找到JSON數據")
+        except json.JSONDecodeError as e:
+            logger.error(f"解析API返回的JSON時出錯: {e}")
+            logger.debug(f"原始回應: {ai_response}")
+        
+        return self._empty_metadata()
+    
+    def _normalize_metadata(self, metadata: Dict) -> Dict[str, str]:
+        """
+        確保元數據包含所有字段且文檔類型合法
+        
+        Args:
+            metadata (Dict): 模型返回的元數據
+            
+        Returns:
+            Dict[str, str]: 規範化後的元數據
+        """
+        # 確保所有必需字段都存在
+        expected_fields = ['author_lastname', 'journal', 'journal_abbr', 'year', 'title', 'doc_type']
+        for field in expected_fields:
+            if field not in metadata or metadata[field] is None:
+                metadata[field] = ''
+        
+        # 確保文檔類型為'paper'或'book'
+        if metadata.get('doc_type', '').lower() not in ['paper', 'book']:
+            # 預設為paper
+            metadata['doc_type'] = 'paper'
+        
+        return metadata
     
     def is_available(self) -> bool:
         """
@@ -183,4 +405,34 @@ PDF文本內容：
         Returns:
             bool: 如果API可用返回True，否則返回False
         """
-        return self.api_key is not None
\ No newline at end of file
+        return bool(self.api_key)
+
+class OpenAICompatibleExtractor(SiliconFlowQwenExtractor):
+    """
+    使用任意兼容 OpenAI chat/completions 接口的服務提取元數據，如本地的 llama.cpp server 或 vLLM
+
+    提示詞、批量打包、重試和結果解析與 SiliconFlow 後端相同，只是接口地址和模型不同，本地服務通常不需要密鑰。
+    """
+    name = 'openai'
+    
+    def __init__(self, api_key: Optional[str] = None, api_base_url: Optional[str] = None, model: Optional[str] = None):
+        """
+        Args:
+            api_key (str, optional): API密鑰，默認讀取 LOCAL_LLM_API_KEY（可以不設置）
+            api_base_url (str, optional): chat/completions 接口地址，默認讀取 LOCAL_LLM_BASE_URL
+            model (str, optional): 模型名稱，默認讀取 LOCAL_LLM_MODEL
+        """
+        # 本地服務有自己的額度，不佔用 SiliconFlow 的 RPM/TPM 預算
+        super().__init__(
+            api_key=api_key or os.environ.get("LOCAL_LLM_API_KEY") or "none",
+            api_base_url=api_base_url if api_base_url is not None else os.environ.get("LOCAL_LLM_BASE_URL", ""),
+            model=model or os.environ.get("LOCAL_LLM_MODEL", "local-model"),
+            rate_limiter=RateLimiter(
+                requests_per_minute=float(os.environ.get("LOCAL_LLM_RPM", 0)),
+                tokens_per_minute=float(os.environ.get("LOCAL_LLM_TPM", 0))
+            )
+        )
+    
+    def is_available(self) -> bool:
+        """配置了接口地址即可用"""
+        return bool(self.api_base_url)
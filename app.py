@@ -1,9 +1,20 @@
 import os
 import logging
-from flask import Flask, render_template, request, jsonify, session, flash, redirect, url_for
-from folder_monitor import FolderMonitor
+from flask import Flask, Response, render_template, request, jsonify, session, flash, redirect, url_for
+from job_manager import JobManager
 import threading
-from models import db, ProcessedFile
+from sqlalchemy import event
+from models import db, ProcessedFile, ensure_indexes, ensure_columns
+from metadata_cache import metadata_cache
+from file_index import file_index
+from duplicate_index import duplicate_index
+from fulltext_index import fulltext_index
+from rename_journal import rename_journal, rename_planner
+from log_stream import log_broadcaster, format_event
+from log_writer import log_writer
+from recent_logs import recent_logs
+from job_queue import job_queue
+import metrics
 
 # 設置日誌
 logging.basicConfig(level=logging.DEBUG, 
@@ -48,40 +59,119 @@ logger.debug(f"Database URL: {app.config['SQLALCHEMY_DATABASE_URI']}")
 # 初始化數據庫
 db.init_app(app)
 
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """為SQLite連接啟用WAL模式：讀寫互不阻塞，提交時無需每次完整fsync"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    # SQLite 默認不執行外鍵約束；作業任務和指紋分帶依賴 ON DELETE CASCADE 隨父記錄刪除
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
 # 創建數據表
 with app.app_context():
+    if db.engine.dialect.name == "sqlite":
+        event.listen(db.engine, "connect", set_sqlite_pragmas)
     db.create_all()
+    ensure_columns()
+    ensure_indexes()
+
+# 初始化元數據緩存
+metadata_cache.init_app(app)
+
+# 初始化文件索引
+file_index.init_app(app)
+
+# 初始化重複檢測索引
+duplicate_index.init_app(app)
+
+# 初始化全文索引
+fulltext_index.init_app(app)
+
+# 初始化重命名日誌，回滾上次運行中斷時未提交的重命名
+rename_journal.init_app(app)
+rename_planner.recover()
 
-# Global variables to store state
-monitor_thread = None
-folder_monitor = None
-is_monitoring = False
-processed_files = []
-monitor_dir = ""
+def publish_saved_logs(entries):
+    """日誌寫入數據庫後放入最近日誌緩衝，並以緩衝序號作為事件id推送"""
+    for entry in entries:
+        stored = recent_logs.append(entry)
+        log_broadcaster.publish('log', stored, event_id=stored['seq'])
+
+# 初始化作業隊列，並標記上次運行中斷的作業以便恢復
+job_queue.init_app(app)
+job_queue.recover()
+
+# 初始化日誌寫入器
+log_writer.on_flush = publish_saved_logs
+log_writer.init_app(app)
+
+
+# 日誌分頁大小
+LOG_PAGE_SIZE = 50
+LOG_PAGE_MAX = 500
+
+def query_log_page(args):
+    """
+    按請求參數查詢一頁處理日誌
+    
+    Args:
+        args: 請求參數，支持 status、year、journal、q、sort、order、cursor、limit
+        
+    Returns:
+        dict: items（日誌字典列表）、next_cursor，首頁還包含符合條件的總數 total
+    """
+    query = ProcessedFile.search(
+        status=args.get('status') or None,
+        year=args.get('year') or None,
+        journal=args.get('journal') or None,
+        text=args.get('q') or None
+    )
+    cursor = args.get('cursor') or None
+    limit = min(max(int(args.get('limit', LOG_PAGE_SIZE)), 1), LOG_PAGE_MAX)
+    rows, next_cursor = ProcessedFile.keyset_page(
+        query,
+        sort=args.get('sort', 'timestamp'),
+        descending=args.get('order', 'desc') != 'asc',
+        cursor=cursor,
+        limit=limit
+    )
+    page = {'items': [row.to_dict() for row in rows], 'next_cursor': next_cursor}
+    if not cursor:
+        # 只在首頁計算總數，翻頁時不重複統計
+        page['total'] = query.order_by(None).count()
+    return page
 
 @app.route('/')
 def index():
     """Render the main page"""
-    global is_monitoring, monitor_dir, processed_files
+    try:
+        log_page = query_log_page({})
+    except Exception as e:
+        logger.error(f"Error loading files from database: {str(e)}")
+        log_page = {'items': [], 'next_cursor': None, 'total': 0}
+    # 頁面渲染時的最近日誌序號，前端從這裡開始接收推送，避免渲染與連接之間的遺漏
+    log_page['seq'] = recent_logs.last_seq
     
-    # Load processed files from database if the in-memory list is empty
-    if not processed_files:
-        try:
-            db_files = ProcessedFile.query.order_by(ProcessedFile.timestamp.desc()).all()
-            processed_files = [file.to_dict() for file in db_files]
-            logger.debug(f"Loaded {len(processed_files)} files from database")
-        except Exception as e:
-            logger.error(f"Error loading files from database: {str(e)}")
+    try:
+        resumable_jobs = [job for job in job_queue.list_jobs() if job['status'] in ('interrupted', 'cancelled')
+                          and job['progress']['queued'] + job['progress']['running'] > 0]
+    except Exception as e:
+        logger.error(f"Error loading jobs from database: {str(e)}")
+        resumable_jobs = []
     
+    active_jobs = job_manager.active_jobs()
     return render_template('index.html', 
-                          is_monitoring=is_monitoring,
-                          monitor_dir=monitor_dir,
-                          processed_files=processed_files)
+                          is_monitoring=bool(active_jobs),
+                          active_jobs=active_jobs,
+                          log_page=log_page,
+                          resumable_jobs=resumable_jobs)
 
 @app.route('/start_monitoring', methods=['POST'])
 def start_monitoring():
     """處理指定目錄中的所有PDF文件（批處理模式）"""
-    global monitor_thread, folder_monitor, is_monitoring, monitor_dir, processed_files
     
     # 獲取表單中的目錄
     directory = request.form.get('directory', '')
@@ -95,74 +185,210 @@ def start_monitoring():
         flash(f"目錄 '{directory}' 不存在", "danger")
         return redirect(url_for('index'))
     
-    # 如果有正在運行的監控，停止它
-    if is_monitoring and folder_monitor:
-        folder_monitor.stop()
-        if monitor_thread:
-            monitor_thread.join(timeout=5)
-    
-    # 清空處理文件列表
-    processed_files.clear()
-    
-    # 設置當前處理的目錄
-    monitor_dir = directory
-    
-    # 創建新的文件夾處理器，但僅處理現有文件，不監控變更
-    folder_monitor = FolderMonitor(directory, on_file_processed)
-    
-    # 在單獨的線程中處理所有現有PDF文件
-    def process_existing_files_only():
-        folder_monitor._process_existing_files()
-        global is_monitoring
-        is_monitoring = False  # 處理完成後自動停止
-    
-    monitor_thread = threading.Thread(target=process_existing_files_only)
-    monitor_thread.daemon = True
-    monitor_thread.start()
+    # 同一目錄已有作業在運行時不重複啟動，不同目錄的作業同時進行
+    if any(job['directory'] == directory for job in job_manager.active_jobs()):
+        flash(f"目錄 '{directory}' 已在處理中", "warning")
+        return redirect(url_for('index'))
     
-    is_monitoring = True
-    flash(f"正在處理目錄中的所有PDF文件: {directory}", "success")
+    job_id = job_manager.start(directory)
+    flash(f"作業 {job_id}: 正在處理目錄中的所有PDF文件: {directory}", "success")
     return redirect(url_for('index'))
 
 @app.route('/stop_monitoring', methods=['POST'])
 def stop_monitoring():
-    """停止處理文件"""
-    global is_monitoring, folder_monitor, monitor_thread
+    """停止所有正在處理的作業"""
+    cancelled = job_manager.cancel_all()
+    if cancelled:
+        log_writer.flush()
+        flash(f"已停止 {cancelled} 個處理作業", "info")
     
-    if folder_monitor:
-        folder_monitor.stop()
-        is_monitoring = False
-        flash("已停止處理文件", "info")
+    return redirect(url_for('index'))
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    """Return recent jobs with their progress as JSON"""
+    return jsonify(job_queue.list_jobs(request.args.get('limit', 20, type=int)))
+
+@app.route('/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Return one job with its progress as JSON
     
+    progress holds the persisted task counts, rate and ETA; live holds the
+    in-memory batch progress while the job is running and is null otherwise.
+    """
+    job = job_queue.get_job(job_id)
+    if job is None:
+        return jsonify({'error': f"Job {job_id} not found"}), 404
+    job['live'] = job_manager.status(job_id)
+    return jsonify(job)
+
+@app.route('/jobs/<int:job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """取消一個正在運行的作業，之後可以恢復"""
+    if job_manager.cancel(job_id):
+        flash(f"已取消作業 {job_id}", "info")
+    else:
+        flash(f"作業 {job_id} 不在運行中", "warning")
+    return redirect(url_for('index'))
+
+@app.route('/jobs/<int:job_id>/resume', methods=['POST'])
+def resume_job(job_id):
+    """恢復中斷或取消的作業，只處理尚未完成的文件"""
+    job = job_queue.get_job(job_id)
+    if job is None:
+        flash(f"作業 {job_id} 不存在", "danger")
+    elif not os.path.isdir(job['directory']):
+        flash(f"目錄 '{job['directory']}' 不存在", "danger")
+    elif job_manager.is_active(job_id):
+        flash(f"作業 {job_id} 已在運行中", "warning")
+    else:
+        job_manager.start(job['directory'], job_id=job_id)
+        flash(f"正在恢復作業 {job_id}: {job['directory']}", "success")
     return redirect(url_for('index'))
 
+@app.route('/clear_cache', methods=['POST'])
+def clear_cache():
+    """清空元數據緩存和文件索引，下次處理時重新掃描所有文件並調用API提取"""
+    deleted = metadata_cache.clear()
+    indexed = file_index.clear()
+    flash(f"已清空元數據緩存（{deleted} 條）和文件索引（{indexed} 條）", "info")
+    return redirect(url_for('index'))
+
+@app.route('/search', methods=['GET'])
+def search():
+    """
+    Search processed papers by title, author, journal and extracted text, best matches first
+    
+    Query parameters: q, limit (default 20, max 100).
+    """
+    try:
+        return jsonify(fulltext_index.search(request.args.get('q', ''), request.args.get('limit', 20)))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 503
+
+@app.route('/journal', methods=['GET'])
+def list_rename_batches():
+    """Return recent rename batches from the rename journal with per-state file counts"""
+    return jsonify(rename_journal.batches(request.args.get('limit', 20, type=int)))
+
+@app.route('/journal/<batch>/<action>', methods=['POST'])
+def apply_rename_batch(batch, action):
+    """
+    Undo or replay every rename in a journal batch
+    
+    undo moves the renamed files back to their original names in reverse
+    order; replay redoes renames that were undone or rolled back.
+    """
+    if action not in ('undo', 'replay'):
+        return jsonify({'error': f"Unknown action {action}"}), 404
+    try:
+        result = rename_planner.undo(batch) if action == 'undo' else rename_planner.replay(batch)
+    except KeyError as e:
+        return jsonify({'error': e.args[0]}), 404
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify(result)
+
 @app.route('/get_logs', methods=['GET'])
 def get_logs():
-    """Return the logs as JSON"""
-    global processed_files
+    """
+    Return one page of logs as JSON
+    
+    Query parameters: status, year, journal, q (title/author substring),
+    sort (timestamp or processing_time), order (asc or desc), cursor, limit.
+    """
+    try:
+        return jsonify(query_log_page(request.args))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+def progress_snapshot(job_id):
+    """作業的當前進度，供SSE推送；作業已結束時 active 為False"""
+    return job_manager.status(job_id) or {
+        'job_id': job_id, 'active': False, 'done': 0, 'total': 0, 'rate': 0.0, 'eta': None
+    }
+
+@app.route('/stream')
+def stream():
+    """
+    Server-Sent Events 推送通道
+    
+    事件類型: log（新的日誌條目，格式與 /get_logs 的 items 相同，另帶序號 seq，也是事件id）、
+    progress（每個作業的 job_id/done/total/rate/eta）、reset（連接落後太多，客戶端應重新加載）。
+    重連時瀏覽器通過 Last-Event-ID 帶回最後收到的序號，首次連接可用 since 參數指定，
+    之後的條目從最近日誌緩衝中補發。
+    """
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    since = int(since) if since and since.isdigit() else None
+    progress = job_manager.active_jobs()
     
-    # If in-memory list is empty, load from database
-    if not processed_files:
-        with app.app_context():
-            db_files = ProcessedFile.query.order_by(ProcessedFile.timestamp.desc()).all()
-            processed_files = [file.to_dict() for file in db_files]
+    def initial():
+        for job_progress in progress:
+            yield format_event('progress', job_progress)
+        if since is None:
+            return
+        entries, truncated = recent_logs.since(since)
+        if truncated:
+            yield format_event('reset', {})
+            return
+        for entry in entries:
+            yield format_event('log', entry, entry['seq'])
     
-    return jsonify(processed_files)
+    response = Response(log_broadcaster.stream(initial), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/recent_logs', methods=['GET'])
+def get_recent_logs():
+    """
+    Return logs newer than a sequence number from the in-memory buffer
+    
+    Query parameters: since (last sequence number the client has), limit.
+    truncated is true when entries after since have already been evicted and
+    the client should reload from /get_logs instead.
+    """
+    since = request.args.get('since', 0, type=int)
+    limit = request.args.get('limit', LOG_PAGE_MAX, type=int)
+    entries, truncated = recent_logs.since(since, limit)
+    return jsonify({'items': entries, 'seq': recent_logs.last_seq, 'truncated': truncated})
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Pipeline counters, stage timing histograms and queue depths in Prometheus text format"""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+def in_flight_files():
+    """Files discovered by running jobs that have not finished yet"""
+    return sum(max(0, status['total'] - status['done']) for status in job_manager.active_jobs())
+
+# 採集時讀取的隊列深度
+metrics.registry.gauge('pdf_active_jobs', '運行中的作業數', function=lambda: len(job_manager.active_jobs()))
+metrics.registry.gauge('pdf_files_in_flight', '運行中作業已發現但尚未完成的文件數', function=in_flight_files)
+metrics.registry.gauge('pdf_job_tasks', '作業隊列中的任務數', ['status'], function=job_queue.task_counts)
+metrics.registry.gauge('pdf_log_buffer_pending', '等待批量寫入數據庫的日誌條數', function=log_writer.pending_count)
+metrics.registry.gauge('pdf_stream_subscribers', '實時日誌訂閱者數', function=log_broadcaster.subscriber_count)
 
 def on_file_processed(log_entry):
     """Callback function when a file is processed"""
-    global processed_files
-    
-    # Add to in-memory list
-    processed_files.append(log_entry)
     logger.info(f"File processed: {log_entry}")
+    metrics.observe_result(log_entry)
     
-    # Save to database
-    with app.app_context():
-        db_file = ProcessedFile.from_log_entry(log_entry)
-        db.session.add(db_file)
-        db.session.commit()
-        logger.debug(f"Saved to database: {db_file.id}")
+    # Queue for batched saving to the database
+    log_writer.add(log_entry)
+    log_broadcaster.publish('progress', progress_snapshot(log_entry.get('job_id')))
+
+def on_job_finished(job_id, progress):
+    """作業結束後寫入緩衝的日誌並推送最終進度"""
+    log_writer.flush()
+    log_broadcaster.publish('progress', progress)
+
+# 作業管理器：多個目錄同時處理，共用工作池和API速率預算
+# 結果由 log_writer 寫入數據庫之後才提交重命名日誌，崩潰時未寫入的重命名會在啟動時回滾
+job_manager = JobManager(on_file_processed, on_job_finished=on_job_finished, commit_journal=False)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=port, debug=True)
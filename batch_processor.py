@@ -0,0 +1,436 @@
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from metadata_extractor import (
+    extract_pdf_content, extract_metadata_from_content, extract_metadata_from_contents, get_cached_metadata,
+    check_duplicate
+)
+from pdf_processor import rename_pdf_file, error_result
+from duplicate_index import duplicate_index, DUPLICATES_FOUND
+from fulltext_index import fulltext_index
+from rename_journal import rename_journal
+from metrics import collect_timings, divide_usage, merge_timings, split_usage
+
+# 設置日誌
+logger = logging.getLogger(__name__)
+
+
+class BatchProcessor:
+    """
+    兩級流水線批處理引擎
+
+    第一級在進程池中解析PDF文本（CPU密集），第二級在線程池中調用API並重命名文件（I/O密集）。
+    兩級之間通過在途文件數上限實現背壓：API處理較慢時，文本提取會暫停，避免解析結果在內存中堆積。
+    每個文件在兩級中的分階段耗時和令牌用量隨結果的 stage_timings、usage 字段回報。
+    同一批中內容哈希相同的副本只有第一個調用API，其餘等它完成後沿用其元數據。
+    一次 run() 的重命名記錄為重命名日誌中的一個批次，回調正常返回（結果已被記錄）後才提交；
+    回調只是緩衝結果時（如網頁服務的 LogWriter）由其在持久化之後提交。
+    """
+    def __init__(self, callback, extract_workers=None, api_concurrency=None, max_pending=None, api_batch_size=None,
+                 extract_pool=None, api_pool=None, slots=None, dry_run=False, commit_journal=True):
+        """
+        初始化批處理引擎
+
+        Args:
+            callback (function): 每個文件處理完成後調用，參數為結果字典
+            extract_workers (int, optional): 文本提取進程數，默認讀取 PDF_EXTRACT_WORKERS 或CPU核數
+            api_concurrency (int, optional): 並發API請求數，默認讀取 API_CONCURRENCY 或 4
+            max_pending (int, optional): 在途文件數上限，默認讀取 BATCH_MAX_PENDING 或兩級並發數之和的兩倍
+            api_batch_size (int, optional): 每個API請求打包的文檔數，默認讀取 API_BATCH_SIZE 或 1（不打包）
+            extract_pool (ProcessPoolExecutor, optional): 多個批處理共用的提取進程池，由調用方負責關閉
+            api_pool (ThreadPoolExecutor, optional): 多個批處理共用的API線程池，由調用方負責關閉
+            slots (optional): 共用的在途名額，需提供 acquire(timeout) 和 release()，默認為本批處理獨佔的信號量
+            dry_run (bool): 只提取元數據並報告計劃的新文件名，不重命名文件
+            commit_journal (bool): 回調返回後提交重命名日誌條目；為False時由調用方在結果持久化後提交
+        """
+        self.callback = callback
+        self.extract_workers = extract_workers or int(os.environ.get("PDF_EXTRACT_WORKERS", os.cpu_count() or 1))
+        self.api_concurrency = api_concurrency or int(os.environ.get("API_CONCURRENCY", 4))
+        self.max_pending = max_pending or int(
+            os.environ.get("BATCH_MAX_PENDING", 2 * (self.extract_workers + self.api_concurrency))
+        )
+        self.api_batch_size = api_batch_size or int(os.environ.get("API_BATCH_SIZE", 1))
+
+        self._cancel_event = threading.Event()
+        self._slots = slots or threading.BoundedSemaphore(self.max_pending)
+        self._shared_extract_pool = extract_pool
+        self._shared_api_pool = api_pool
+        self._extract_futures = set()
+        self.dry_run = dry_run
+        self.commit_journal = commit_journal
+        self._reserved_paths = set()
+        self.journal_batch = None
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._in_flight = 0
+        self._extracting = 0
+        self._text_buffer = []
+        # 內容哈希 -> 第一個副本的處理狀態；文件路徑 -> 它作為第一個副本的內容哈希
+        self._copies = {}
+        self._leaders = {}
+        self._extract_pool = None
+        self._api_pool = None
+
+        self.total = 0
+        self.completed = 0
+        self.started_at = None
+
+    def run(self, pdf_paths):
+        """
+        處理一批PDF文件，阻塞直到全部完成或被取消
+
+        Args:
+            pdf_paths (iterable): PDF文件路徑，可以是生成器
+        """
+        self.started_at = time.time()
+        self.journal_batch = None if self.dry_run else rename_journal.begin_batch()
+        logger.info(
+            f"啟動批處理: 提取進程 {self.extract_workers} 個，API並發 {self.api_concurrency}，"
+            f"在途上限 {self.max_pending}"
+        )
+
+        # 使用spawn啟動子進程，避免在多線程的Web進程中fork
+        self._extract_pool = self._shared_extract_pool or ProcessPoolExecutor(
+            max_workers=self.extract_workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        self._api_pool = self._shared_api_pool or ThreadPoolExecutor(
+            max_workers=self.api_concurrency,
+            thread_name_prefix="pdf-api"
+        )
+
+        try:
+            for pdf_path in pdf_paths:
+                if not self._acquire_slot():
+                    break
+                with self._lock:
+                    self.total += 1
+                    self._in_flight += 1
+                self._submit(pdf_path)
+
+            # 等待在途文件全部完成
+            with self._idle:
+                while self._in_flight > 0 and not self._cancel_event.is_set():
+                    self._idle.wait(0.5)
+        finally:
+            self._shutdown_pools(wait=not self._cancel_event.is_set())
+            rename_journal.end_batch(self.journal_batch)
+
+        elapsed = time.time() - self.started_at
+        logger.info(f"批處理結束: 完成 {self.completed}/{self.total} 個文件，耗時 {elapsed:.1f} 秒")
+
+    def cancel(self):
+        """取消批處理：停止提交新文件並丟棄尚未開始的任務"""
+        if self._cancel_event.is_set():
+            return
+        logger.info("取消批處理")
+        self._cancel_event.set()
+        self._shutdown_pools(wait=False)
+
+    def _shutdown_pools(self, wait):
+        """關閉本批處理獨佔的線程池；共用線程池只取消本批處理尚未開始的提取任務"""
+        with self._lock:
+            futures = list(self._extract_futures)
+        if self._shared_extract_pool:
+            if self._cancel_event.is_set():
+                for future in futures:
+                    future.cancel()
+        elif self._extract_pool:
+            self._extract_pool.shutdown(wait=False, cancel_futures=True)
+        if not self._shared_api_pool and self._api_pool:
+            self._api_pool.shutdown(wait=wait, cancel_futures=True)
+
+    def progress(self):
+        """
+        當前進度快照
+
+        Returns:
+            dict: done、total（已發現的文件數，掃描未結束時會繼續增長）、
+                  rate（每秒完成文件數）、eta（預計剩餘秒數，無法估計時為None）
+        """
+        with self._lock:
+            done, total = self.completed, self.total
+        elapsed = time.time() - self.started_at if self.started_at else 0.0
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = (total - done) / rate if rate > 0 else None
+        return {'done': done, 'total': total, 'rate': round(rate, 2), 'eta': round(eta, 1) if eta is not None else None}
+
+    def is_cancelled(self):
+        """是否已被取消"""
+        return self._cancel_event.is_set()
+
+    def _acquire_slot(self):
+        """等待在途名額，被取消時返回False"""
+        while not self._cancel_event.is_set():
+            if self._slots.acquire(timeout=0.5):
+                return True
+        return False
+
+    def _submit(self, pdf_path):
+        """
+        將文件送入流水線，路徑、大小和修改時間未變的緩存文件跳過文本提取和API調用
+
+        提交線程只做不讀取文件的快速檢查，內容哈希在提取進程中與文本一起計算，
+        之後在API線程中按哈希查找緩存（見 _lookup_by_hash）。
+        """
+        start_time = time.time()
+        try:
+            with collect_timings() as timings:
+                cached_metadata = get_cached_metadata(pdf_path, hash_file=False)
+            if cached_metadata:
+                self._api_pool.submit(self._finish, pdf_path, cached_metadata, start_time, timings)
+                return
+
+            with self._lock:
+                self._extracting += 1
+            try:
+                # 提取進程中的索引未初始化，按主進程的設置決定是否計算指紋和讀取全文
+                future = self._extract_pool.submit(
+                    extract_pdf_content, pdf_path,
+                    fingerprint=duplicate_index.is_enabled(), fulltext=fulltext_index.is_enabled()
+                )
+            except Exception:
+                with self._lock:
+                    self._extracting -= 1
+                raise
+            with self._lock:
+                self._extract_futures.add(future)
+            future.add_done_callback(lambda f: self._on_text_extracted(pdf_path, f, start_time, timings))
+        except Exception as e:
+            # 線程池已關閉（被取消）時直接釋放名額，其他錯誤記錄為處理失敗
+            if self._cancel_event.is_set():
+                self._release(pdf_path)
+            else:
+                self._complete(pdf_path, error_result(pdf_path, e, start_time))
+
+    def _on_text_extracted(self, pdf_path, future, start_time, timings):
+        """文本提取完成後將文件交給API線程池（開啟打包時先放入緩衝區）"""
+        with self._lock:
+            self._extracting -= 1
+            self._extract_futures.discard(future)
+        try:
+            if future.cancelled():
+                self._release(pdf_path)
+                return
+            content = future.result()
+            # 提取進程中的計時隨結果返回，與主進程中的緩存查找耗時合併
+            content['timings'] = merge_timings(timings, content.get('timings'))
+            self._dispatch(pdf_path, content, start_time)
+        except Exception as e:
+            if self._cancel_event.is_set():
+                self._release(pdf_path)
+            else:
+                logger.error(f"提取PDF文本時發生錯誤 {pdf_path}: {str(e)}")
+                self._complete(pdf_path, error_result(pdf_path, e, start_time))
+        finally:
+            if self.api_batch_size > 1:
+                self._flush_text_buffer()
+
+    def _dispatch(self, pdf_path, content, start_time):
+        """將提取好文本的文件交給API線程池，同一批中已有相同內容的文件在處理時先等待它完成"""
+        if self._wait_for_copy(pdf_path, content, start_time):
+            return
+        if self.api_batch_size > 1:
+            with self._lock:
+                self._text_buffer.append((pdf_path, content, start_time))
+        else:
+            self._api_pool.submit(self._extract_and_rename, pdf_path, content, start_time)
+
+    def _wait_for_copy(self, pdf_path, content, start_time):
+        """
+        按內容哈希查找同一批中內容相同的文件，沒有時將本文件登記為第一個副本
+
+        等待中的副本保留其在途名額，第一個副本完成時由 _resolve_copies 處理。
+
+        Returns:
+            bool: 本文件是副本（正在等待或已交給 _finish）時返回True
+        """
+        content_hash = content.get('content_hash')
+        if not content_hash:
+            return False
+        with self._lock:
+            copy = self._copies.get(content_hash)
+            if copy is None:
+                self._copies[content_hash] = {'waiters': [], 'original': None}
+                self._leaders[pdf_path] = content_hash
+                return False
+            if copy['original'] is None:
+                copy['waiters'].append((pdf_path, content, start_time))
+                return True
+            original = copy['original']
+        self._finish_copy(pdf_path, content, start_time, original)
+        return True
+
+    def _resolve_copies(self, pdf_path, result):
+        """
+        第一個副本完成後處理等待它的副本
+
+        成功時副本沿用其元數據並記為完全相同的重複文件；失敗時等待的副本重新分派，其中第一個成為新的第一個副本。
+        """
+        with self._lock:
+            content_hash = self._leaders.pop(pdf_path, None)
+            if content_hash is None:
+                return
+            copy = self._copies[content_hash]
+            waiters, copy['waiters'] = copy['waiters'], []
+            if result and result.get('status') != 'error' and result.get('metadata'):
+                copy['original'] = {
+                    'path': result.get('duplicate_of') or result.get('new_path') or pdf_path,
+                    'metadata': result['metadata']
+                }
+            else:
+                del self._copies[content_hash]
+        for waiter_path, content, start_time in waiters:
+            if self._cancel_event.is_set():
+                self._release(waiter_path)
+            elif copy['original']:
+                self._finish_copy(waiter_path, content, start_time, copy['original'])
+            else:
+                try:
+                    self._dispatch(waiter_path, content, start_time)
+                except RuntimeError:
+                    # 線程池已在取消時關閉
+                    self._release(waiter_path)
+        if waiters and self.api_batch_size > 1:
+            self._flush_text_buffer()
+
+    def _finish_copy(self, pdf_path, content, start_time, original):
+        """用同一批中第一個副本的元數據重命名內容相同的文件"""
+        logger.info(f"與同一批中的 {original['path']} 內容相同，沿用其元數據: {pdf_path}")
+        if duplicate_index.is_enabled():
+            content['duplicate'] = {
+                'path': original['path'], 'metadata': original['metadata'], 'similarity': 1.0, 'exact': True
+            }
+            DUPLICATES_FOUND.inc(kind='exact')
+        try:
+            self._api_pool.submit(
+                self._finish, pdf_path, dict(original['metadata']), start_time, content.get('timings'), content
+            )
+        except RuntimeError:
+            # 線程池已在取消時關閉
+            self._release(pdf_path)
+
+    def _flush_text_buffer(self):
+        """
+        湊滿一批或沒有正在提取的文件時，將緩衝的文本整批提交到API線程池
+
+        後一個條件保證在途上限小於批大小或輸入結束時緩衝區不會一直等待。
+        """
+        with self._lock:
+            if not self._text_buffer:
+                return
+            if len(self._text_buffer) < self.api_batch_size and self._extracting > 0:
+                return
+            batch, self._text_buffer = self._text_buffer, []
+        try:
+            self._api_pool.submit(self._extract_batch_and_rename, batch)
+        except RuntimeError:
+            # 線程池已在取消時關閉
+            for pdf_path, _, _ in batch:
+                self._release(pdf_path)
+
+    def _extract_batch_and_rename(self, batch):
+        """用一次API請求提取一批文件的元數據並逐個重命名"""
+        if self._cancel_event.is_set():
+            for pdf_path, _, _ in batch:
+                self._release(pdf_path)
+            return
+        batch = [item for item in batch if not self._lookup_by_hash(*item)]
+        if not batch:
+            return
+        try:
+            # 整批共用的API請求耗時計入批中每個文件
+            with collect_timings() as shared_timings:
+                metadata_by_path = extract_metadata_from_contents(
+                    {pdf_path: content for pdf_path, content, _ in batch}
+                )
+        except Exception as e:
+            for pdf_path, _, start_time in batch:
+                self._complete(pdf_path, error_result(pdf_path, e, start_time))
+            return
+        # 共用請求的令牌用量按文件數分攤，餘數計入最後一個文件，總量不變
+        shared_stages, shared_usage = split_usage(shared_timings)
+        for (pdf_path, content, start_time), usage in zip(batch, divide_usage(shared_usage, len(batch))):
+            timings = merge_timings(dict(content.get('timings') or {}), dict(shared_stages, **usage))
+            self._finish(pdf_path, metadata_by_path[pdf_path], start_time, timings, content)
+
+    def _extract_and_rename(self, pdf_path, content, start_time):
+        """提取元數據（本地結果不足時調用API）並重命名文件"""
+        if self._cancel_event.is_set():
+            self._release(pdf_path)
+            return
+        if self._lookup_by_hash(pdf_path, content, start_time):
+            return
+        timings = content.get('timings') or {}
+        try:
+            with collect_timings(timings):
+                metadata = extract_metadata_from_content(pdf_path, content)
+        except Exception as e:
+            self._complete(pdf_path, error_result(pdf_path, e, start_time))
+            return
+        self._finish(pdf_path, metadata, start_time, timings, content)
+
+    def _lookup_by_hash(self, pdf_path, content, start_time):
+        """
+        用提取進程算出的內容哈希查找緩存（如內容相同的副本），命中時直接重命名
+
+        Returns:
+            bool: 命中緩存並已交給 _finish 時返回True
+        """
+        if not content.get('content_hash'):
+            return False
+        timings = content.get('timings') or {}
+        try:
+            with collect_timings(timings):
+                cached_metadata = get_cached_metadata(pdf_path, content_hash=content['content_hash'])
+                if cached_metadata:
+                    check_duplicate(pdf_path, content)
+        except Exception as e:
+            logger.warning(f"按內容哈希查找緩存時出錯 {pdf_path}: {str(e)}")
+            return False
+        if not cached_metadata:
+            return False
+        self._finish(pdf_path, cached_metadata, start_time, timings, content)
+        return True
+
+    def _finish(self, pdf_path, metadata, start_time, timings=None, content=None):
+        """按重複檢測結果重命名文件並回報結果（附帶該文件的分階段耗時）"""
+        if self._cancel_event.is_set():
+            self._release(pdf_path)
+            return
+        with collect_timings(timings) as timings:
+            if content is None:
+                # 命中緩存的文件沒有經過文本提取，只按字節哈希查找重複
+                content = {}
+                check_duplicate(pdf_path, content)
+            result = rename_pdf_file(
+                pdf_path, metadata, start_time, dry_run=self.dry_run, reserved=self._reserved_paths,
+                fingerprint=content.get('fingerprint'), duplicate=content.get('duplicate'),
+                text=content.get('fulltext', content.get('text')),
+                journal_batch=self.journal_batch
+            )
+        result['stage_timings'], result['usage'] = split_usage(timings)
+        self._complete(pdf_path, result)
+
+    def _complete(self, pdf_path, result):
+        """回報處理結果，回調成功後提交重命名，並釋放在途名額"""
+        try:
+            self.callback(result)
+            if self.commit_journal:
+                rename_journal.commit(result)
+        except Exception as e:
+            logger.error(f"處理結果回調出錯 {pdf_path}: {str(e)}")
+        with self._lock:
+            self.completed += 1
+        self._release(pdf_path, result)
+
+    def _release(self, pdf_path, result=None):
+        """處理等待本文件的副本，釋放在途名額並在全部完成時喚醒等待線程"""
+        self._resolve_copies(pdf_path, result)
+        self._slots.release()
+        with self._idle:
+            self._in_flight -= 1
+            self._idle.notify_all()
@@ -0,0 +1,9 @@
+"""
+處理流水線的基準測試工具
+
+用法:
+    python -m benchmarks.run --files 200 --latency 0.3 --error-rate 0.02
+
+生成合成PDF語料，在本地模擬的 SiliconFlow 服務器上運行各個處理階段，
+報告吞吐量、各階段延遲的 p50/p95/p99 以及峰值內存。
+"""
@@ -0,0 +1,176 @@
+import os
+import random
+from typing import Dict, List, Optional
+
+# 用於生成正文的詞彙
+WORDS = (
+    "adaptive analysis approach bayesian channel classification cluster convolutional data deep "
+    "distributed dynamic efficient estimation evaluation feature framework gradient graph inference "
+    "kernel large learning linear model network neural nonlinear optimization parallel performance "
+    "probabilistic quantum random representation robust sampling scalable signal sparse spectral "
+    "statistical stochastic structure system temporal theory training transfer variational"
+).split()
+LASTNAMES = ["Zhang", "Smith", "Müller", "Garcia", "Tanaka", "Kowalski", "Rossi", "Nguyen", "Silva", "Cohen"]
+FIRSTNAMES = ["Wei", "John", "Anna", "Maria", "Hiro", "Piotr", "Luca", "Linh", "Ana", "David"]
+JOURNALS = [
+    "Physical Review Letters", "Nature Communications", "IEEE Transactions on Signal Processing",
+    "Journal of Machine Learning Research", "Neural Computation", "Journal of Applied Physics",
+]
+
+# 每頁正文行數和每行詞數
+LINES_PER_PAGE = 45
+WORDS_PER_LINE = 12
+
+
+def _escape(text: str) -> bytes:
+    """轉義PDF字符串中的特殊字符（Helvetica 只支持 Latin-1）"""
+    raw = text.encode('latin-1', errors='replace')
+    return raw.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+def _two_column_content(lines: List[str]) -> bytes:
+    """
+    前一半行排在左欄、後一半排在右欄，內容流按行交替繪製左右兩欄
+
+    許多排版工具生成的雙欄PDF都是這樣，按內容流順序提取的引擎會把兩欄的行交錯在一起。
+    """
+    half = (len(lines) + 1) // 2
+    ops = []
+    for row in range(half):
+        y = 760 - row * 14
+        for x, index in ((50, row), (320, row + half)):
+            if index < len(lines):
+                ops.append(b"1 0 0 1 %d %d Tm (" % (x, y) + _escape(lines[index]) + b") Tj")
+    return b"BT /F1 9 Tf " + b" ".join(ops) + b" ET"
+
+
+def build_pdf(pages: List[List[str]], info: Optional[Dict[str, str]] = None, padding: int = 0,
+              columns: int = 1) -> bytes:
+    """
+    生成最小的PDF文件
+
+    Args:
+        pages (List[List[str]]): 每頁的文本行，按閱讀順序排列
+        info (Dict[str, str], optional): 文檔信息字典（/Title、/Author 等）
+        padding (int): 附加的未引用二進制流字節數，模擬內嵌圖片等造成的大文件
+        columns (int): 1 為單欄，2 為雙欄排版（第一頁除外）
+
+    Returns:
+        bytes: PDF文件內容
+    """
+    objects = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = add(b"")  # 佔位，頁面生成後填入
+    kids = []
+    for number, lines in enumerate(pages):
+        if columns == 2 and number > 0:
+            content = _two_column_content(lines)
+        else:
+            content = b"BT /F1 10 Tf 50 760 Td 14 TL " + b" ".join(b"(" + _escape(line) + b") '" for line in lines) + b" ET"
+        stream = add(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        kids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (pages_id, font, stream)
+        ))
+    objects[pages_id - 1] = (
+        b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % kid for kid in kids) + b"] /Count %d >>" % len(kids)
+    )
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+    if padding:
+        blob = os.urandom(padding)
+        add(b"<< /Length %d >>\nstream\n" % len(blob) + blob + b"\nendstream")
+    info_id = None
+    if info:
+        info_id = add(b"<< " + b" ".join(b"/%s (%s)" % (key.encode(), _escape(value)) for key, value in info.items()) + b" >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R" % (len(objects) + 1, catalog)
+    if info_id:
+        out += b" /Info %d 0 R" % info_id
+    out += b" >>\nstartxref\n%d\n%%%%EOF\n" % xref
+    return bytes(out)
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def _paper(rng: random.Random, index: int, page_count: int, columns: int = 1) -> Dict:
+    """生成一篇合成論文的元數據和頁面文本，雙欄論文正文每行的詞數減半"""
+    metadata = {
+        'author_lastname': rng.choice(LASTNAMES),
+        'journal': rng.choice(JOURNALS),
+        'year': str(rng.randint(1995, 2025)),
+        'title': _sentence(rng, rng.randint(6, 12)).capitalize() + f" {index}",
+    }
+    authors = ", ".join(
+        f"{rng.choice(FIRSTNAMES)} {name}"
+        for name in [metadata['author_lastname']] + rng.sample(LASTNAMES, rng.randint(0, 3))
+    )
+    first_page = [
+        metadata['title'],
+        authors,
+        f"{metadata['journal']}, vol. {rng.randint(1, 120)}, {metadata['year']}",
+        f"DOI: 10.{rng.randint(1000, 9999)}/bench.{index}",
+        "Abstract",
+    ] + [_sentence(rng, WORDS_PER_LINE) for _ in range(LINES_PER_PAGE - 5)]
+    words_per_line = WORDS_PER_LINE // columns
+    lines_per_page = LINES_PER_PAGE * columns
+    pages = [first_page] + [
+        [_sentence(rng, words_per_line) for _ in range(lines_per_page)] for _ in range(page_count - 1)
+    ]
+    return {'metadata': metadata, 'pages': pages}
+
+
+def generate_corpus(directory: str, count: int, min_pages: int = 1, max_pages: int = 30,
+                    max_padding_kb: int = 0, info_fraction: float = 0.0, seed: int = 0,
+                    two_column_fraction: float = 0.0, truth: Optional[Dict[str, List[List[str]]]] = None) -> List[str]:
+    """
+    生成合成PDF語料
+
+    Args:
+        directory (str): 輸出目錄
+        count (int): 文件數
+        min_pages / max_pages (int): 頁數範圍
+        max_padding_kb (int): 每個文件附加的隨機二進制數據上限（KB），用於覆蓋大文件
+        info_fraction (float): 帶完整文檔信息字典的文件比例，這些文件可由本地元數據提取，不需要調用API
+        seed (int): 隨機種子，相同參數生成相同的文本
+        two_column_fraction (float): 雙欄排版的文件比例，用於比較文本引擎的閱讀順序
+        truth (Dict, optional): 傳入字典時填入每個文件按閱讀順序排列的頁面文本行，用於評估提取質量
+
+    Returns:
+        List[str]: 生成的文件路徑
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for index in range(count):
+        page_count = rng.randint(min_pages, max_pages)
+        # 比例為0時不消耗隨機數，已有的種子生成的語料不變
+        columns = 2 if two_column_fraction and rng.random() < two_column_fraction else 1
+        paper = _paper(rng, index, page_count, columns)
+        info = None
+        if rng.random() < info_fraction:
+            meta = paper['metadata']
+            info = {'Title': meta['title'], 'Author': meta['author_lastname'],
+                    'Subject': meta['journal'], 'CreationDate': f"D:{meta['year']}0101000000"}
+        padding = rng.randint(0, max_padding_kb) * 1024 if max_padding_kb else 0
+        path = os.path.join(directory, f"paper_{index:05d}.pdf")
+        with open(path, 'wb') as f:
+            f.write(build_pdf(paper['pages'], info, padding, columns))
+        if truth is not None:
+            truth[path] = paper['pages']
+        paths.append(path)
+    return paths
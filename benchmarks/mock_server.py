@@ -0,0 +1,142 @@
+import re
+import json
+import time
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+# 提示詞中文檔文本的起始標記（見 ai_metadata_extractor._build_prompt / _call_batch_api）
+SINGLE_MARKER = "PDF文本內容："
+BATCH_SECTION = re.compile(r"=== 文檔 (doc\d+) ===\n")
+YEAR_PATTERN = re.compile(r"\b(19|20)\d{2}\b")
+# extract_text_from_pdf 在每頁前插入的頁碼標記
+PAGE_HEADER = re.compile(r"^第\d+頁內容:?$")
+
+
+def guess_metadata(text: str) -> Dict[str, str]:
+    """
+    按合成語料的版式（標題、作者、期刊和年份各佔一行）從文本中「識別」元數據，
+    模擬語言模型的輸出
+    """
+    lines = [line.strip() for line in text.strip().splitlines()
+             if line.strip() and not PAGE_HEADER.match(line.strip())]
+    title = lines[0] if lines else ""
+    authors = lines[1] if len(lines) > 1 else ""
+    venue = lines[2] if len(lines) > 2 else ""
+    year = YEAR_PATTERN.search(venue)
+    journal = venue.split(",")[0].strip()
+    return {
+        "author_lastname": authors.split(",")[0].split()[-1] if authors.split() else "",
+        "journal": journal,
+        "journal_abbr": "".join(word[0] for word in journal.split() if word[0].isupper()),
+        "year": year.group(0) if year else "",
+        "title": title,
+        "doc_type": "paper",
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """模擬 chat/completions 接口：按配置的延遲和錯誤率返回響應"""
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+            failed = server.rng.random() < server.error_rate
+            if failed:
+                server.error_count += 1
+                status = server.rng.choice((429, 500, 503))
+            delay = max(0.0, server.latency + server.rng.uniform(-server.jitter, server.jitter))
+        time.sleep(delay)
+
+        if failed:
+            self._send(status, {"error": {"message": "injected failure"}}, retry_after=status == 429)
+            return
+        try:
+            prompt = json.loads(body)["messages"][-1]["content"]
+        except (ValueError, KeyError, IndexError, TypeError):
+            self._send(400, {"error": {"message": "bad request"}})
+            return
+        content = self._answer(prompt)
+        self._send(200, {
+            "choices": [{"message": {"role": "assistant", "content": content}}],
+            "usage": {
+                "prompt_tokens": len(prompt) // 4,
+                "completion_tokens": len(content) // 4,
+                "total_tokens": (len(prompt) + len(content)) // 4,
+            },
+        })
+
+    def _answer(self, prompt: str) -> str:
+        """單篇提示返回JSON對象，批量提示返回帶id的JSON數組"""
+        sections = BATCH_SECTION.split(prompt)
+        if len(sections) > 1:
+            items: List[Dict[str, str]] = []
+            for doc_id, text in zip(sections[1::2], sections[2::2]):
+                items.append({"id": doc_id, **guess_metadata(text)})
+            return json.dumps(items, ensure_ascii=False)
+        text = prompt.split(SINGLE_MARKER, 1)[-1]
+        return json.dumps(guess_metadata(text), ensure_ascii=False)
+
+    def _send(self, status: int, payload: Dict, retry_after: bool = False):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if retry_after:
+            self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockSiliconFlowServer:
+    """
+    本地模擬的 SiliconFlow 服務器，可作為上下文管理器使用
+
+    用法:
+        with MockSiliconFlowServer(latency=0.3, error_rate=0.05) as server:
+            os.environ["SILICONFLOW_API_BASE_URL"] = server.url
+    """
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        """
+        Args:
+            latency (float): 每個請求的平均響應延遲（秒）
+            jitter (float): 延遲的隨機浮動範圍（秒）
+            error_rate (float): 返回429/5xx錯誤的概率
+            seed (int): 隨機種子
+        """
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.lock = threading.Lock()
+        self.httpd.rng = random.Random(seed)
+        self.httpd.latency = latency
+        self.httpd.jitter = jitter
+        self.httpd.error_rate = error_rate
+        self.httpd.request_count = 0
+        self.httpd.error_count = 0
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1/chat/completions"
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-siliconflow", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def stats(self) -> Dict[str, int]:
+        """已處理的請求數和注入的錯誤數"""
+        with self.httpd.lock:
+            return {"requests": self.httpd.request_count, "errors": self.httpd.error_count}
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,239 @@
+"""
+處理流水線基準測試
+
+    python -m benchmarks.run --files 200 --latency 0.3 --jitter 0.1 --error-rate 0.02
+    python -m benchmarks.run --corpus /path/to/pdfs --stages text --json
+
+依次運行以下階段（每個階段使用語料的獨立副本，不修改原文件）：
+    text     逐個調用 extract_text_from_pdf
+    process  逐個調用 process_pdf_file（提取元數據、調用API、重命名）
+    batch    用 BatchProcessor 處理整個目錄
+"""
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+from typing import Dict, List, Optional
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.mock_server import MockSiliconFlowServer
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+STAGES = ('text', 'process', 'batch')
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """最近秩法計算百分位數"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def peak_rss_mb() -> Dict[str, Optional[float]]:
+    """
+    本進程和已回收子進程（提取進程池）自啟動以來的峰值常駐內存（MB）
+
+    這是整個進程的累計最大值，無法按階段重置，後面的階段會沿用前面階段的峰值。
+    """
+    if resource is None:
+        return {'self': None, 'children': None}
+    # Linux 上 ru_maxrss 以KB為單位，macOS 上以字節為單位
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return {
+        'self': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        'children': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+def rss_growth_mb(before: Dict[str, Optional[float]]) -> Dict[str, Optional[float]]:
+    """
+    相對於階段開始時的峰值，本階段把進程峰值常駐內存抬高了多少（MB）
+
+    為0表示本階段的內存佔用沒有超過之前的峰值，而不是本階段不佔內存。
+    """
+    after = peak_rss_mb()
+    return {
+        key: None if before[key] is None else round(after[key] - before[key], 1)
+        for key in after
+    }
+
+
+def summarize(name: str, latencies: List[float], elapsed: float, files: int, errors: int,
+              rss_before: Dict[str, Optional[float]]) -> Dict:
+    """匯總一個階段的吞吐量、延遲分佈，以及進程峰值內存和本階段帶來的峰值增長"""
+    return {
+        'stage': name,
+        'files': files,
+        'errors': errors,
+        'elapsed': round(elapsed, 3),
+        'files_per_sec': round(files / elapsed, 2) if elapsed > 0 else None,
+        'p50': _round(percentile(latencies, 50)),
+        'p95': _round(percentile(latencies, 95)),
+        'p99': _round(percentile(latencies, 99)),
+        'peak_rss_mb': peak_rss_mb(),
+        'peak_rss_growth_mb': rss_growth_mb(rss_before),
+    }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 4) if value is not None else None
+
+
+def _copy_corpus(corpus: str, workdir: str, name: str) -> List[str]:
+    """把語料複製到階段專用目錄，返回其中的PDF路徑"""
+    target = os.path.join(workdir, name)
+    shutil.copytree(corpus, target)
+    return sorted(
+        os.path.join(target, entry) for entry in os.listdir(target) if entry.lower().endswith('.pdf')
+    )
+
+
+def bench_text(paths: List[str]) -> Dict:
+    from metadata_extractor import extract_text_from_pdf
+
+    latencies, errors = [], 0
+    rss_before = peak_rss_mb()
+    started = time.perf_counter()
+    for path in paths:
+        t0 = time.perf_counter()
+        if not extract_text_from_pdf(path):
+            errors += 1
+        latencies.append(time.perf_counter() - t0)
+    return summarize('text', latencies, time.perf_counter() - started, len(paths), errors, rss_before)
+
+
+def bench_process(paths: List[str]) -> Dict:
+    from pdf_processor import process_pdf_file
+
+    latencies, errors = [], 0
+    rss_before = peak_rss_mb()
+    started = time.perf_counter()
+    for path in paths:
+        t0 = time.perf_counter()
+        if process_pdf_file(path)['status'] == 'error':
+            errors += 1
+        latencies.append(time.perf_counter() - t0)
+    return summarize('process', latencies, time.perf_counter() - started, len(paths), errors, rss_before)
+
+
+def bench_batch(paths: List[str], workers: Optional[int], api_concurrency: Optional[int],
+                batch_size: Optional[int]) -> Dict:
+    from batch_processor import BatchProcessor
+
+    results = []
+    processor = BatchProcessor(results.append, extract_workers=workers, api_concurrency=api_concurrency,
+                               api_batch_size=batch_size)
+    rss_before = peak_rss_mb()
+    started = time.perf_counter()
+    processor.run(paths)
+    elapsed = time.perf_counter() - started
+    # 批處理中每個文件的延遲為從提交到重命名完成的時間（含排隊）
+    latencies = [result.get('processing_time', 0.0) for result in results]
+    errors = sum(1 for result in results if result['status'] == 'error')
+    return summarize('batch', latencies, elapsed, len(results), errors, rss_before)
+
+
+def format_table(reports: List[Dict]) -> str:
+    """格式化為便於閱讀的表格"""
+    header = (f"{'stage':<8} {'files':>6} {'errors':>6} {'files/s':>9} {'p50':>8} {'p95':>8} {'p99':>8} "
+              f"{'peak MB':>14} {'growth MB':>14}")
+    lines = [header, '-' * len(header)]
+    for report in reports:
+        rss, growth = report['peak_rss_mb'], report['peak_rss_growth_mb']
+        lines.append(
+            f"{report['stage']:<8} {report['files']:>6} {report['errors']:>6} "
+            f"{_fmt(report['files_per_sec']):>9} {_fmt(report['p50']):>8} {_fmt(report['p95']):>8} "
+            f"{_fmt(report['p99']):>8} {_fmt(rss['self']):>6}/{_fmt(rss['children']):<7} "
+            f"{_fmt(growth['self']):>6}/{_fmt(growth['children']):<7}"
+        )
+    return '\n'.join(lines)
+
+
+def _fmt(value) -> str:
+    return '-' if value is None else f"{value:g}"
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run', description='處理流水線基準測試')
+    corpus = parser.add_argument_group('語料')
+    corpus.add_argument('--corpus', help='使用已有的PDF目錄，不生成合成語料')
+    corpus.add_argument('--files', type=int, default=50, help='合成語料的文件數')
+    corpus.add_argument('--min-pages', type=int, default=1, help='最少頁數')
+    corpus.add_argument('--max-pages', type=int, default=30, help='最多頁數')
+    corpus.add_argument('--max-padding-kb', type=int, default=0, help='每個文件附加的隨機數據上限（KB），模擬大文件')
+    corpus.add_argument('--info-fraction', type=float, default=0.0,
+                        help='帶完整文檔屬性（可本地提取、無需API）的文件比例')
+    corpus.add_argument('--seed', type=int, default=0, help='隨機種子')
+    server = parser.add_argument_group('模擬服務器')
+    server.add_argument('--latency', type=float, default=0.2, help='平均響應延遲（秒）')
+    server.add_argument('--jitter', type=float, default=0.05, help='延遲浮動範圍（秒）')
+    server.add_argument('--error-rate', type=float, default=0.0, help='返回429/5xx的概率')
+    run = parser.add_argument_group('運行')
+    run.add_argument('--stages', default=','.join(STAGES), help=f"逗號分隔的階段，可選 {','.join(STAGES)}")
+    run.add_argument('--workers', type=int, help='batch 階段的文本提取進程數')
+    run.add_argument('--api-concurrency', type=int, help='batch 階段的並發API請求數')
+    run.add_argument('--batch-size', type=int, help='batch 階段每個API請求打包的文檔數')
+    run.add_argument('--json', action='store_true', help='以JSON輸出報告')
+    run.add_argument('-v', '--verbose', action='store_true', help='輸出處理日誌')
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        print(f"未知的階段: {', '.join(sorted(unknown))}", file=sys.stderr)
+        return 2
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', stream=sys.stderr)
+
+    workdir = tempfile.mkdtemp(prefix='pdf-bench-')
+    try:
+        corpus = args.corpus
+        if not corpus:
+            corpus = os.path.join(workdir, 'corpus')
+            generate_corpus(corpus, args.files, args.min_pages, args.max_pages, args.max_padding_kb,
+                            args.info_fraction, args.seed)
+
+        with MockSiliconFlowServer(args.latency, args.jitter, args.error_rate, args.seed) as server:
+            # 必須在導入處理模塊之前設置，API客戶端和提取進程池都從環境變量讀取配置
+            os.environ['SILICONFLOW_API_KEY'] = 'benchmark'
+            os.environ['SILICONFLOW_API_BASE_URL'] = server.url
+            os.environ.setdefault('SILICONFLOW_RPM', '0')
+            os.environ.setdefault('SILICONFLOW_TPM', '0')
+
+            reports = []
+            for stage in stages:
+                paths = _copy_corpus(corpus, workdir, stage)
+                if stage == 'text':
+                    reports.append(bench_text(paths))
+                elif stage == 'process':
+                    reports.append(bench_process(paths))
+                else:
+                    reports.append(bench_batch(paths, args.workers, args.api_concurrency, args.batch_size))
+            api = server.stats()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps({'stages': reports, 'api': api}, ensure_ascii=False, indent=2))
+    else:
+        print(format_table(reports))
+        print(f"\nAPI請求 {api['requests']} 次，注入錯誤 {api['errors']} 次；延遲單位為秒")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""
+PDF文本引擎基準測試：比較各引擎的提取速度和質量
+
+    python -m benchmarks.text_engines --files 50 --max-pages 10 --two-column-fraction 0.5
+    python -m benchmarks.text_engines --corpus /path/to/pdfs --engines pypdf2,pdftotext --json
+
+每個已安裝的引擎（或 --engines 指定的引擎）逐頁提取語料中的全部頁面，報告每秒頁數、
+出錯和空白頁數。合成語料有已知的頁面文本，另外報告兩項質量指標：
+    recall  提取出的詞佔原文詞的比例（按詞頻計），反映丟字和亂碼
+    order   提取結果與原文詞序列的相似度（difflib），反映雙欄等排版下的閱讀順序
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import difflib
+import logging
+import argparse
+import tempfile
+from collections import Counter
+from typing import Dict, List, Optional
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.run import peak_rss_mb, rss_growth_mb, _fmt
+
+# 詞序相似度只比較每頁的前若干個詞，difflib 的耗時隨長度平方增長
+ORDER_WORDS = 400
+
+
+def score_page(expected: List[str], extracted: str) -> Dict[str, float]:
+    """
+    計算一頁的詞召回率和詞序相似度
+
+    Args:
+        expected (List[str]): 按閱讀順序排列的原文行
+        extracted (str): 引擎提取的文本
+
+    Returns:
+        Dict[str, float]: recall 和 order，均在0到1之間
+    """
+    truth = ' '.join(expected).split()
+    words = extracted.split()
+    if not truth:
+        return {'recall': 1.0, 'order': 1.0}
+    found = sum((Counter(truth) & Counter(words)).values())
+    matcher = difflib.SequenceMatcher(None, truth[:ORDER_WORDS], words[:ORDER_WORDS], autojunk=False)
+    return {'recall': found / len(truth), 'order': matcher.ratio()}
+
+
+def bench_engine(backend, paths: List[str], max_pages: int,
+                 truth: Optional[Dict[str, List[List[str]]]] = None) -> Dict:
+    """用一個引擎提取所有文件的前 max_pages 頁"""
+    from pdf_reader import open_pdf
+
+    pages, errors, empty = 0, 0, 0
+    recall, order = [], []
+    rss_before = peak_rss_mb()
+    started = time.perf_counter()
+    for path in paths:
+        try:
+            with open_pdf(path) as reader, backend.open(path, reader) as document:
+                for index in range(min(max_pages, document.page_count)):
+                    text = document.page_text(index)
+                    pages += 1
+                    if not text.strip():
+                        empty += 1
+                    if truth and path in truth:
+                        scores = score_page(truth[path][index], text)
+                        recall.append(scores['recall'])
+                        order.append(scores['order'])
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"{backend.name} 處理 {path} 時出錯: {str(e)}")
+            errors += 1
+    elapsed = time.perf_counter() - started
+    return {
+        'engine': backend.name,
+        'files': len(paths),
+        'pages': pages,
+        'errors': errors,
+        'empty_pages': empty,
+        'elapsed': round(elapsed, 3),
+        'pages_per_sec': round(pages / elapsed, 1) if elapsed > 0 else None,
+        'recall': round(sum(recall) / len(recall), 4) if recall else None,
+        'order': round(sum(order) / len(order), 4) if order else None,
+        'peak_rss_mb': peak_rss_mb()['self'],
+        'peak_rss_growth_mb': rss_growth_mb(rss_before)['self'],
+    }
+
+
+def format_table(reports: List[Dict]) -> str:
+    """格式化為便於閱讀的表格"""
+    header = f"{'engine':<10} {'pages':>6} {'errors':>6} {'empty':>6} {'pages/s':>9} {'recall':>7} {'order':>7}"
+    lines = [header, '-' * len(header)]
+    for report in reports:
+        lines.append(
+            f"{report['engine']:<10} {report['pages']:>6} {report['errors']:>6} {report['empty_pages']:>6} "
+            f"{_fmt(report['pages_per_sec']):>9} {_fmt(report['recall']):>7} {_fmt(report['order']):>7}"
+        )
+    return '\n'.join(lines)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.text_engines', description='PDF文本引擎基準測試')
+    parser.add_argument('--corpus', help='使用已有的PDF目錄（沒有原文，不報告質量指標）')
+    parser.add_argument('--files', type=int, default=50, help='合成語料的文件數')
+    parser.add_argument('--min-pages', type=int, default=1, help='最少頁數')
+    parser.add_argument('--max-pages', type=int, default=10, help='最多頁數，也是每個文件最多提取的頁數')
+    parser.add_argument('--two-column-fraction', type=float, default=0.5, help='雙欄排版的文件比例')
+    parser.add_argument('--seed', type=int, default=0, help='隨機種子')
+    parser.add_argument('--engines', default='auto', help='逗號分隔的引擎，默認為所有已安裝的引擎')
+    parser.add_argument('--json', action='store_true', help='以JSON輸出報告')
+    return parser
+
+
+def main(argv=None) -> int:
+    from text_backends import AUTO_ORDER, BACKENDS
+
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                        stream=sys.stderr)
+    names = AUTO_ORDER if args.engines == 'auto' else [name.strip() for name in args.engines.split(',') if name.strip()]
+    unknown = [name for name in names if name not in BACKENDS]
+    if unknown:
+        print(f"未知的引擎: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+    backends = [BACKENDS[name]() for name in names]
+    missing = [backend.name for backend in backends if not backend.is_available()]
+    backends = [backend for backend in backends if backend.is_available()]
+
+    workdir = tempfile.mkdtemp(prefix='pdf-engines-')
+    try:
+        truth = None
+        if args.corpus:
+            paths = sorted(
+                os.path.join(args.corpus, entry) for entry in os.listdir(args.corpus) if entry.lower().endswith('.pdf')
+            )
+        else:
+            truth = {}
+            paths = generate_corpus(workdir, args.files, args.min_pages, args.max_pages, seed=args.seed,
+                                    two_column_fraction=args.two_column_fraction, truth=truth)
+        reports = [bench_engine(backend, paths, args.max_pages, truth) for backend in backends]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps({'engines': reports, 'missing': missing}, ensure_ascii=False, indent=2))
+    else:
+        print(format_table(reports))
+        if missing:
+            print(f"\n未安裝: {', '.join(missing)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,330 @@
+import os
+import re
+import json
+import random
+import hashlib
+import logging
+from typing import Dict, List, Optional
+
+from metadata_cache import compute_file_hash
+from metrics import registry
+
+# 設置日誌
+logger = logging.getLogger(__name__)
+
+# MinHash 簽名長度和 LSH 分帶：16 個帶 × 每帶 4 行，相似度約 0.5 以上的文檔大概率落入同一個桶
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+
+# 按單詞 3-gram 切分首頁文本；少於此數量的文本太短，不計算 MinHash，只做字節哈希比較
+SHINGLE_SIZE = 3
+MIN_SHINGLES = 10
+
+# 每次查找最多比較的候選數
+MAX_CANDIDATES = 50
+
+POLICIES = ('report', 'link', 'move', 'off')
+
+_MERSENNE_PRIME = (1 << 61) - 1
+# 固定種子，保證不同進程和不同次運行生成的簽名可以相互比較
+_random = random.Random(20240601)
+_PERMUTATIONS = [
+    (_random.randrange(1, _MERSENNE_PRIME), _random.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERMUTATIONS)
+]
+
+FIRST_PAGE_PATTERN = re.compile(r'第1頁內容:\n(.*?)(?:\n第\d+頁內容:|\Z)', re.DOTALL)
+WORD_PATTERN = re.compile(r'[^\W_]+')
+
+DUPLICATES_FOUND = registry.counter('pdf_duplicates_total', '處理前識別出的重複文件數', ['kind'])
+
+
+def _shingles(text: str) -> set:
+    words = WORD_PATTERN.findall(text.lower())
+    return {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def _base_hash(shingle: str) -> int:
+    return int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def compute_minhash(text: str) -> Optional[List[int]]:
+    """
+    計算文本的 MinHash 簽名
+
+    兩個簽名中相等位置的比例是兩段文本單詞 3-gram 集合 Jaccard 相似度的無偏估計。
+
+    Args:
+        text (str): 文本
+
+    Returns:
+        Optional[List[int]]: 長度為 NUM_PERMUTATIONS 的簽名，文本太短時返回None
+    """
+    shingles = _shingles(text)
+    if len(shingles) < MIN_SHINGLES:
+        return None
+    hashes = [_base_hash(shingle) % _MERSENNE_PRIME for shingle in shingles]
+    return [min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def first_page_text(text: str) -> str:
+    """extract_pdf_content 文本中第一頁的內容（不含PDF屬性，不同下載來源的屬性常常不同）"""
+    match = FIRST_PAGE_PATTERN.search(text)
+    return match.group(1) if match else ''
+
+
+def compute_fingerprint(pdf_path: str, text: str = '', content_hash: Optional[str] = None) -> Dict:
+    """
+    計算文件的指紋：文件內容的 SHA-256 和首頁文本的 MinHash 簽名
+
+    Args:
+        pdf_path (str): PDF文件路徑
+        text (str): extract_pdf_content 提取的文本，為空時只計算字節哈希
+        content_hash (str, optional): 已計算的內容哈希（如緩存查找用的哈希），傳入時不再讀取文件
+
+    Returns:
+        Dict: 包含 content_hash 和 minhash（可能為None）的字典，可以在進程之間傳遞
+    """
+    return {
+        'content_hash': content_hash or compute_file_hash(pdf_path),
+        'minhash': compute_minhash(first_page_text(text)) if text else None
+    }
+
+
+def estimate_similarity(signature: List[int], other: List[int]) -> float:
+    """用兩個 MinHash 簽名估計 Jaccard 相似度"""
+    return sum(1 for a, b in zip(signature, other) if a == b) / len(signature)
+
+
+def band_values(signature: List[int]) -> List[str]:
+    """簽名每個 LSH 帶的哈希值（十六進制）"""
+    return [
+        hashlib.blake2b(
+            b''.join(value.to_bytes(8, 'big') for value in signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]),
+            digest_size=8
+        ).hexdigest()
+        for band in range(LSH_BANDS)
+    ]
+
+
+def _encode_signature(signature: Optional[List[int]]) -> Optional[str]:
+    if signature is None:
+        return None
+    return ''.join(f'{value:016x}' for value in signature)
+
+
+def _decode_signature(encoded: Optional[str]) -> Optional[List[int]]:
+    if not encoded:
+        return None
+    return [int(encoded[i:i + 16], 16) for i in range(0, len(encoded), 16)]
+
+
+class DuplicateIndex:
+    """
+    已處理論文的重複檢測索引
+
+    按文件內容哈希查找完全相同的文件，按首頁文本的 MinHash 簽名在 LSH 分帶表中查找
+    相似的文件（如同一論文的預印本和正式版），只需比較落入相同桶的候選，不需遍歷整個庫。
+    用法與 Flask 擴展相同：先創建實例，再調用 init_app(app)。
+
+    只有成功命名的原始文件會寫入索引；同一批中內容完全相同的副本由 BatchProcessor 按內容哈希識別，
+    同一批中並行處理的近似重複文件可能都不會被識別。
+    """
+    def __init__(self, app=None):
+        """初始化索引，未綁定應用前索引處於停用狀態"""
+        self.app = None
+        self.policy = 'off'
+        self.duplicates_dir = 'duplicates'
+        self.min_similarity = 0.8
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        綁定Flask應用並從環境變量讀取配置
+
+        環境變量:
+            DUPLICATE_POLICY: 發現重複時的處理方式 report/link/move/off（默認 report）
+            DUPLICATES_DIR: move 策略的目標目錄，相對路徑相對於重複文件所在目錄（默認 duplicates）
+            DUPLICATE_MIN_SIMILARITY: 視為近似重複的最低估計相似度（默認 0.8）
+        """
+        from models import db, PaperFingerprint, FingerprintBand
+
+        self.app = app
+        self._db = db
+        self._model = PaperFingerprint
+        self._band_model = FingerprintBand
+        self.policy = os.environ.get("DUPLICATE_POLICY", "report").lower()
+        if self.policy not in POLICIES:
+            logger.warning(f"未知的重複處理策略 {self.policy}，使用 report")
+            self.policy = 'report'
+        self.duplicates_dir = os.environ.get("DUPLICATES_DIR", "duplicates")
+        self.min_similarity = float(os.environ.get("DUPLICATE_MIN_SIMILARITY", 0.8))
+        logger.info(f"重複檢測策略: {self.policy}，近似重複閾值 {self.min_similarity}")
+
+    def is_enabled(self) -> bool:
+        """索引是否可用"""
+        return self.policy != 'off' and self.app is not None
+
+    def duplicates_directory(self, pdf_path: str) -> str:
+        """move 策略下重複文件的目標目錄"""
+        directory = os.path.dirname(pdf_path)
+        if os.path.isabs(self.duplicates_dir):
+            return self.duplicates_dir
+        if os.path.basename(os.path.abspath(directory)) == os.path.normpath(self.duplicates_dir):
+            # 文件已在重複文件目錄中，不再嵌套
+            return directory
+        return os.path.join(directory, self.duplicates_dir)
+
+    def find(self, pdf_path: str, fingerprint: Optional[Dict]) -> Optional[Dict]:
+        """
+        查找與文件重複的已處理論文
+
+        Args:
+            pdf_path (str): PDF文件路徑（索引中同一路徑的記錄不算重複）
+            fingerprint (Dict, optional): compute_fingerprint() 的結果
+
+        Returns:
+            Optional[Dict]: 找到時返回 path、metadata、similarity 和 exact，否則返回None
+        """
+        if not self.is_enabled() or not fingerprint:
+            return None
+
+        try:
+            path = os.path.abspath(pdf_path)
+            signature = fingerprint.get('minhash')
+            with self.app.app_context():
+                model, band_model = self._model, self._band_model
+                if fingerprint.get('content_hash'):
+                    for entry in model.query.filter(model.content_hash == fingerprint['content_hash'], model.path != path):
+                        if os.path.exists(entry.path):
+                            DUPLICATES_FOUND.inc(kind='exact')
+                            return self._match(entry, 1.0, True)
+                if signature is None:
+                    return None
+
+                # 共享的帶越多，相似度通常越高；候選超出上限時優先比較這些
+                bands = band_values(signature)
+                candidate_ids = [
+                    row.fingerprint_id for row in band_model.query
+                    .with_entities(band_model.fingerprint_id)
+                    .filter(self._db.or_(*(
+                        self._db.and_(band_model.band == band, band_model.value == value)
+                        for band, value in enumerate(bands)
+                    )))
+                    .group_by(band_model.fingerprint_id)
+                    .order_by(self._db.func.count().desc(), band_model.fingerprint_id)
+                    .limit(MAX_CANDIDATES)
+                ]
+                best, best_similarity = None, 0.0
+                if candidate_ids:
+                    for entry in model.query.filter(model.id.in_(candidate_ids), model.path != path):
+                        similarity = estimate_similarity(signature, _decode_signature(entry.minhash))
+                        if similarity > best_similarity and os.path.exists(entry.path):
+                            best, best_similarity = entry, similarity
+                if best is None or best_similarity < self.min_similarity:
+                    return None
+                DUPLICATES_FOUND.inc(kind='near')
+                return self._match(best, best_similarity, False)
+
+        except Exception as e:
+            logger.warning(f"查找重複文件時出錯: {str(e)}")
+            return None
+
+    @staticmethod
+    def _match(entry, similarity: float, exact: bool) -> Dict:
+        return {
+            'path': entry.path,
+            'metadata': json.loads(entry.metadata_json) if entry.metadata_json else {},
+            'similarity': round(similarity, 3),
+            'exact': exact
+        }
+
+    def record(self, pdf_path: str, fingerprint: Optional[Dict], metadata: Dict[str, str],
+               previous_path: Optional[str] = None) -> None:
+        """
+        把成功命名的文件加入索引
+
+        Args:
+            pdf_path (str): 文件的當前路徑
+            fingerprint (Dict, optional): compute_fingerprint() 的結果
+            metadata (Dict[str, str]): 文件的元數據，之後的重複文件直接沿用
+            previous_path (str, optional): 重命名前的路徑，已有記錄時更新為新路徑
+        """
+        if not self.is_enabled() or not fingerprint:
+            return
+
+        try:
+            path = os.path.abspath(pdf_path)
+            paths = {path, os.path.abspath(previous_path)} if previous_path else {path}
+            signature = fingerprint.get('minhash')
+            with self.app.app_context():
+                entries = self._model.query.filter(self._model.path.in_(paths)).all()
+                entry = next((item for item in entries if item.path == path), entries[0] if entries else None)
+                for stale in entries:
+                    if stale is not entry:
+                        self._db.session.delete(stale)
+                self._db.session.flush()
+                if entry is None:
+                    entry = self._model(path=path)
+                    self._db.session.add(entry)
+                entry.path = path
+                entry.content_hash = fingerprint.get('content_hash')
+                entry.metadata_json = json.dumps(metadata, ensure_ascii=False)
+                # 命中緩存的文件沒有提取文本，只有字節哈希，保留已有的簽名
+                if signature is not None:
+                    entry.minhash = _encode_signature(signature)
+                    self._db.session.flush()
+                    self._band_model.query.filter_by(fingerprint_id=entry.id).delete(synchronize_session=False)
+                    self._db.session.add_all(
+                        self._band_model(fingerprint_id=entry.id, band=band, value=value)
+                        for band, value in enumerate(band_values(signature))
+                    )
+                self._db.session.commit()
+        except Exception as e:
+            logger.warning(f"更新重複檢測索引時出錯: {str(e)}")
+
+    def update_path(self, old_path: str, new_path: str) -> None:
+        """
+        文件被移動（如撤銷重命名）後更新索引中的路徑
+
+        Args:
+            old_path (str): 原始路徑
+            new_path (str): 新路徑
+        """
+        if self.app is None:
+            return
+
+        try:
+            with self.app.app_context():
+                entry = self._model.query.filter_by(path=os.path.abspath(old_path)).first()
+                if entry:
+                    stale = self._model.query.filter_by(path=os.path.abspath(new_path)).first()
+                    if stale:
+                        self._db.session.delete(stale)
+                        self._db.session.flush()
+                    entry.path = os.path.abspath(new_path)
+                    self._db.session.commit()
+        except Exception as e:
+            logger.warning(f"更新重複檢測索引路徑時出錯: {str(e)}")
+
+    def clear(self) -> int:
+        """
+        清空索引
+
+        Returns:
+            int: 刪除的條目數
+        """
+        if self.app is None:
+            return 0
+
+        with self.app.app_context():
+            self._band_model.query.delete()
+            deleted = self._model.query.delete()
+            self._db.session.commit()
+        logger.info(f"已清空重複檢測索引，共 {deleted} 條")
+        return deleted
+
+
+# 全局索引實例，由 app.py 調用 init_app 綁定
+duplicate_index = DuplicateIndex()
@@ -0,0 +1,286 @@
+import os
+import re
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+
+from metrics import registry
+
+# 設置日誌
+logger = logging.getLogger(__name__)
+
+# 逗號分隔的後端列表，按順序嘗試，前一個結果缺少主要字段時升級到下一個
+DEFAULT_BACKENDS = "siliconflow"
+
+ESCALATIONS = registry.counter(
+    'pdf_extractor_escalations_total', '因結果缺少主要字段而升級到下一個提取後端的次數', ['backend']
+)
+
+
+class MetadataExtractor:
+    """
+    元數據提取後端的公共接口
+
+    子類實現 extract_pdf_metadata()；extract_pdf_metadata_batch() 默認逐篇調用，
+    支持打包請求的後端可以覆蓋。
+    """
+    name = ''
+    model = ''
+
+    def is_available(self) -> bool:
+        """後端是否已配置可用"""
+        return True
+
+    def extract_pdf_metadata(self, text: str, fetch_more: Optional[Callable[[], str]] = None) -> Dict[str, str]:
+        """
+        從PDF文本提取元數據
+
+        Args:
+            text (str): PDF文本內容
+            fetch_more (Callable[[], str], optional): 返回後續頁面文本的函數，結果缺少主要字段時可調用
+
+        Returns:
+            Dict[str, str]: 包含元數據的字典
+        """
+        raise NotImplementedError
+
+    def extract_pdf_metadata_batch(self, documents: Dict[str, str],
+                                   fetch_more: Optional[Callable[[str], str]] = None) -> Dict[str, Dict[str, str]]:
+        """
+        批量提取多個文檔的元數據
+
+        Args:
+            documents (Dict[str, str]): 文檔ID到PDF文本的映射
+            fetch_more (Callable[[str], str], optional): 按文檔ID返回後續頁面文本的函數
+
+        Returns:
+            Dict[str, Dict[str, str]]: 文檔ID到元數據字典的映射
+        """
+        return {
+            doc_id: self.extract_pdf_metadata(text, (lambda doc_id=doc_id: fetch_more(doc_id)) if fetch_more else None)
+            for doc_id, text in documents.items()
+        }
+
+    def _empty_metadata(self) -> Dict[str, str]:
+        """返回所有字段為空的元數據"""
+        return {
+            'author_lastname': '',
+            'journal': '',
+            'journal_abbr': '',
+            'year': '',
+            'title': '',
+            'doc_type': 'paper'
+        }
+
+    def _has_essential_fields(self, result: Dict[str, str]) -> bool:
+        """
+        檢查是否提取到了主要字段
+
+        Args:
+            result (Dict[str, str]): 提取的元數據
+
+        Returns:
+            bool: 如果主要字段存在則返回True
+        """
+        essential_fields = ['author_lastname', 'title', 'year']
+        return all(bool(result.get(field)) for field in essential_fields)
+
+
+class HeuristicExtractor(MetadataExtractor):
+    """
+    不調用任何模型，按論文首頁的常見版式用規則提取元數據
+
+    假設首頁依次是標題、作者行和期刊信息；速度快、無成本，適合作為升級鏈中的第一級。
+    """
+    name = 'heuristic'
+    model = 'heuristic-v1'
+
+    PAGE_PATTERN = re.compile(r'第1頁內容:\n(.*?)(?:\n第\d+頁內容:|\Z)', re.DOTALL)
+    YEAR_PATTERN = re.compile(r'\b(?:19|20)\d{2}\b')
+    COPYRIGHT_YEAR_PATTERN = re.compile(r'(?:©|\(c\)|copyright)\D{0,20}?((?:19|20)\d{2})', re.IGNORECASE)
+    NAME_PATTERN = re.compile(r"^[A-Z][\w.'\-]*(?:\s+[A-Z][\w.'\-]*)+")
+    VENUE_PATTERN = re.compile(
+        r'\b(?:journal|transactions|proceedings|letters|review|conference|symposium|communications|annals)\b',
+        re.IGNORECASE
+    )
+    # 不可能是標題的行：鏈接、郵箱、版權、期刊卷期等
+    NOT_TITLE_PATTERN = re.compile(
+        r'https?://|www\.|@|©|copyright|\bdoi\b|\bissn\b|\bvol\b|\bvolume\b|arxiv|received|accepted|published',
+        re.IGNORECASE
+    )
+    HEADER_LINES = 15
+
+    def extract_pdf_metadata(self, text: str, fetch_more: Optional[Callable[[], str]] = None) -> Dict[str, str]:
+        metadata = self._empty_metadata()
+        match = self.PAGE_PATTERN.search(text)
+        page = match.group(1) if match else text
+        lines = [line.strip() for line in page.splitlines() if line.strip()][:self.HEADER_LINES]
+
+        title_index = next((i for i, line in enumerate(lines) if self._looks_like_title(line)), None)
+        if title_index is not None:
+            metadata['title'] = lines[title_index]
+            for line in lines[title_index + 1:title_index + 4]:
+                lastname = self._first_author_lastname(line)
+                if lastname:
+                    metadata['author_lastname'] = lastname
+                    break
+
+        venue = next((line for line in lines if self.VENUE_PATTERN.search(line) and line != metadata['title']), '')
+        if venue:
+            metadata['journal'] = re.split(r',|\d', venue, maxsplit=1)[0].strip()
+
+        year = self.COPYRIGHT_YEAR_PATTERN.search(page) or self.YEAR_PATTERN.search(venue) or \
+            self.YEAR_PATTERN.search('\n'.join(lines))
+        if year:
+            metadata['year'] = year.group(1) if year.groups() else year.group(0)
+        return metadata
+
+    def _looks_like_title(self, line: str) -> bool:
+        words = line.split()
+        return (
+            4 <= len(words) <= 30 and 20 <= len(line) <= 250
+            and not self.NOT_TITLE_PATTERN.search(line)
+            and not self.VENUE_PATTERN.search(line)
+            and sum(char.isdigit() for char in line) < 5
+        )
+
+    def _first_author_lastname(self, line: str) -> str:
+        """作者行中第一個姓名的最後一個詞（去掉上標數字和符號）"""
+        first = re.split(r',|;|\band\b|&', line)[0].strip()
+        first = re.sub(r'[\d*†‡§¹²³]+', '', first).strip()
+        if not self.NAME_PATTERN.match(first) or len(first.split()) > 4:
+            return ''
+        lastname = first.split()[-1].strip('.')
+        return lastname if len(lastname) > 1 else ''
+
+
+class ExtractorRouter(MetadataExtractor):
+    """
+    按順序嘗試多個後端，結果缺少主要字段時升級到下一個後端
+
+    前面後端提取到的字段會保留，用於補全後面後端未給出的字段。
+    讀取更多頁面（fetch_more）只交給最後一個後端，避免每一級都重新解析PDF。
+    """
+    name = 'router'
+
+    def __init__(self, backends: List[MetadataExtractor]):
+        self.backends = backends
+        # 緩存條目與後端組合綁定，組合變化後重新提取
+        self.model = '>'.join(backend.model for backend in backends)
+
+    def available_backends(self) -> List[MetadataExtractor]:
+        return [backend for backend in self.backends if backend.is_available()]
+
+    def is_available(self) -> bool:
+        return bool(self.available_backends())
+
+    def extract_pdf_metadata(self, text: str, fetch_more: Optional[Callable[[], str]] = None) -> Dict[str, str]:
+        backends = self.available_backends()
+        result = self._empty_metadata()
+        for index, backend in enumerate(backends):
+            is_last = index == len(backends) - 1
+            metadata = backend.extract_pdf_metadata(text, fetch_more if is_last else None)
+            result = self._merge(metadata, result)
+            if self._has_essential_fields(result) or is_last:
+                break
+            logger.info(f"{backend.name} 後端結果缺少主要字段，升級到 {backends[index + 1].name}")
+            ESCALATIONS.inc(backend=backends[index + 1].name)
+        return result
+
+    def extract_pdf_metadata_batch(self, documents: Dict[str, str],
+                                   fetch_more: Optional[Callable[[str], str]] = None) -> Dict[str, Dict[str, str]]:
+        backends = self.available_backends()
+        results = {doc_id: self._empty_metadata() for doc_id in documents}
+        pending = dict(documents)
+        for index, backend in enumerate(backends):
+            is_last = index == len(backends) - 1
+            batch = backend.extract_pdf_metadata_batch(pending, fetch_more if is_last else None)
+            for doc_id, metadata in batch.items():
+                results[doc_id] = self._merge(metadata, results[doc_id])
+            pending = {doc_id: text for doc_id, text in pending.items() if not self._has_essential_fields(results[doc_id])}
+            if not pending or is_last:
+                break
+            logger.info(f"{len(pending)} 個文檔的 {backend.name} 結果缺少主要字段，升級到 {backends[index + 1].name}")
+            ESCALATIONS.inc(len(pending), backend=backends[index + 1].name)
+        return results
+
+    @staticmethod
+    def _merge(metadata: Dict[str, str], fallback: Dict[str, str]) -> Dict[str, str]:
+        """用前一級的結果填充本級未給出的字段"""
+        merged = dict(metadata or {})
+        for field, value in fallback.items():
+            if value and not merged.get(field):
+                merged[field] = value
+        return merged
+
+
+def _siliconflow():
+    from ai_metadata_extractor import SiliconFlowQwenExtractor
+    return SiliconFlowQwenExtractor()
+
+
+def _openai_compatible():
+    from ai_metadata_extractor import OpenAICompatibleExtractor
+    return OpenAICompatibleExtractor()
+
+
+# 後端名稱到工廠函數的映射，工廠在首次使用時才調用（導入模型客戶端較慢）
+BACKEND_FACTORIES: Dict[str, Callable[[], MetadataExtractor]] = {
+    'siliconflow': _siliconflow,
+    'openai': _openai_compatible,
+    'heuristic': HeuristicExtractor,
+}
+
+_lock = threading.Lock()
+_backends: Dict[str, MetadataExtractor] = {}
+_extractor: Optional[ExtractorRouter] = None
+
+
+def register_backend(name: str, factory: Callable[[], MetadataExtractor]) -> None:
+    """
+    註冊自定義後端
+
+    Args:
+        name (str): 在 EXTRACTOR_BACKENDS 中使用的名稱
+        factory (Callable[[], MetadataExtractor]): 創建後端實例的函數
+    """
+    with _lock:
+        BACKEND_FACTORIES[name] = factory
+        _backends.pop(name, None)
+    reset_extractor()
+
+
+def get_backend(name: str) -> MetadataExtractor:
+    """按名稱獲取後端實例，首次使用時創建"""
+    with _lock:
+        backend = _backends.get(name)
+        if backend is None:
+            if name not in BACKEND_FACTORIES:
+                raise ValueError(f"未知的提取後端: {name}（可選 {', '.join(sorted(BACKEND_FACTORIES))}）")
+            backend = _backends[name] = BACKEND_FACTORIES[name]()
+        return backend
+
+
+def get_extractor() -> ExtractorRouter:
+    """
+    按 EXTRACTOR_BACKENDS 配置的順序組合後端，首次調用時創建
+
+    例如 "heuristic,openai,siliconflow" 先用規則提取，缺少主要字段時交給本地模型，
+    仍不完整時再調用 SiliconFlow 上的大模型。
+    """
+    global _extractor
+    if _extractor is None:
+        names = [name.strip() for name in os.environ.get("EXTRACTOR_BACKENDS", DEFAULT_BACKENDS).split(',') if name.strip()]
+        router = ExtractorRouter([get_backend(name) for name in names])
+        logger.info(f"元數據提取後端: {' > '.join(names)}")
+        with _lock:
+            if _extractor is None:
+                _extractor = router
+    return _extractor
+
+
+def reset_extractor() -> None:
+    """丟棄已創建的後端組合，下次 get_extractor() 時按當前配置重建"""
+    global _extractor
+    with _lock:
+        _extractor = None
@@ -0,0 +1,190 @@
+import os
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, Tuple
+
+# 設置日誌
+logger = logging.getLogger(__name__)
+
+# 每次查詢索引時處理的文件數
+INDEX_QUERY_BATCH = 500
+
+
+def scan_pdf_files(root: str, recursive: bool = True) -> Iterator[Tuple[str, os.stat_result]]:
+    """
+    用 os.scandir 流式遍歷目錄中的PDF文件
+
+    使用顯式棧代替遞歸，不構建完整文件列表；不跟隨目錄符號鏈接（避免循環），
+    跳過隱藏目錄，無權限訪問的目錄只記錄警告。
+
+    Args:
+        root (str): 起始目錄
+        recursive (bool): 是否遍歷子目錄
+
+    Yields:
+        Tuple[str, os.stat_result]: 文件路徑及其stat信息
+    """
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if recursive and not entry.name.startswith('.'):
+                                stack.append(entry.path)
+                        elif entry.name.lower().endswith('.pdf') and entry.is_file():
+                            yield entry.path, entry.stat()
+                    except OSError as e:
+                        logger.warning(f"無法讀取 {entry.path}: {str(e)}")
+        except OSError as e:
+            logger.warning(f"無法掃描目錄 {directory}: {str(e)}")
+
+
+def _signature(stat: os.stat_result) -> Tuple[int, int, float]:
+    """文件的 (inode, 大小, 修改時間) 簽名"""
+    return stat.st_ino, stat.st_size, stat.st_mtime
+
+
+class FileIndex:
+    """
+    持久化的文件索引，記錄已處理文件的 (路徑, inode, 大小, 修改時間)
+
+    重新掃描時只返回新增或發生變化的文件。用法與 Flask 擴展相同：先創建實例，再調用 init_app(app)；
+    未綁定應用時所有文件都視為需要處理。
+    """
+    def __init__(self, app=None):
+        """初始化索引，未綁定應用前索引處於停用狀態"""
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """綁定Flask應用"""
+        from models import db, IndexedFile
+
+        self.app = app
+        self._db = db
+        self._model = IndexedFile
+
+    def is_enabled(self) -> bool:
+        """索引是否可用"""
+        return self.app is not None
+
+    def filter_changed(self, files: Iterable[Tuple[str, os.stat_result]]) -> Iterator[str]:
+        """
+        過濾出索引中不存在或簽名已變化的文件，按批查詢數據庫以保持流式處理
+
+        Args:
+            files (Iterable[Tuple[str, os.stat_result]]): scan_pdf_files 的輸出
+
+        Yields:
+            str: 需要處理的文件路徑
+        """
+        batch = []
+        for item in files:
+            batch.append(item)
+            if len(batch) >= INDEX_QUERY_BATCH:
+                yield from self._changed_in(batch)
+                batch = []
+        if batch:
+            yield from self._changed_in(batch)
+
+    def _changed_in(self, batch) -> Iterator[str]:
+        """返回一批文件中需要處理的路徑"""
+        if not self.is_enabled():
+            return iter([path for path, _ in batch])
+
+        try:
+            known = self._lookup([os.path.abspath(path) for path, _ in batch])
+        except Exception as e:
+            logger.warning(f"查詢文件索引時出錯: {str(e)}")
+            known = {}
+        return iter([
+            path for path, stat in batch
+            if known.get(os.path.abspath(path)) != _signature(stat)
+        ])
+
+    def _lookup(self, paths) -> Dict[str, Tuple[int, int, float]]:
+        """查詢一批路徑在索引中的簽名"""
+        model = self._model
+        with self.app.app_context():
+            rows = (
+                model.query
+                .with_entities(model.path, model.inode, model.size, model.mtime)
+                .filter(model.path.in_(paths))
+                .all()
+            )
+        return {row.path: (row.inode, row.size, row.mtime) for row in rows}
+
+    def record(self, result: Dict) -> None:
+        """
+        根據處理結果更新索引
+
+        成功、跳過或識別為重複的文件以最終路徑記錄，重命名時刪除原路徑；出錯的文件不記錄，下次掃描會重試。
+
+        Args:
+            result (Dict): process_pdf_file 或批處理引擎返回的結果字典
+        """
+        if not self.is_enabled() or result.get('status') not in ('success', 'skipped', 'duplicate'):
+            return
+
+        original_path = os.path.abspath(result.get('original_path', ''))
+        path = os.path.abspath(result.get('new_path') or original_path)
+        try:
+            stat = os.stat(path)
+            with self.app.app_context():
+                if path != original_path:
+                    self._model.query.filter_by(path=original_path).delete(synchronize_session=False)
+                entry = self._model.query.filter_by(path=path).first()
+                if entry is None:
+                    entry = self._model(path=path)
+                    self._db.session.add(entry)
+                entry.inode, entry.size, entry.mtime = _signature(stat)
+                entry.status = result['status']
+                entry.indexed_at = datetime.utcnow()
+                self._db.session.commit()
+        except Exception as e:
+            logger.warning(f"更新文件索引時出錯: {str(e)}")
+
+    def update_path(self, old_path: str, new_path: str) -> None:
+        """
+        文件被移動（如撤銷重命名）後更新索引中的路徑，簽名不變，重新掃描時不會再處理
+
+        Args:
+            old_path (str): 原始路徑
+            new_path (str): 新路徑
+        """
+        if not self.is_enabled():
+            return
+
+        try:
+            with self.app.app_context():
+                entry = self._model.query.filter_by(path=os.path.abspath(old_path)).first()
+                if entry:
+                    self._model.query.filter_by(path=os.path.abspath(new_path)).delete(synchronize_session=False)
+                    entry.path = os.path.abspath(new_path)
+                    self._db.session.commit()
+        except Exception as e:
+            logger.warning(f"更新文件索引路徑時出錯: {str(e)}")
+
+    def clear(self) -> int:
+        """
+        清空文件索引，下次掃描將重新處理所有文件
+
+        Returns:
+            int: 刪除的條目數
+        """
+        if not self.is_enabled():
+            return 0
+
+        with self.app.app_context():
+            deleted = self._model.query.delete()
+            self._db.session.commit()
+        logger.info(f"已清空文件索引，共 {deleted} 條")
+        return deleted
+
+
+# 全局索引實例，由 app.py 調用 init_app 綁定
+file_index = FileIndex()
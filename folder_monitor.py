@@ -1,35 +1,183 @@
 import os
 import time
+import itertools
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 from pdf_processor import process_pdf_file
+from batch_processor import BatchProcessor
+from file_index import file_index, scan_pdf_files
+from job_queue import job_queue
+from rename_journal import rename_journal
+
+# Seconds a file's size and mtime must stay unchanged before it is processed
+WATCH_DEBOUNCE_SECONDS = float(os.environ.get("WATCH_DEBOUNCE_SECONDS", 2.0))
+# Number of worker threads processing files reported by watchdog
+WATCH_WORKERS = int(os.environ.get("WATCH_WORKERS", os.environ.get("API_CONCURRENCY", 4)))
+# How long events on a file we renamed ourselves are ignored
+RENAME_IGNORE_SECONDS = 30.0
+# Whether subdirectories are scanned and watched
+WATCH_RECURSIVE = os.environ.get("WATCH_RECURSIVE", "1").lower() not in ("0", "false", "no")
+
+
+class DebouncedEventQueue:
+    """
+    Coalesces file events per path and hands stable files to a worker pool
+
+    A path is only dispatched once its size and mtime have stayed unchanged for
+    ``debounce_seconds``, so a download firing many modified events is processed
+    once after it has been fully written.
+    """
+
+    def __init__(self, process, debounce_seconds=None, workers=None):
+        """
+        Initialize the queue
+
+        Args:
+            process (function): Called with a path from a worker thread, returns a result dict
+            debounce_seconds (float, optional): Stability window, defaults to WATCH_DEBOUNCE_SECONDS
+            workers (int, optional): Worker thread count, defaults to WATCH_WORKERS
+        """
+        self.process = process
+        self.debounce_seconds = WATCH_DEBOUNCE_SECONDS if debounce_seconds is None else debounce_seconds
+        self.logger = logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._pending = {}      # path -> (size, mtime, stable_since)
+        self._running = set()
+        self._ignored = {}      # path -> expiry time
+        self._stopped = False
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers or WATCH_WORKERS,
+            thread_name_prefix="pdf-watch"
+        )
+        self._thread = threading.Thread(target=self._run, name="pdf-debounce", daemon=True)
+        self._thread.start()
+
+    def put(self, path):
+        """Queue a path, restarting its stability window if it is already pending"""
+        now = time.time()
+        with self._wakeup:
+            if self._stopped or self._is_ignored(path, now):
+                return
+            self._pending[path] = (None, None, now)
+            self._wakeup.notify()
+
+    def ignore(self, path, seconds=RENAME_IGNORE_SECONDS):
+        """Drop events for a path for a while, e.g. the target of our own rename"""
+        with self._lock:
+            self._ignored[path] = time.time() + seconds
+            self._pending.pop(path, None)
+
+    def pending_count(self):
+        """Number of paths waiting to become stable or being processed"""
+        with self._lock:
+            return len(self._pending) + len(self._running)
+
+    def stop(self):
+        """Stop dispatching and discard work that has not started"""
+        with self._wakeup:
+            self._stopped = True
+            self._pending.clear()
+            self._wakeup.notify()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _is_ignored(self, path, now):
+        """Whether events for path are currently ignored, expiring stale entries"""
+        expiry = self._ignored.get(path)
+        if expiry is None:
+            return False
+        if expiry < now:
+            del self._ignored[path]
+            return False
+        return True
+
+    def _run(self):
+        """Poll pending paths and dispatch those whose size and mtime are stable"""
+        poll_interval = max(min(self.debounce_seconds / 2, 1.0), 0.05)
+        with self._wakeup:
+            while not self._stopped:
+                if not self._pending:
+                    self._wakeup.wait()
+                    continue
+                self._wakeup.wait(poll_interval)
+                if self._stopped:
+                    break
+                now = time.time()
+                for path, (size, mtime, stable_since) in list(self._pending.items()):
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        # Deleted or moved away before it settled
+                        del self._pending[path]
+                        continue
+                    if (stat.st_size, stat.st_mtime) != (size, mtime):
+                        self._pending[path] = (stat.st_size, stat.st_mtime, now)
+                    elif now - stable_since >= self.debounce_seconds and path not in self._running:
+                        del self._pending[path]
+                        self._running.add(path)
+                        self._executor.submit(self._work, path)
+
+    def _work(self, path):
+        """Process a stable path and ignore the events caused by renaming it"""
+        try:
+            result = self.process(path)
+            new_path = result.get("new_path") if isinstance(result, dict) else None
+            if new_path and new_path != path:
+                self.ignore(new_path)
+        except Exception as e:
+            self.logger.error(f"Error in watch worker for {path}: {str(e)}")
+        finally:
+            with self._lock:
+                self._running.discard(path)
+
 
 class PDFHandler(FileSystemEventHandler):
     """Handler for PDF file events"""
     
-    def __init__(self, callback):
-        """Initialize with a callback function"""
+    def __init__(self, callback, debounce_seconds=None, workers=None, commit_journal=True):
+        """Initialize with a callback function; see FolderMonitor for commit_journal"""
         self.callback = callback
+        self.commit_journal = commit_journal
         self.logger = logging.getLogger(__name__)
+        # All renames made while watching form one batch in the rename journal
+        self.journal_batch = rename_journal.begin_batch()
+        self.queue = DebouncedEventQueue(self._process_pdf, debounce_seconds, workers)
     
     def on_created(self, event):
         """Called when a file is created"""
         if not event.is_directory and event.src_path.lower().endswith('.pdf'):
             self.logger.info(f"New PDF detected: {event.src_path}")
-            self._process_pdf(event.src_path)
+            self.queue.put(event.src_path)
     
     def on_modified(self, event):
         """Called when a file is modified"""
         if not event.is_directory and event.src_path.lower().endswith('.pdf'):
-            self.logger.info(f"Modified PDF detected: {event.src_path}")
-            self._process_pdf(event.src_path)
+            self.logger.debug(f"Modified PDF detected: {event.src_path}")
+            self.queue.put(event.src_path)
+    
+    def on_moved(self, event):
+        """Called when a file is moved, e.g. a finished download renamed to .pdf"""
+        if not event.is_directory and event.dest_path.lower().endswith('.pdf'):
+            self.queue.put(event.dest_path)
+    
+    def stop(self):
+        """Stop the event queue and its workers"""
+        self.queue.stop()
+        rename_journal.end_batch(self.journal_batch)
     
     def _process_pdf(self, pdf_path):
         """Process the PDF file and invoke callback"""
         try:
-            result = process_pdf_file(pdf_path)
+            result = process_pdf_file(pdf_path, journal_batch=self.journal_batch)
             self.callback(result)
+            # Commit the rename only once the callback has recorded the result
+            if self.commit_journal:
+                rename_journal.commit(result)
+            return result
         except Exception as e:
             error_message = f"Error processing {pdf_path}: {str(e)}"
             self.logger.error(error_message)
@@ -43,17 +191,27 @@ class PDFHandler(FileSystemEventHandler):
 class FolderMonitor:
     """Monitors a folder for PDF files"""
     
-    def __init__(self, directory, callback):
+    def __init__(self, directory, callback, recursive=None, job_id=None, batch_options=None, commit_journal=True):
         """
         Initialize the monitor
         
         Args:
             directory (str): Directory to monitor
             callback (function): Function to call when a file is processed
+            recursive (bool, optional): Include subdirectories, defaults to WATCH_RECURSIVE
+            job_id (int, optional): Existing job to resume, a new job is created when omitted
+            batch_options (dict, optional): Extra BatchProcessor arguments, e.g. shared pools
+            commit_journal (bool): Commit each rename in the journal once the callback returns. Pass False
+                when the callback only buffers results and commits them after they are persisted
         """
         self.directory = directory
-        self.callback = callback
+        self.user_callback = callback
+        self.recursive = WATCH_RECURSIVE if recursive is None else recursive
+        self.job_id = job_id
         self.observer = None
+        self.event_handler = None
+        self.commit_journal = commit_journal
+        self.batch_processor = BatchProcessor(self.callback, commit_journal=commit_journal, **(batch_options or {}))
         self.logger = logging.getLogger(__name__)
         
     def start(self):
@@ -64,9 +222,9 @@ class FolderMonitor:
         self._process_existing_files()
         
         # Set up watchdog observer
-        event_handler = PDFHandler(self.callback)
+        self.event_handler = PDFHandler(self.callback, commit_journal=self.commit_journal)
         self.observer = Observer()
-        self.observer.schedule(event_handler, self.directory, recursive=False)
+        self.observer.schedule(self.event_handler, self.directory, recursive=self.recursive)
         self.observer.start()
         
         try:
@@ -78,37 +236,63 @@ class FolderMonitor:
             self.stop()
     
     def stop(self):
-        """Stop monitoring the directory"""
+        """Stop monitoring the directory and cancel any running batch"""
+        self.batch_processor.cancel()
         if self.observer:
             self.logger.info("Stopping directory monitor")
             self.observer.stop()
             self.observer.join()
             self.observer = None
+        if self.event_handler:
+            self.event_handler.stop()
+            self.event_handler = None
+    
+    def callback(self, result):
+        """Record the result in the file index and job queue, then forward it to the user callback"""
+        file_index.record(result)
+        if self.job_id is not None:
+            job_queue.complete(self.job_id, result)
+        self.user_callback(result)
     
     def _process_existing_files(self):
-        """Process PDF files that already exist in the directory"""
+        """
+        Process PDF files that already exist in the directory using the batch engine
+        
+        The tree is streamed with os.scandir and files whose (inode, size, mtime)
+        match the persistent file index are skipped. When the job queue is
+        available, the scan feeds a durable job that the batch engine pulls
+        from, so an interrupted batch can be resumed with the same job_id.
+        """
         self.logger.info(f"Checking for existing PDF files in {self.directory}")
+        if not os.path.isdir(self.directory):
+            self.logger.error(f"Directory does not exist: {self.directory}")
+            return
+        
+        changed_files = file_index.filter_changed(scan_pdf_files(self.directory, self.recursive))
+        if not job_queue.is_enabled():
+            self.batch_processor.run(changed_files)
+            self.logger.info(f"Processed {self.batch_processor.total} new or changed PDF files")
+            return
+        
+        if self.job_id is None:
+            self.job_id = job_queue.create_job(self.directory)
+        job_queue.start_job(self.job_id)
+        
+        scanner = threading.Thread(
+            target=self._enqueue_files, args=(changed_files,), name=f"job-{self.job_id}-scan", daemon=True
+        )
+        scanner.start()
+        self.batch_processor.run(job_queue.iter_tasks(self.job_id, self.batch_processor.is_cancelled))
+        job_queue.finish_job(self.job_id, cancelled=self.batch_processor.is_cancelled())
+        self.logger.info(f"Job {self.job_id} processed {self.batch_processor.total} PDF files")
+    
+    def _enqueue_files(self, paths):
+        """Add scanned files to the job, then mark the scan complete"""
         try:
-            files = [f for f in os.listdir(self.directory) 
-                    if os.path.isfile(os.path.join(self.directory, f)) 
-                    and f.lower().endswith('.pdf')]
-            
-            self.logger.info(f"Found {len(files)} existing PDF files")
-            
-            for filename in files:
-                filepath = os.path.join(self.directory, filename)
-                self.logger.info(f"Processing existing file: {filepath}")
-                try:
-                    result = process_pdf_file(filepath)
-                    self.callback(result)
-                except Exception as e:
-                    error_message = f"Error processing existing file {filepath}: {str(e)}"
-                    self.logger.error(error_message)
-                    self.callback({
-                        "status": "error",
-                        "original_path": filepath,
-                        "error": str(e),
-                        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
-                    })
+            not_cancelled = lambda _: not self.batch_processor.is_cancelled()
+            added = job_queue.enqueue(self.job_id, itertools.takewhile(not_cancelled, paths))
+            self.logger.info(f"Job {self.job_id}: queued {added} new or changed PDF files")
         except Exception as e:
-            self.logger.error(f"Error listing directory contents: {str(e)}")
+            self.logger.error(f"Error scanning {self.directory}: {str(e)}")
+        finally:
+            job_queue.mark_scanned(self.job_id)
\ No newline at end of file
@@ -0,0 +1,271 @@
+import os
+import re
+import time
+import zlib
+import logging
+from datetime import datetime
+from typing import Dict, Optional
+
+# 設置日誌
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'paper_text_fts'
+# 無內容（contentless）的FTS5表只保存倒排索引，原文壓縮後保存在 paper_texts 中
+FTS_SCHEMA = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "title, author, journal, body, content='', tokenize='unicode61 remove_diacritics 2')"
+)
+# bm25 中各列的權重：標題 > 作者 > 期刊 > 正文
+BM25_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+SNIPPET_CHARS = 240
+COMPRESSION_LEVEL = 6
+
+# unicode61 分詞器把連續的中日韓字符當作一個詞，索引和查詢前在每個字兩側加空格，按單字匹配
+CJK_PATTERN = re.compile(r'([㐀-鿿豈-﫿])')
+QUERY_TOKEN_PATTERN = re.compile(r'[㐀-鿿豈-﫿]+|[^\W_㐀-鿿豈-﫿]+')
+
+
+def _segment(value: Optional[str]) -> str:
+    return CJK_PATTERN.sub(r' \1 ', value or '')
+
+
+def build_match_query(query: str) -> str:
+    """
+    把用戶輸入轉換為FTS5查詢：所有詞都需出現，中日韓詞按連續單字短語匹配，最後一個詞按前綴匹配
+
+    用戶輸入中的引號、運算符等不會被解釋為FTS5語法。
+
+    Args:
+        query (str): 搜索框中的文本
+
+    Returns:
+        str: FTS5 MATCH 表達式，沒有可搜索的詞時為空字符串
+    """
+    tokens = QUERY_TOKEN_PATTERN.findall(query)
+    terms = ['"' + ' '.join(token) + '"' if CJK_PATTERN.match(token) else f'"{token}"' for token in tokens]
+    if tokens and not CJK_PATTERN.match(tokens[-1]):
+        # 邊輸入邊搜索時最後一個詞通常還不完整
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def compress_text(value: str) -> bytes:
+    return zlib.compress(value.encode('utf-8'), COMPRESSION_LEVEL)
+
+
+def decompress_text(value: Optional[bytes]) -> str:
+    return zlib.decompress(value).decode('utf-8') if value else ''
+
+
+def make_snippet(body: str, query: str, width: int = SNIPPET_CHARS) -> str:
+    """取正文中第一個查詢詞附近的片段，找不到時取開頭"""
+    lowered = body.lower()
+    positions = [lowered.find(token.lower()) for token in QUERY_TOKEN_PATTERN.findall(query)]
+    positions = [position for position in positions if position >= 0]
+    start = max(0, min(positions) - width // 4) if positions else 0
+    snippet = ' '.join(body[start:start + width].split())
+    return ('…' if start > 0 else '') + snippet + ('…' if start + width < len(body) else '')
+
+
+class FullTextIndex:
+    """
+    已處理論文的全文檢索索引
+
+    保存提取階段解析的PDF文本（zlib壓縮），並在SQLite FTS5中建立倒排索引。提取元數據在信息足夠時提前停止，
+    索引啟用時提取階段會繼續讀取正文，最多到第 FULLTEXT_MAX_PAGES 頁、FULLTEXT_MAX_CHARS 個字符為止，
+    之後頁面中的詞搜不到；只讀取頭部的大文件（PDF_HEADER_ONLY_MB）只索引第一頁。
+    搜索按 bm25 排序，只需讀取索引和排名靠前結果的壓縮文本，不會重新解析PDF。
+    文件重命名成功後增量更新。用法與 Flask 擴展相同：先創建實例，再調用 init_app(app)。
+    """
+    def __init__(self, app=None):
+        """初始化索引，未綁定應用前索引處於停用狀態"""
+        self.app = None
+        self.enabled = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        綁定Flask應用並創建FTS5表
+
+        環境變量:
+            FULLTEXT_INDEX_ENABLED: 設為 0/false 可停用全文索引（默認啟用）
+
+        數據庫不是SQLite或SQLite未編譯FTS5時停用索引。
+        """
+        from sqlalchemy import text as sql
+        from models import db, PaperText
+
+        self.app = app
+        self._db = db
+        self._model = PaperText
+        self.enabled = os.environ.get("FULLTEXT_INDEX_ENABLED", "1").lower() not in ("0", "false", "no")
+        if not self.enabled:
+            return
+        try:
+            with app.app_context():
+                if db.engine.dialect.name != "sqlite":
+                    raise RuntimeError(f"不支持的數據庫 {db.engine.dialect.name}")
+                with db.engine.begin() as connection:
+                    connection.execute(sql(FTS_SCHEMA))
+        except Exception as e:
+            logger.warning(f"無法創建全文索引，已停用: {str(e)}")
+            self.enabled = False
+
+    def is_enabled(self) -> bool:
+        """索引是否可用"""
+        return self.enabled and self.app is not None
+
+    def record(self, pdf_path: str, text: Optional[str], metadata: Dict[str, str],
+               previous_path: Optional[str] = None) -> None:
+        """
+        加入或更新文件的全文索引
+
+        Args:
+            pdf_path (str): 文件的當前路徑
+            text (str, optional): 提取的文本，為None時（如命中緩存）保留已索引的文本，只更新路徑和元數據
+            metadata (Dict[str, str]): 文件的元數據
+            previous_path (str, optional): 重命名前的路徑，已有記錄時更新為新路徑
+        """
+        if not self.is_enabled():
+            return
+
+        try:
+            path = os.path.abspath(pdf_path)
+            paths = {path, os.path.abspath(previous_path)} if previous_path else {path}
+            with self.app.app_context():
+                entries = self._model.query.filter(self._model.path.in_(paths)).all()
+                entry = next((item for item in entries if item.path == path), entries[0] if entries else None)
+                if entry is None and text is None:
+                    return
+                for existing in entries:
+                    self._delete_from_index(existing)
+                    if existing is not entry:
+                        self._db.session.delete(existing)
+                self._db.session.flush()
+
+                if entry is None:
+                    entry = self._model(path=path)
+                    self._db.session.add(entry)
+                entry.path = path
+                entry.title = metadata.get('title') or ''
+                entry.author = metadata.get('author_lastname') or ''
+                entry.journal = metadata.get('journal') or ''
+                entry.year = metadata.get('year') or ''
+                if text is not None:
+                    entry.text_compressed = compress_text(text)
+                    entry.text_length = len(text)
+                entry.indexed_at = datetime.utcnow()
+                self._db.session.flush()
+                self._insert_into_index(entry)
+                self._db.session.commit()
+        except Exception as e:
+            logger.warning(f"更新全文索引時出錯: {str(e)}")
+
+    def update_path(self, old_path: str, new_path: str) -> None:
+        """
+        文件被移動（如撤銷重命名）後更新路徑，索引的文本和元數據不變
+
+        Args:
+            old_path (str): 原始路徑
+            new_path (str): 新路徑
+        """
+        if not self.is_enabled():
+            return
+
+        try:
+            with self.app.app_context():
+                entry = self._model.query.filter_by(path=os.path.abspath(old_path)).first()
+                if entry:
+                    stale = self._model.query.filter_by(path=os.path.abspath(new_path)).first()
+                    if stale:
+                        self._delete_from_index(stale)
+                        self._db.session.delete(stale)
+                        self._db.session.flush()
+                    entry.path = os.path.abspath(new_path)
+                    self._db.session.commit()
+        except Exception as e:
+            logger.warning(f"更新全文索引路徑時出錯: {str(e)}")
+
+    def _index_values(self, entry) -> Dict:
+        return {
+            'rowid': entry.id,
+            'title': _segment(entry.title),
+            'author': _segment(entry.author),
+            'journal': _segment(entry.journal),
+            'body': _segment(decompress_text(entry.text_compressed))
+        }
+
+    def _insert_into_index(self, entry) -> None:
+        from sqlalchemy import text as sql
+        self._db.session.execute(
+            sql(f"INSERT INTO {FTS_TABLE}(rowid, title, author, journal, body) "
+                "VALUES (:rowid, :title, :author, :journal, :body)"),
+            self._index_values(entry)
+        )
+
+    def _delete_from_index(self, entry) -> None:
+        from sqlalchemy import text as sql
+        # 無內容表刪除時需要提供索引時的原值
+        self._db.session.execute(
+            sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, journal, body) "
+                "VALUES ('delete', :rowid, :title, :author, :journal, :body)"),
+            self._index_values(entry)
+        )
+
+    def search(self, query: str, limit: int = DEFAULT_LIMIT) -> Dict:
+        """
+        按相關度搜索已索引的論文
+
+        Args:
+            query (str): 搜索文本
+            limit (int): 最多返回的結果數
+
+        Returns:
+            Dict: query、results（path、title、author、journal、year、score、snippet）和 elapsed_ms
+
+        Raises:
+            ValueError: 查詢中沒有可搜索的詞
+            RuntimeError: 全文索引未啟用
+        """
+        from sqlalchemy import text as sql
+
+        if not self.is_enabled():
+            raise RuntimeError("全文索引未啟用")
+        match = build_match_query(query)
+        if not match:
+            raise ValueError("請輸入要搜索的詞")
+        limit = min(max(int(limit), 1), MAX_LIMIT)
+
+        start = time.perf_counter()
+        with self.app.app_context():
+            weights = ', '.join(str(weight) for weight in BM25_WEIGHTS)
+            rows = self._db.session.execute(
+                sql(f"SELECT rowid, bm25({FTS_TABLE}, {weights}) AS score FROM {FTS_TABLE} "
+                    f"WHERE {FTS_TABLE} MATCH :match ORDER BY score LIMIT :limit"),
+                {'match': match, 'limit': limit}
+            ).all()
+            entries = {entry.id: entry for entry in self._model.query.filter(self._model.id.in_([row.rowid for row in rows]))}
+            results = []
+            for row in rows:
+                entry = entries.get(row.rowid)
+                if entry is None:
+                    continue
+                results.append({
+                    'path': entry.path,
+                    'title': entry.title,
+                    'author': entry.author,
+                    'journal': entry.journal,
+                    'year': entry.year,
+                    # bm25 越小越相關，取負數使分數越大越相關
+                    'score': round(-row.score, 4),
+                    'snippet': make_snippet(decompress_text(entry.text_compressed), query)
+                })
+        return {'query': query, 'results': results, 'elapsed_ms': round((time.perf_counter() - start) * 1000, 2)}
+
+
+# 全局索引實例，由 app.py 調用 init_app 綁定
+fulltext_index = FullTextIndex()
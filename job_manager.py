@@ -0,0 +1,246 @@
+import os
+import time
+import atexit
+import logging
+import threading
+import itertools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from folder_monitor import FolderMonitor
+from job_queue import job_queue
+
+# 設置日誌
+logger = logging.getLogger(__name__)
+
+
+class FairScheduler:
+    """
+    在多個作業之間輪流分配全局在途名額
+
+    每個作業同一時間最多有一個等待者（其批處理引擎的提交循環），名額按等待先後授予，
+    拿到名額的作業重新排到隊尾，因此各作業輪流推進，大目錄不會餓死小目錄。
+    等待超時（用於檢查取消）不會失去排隊位置。
+    """
+    def __init__(self, capacity: int):
+        """
+        初始化調度器
+
+        Args:
+            capacity (int): 所有作業共享的在途文件數上限
+        """
+        self.capacity = capacity
+        self._available = capacity
+        self._cond = threading.Condition()
+        self._queue = deque()      # 排隊的作業，按授予順序
+        self._waiting = set()      # 當前正在 acquire 中等待的作業
+
+    def slots_for(self, key) -> "_JobSlots":
+        """返回某個作業使用的名額句柄，接口與信號量相同"""
+        return _JobSlots(self, key)
+
+    def acquire(self, key, timeout: Optional[float] = None) -> bool:
+        """為作業申請一個名額，超時返回False但保留排隊位置"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if key not in self._queue:
+                self._queue.append(key)
+            self._waiting.add(key)
+            try:
+                while not (self._available > 0 and self._next_waiting() == key):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                self._available -= 1
+                self._queue.remove(key)
+                return True
+            finally:
+                self._waiting.discard(key)
+                self._cond.notify_all()
+
+    def release(self) -> None:
+        """歸還一個名額"""
+        with self._cond:
+            self._available = min(self._available + 1, self.capacity)
+            self._cond.notify_all()
+
+    def forget(self, key) -> None:
+        """作業結束後移除其排隊位置"""
+        with self._cond:
+            if key in self._queue:
+                self._queue.remove(key)
+            self._cond.notify_all()
+
+    def _next_waiting(self):
+        """隊列中第一個正在等待的作業（超時離開的作業不阻擋後面的作業）"""
+        for key in self._queue:
+            if key in self._waiting:
+                return key
+        return None
+
+
+class _JobSlots:
+    """綁定到某個作業的名額句柄"""
+    def __init__(self, scheduler: FairScheduler, key):
+        self._scheduler = scheduler
+        self._key = key
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        return self._scheduler.acquire(self._key, timeout)
+
+    def release(self) -> None:
+        self._scheduler.release()
+
+
+class JobManager:
+    """
+    同時處理多個目錄的作業管理器
+
+    所有作業共用一個文本提取進程池、一個API線程池和全局在途名額，名額通過 FairScheduler
+    在作業之間輪流分配。API速率預算由全局 SiliconFlow 客戶端的限流器統一控制，
+    因此作業數增加不會突破 SILICONFLOW_RPM/TPM。
+    """
+    def __init__(self, callback: Callable[[Dict], None], on_job_finished: Callable[[int, Dict], None] = None,
+                 commit_journal: bool = True):
+        """
+        初始化作業管理器
+
+        Args:
+            callback (function): 每個文件處理完成後調用，參數為結果字典（帶 job_id 字段）
+            on_job_finished (function, optional): 作業結束（完成或取消）後調用，參數為作業id和最終進度
+            commit_journal (bool): 回調返回後提交重命名日誌條目；回調只緩衝結果時傳入False，由其在持久化後提交
+        """
+        self.callback = callback
+        self.commit_journal = commit_journal
+        self.on_job_finished = on_job_finished
+        self.extract_workers = int(os.environ.get("PDF_EXTRACT_WORKERS", os.cpu_count() or 1))
+        self.api_concurrency = int(os.environ.get("API_CONCURRENCY", 4))
+        self.max_pending = int(
+            os.environ.get("BATCH_MAX_PENDING", 2 * (self.extract_workers + self.api_concurrency))
+        )
+        self.scheduler = FairScheduler(self.max_pending)
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._local_ids = itertools.count(1)
+        self._extract_pool = None
+        self._api_pool = None
+        atexit.register(self.shutdown)
+
+    def _pools(self):
+        """按需創建共用線程池"""
+        if self._extract_pool is None:
+            # 使用spawn啟動子進程，避免在多線程的Web進程中fork
+            self._extract_pool = ProcessPoolExecutor(
+                max_workers=self.extract_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            self._api_pool = ThreadPoolExecutor(
+                max_workers=self.api_concurrency,
+                thread_name_prefix="pdf-api"
+            )
+        return self._extract_pool, self._api_pool
+
+    def start(self, directory: str, job_id: Optional[int] = None) -> int:
+        """
+        在後台開始處理目錄；同一作業已在運行時直接返回
+
+        Args:
+            directory (str): 要處理的目錄
+            job_id (int, optional): 要恢復的作業id，為空時創建新作業
+
+        Returns:
+            int: 作業id
+        """
+        if job_id is None:
+            job_id = job_queue.create_job(directory) if job_queue.is_enabled() else -next(self._local_ids)
+
+        with self._lock:
+            if job_id in self._jobs:
+                return job_id
+            extract_pool, api_pool = self._pools()
+            monitor = FolderMonitor(
+                directory,
+                lambda result: self.callback(dict(result, job_id=job_id)),
+                job_id=job_id if job_queue.is_enabled() else None,
+                commit_journal=self.commit_journal,
+                batch_options={
+                    'extract_pool': extract_pool,
+                    'api_pool': api_pool,
+                    'slots': self.scheduler.slots_for(job_id),
+                }
+            )
+            thread = threading.Thread(target=self._run, args=(job_id, monitor), name=f"job-{job_id}", daemon=True)
+            self._jobs[job_id] = {'directory': directory, 'monitor': monitor, 'thread': thread}
+            thread.start()
+
+        logger.info(f"作業 {job_id} 開始處理目錄: {directory}")
+        return job_id
+
+    def _run(self, job_id: int, monitor: FolderMonitor):
+        """作業線程：處理目錄中的現有文件，結束後移除作業"""
+        try:
+            monitor._process_existing_files()
+        except Exception as e:
+            logger.error(f"作業 {job_id} 出錯: {str(e)}")
+        finally:
+            with self._lock:
+                job = self._jobs.pop(job_id, None)
+            self.scheduler.forget(job_id)
+            if self.on_job_finished:
+                # 作業記錄可能已不在表中，目錄以監視器為準
+                directory = job['directory'] if job else monitor.directory
+                progress = monitor.batch_processor.progress()
+                self.on_job_finished(job_id, dict(progress, job_id=job_id, directory=directory, active=False))
+
+    def cancel(self, job_id: int) -> bool:
+        """
+        取消正在運行的作業
+
+        Returns:
+            bool: 作業是否在運行
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return False
+        logger.info(f"取消作業 {job_id}")
+        job['monitor'].stop()
+        return True
+
+    def cancel_all(self) -> int:
+        """取消所有正在運行的作業，返回取消的作業數"""
+        with self._lock:
+            job_ids = list(self._jobs)
+        return sum(self.cancel(job_id) for job_id in job_ids)
+
+    def is_active(self, job_id: Optional[int] = None) -> bool:
+        """指定作業（或任一作業）是否在運行"""
+        with self._lock:
+            return job_id in self._jobs if job_id is not None else bool(self._jobs)
+
+    def status(self, job_id: int) -> Optional[Dict]:
+        """運行中作業的實時進度，作業不在運行時返回None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        return dict(
+            job['monitor'].batch_processor.progress(),
+            job_id=job_id, directory=job['directory'], active=True
+        )
+
+    def active_jobs(self) -> List[Dict]:
+        """所有運行中作業的實時進度"""
+        with self._lock:
+            job_ids = list(self._jobs)
+        return [status for status in map(self.status, job_ids) if status]
+
+    def shutdown(self) -> None:
+        """取消所有作業並關閉共用線程池"""
+        self.cancel_all()
+        if self._extract_pool:
+            self._extract_pool.shutdown(wait=False, cancel_futures=True)
+            self._api_pool.shutdown(wait=False, cancel_futures=True)
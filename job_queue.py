@@ -0,0 +1,311 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from siliconflow_client import backoff_delay
+
+# 設置日誌
+logger = logging.getLogger(__name__)
+
+# 每次寫入/查詢任務時處理的路徑數
+ENQUEUE_BATCH = 500
+# 沒有可領取任務時的輪詢間隔（秒）
+POLL_SECONDS = 0.5
+# 計算吞吐量的時間窗口（秒）
+THROUGHPUT_WINDOW = 60
+
+
+class JobQueue:
+    """
+    基於數據庫的持久化作業隊列
+
+    每次批處理是一個作業（jobs表），其中每個文件是一個任務（tasks表）。批處理引擎從隊列領取任務，
+    進程重啟後未完成的任務仍在數據庫中，可以恢復作業而無需重新處理已完成的文件；失敗的任務
+    按指數退避重試。無需外部消息代理。用法與 Flask 擴展相同：先創建實例，再調用 init_app(app)。
+    """
+    def __init__(self, app=None):
+        """初始化隊列，未綁定應用前隊列處於停用狀態"""
+        self.app = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        綁定Flask應用並從環境變量讀取配置
+
+        環境變量:
+            JOB_MAX_ATTEMPTS: 每個文件最多嘗試次數（默認 3）
+            JOB_RETRY_BASE_SECONDS: 失敗重試的基礎退避時間（默認 30）
+            JOB_RETRY_MAX_SECONDS: 退避時間上限（默認 3600）
+            JOB_CLAIM_BATCH: 每次領取的任務數（默認 20）
+        """
+        from models import db, Job, Task
+
+        self.app = app
+        self._db = db
+        self._job = Job
+        self._task = Task
+        self.max_attempts = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+        self.retry_base = float(os.environ.get("JOB_RETRY_BASE_SECONDS", 30))
+        self.retry_max = float(os.environ.get("JOB_RETRY_MAX_SECONDS", 3600))
+        self.claim_batch = int(os.environ.get("JOB_CLAIM_BATCH", 20))
+
+    def is_enabled(self) -> bool:
+        """隊列是否可用"""
+        return self.app is not None
+
+    def create_job(self, directory: str) -> int:
+        """
+        創建作業
+
+        Args:
+            directory (str): 要處理的目錄
+
+        Returns:
+            int: 作業id
+        """
+        with self.app.app_context():
+            job = self._job(directory=directory, status='queued')
+            self._db.session.add(job)
+            self._db.session.commit()
+            return job.id
+
+    def get_job(self, job_id: int) -> Optional[Dict]:
+        """返回作業信息及進度，不存在時返回None"""
+        with self.app.app_context():
+            job = self._db.session.get(self._job, job_id)
+            if job is None:
+                return None
+            return dict(job.to_dict(), progress=self._progress(job))
+
+    def list_jobs(self, limit: int = 20) -> List[Dict]:
+        """返回最近的作業及其進度"""
+        with self.app.app_context():
+            jobs = self._job.query.order_by(self._job.id.desc()).limit(limit).all()
+            return [dict(job.to_dict(), progress=self._progress(job)) for job in jobs]
+
+    def recover(self) -> List[int]:
+        """
+        啟動時調用：將上次運行中斷的作業標記為 interrupted，並把執行到一半的任務放回隊列
+
+        Returns:
+            List[int]: 被中斷、可以恢復的作業id
+        """
+        with self._lock, self.app.app_context():
+            jobs = self._job.query.filter(self._job.status.in_(('queued', 'running'))).all()
+            for job in jobs:
+                job.status = 'interrupted'
+            self._task.query.filter_by(status='running').update(
+                {'status': 'queued'}, synchronize_session=False
+            )
+            self._db.session.commit()
+            job_ids = [job.id for job in jobs]
+        if job_ids:
+            logger.info(f"發現 {len(job_ids)} 個中斷的作業，可以恢復: {job_ids}")
+        return job_ids
+
+    def start_job(self, job_id: int) -> None:
+        """將作業標記為運行中，恢復作業時把遺留的運行中任務放回隊列；每次啟動都會重新掃描目錄"""
+        with self._lock, self.app.app_context():
+            job = self._db.session.get(self._job, job_id)
+            job.status = 'running'
+            job.scan_complete = False
+            job.started_at = job.started_at or datetime.utcnow()
+            job.finished_at = None
+            self._task.query.filter_by(job_id=job_id, status='running').update(
+                {'status': 'queued'}, synchronize_session=False
+            )
+            self._db.session.commit()
+
+    def finish_job(self, job_id: int, cancelled: bool = False) -> None:
+        """
+        結束作業
+
+        Args:
+            job_id (int): 作業id
+            cancelled (bool): 是否被取消；取消時已領取但未處理的任務放回隊列，之後可以恢復
+        """
+        with self._lock, self.app.app_context():
+            job = self._db.session.get(self._job, job_id)
+            if cancelled:
+                self._task.query.filter_by(job_id=job_id, status='running').update(
+                    {'status': 'queued'}, synchronize_session=False
+                )
+            job.status = 'cancelled' if cancelled else 'done'
+            job.finished_at = datetime.utcnow()
+            self._db.session.commit()
+
+    def enqueue(self, job_id: int, paths: Iterable[str]) -> int:
+        """
+        把文件加入作業，已存在的路徑被忽略（恢復作業時可以安全地重新掃描）
+
+        Args:
+            job_id (int): 作業id
+            paths (Iterable[str]): 文件路徑，可以是生成器
+
+        Returns:
+            int: 新增的任務數
+        """
+        added = 0
+        batch = []
+        for path in paths:
+            batch.append(path)
+            if len(batch) >= ENQUEUE_BATCH:
+                added += self._enqueue_batch(job_id, batch)
+                batch = []
+        if batch:
+            added += self._enqueue_batch(job_id, batch)
+        return added
+
+    def _enqueue_batch(self, job_id: int, paths: List[str]) -> int:
+        """寫入一批任務"""
+        task = self._task
+        with self._lock, self.app.app_context():
+            existing = {
+                row.path for row in task.query.with_entities(task.path)
+                .filter(task.job_id == job_id, task.path.in_(paths))
+            }
+            new_paths = [path for path in dict.fromkeys(paths) if path not in existing]
+            now = datetime.utcnow()
+            self._db.session.add_all([
+                task(job_id=job_id, path=path, status='queued', attempts=0, next_attempt_at=now, updated_at=now)
+                for path in new_paths
+            ])
+            self._db.session.commit()
+        return len(new_paths)
+
+    def mark_scanned(self, job_id: int) -> None:
+        """標記作業的目錄掃描已完成，之後隊列取空即表示作業結束"""
+        with self._lock, self.app.app_context():
+            job = self._db.session.get(self._job, job_id)
+            job.scan_complete = True
+            self._db.session.commit()
+
+    def iter_tasks(self, job_id: int, should_stop: Callable[[], bool] = lambda: False) -> Iterator[str]:
+        """
+        持續領取作業中到期的任務，直到掃描完成且沒有排隊或處理中的任務
+
+        處理中的任務失敗後可能重新排隊，因此在它們完成之前生成器會等待而不是結束。
+
+        Args:
+            job_id (int): 作業id
+            should_stop (function): 返回True時停止領取
+
+        Yields:
+            str: 待處理的文件路徑
+        """
+        while not should_stop():
+            paths = self._claim(job_id, self.claim_batch)
+            if paths:
+                yield from paths
+                continue
+            if self._is_drained(job_id):
+                return
+            # 等待掃描線程、處理中的任務或重試退避
+            time.sleep(POLL_SECONDS)
+
+    def _claim(self, job_id: int, limit: int) -> List[str]:
+        """將最多limit個到期任務標記為處理中並返回其路徑"""
+        task = self._task
+        with self._lock, self.app.app_context():
+            tasks = (
+                task.query
+                .filter(task.job_id == job_id, task.status == 'queued', task.next_attempt_at <= datetime.utcnow())
+                .order_by(task.id)
+                .limit(limit)
+                .all()
+            )
+            now = datetime.utcnow()
+            for claimed in tasks:
+                claimed.status = 'running'
+                claimed.attempts = (claimed.attempts or 0) + 1
+                claimed.updated_at = now
+            self._db.session.commit()
+            return [claimed.path for claimed in tasks]
+
+    def _is_drained(self, job_id: int) -> bool:
+        """掃描已完成且沒有排隊或處理中的任務"""
+        task = self._task
+        with self.app.app_context():
+            job = self._db.session.get(self._job, job_id)
+            if not job.scan_complete:
+                return False
+            pending = task.query.filter(
+                task.job_id == job_id, task.status.in_(('queued', 'running'))
+            ).count()
+            return pending == 0
+
+    def complete(self, job_id: int, result: Dict) -> None:
+        """
+        根據處理結果更新任務：成功或跳過記為done，出錯時退避重試，達到上限後記為failed
+
+        Args:
+            job_id (int): 作業id
+            result (Dict): 批處理引擎返回的結果字典
+        """
+        task = self._task
+        try:
+            with self._lock, self.app.app_context():
+                entry = task.query.filter_by(job_id=job_id, path=result.get('original_path', '')).first()
+                if entry is None:
+                    return
+                now = datetime.utcnow()
+                entry.updated_at = now
+                if result.get('status') != 'error':
+                    entry.status = 'done'
+                    entry.last_error = None
+                elif (entry.attempts or 0) < self.max_attempts:
+                    delay = backoff_delay(entry.attempts - 1, self.retry_base, self.retry_max)
+                    entry.status = 'queued'
+                    entry.next_attempt_at = now + timedelta(seconds=delay)
+                    entry.last_error = result.get('error', '')
+                    logger.info(f"{entry.path} 第 {entry.attempts} 次處理失敗，{delay:.0f} 秒後重試")
+                else:
+                    entry.status = 'failed'
+                    entry.last_error = result.get('error', '')
+                self._db.session.commit()
+        except Exception as e:
+            logger.error(f"更新任務狀態時出錯: {str(e)}")
+
+    def task_counts(self) -> Dict[str, int]:
+        """所有作業的任務數，按狀態統計（用於監控隊列深度）"""
+        if not self.is_enabled():
+            return {}
+        task = self._task
+        with self.app.app_context():
+            return dict(
+                task.query.with_entities(task.status, self._db.func.count(task.id)).group_by(task.status).all()
+            )
+
+    def _progress(self, job) -> Dict:
+        """統計作業進度（需在應用上下文中調用）"""
+        task = self._task
+        counts = dict(
+            task.query.with_entities(task.status, self._db.func.count(task.id))
+            .filter(task.job_id == job.id)
+            .group_by(task.status)
+            .all()
+        )
+        window_start = datetime.utcnow() - timedelta(seconds=THROUGHPUT_WINDOW)
+        recent = task.query.filter(
+            task.job_id == job.id, task.status.in_(('done', 'failed')), task.updated_at >= window_start
+        ).count()
+        rate = recent / THROUGHPUT_WINDOW
+        remaining = counts.get('queued', 0) + counts.get('running', 0)
+        return {
+            'total': sum(counts.values()),
+            'queued': counts.get('queued', 0),
+            'running': counts.get('running', 0),
+            'done': counts.get('done', 0),
+            'failed': counts.get('failed', 0),
+            'rate': round(rate, 2),
+            'eta': round(remaining / rate, 1) if rate > 0 else None
+        }
+
+
+# 全局作業隊列實例，由 app.py 調用 init_app 綁定
+job_queue = JobQueue()
@@ -0,0 +1,325 @@
+import os
+import re
+import csv
+import sqlite3
+import logging
+import threading
+from typing import Dict, Optional
+
+# 設置日誌
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 內置的期刊縮寫數據（常見期刊），完整列表可通過 JOURNAL_DUMP_PATH 指定
+BUNDLED_DUMP_PATH = os.path.join(BASE_DIR, "data", "journal_abbreviations.csv")
+DEFAULT_INDEX_PATH = os.path.join(BASE_DIR, "instance", "journal_index.db")
+
+# 模糊匹配的最低相似度（三元組Dice係數），候選還需通過逐詞校驗
+FUZZY_MATCH_THRESHOLD = float(os.environ.get("JOURNAL_FUZZY_THRESHOLD", 0.5))
+
+# 比較期刊名稱時忽略的虛詞
+STOPWORDS = {'of', 'the', 'and', 'on', 'in', 'for', 'de', 'la', 'und', 'fur'}
+
+ISSN_PATTERN = re.compile(r'^\d{4}-?\d{3}[\dXx]$')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS journals (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    title_norm TEXT NOT NULL,
+    iso4 TEXT NOT NULL,
+    iso4_norm TEXT NOT NULL,
+    issn TEXT,
+    eissn TEXT,
+    doi_prefix TEXT,
+    gram_count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_journals_title_norm ON journals (title_norm);
+CREATE INDEX IF NOT EXISTS ix_journals_iso4_norm ON journals (iso4_norm);
+CREATE INDEX IF NOT EXISTS ix_journals_issn ON journals (issn);
+CREATE INDEX IF NOT EXISTS ix_journals_eissn ON journals (eissn);
+CREATE INDEX IF NOT EXISTS ix_journals_doi_prefix ON journals (doi_prefix);
+CREATE TABLE IF NOT EXISTS trigrams (
+    gram TEXT NOT NULL,
+    journal_id INTEGER NOT NULL,
+    PRIMARY KEY (gram, journal_id)
+) WITHOUT ROWID;
+"""
+
+
+def normalize_name(name: str) -> str:
+    """
+    規範化期刊名稱用於比較：小寫、& 改為 and、去掉開頭的 the 和標點
+
+    Args:
+        name (str): 期刊名稱或縮寫
+
+    Returns:
+        str: 規範化後的名稱
+    """
+    name = name.lower().replace('&', ' and ')
+    name = re.sub(r'[^\w\s]', ' ', name)
+    name = re.sub(r'^\s*the\s+', '', name)
+    return ' '.join(name.split())
+
+
+def trigrams(name: str) -> set:
+    """返回規範化名稱的字符三元組集合（詞首尾補空格）"""
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _words_match(word: str, other: str) -> bool:
+    """兩個詞相同、其一是另一個的縮寫前綴（至少3個字符），或僅有拼寫差異"""
+    if word == other:
+        return True
+    shorter, longer = sorted((word, other), key=len)
+    if len(shorter) >= 3 and longer.startswith(shorter):
+        return True
+    if min(len(word), len(other)) < 5:
+        return False
+    word_grams, other_grams = trigrams(word), trigrams(other)
+    return 2.0 * len(word_grams & other_grams) / (len(word_grams) + len(other_grams)) >= 0.7
+
+
+def names_compatible(name_norm: str, candidate_norm: str) -> bool:
+    """
+    逐詞校驗模糊匹配的候選：兩邊的每個實詞都必須在另一邊找到對應詞
+
+    僅靠三元組相似度會把 Physical Review A 匹配到 Physical Review E，
+    或把 Journal of Applied Physics Letters 匹配到 Journal of Applied Physics。
+    """
+    words = [word for word in name_norm.split() if word not in STOPWORDS]
+    candidate_words = [word for word in candidate_norm.split() if word not in STOPWORDS]
+    if not words or not candidate_words:
+        return False
+    return (all(any(_words_match(word, other) for other in candidate_words) for word in words) and
+            all(any(_words_match(other, word) for word in words) for other in candidate_words))
+
+
+def normalize_issn(issn: str) -> str:
+    """將ISSN統一為 1234-567X 格式，不合法時返回空字符串"""
+    issn = issn.strip().upper()
+    if not ISSN_PATTERN.match(issn):
+        return ''
+    issn = issn.replace('-', '')
+    return f"{issn[:4]}-{issn[4:]}"
+
+
+class JournalIndex:
+    """
+    基於SQLite的離線期刊索引，將期刊全稱、ISSN和DOI前綴映射到標準ISO4縮寫
+
+    索引文件從CSV數據構建，數據文件變化時自動重建；讀取時啟用 mmap。
+    模糊查找使用三元組倒排表，只比較共享三元組最多的候選，不掃描全表。
+    """
+    def __init__(self, index_path: str = None, dump_path: str = None):
+        """
+        Args:
+            index_path (str, optional): 索引文件路徑，默認讀取 JOURNAL_INDEX_PATH 或 instance/journal_index.db
+            dump_path (str, optional): CSV數據路徑，默認讀取 JOURNAL_DUMP_PATH 或內置數據
+        """
+        self.index_path = index_path or os.environ.get("JOURNAL_INDEX_PATH", DEFAULT_INDEX_PATH)
+        self.dump_path = dump_path or os.environ.get("JOURNAL_DUMP_PATH", BUNDLED_DUMP_PATH)
+        self._local = threading.local()
+        self._build_lock = threading.Lock()
+        self._ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        """每個線程使用自己的連接（sqlite3連接不能跨線程共用）"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.index_path)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA mmap_size = 268435456")
+            self._local.connection = connection
+        return connection
+
+    def _ensure_built(self) -> None:
+        """首次使用時檢查索引是否與數據文件一致，不一致則重建"""
+        if self._ready:
+            return
+        with self._build_lock:
+            if self._ready:
+                return
+            os.makedirs(os.path.dirname(self.index_path) or '.', exist_ok=True)
+            connection = self._connect()
+            connection.executescript(SCHEMA)
+            stat = os.stat(self.dump_path)
+            signature = f"{os.path.abspath(self.dump_path)}:{stat.st_size}:{stat.st_mtime}"
+            row = connection.execute("SELECT value FROM meta WHERE key = 'source'").fetchone()
+            if row is None or row['value'] != signature:
+                self._build(connection, signature)
+            self._ready = True
+
+    def _build(self, connection: sqlite3.Connection, signature: str) -> None:
+        """從CSV數據重建索引"""
+        logger.info(f"構建期刊縮寫索引: {self.dump_path}")
+        with connection:
+            connection.execute("DELETE FROM journals")
+            connection.execute("DELETE FROM trigrams")
+            count = 0
+            for entry in self._read_dump():
+                title_norm = normalize_name(entry['title'])
+                grams = trigrams(title_norm)
+                cursor = connection.execute(
+                    "INSERT INTO journals (title, title_norm, iso4, iso4_norm, issn, eissn, doi_prefix, gram_count) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (entry['title'], title_norm, entry['iso4'], normalize_name(entry['iso4']),
+                     entry['issn'] or None, entry['eissn'] or None, entry['doi_prefix'] or None, len(grams))
+                )
+                connection.executemany(
+                    "INSERT OR IGNORE INTO trigrams (gram, journal_id) VALUES (?, ?)",
+                    [(gram, cursor.lastrowid) for gram in grams]
+                )
+                count += 1
+            connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('source', ?)", (signature,))
+        logger.info(f"期刊縮寫索引構建完成，共 {count} 條")
+
+    def _read_dump(self):
+        """
+        讀取CSV數據
+
+        支持帶表頭的格式（title, iso4, issn, eissn, doi_prefix），也支持無表頭的
+        「全稱,縮寫」兩列格式（如 JabRef 的期刊縮寫列表），分隔符自動識別。
+        """
+        with open(self.dump_path, newline='', encoding='utf-8') as file:
+            sample = file.read(4096)
+            file.seek(0)
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+            except csv.Error:
+                dialect = csv.excel
+            rows = csv.reader(file, dialect)
+            header = next(rows, None)
+            if header is None:
+                return
+            columns = [column.strip().lower() for column in header]
+            if 'title' not in columns:
+                columns = ['title', 'iso4']
+                rows = [header, *rows]
+            for row in rows:
+                entry = dict(zip(columns, (value.strip() for value in row)))
+                if not entry.get('title') or not entry.get('iso4'):
+                    continue
+                yield {
+                    'title': entry['title'],
+                    'iso4': entry['iso4'],
+                    'issn': normalize_issn(entry.get('issn', '')),
+                    'eissn': normalize_issn(entry.get('eissn', '')),
+                    'doi_prefix': entry.get('doi_prefix', '').lower(),
+                }
+
+    def lookup_issn(self, issn: str) -> Optional[Dict[str, str]]:
+        """按印刷版或電子版ISSN查找期刊"""
+        issn = normalize_issn(issn)
+        if not issn:
+            return None
+        self._ensure_built()
+        row = self._connect().execute(
+            "SELECT title, iso4 FROM journals WHERE issn = ? OR eissn = ? LIMIT 1", (issn, issn)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def lookup_doi(self, doi: str) -> Optional[Dict[str, str]]:
+        """
+        按DOI前綴查找期刊，取最長的匹配前綴
+
+        例如 10.1103/PhysRevLett.123.456 會依次嘗試 10.1103/PhysRevLett.123、10.1103/PhysRevLett 等前綴。
+        """
+        doi = doi.strip().lower()
+        if '/' not in doi:
+            return None
+        registrant, suffix = doi.split('/', 1)
+        candidates = [registrant + '/' + suffix[:match.start()] for match in re.finditer(r'[./\-_()]|\d', suffix)]
+        candidates.append(doi)
+        self._ensure_built()
+        placeholders = ','.join('?' * len(candidates))
+        row = self._connect().execute(
+            f"SELECT title, iso4 FROM journals WHERE doi_prefix IN ({placeholders}) "
+            f"ORDER BY length(doi_prefix) DESC LIMIT 1",
+            candidates
+        ).fetchone()
+        return dict(row) if row else None
+
+    def lookup_name(self, name: str) -> Optional[Dict[str, str]]:
+        """
+        按期刊全稱或縮寫查找，先精確匹配，再用三元組召回候選並逐詞校驗
+
+        Args:
+            name (str): 期刊名稱或縮寫
+
+        Returns:
+            Optional[Dict[str, str]]: 包含 title、iso4 和 score 的字典，找不到時返回None
+        """
+        name_norm = normalize_name(name)
+        if not name_norm:
+            return None
+        self._ensure_built()
+        connection = self._connect()
+
+        row = connection.execute(
+            "SELECT title, iso4 FROM journals WHERE title_norm = ? OR iso4_norm = ? LIMIT 1",
+            (name_norm, name_norm)
+        ).fetchone()
+        if row:
+            return dict(row, score=1.0)
+
+        grams = trigrams(name_norm)
+        placeholders = ','.join('?' * len(grams))
+        candidates = connection.execute(
+            f"SELECT j.title, j.title_norm, j.iso4, j.gram_count, COUNT(*) AS shared FROM trigrams t "
+            f"JOIN journals j ON j.id = t.journal_id WHERE t.gram IN ({placeholders}) "
+            f"GROUP BY t.journal_id ORDER BY shared DESC LIMIT 20",
+            list(grams)
+        ).fetchall()
+        best = None
+        for candidate in candidates:
+            score = 2.0 * candidate['shared'] / (len(grams) + candidate['gram_count'])
+            if score < FUZZY_MATCH_THRESHOLD or not names_compatible(name_norm, candidate['title_norm']):
+                continue
+            if best is None or score > best['score']:
+                best = {'title': candidate['title'], 'iso4': candidate['iso4'], 'score': score}
+        return best
+
+    def normalize_journal_fields(self, metadata: Dict[str, str]) -> Optional[Dict[str, str]]:
+        """
+        用索引中的標準名稱和ISO4縮寫填充或統一元數據中的期刊字段
+
+        依次按ISSN、DOI、期刊全稱、期刊縮寫查找；找不到時保持原值。
+
+        Args:
+            metadata (Dict[str, str]): 元數據字典（會被原地修改）
+
+        Returns:
+            Optional[Dict[str, str]]: 匹配的索引條目，包含 title、iso4、source（用於查找的字段名）
+                                      和 score（名稱匹配的相似度，ISSN和DOI為1），找不到時返回None
+        """
+        if metadata.get('doc_type') == 'book':
+            return None
+        lookups = (
+            ('issn', self.lookup_issn), ('doi', self.lookup_doi),
+            ('journal', self.lookup_name), ('journal_abbr', self.lookup_name),
+        )
+        entry = None
+        try:
+            for source, lookup in lookups:
+                entry = metadata.get(source) and lookup(metadata[source])
+                if entry:
+                    entry = dict(entry, source=source, score=entry.get('score', 1.0))
+                    break
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"查詢期刊縮寫索引時出錯: {str(e)}")
+            return None
+        if entry:
+            if entry['iso4'] != metadata.get('journal_abbr'):
+                logger.debug(f"期刊縮寫統一為: {entry['iso4']}（原值: {metadata.get('journal_abbr', '')}）")
+            metadata['journal'] = entry['title']
+            metadata['journal_abbr'] = entry['iso4']
+        return entry or None
+
+
+# 全局索引實例，首次查詢時才構建或打開索引文件
+journal_index = JournalIndex()
@@ -0,0 +1,105 @@
+import json
+import queue
+import logging
+import threading
+from typing import Callable, Dict, Iterable, Iterator
+
+# 設置日誌
+logger = logging.getLogger(__name__)
+
+# 每個訂閱者最多緩衝的事件數，超出時斷開該訂閱者
+SUBSCRIBER_QUEUE_SIZE = 1000
+# 空閒時發送心跳註釋的間隔（秒），防止代理斷開連接
+HEARTBEAT_SECONDS = 15
+
+
+class _Subscriber:
+    """單個SSE連接的事件隊列"""
+    def __init__(self, max_size: int):
+        self.queue = queue.Queue(maxsize=max_size)
+        self.overflowed = False
+
+
+class LogBroadcaster:
+    """
+    將處理日誌和進度推送給所有SSE連接
+
+    每個連接擁有獨立的有界隊列，發布事件不會阻塞處理線程。消費過慢的連接在隊列寫滿後
+    會收到 reset 事件並被斷開，前端重新加載當前頁後再重新連接。
+    """
+    def __init__(self, max_queue: int = SUBSCRIBER_QUEUE_SIZE):
+        """初始化廣播器"""
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._subscribers = set()
+
+    def subscriber_count(self) -> int:
+        """當前連接數"""
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, event: str, data: Dict, event_id: int = None) -> None:
+        """
+        向所有連接廣播一個事件
+
+        Args:
+            event (str): 事件類型，例如 log、progress
+            data (Dict): 可序列化為JSON的事件內容
+            event_id (int, optional): 事件序號，瀏覽器重連時通過 Last-Event-ID 帶回
+        """
+        with self._lock:
+            if not self._subscribers:
+                return
+            message = format_event(event, data, event_id)
+            for subscriber in self._subscribers:
+                if subscriber.overflowed:
+                    continue
+                try:
+                    subscriber.queue.put_nowait(message)
+                except queue.Full:
+                    subscriber.overflowed = True
+                    logger.warning("SSE連接消費過慢，將要求其重新加載")
+
+    def stream(self, initial: Callable[[], Iterable[str]] = None, heartbeat: float = HEARTBEAT_SECONDS) -> Iterator[str]:
+        """
+        生成一個SSE連接的響應內容，連接關閉時自動取消訂閱
+
+        Args:
+            initial (function, optional): 訂閱之後才調用，返回首先發送的已格式化事件；
+                在訂閱之後生成可保證補發的事件與實時事件之間沒有遺漏（可能重複）
+            heartbeat (float): 心跳間隔（秒）
+
+        Yields:
+            str: text/event-stream 格式的消息
+        """
+        subscriber = _Subscriber(self.max_queue)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        try:
+            yield "retry: 3000\n\n"
+            if initial:
+                yield from initial()
+            while True:
+                if subscriber.overflowed and subscriber.queue.empty():
+                    yield format_event('reset', {})
+                    return
+                try:
+                    yield subscriber.queue.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscriber)
+
+
+def format_event(event: str, data: Dict, event_id: int = None) -> str:
+    """格式化為一條SSE消息，event_id 為空時不帶序號（用於連接建立時發送的初始狀態）"""
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+
+# 全局廣播實例
+log_broadcaster = LogBroadcaster()
@@ -0,0 +1,202 @@
+import os
+import time
+import atexit
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy.exc import OperationalError
+from metrics import LOG_FLUSH_SECONDS
+from rename_journal import rename_journal
+
+# 設置日誌
+logger = logging.getLogger(__name__)
+
+
+class LogWriter:
+    """
+    處理日誌的寫後緩衝
+
+    日誌條目先放入內存緩衝，由後台線程在湊滿一批或間隔到期時用一個事務批量寫入數據庫，
+    避免每個文件一次提交（SQLite上即一次fsync）以及工作線程爭用數據庫鎖。
+    條目帶 journal_entry 時，在寫入數據庫之後才提交其重命名：進程在寫入之前崩潰，
+    重命名日誌中的條目仍未提交，啟動時會被回滾，文件名與數據庫保持一致。
+    用法與 Flask 擴展相同：先創建實例，再調用 init_app(app)。
+    """
+    def __init__(self, app=None, on_flush: Optional[Callable[[List[Dict]], None]] = None):
+        """
+        初始化寫入器
+
+        Args:
+            app (Flask, optional): Flask應用
+            on_flush (function, optional): 每批寫入成功後調用，參數為帶數據庫id的日誌字典列表
+        """
+        self.app = None
+        self.on_flush = on_flush
+        self.batch_size = 0
+        self.flush_interval = 0.0
+        self.max_attempts = 3
+        self.max_buffered = 0
+        # (日誌字典, 已失敗次數)
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        綁定Flask應用並啟動後台寫入線程
+
+        環境變量:
+            LOG_FLUSH_BATCH: 湊滿多少條立即寫入（默認 100）
+            LOG_FLUSH_INTERVAL_MS: 最長等待多少毫秒後寫入（默認 500）
+            LOG_FLUSH_MAX_ATTEMPTS: 單條日誌寫入失敗多少次後丟棄（默認 3）
+            LOG_BUFFER_MAX: 數據庫不可用時最多緩衝的條數，超出後丟棄最舊的條目，0 表示不限制（默認 10000）
+        """
+        from models import db, ProcessedFile
+
+        self.app = app
+        self._db = db
+        self._model = ProcessedFile
+        self.batch_size = int(os.environ.get("LOG_FLUSH_BATCH", 100))
+        self.flush_interval = int(os.environ.get("LOG_FLUSH_INTERVAL_MS", 500)) / 1000.0
+        self.max_attempts = int(os.environ.get("LOG_FLUSH_MAX_ATTEMPTS", 3))
+        self.max_buffered = int(os.environ.get("LOG_BUFFER_MAX", 10000))
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def add(self, log_entry: Dict) -> None:
+        """
+        緩衝一條日誌
+
+        Args:
+            log_entry (Dict): 處理結果字典
+        """
+        with self._wakeup:
+            self._buffer.append((log_entry, 0))
+            if len(self._buffer) >= self.batch_size:
+                self._wakeup.notify()
+
+    def pending_count(self) -> int:
+        """尚未寫入的日誌條數"""
+        with self._lock:
+            return len(self._buffer)
+
+    def flush(self) -> int:
+        """
+        立即寫入緩衝中的所有日誌
+
+        整批寫入失敗時逐條重試：數據庫暫時不可用（如被鎖定）的條目放回緩衝等待下次寫入，
+        單條數據本身有問題的條目重試 LOG_FLUSH_MAX_ATTEMPTS 次後丟棄並記錄錯誤，不阻塞之後的日誌。
+        寫入成功的條目隨後提交其重命名日誌條目。
+
+        Returns:
+            int: 寫入的條數
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._buffer = self._buffer, []
+            if not pending or self.app is None:
+                return 0
+
+            started = time.perf_counter()
+            with self.app.app_context():
+                saved, retry = self._write(pending)
+            LOG_FLUSH_SECONDS.observe(time.perf_counter() - started)
+
+            if retry:
+                with self._lock:
+                    self._buffer[:0] = retry
+                    excess = len(self._buffer) - self.max_buffered
+                    if self.max_buffered and excess > 0:
+                        # 數據庫長時間不可用時丟棄最舊的條目，避免緩衝無限增長
+                        del self._buffer[:excess]
+                        logger.error(f"處理日誌緩衝超出上限 {self.max_buffered} 條，已丟棄最舊的 {excess} 條")
+            if not saved:
+                return 0
+
+            logger.debug(f"已批量寫入 {len(saved)} 條處理日誌")
+            for entry, _ in saved:
+                rename_journal.commit(entry)
+            saved = [row for _, row in saved]
+            if self.on_flush:
+                try:
+                    self.on_flush(saved)
+                except Exception as e:
+                    logger.error(f"日誌寫入回調出錯: {str(e)}")
+            return len(saved)
+
+    def _write(self, pending: List[Tuple[Dict, int]]) -> Tuple[List[Tuple[Dict, Dict]], List[Tuple[Dict, int]]]:
+        """
+        在一個事務中寫入一批日誌，失敗時逐條寫入（需在應用上下文中調用）
+
+        Args:
+            pending: (日誌字典, 已失敗次數) 列表
+
+        Returns:
+            tuple: (寫入成功的 (原日誌字典, 帶id的日誌字典) 列表, 需要放回緩衝重試的條目)
+        """
+        try:
+            rows = [self._model.from_log_entry(entry) for entry, _ in pending]
+            self._db.session.add_all(rows)
+            self._db.session.commit()
+            return [(entry, row.to_dict()) for (entry, _), row in zip(pending, rows)], []
+        except Exception as e:
+            self._db.session.rollback()
+            if len(pending) > 1:
+                logger.warning(f"批量寫入 {len(pending)} 條處理日誌失敗，改為逐條寫入: {str(e)}")
+
+        saved, retry = [], []
+        for entry, attempts in pending:
+            try:
+                row = self._model.from_log_entry(entry)
+                self._db.session.add(row)
+                self._db.session.commit()
+                saved.append((entry, row.to_dict()))
+            except OperationalError as e:
+                # 數據庫鎖定、連接斷開等與條目本身無關的錯誤，不計入失敗次數
+                self._db.session.rollback()
+                logger.error(f"寫入處理日誌失敗，將在下次重試: {str(e)}")
+                retry.append((entry, attempts))
+            except Exception as e:
+                self._db.session.rollback()
+                attempts += 1
+                if attempts >= self.max_attempts:
+                    logger.error(
+                        f"處理日誌寫入 {attempts} 次均失敗，已丟棄 {entry.get('original_path', '')}: {str(e)}"
+                    )
+                else:
+                    retry.append((entry, attempts))
+        return saved, retry
+
+    def close(self) -> None:
+        """停止後台線程並寫入剩餘日誌"""
+        with self._wakeup:
+            if self._closed:
+                return
+            self._closed = True
+            self._wakeup.notify()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def _run(self):
+        """後台線程：湊滿一批或間隔到期時寫入"""
+        retry = False
+        while True:
+            with self._wakeup:
+                # 寫入失敗後至少等待一個間隔再重試，避免緩衝已滿時空轉
+                if not self._closed and (retry or len(self._buffer) < self.batch_size):
+                    self._wakeup.wait(self.flush_interval)
+                if self._closed:
+                    return
+            retry = self.flush() == 0 and self.pending_count() > 0
+
+
+# 全局寫入器實例，由 app.py 調用 init_app 綁定
+log_writer = LogWriter()
@@ -0,0 +1,279 @@
+import os
+import json
+import hashlib
+import logging
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Optional
+from metrics import CACHE_LOOKUPS
+import pdf_reader
+
+# 設置日誌
+logger = logging.getLogger(__name__)
+
+# 計算哈希時每次讀取的塊大小
+HASH_CHUNK_SIZE = 1024 * 1024
+# 只讀取頭部信息的大文件（見 PDF_HEADER_ONLY_MB）按頭、中、尾各取此大小的樣本計算哈希
+HASH_SAMPLE_MB = float(os.environ.get("HASH_SAMPLE_MB", 4))
+
+
+@lru_cache(maxsize=4096)
+def _hash_file(path: str, size: int, mtime: float) -> str:
+    """按 (路徑, 大小, 修改時間) 緩存文件哈希，避免同一文件在一次掃描中被重複讀取"""
+    sha256 = hashlib.sha256()
+    sample = int(HASH_SAMPLE_MB * pdf_reader.MB)
+    with open(path, 'rb') as file:
+        if 3 * sample < size and pdf_reader.is_header_only(path):
+            # 文件頭、中間和尾部（交叉引用表和尾部字典）加上文件大小，足以區分不同的文件；
+            # 前綴保證抽樣哈希不會與完整哈希相同
+            sha256.update(b'sampled:%d:' % size)
+            for offset in (0, (size - sample) // 2, size - sample):
+                file.seek(offset)
+                sha256.update(file.read(sample))
+            return sha256.hexdigest()
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def compute_file_hash(pdf_path: str) -> str:
+    """
+    計算文件內容的SHA-256哈希
+
+    超過 PDF_HEADER_ONLY_MB 的文件只讀取頭、中、尾的樣本，這些文件本來就不逐頁解析，
+    不應為了緩存和重複檢測讀完整個文件。
+    
+    Args:
+        pdf_path (str): 文件路徑
+        
+    Returns:
+        str: 十六進制哈希字符串
+    """
+    stat = os.stat(pdf_path)
+    return _hash_file(os.path.abspath(pdf_path), stat.st_size, stat.st_mtime)
+
+
+class MetadataCache:
+    """
+    以文件內容哈希為鍵的持久化元數據緩存
+    
+    命中緩存時可以同時跳過PDF解析和API調用。先用 (路徑, 大小, 修改時間) 做快速檢查，
+    不匹配時才計算內容哈希。用法與 Flask 擴展相同：先創建實例，再調用 init_app(app)。
+    """
+    def __init__(self, app=None):
+        """初始化緩存，未綁定應用前緩存處於停用狀態"""
+        self.app = None
+        self.enabled = False
+        self.max_entries = 0
+        # 緩存條目數，第一次寫入時從數據庫讀取，之後新增條目時遞增，淘汰時重新統計
+        self._entry_count = None
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        """
+        綁定Flask應用並從環境變量讀取配置
+        
+        環境變量:
+            METADATA_CACHE_ENABLED: 設為 0/false 可停用緩存（默認啟用）
+            METADATA_CACHE_MAX_ENTRIES: 最多保留的緩存條目數，0 表示不限制（默認 50000）
+        """
+        from models import db, CachedMetadata
+        
+        self.app = app
+        self._db = db
+        self._model = CachedMetadata
+        self.enabled = os.environ.get("METADATA_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+        self.max_entries = int(os.environ.get("METADATA_CACHE_MAX_ENTRIES", 50000))
+        logger.info(f"元數據緩存{'已啟用' if self.enabled else '已停用'}，上限 {self.max_entries} 條")
+    
+    def is_enabled(self) -> bool:
+        """緩存是否可用"""
+        return self.enabled and self.app is not None
+    
+    def lookup(self, pdf_path: str, extractor: str = '', content_hash: Optional[str] = None,
+               hash_file: bool = True) -> Optional[Dict[str, str]]:
+        """
+        查找文件的緩存元數據
+        
+        Args:
+            pdf_path (str): PDF文件路徑
+            extractor (str): 產生元數據的模型標識，與緩存條目不一致時視為未命中
+            content_hash (str, optional): 已計算的內容哈希（如在提取進程中算出），快速檢查不匹配時直接使用
+            hash_file (bool): 快速檢查不匹配且沒有傳入哈希時是否讀取文件計算哈希；
+                              為False時直接返回None且不計入未命中，由之後帶哈希的查找計數
+            
+        Returns:
+            Optional[Dict[str, str]]: 命中時返回元數據字典，否則返回None
+        """
+        if not self.is_enabled():
+            return None
+        
+        try:
+            path = os.path.abspath(pdf_path)
+            stat = os.stat(path)
+            
+            with self.app.app_context():
+                # 快速檢查：路徑、大小、修改時間均未變化時無需讀取文件內容
+                entry = self._model.query.filter_by(file_path=path).first()
+                if not (entry and entry.file_size == stat.st_size and entry.file_mtime == stat.st_mtime):
+                    if content_hash is None:
+                        if not hash_file:
+                            return None
+                        content_hash = _hash_file(path, stat.st_size, stat.st_mtime)
+                    entry = self._model.query.filter_by(content_hash=content_hash).first()
+                
+                if not entry or entry.extractor != extractor:
+                    CACHE_LOOKUPS.inc(result='miss')
+                    return None
+                
+                entry.file_path = path
+                entry.file_size = stat.st_size
+                entry.file_mtime = stat.st_mtime
+                entry.hit_count = (entry.hit_count or 0) + 1
+                entry.last_used_at = datetime.utcnow()
+                metadata = json.loads(entry.metadata_json)
+                self._db.session.commit()
+            
+            CACHE_LOOKUPS.inc(result='hit')
+            logger.info(f"元數據緩存命中: {pdf_path}")
+            return metadata
+        
+        except Exception as e:
+            CACHE_LOOKUPS.inc(result='error')
+            logger.warning(f"讀取元數據緩存時出錯: {str(e)}")
+            return None
+    
+    def store(self, pdf_path: str, metadata: Dict[str, str], extractor: str = '') -> None:
+        """
+        保存文件的元數據到緩存
+        
+        Args:
+            pdf_path (str): PDF文件路徑
+            metadata (Dict[str, str]): 提取的元數據
+            extractor (str): 產生元數據的模型標識
+        """
+        if not self.is_enabled():
+            return
+        
+        try:
+            path = os.path.abspath(pdf_path)
+            stat = os.stat(path)
+            content_hash = _hash_file(path, stat.st_size, stat.st_mtime)
+            
+            with self.app.app_context():
+                entry = self._model.query.filter_by(content_hash=content_hash).first()
+                added = entry is None
+                if added:
+                    entry = self._model(content_hash=content_hash, hit_count=0)
+                    self._db.session.add(entry)
+                entry.file_path = path
+                entry.file_size = stat.st_size
+                entry.file_mtime = stat.st_mtime
+                entry.extractor = extractor
+                entry.metadata_json = json.dumps(metadata, ensure_ascii=False)
+                entry.last_used_at = datetime.utcnow()
+                self._db.session.commit()
+                
+                if self.max_entries and added:
+                    if self._entry_count is None:
+                        self._entry_count = self._model.query.count()
+                    else:
+                        self._entry_count += 1
+                    if self._entry_count > self.max_entries:
+                        self._prune()
+        
+        except Exception as e:
+            logger.warning(f"寫入元數據緩存時出錯: {str(e)}")
+    
+    def update_path(self, old_path: str, new_path: str) -> None:
+        """
+        文件重命名後更新緩存條目中的路徑，使下次掃描可以走快速檢查
+        
+        Args:
+            old_path (str): 原始路徑
+            new_path (str): 新路徑
+        """
+        if not self.is_enabled():
+            return
+        
+        try:
+            with self.app.app_context():
+                entry = self._model.query.filter_by(file_path=os.path.abspath(old_path)).first()
+                if entry:
+                    entry.file_path = os.path.abspath(new_path)
+                    self._db.session.commit()
+        except Exception as e:
+            logger.warning(f"更新元數據緩存路徑時出錯: {str(e)}")
+    
+    def invalidate(self, pdf_path: str) -> int:
+        """
+        刪除指定文件的緩存條目
+        
+        Args:
+            pdf_path (str): PDF文件路徑
+            
+        Returns:
+            int: 刪除的條目數
+        """
+        if self.app is None:
+            return 0
+        
+        path = os.path.abspath(pdf_path)
+        with self.app.app_context():
+            query = self._model.query.filter_by(file_path=path)
+            if os.path.isfile(path):
+                query = self._model.query.filter(
+                    (self._model.file_path == path) |
+                    (self._model.content_hash == compute_file_hash(path))
+                )
+            deleted = query.delete(synchronize_session=False)
+            self._db.session.commit()
+        self._entry_count = None
+        return deleted
+    
+    def clear(self) -> int:
+        """
+        清空所有緩存條目
+        
+        Returns:
+            int: 刪除的條目數
+        """
+        if self.app is None:
+            return 0
+        
+        with self.app.app_context():
+            deleted = self._model.query.delete()
+            self._db.session.commit()
+        self._entry_count = None
+        _hash_file.cache_clear()
+        logger.info(f"已清空元數據緩存，共 {deleted} 條")
+        return deleted
+    
+    def _prune(self) -> None:
+        """
+        超出上限時按最近使用時間淘汰最舊的條目（需在應用上下文中調用）
+
+        計數只包括本進程的寫入，其他進程（如命令行）共用數據庫時可能暫時超出上限，
+        此處重新統計實際條目數，下一次寫入時即會淘汰。
+        """
+        count = self._model.query.count()
+        excess = count - self.max_entries
+        self._entry_count = count
+        if excess <= 0:
+            return
+        
+        stale_ids = [
+            row.id for row in self._model.query
+            .with_entities(self._model.id)
+            .order_by(self._model.last_used_at.asc())
+            .limit(excess)
+        ]
+        self._model.query.filter(self._model.id.in_(stale_ids)).delete(synchronize_session=False)
+        self._db.session.commit()
+        self._entry_count = count - len(stale_ids)
+        logger.info(f"元數據緩存超出上限，已淘汰 {len(stale_ids)} 條")
+
+
+# 全局緩存實例，由 app.py 調用 init_app 綁定
+metadata_cache = MetadataCache()
@@ -1,57 +1,176 @@
+import os
+import re
 import logging
-import PyPDF2
-from ai_metadata_extractor import SiliconFlowQwenExtractor
+import contextlib
+from extractor_backends import get_extractor
+from metadata_cache import metadata_cache, compute_file_hash
+from journal_index import journal_index
+from duplicate_index import duplicate_index, compute_fingerprint
+from fulltext_index import fulltext_index
+from metrics import collect_timings, stage
+from pdf_reader import ParseBudget, open_pdf, is_header_only
+from text_backends import get_text_backends, FALLBACKS as TEXT_FALLBACKS
 
 # 設置日誌
 logger = logging.getLogger(__name__)
 
-# 初始化AI提取器
-ai_extractor = SiliconFlowQwenExtractor()
-USE_AI_EXTRACTION = ai_extractor.is_available()
+# 文本提取配置：最多讀取的頁數和字符預算（超出模型上下文的文本會被截斷，無需解析）
+MAX_PDF_PAGES = int(os.environ.get("PDF_MAX_PAGES", 10))
+PDF_TEXT_CHAR_BUDGET = int(os.environ.get("PDF_TEXT_CHAR_BUDGET", 30000))
+# 全文索引的正文：提前停止之後繼續讀取到第幾頁為止，以及最多保存的字符數
+FULLTEXT_MAX_PAGES = int(os.environ.get("FULLTEXT_MAX_PAGES", 50))
+FULLTEXT_MAX_CHARS = int(os.environ.get("FULLTEXT_MAX_CHARS", 500000))
 
-def extract_metadata_from_pdf(pdf_path):
+# 判斷是否已有足夠信息的啟發式規則
+YEAR_PATTERN = re.compile(r'\b(?:19|20)\d{2}\b')
+AUTHOR_PATTERN = re.compile(r'\b[A-Z][a-z]+(?:\s+[A-Z]\.)*\s+[A-Z][a-z]+(?:\s*[,*¹²³†‡]|\s+and\b)|作者')
+PAGE_MARKER_PATTERN = re.compile(r'第(\d+)頁內容:')
+
+# 是否使用離線期刊索引統一期刊縮寫
+JOURNAL_INDEX_ENABLED = os.environ.get("JOURNAL_INDEX_ENABLED", "1").lower() not in ("0", "false", "no")
+
+# 本地提取：置信度達到閾值且命名所需字段齊全時不再調用語言模型
+LOCAL_METADATA_MIN_CONFIDENCE = float(os.environ.get("LOCAL_METADATA_MIN_CONFIDENCE", 0.7))
+DOI_PATTERN = re.compile(r'\b(10\.\d{4,9}/[^\s"<>]+)', re.IGNORECASE)
+ARXIV_PATTERN = re.compile(r'arXiv:\s*(\d{2})(\d{2})\.(\d{4,5})(v\d+)?', re.IGNORECASE)
+ISSN_PATTERN = re.compile(r'\b(?:e-?)?ISSN[:\s]*(\d{4}-\d{3}[\dX])\b', re.IGNORECASE)
+COPYRIGHT_YEAR_PATTERN = re.compile(r'(?:©|\(c\)|copyright)\s*(?:\D{0,20}?)((?:19|20)\d{2})', re.IGNORECASE)
+JUNK_TITLE_PATTERN = re.compile(
+    r'^(untitled|document\d*|microsoft word\b.*|title|\d+)$|\.(pdf|docx?|dvi|tex|ps)$', re.IGNORECASE
+)
+
+def get_cached_metadata(pdf_path, content_hash=None, hash_file=True):
+    """
+    查找文件的緩存元數據（與當前使用的模型綁定）
+    
+    Args:
+        pdf_path (str): PDF文件路徑
+        content_hash (str, optional): 已計算的內容哈希，見 extract_pdf_content 結果中的 content_hash
+        hash_file (bool): 為False時只做路徑、大小和修改時間的快速檢查，不讀取文件
+        
+    Returns:
+        dict | None: 命中時返回元數據字典，否則返回None
+    """
+    if not metadata_cache.is_enabled():
+        return None
+    with stage('cache_lookup'):
+        return metadata_cache.lookup(
+            pdf_path, extractor=get_extractor().model, content_hash=content_hash, hash_file=hash_file
+        )
+
+def check_duplicate(pdf_path, content):
+    """
+    在調用API之前查找與文件重複的已處理論文，結果寫入 content['duplicate']
+    
+    content 中沒有指紋時（如命中緩存、未提取文本）只計算字節哈希，按完全相同的文件查找。
+    
+    Args:
+        pdf_path (str): PDF文件路徑
+        content (dict): extract_pdf_content 的結果，會被原地修改
+        
+    Returns:
+        dict | None: 找到時返回原論文的 path、metadata、similarity 和 exact，否則返回None
+    """
+    content['duplicate'] = None
+    if not duplicate_index.is_enabled():
+        return None
+    with stage('duplicate_check'):
+        try:
+            if not content.get('fingerprint'):
+                content['fingerprint'] = compute_fingerprint(pdf_path, content_hash=content.get('content_hash'))
+        except OSError as e:
+            logger.warning(f"計算文件指紋時出錯 {pdf_path}: {str(e)}")
+            return None
+        content['duplicate'] = duplicate_index.find(pdf_path, content['fingerprint'])
+    if content['duplicate']:
+        logger.info(
+            f"{pdf_path} 與已處理的 {content['duplicate']['path']} 重複"
+            f"（相似度 {content['duplicate']['similarity']}），沿用其元數據"
+        )
+    return content['duplicate']
+
+def extract_metadata_from_pdf(pdf_path, content=None):
     """
     直接從PDF文件提取文本並使用語言模型提取元數據
     
     Args:
         pdf_path (str): PDF文件路徑
+        content (dict, optional): 傳入時寫入提取結果，包括 fingerprint 和 duplicate（重複檢測結果）
         
     Returns:
         dict: 包含提取的元數據的字典
     """
-    # 默認元數據
-    metadata = {
-        'author_lastname': '',
-        'journal': '',
-        'journal_abbr': '',
-        'year': '',
-        'title': '',
-        'doc_type': 'paper'
-    }
+    content = {} if content is None else content
+    
+    # 命中緩存時直接返回，跳過PDF解析和API調用（只按字節哈希查找重複）
+    cached_metadata = get_cached_metadata(pdf_path)
+    if cached_metadata:
+        check_duplicate(pdf_path, content)
+        return cached_metadata
     
     logger.info(f"從PDF提取文本並使用AI提取元數據: {pdf_path}")
     
     try:
-        # 從PDF提取文本
-        text = extract_text_from_pdf(pdf_path)
+        # 從PDF提取文本和本地元數據
+        content.update(extract_pdf_content(pdf_path))
+    except Exception as e:
+        logger.error(f"提取元數據過程中發生錯誤: {str(e)}", exc_info=True)
+        return _default_metadata()
+    
+    return extract_metadata_from_content(pdf_path, content)
+
+def extract_metadata_from_content(pdf_path, content):
+    """
+    根據 extract_pdf_content 的結果提取元數據，成功時寫入緩存
+    
+    與已處理的論文重複時沿用原論文的元數據（結果見 content['duplicate']）；本地提取結果足夠可靠時直接使用，
+    否則調用語言模型，並用本地結果補全模型未給出的字段。
+    
+    Args:
+        pdf_path (str): PDF文件路徑（用於緩存和讀取更多頁面）
+        content (dict): 包含 text、local_metadata 和 confidence 的字典，會寫入 duplicate 字段
         
-        # 如果無法提取文本，返回空元數據
+    Returns:
+        dict: 包含提取的元數據的字典
+    """
+    text = content.get('text', '')
+    local_metadata, confidence = normalize_local_metadata(content)
+    
+    # 默認元數據（用本地提取結果填充）
+    metadata = _merge_metadata(_default_metadata(), local_metadata)
+    
+    try:
+        duplicate = check_duplicate(pdf_path, content)
+        if duplicate and duplicate['metadata']:
+            return dict(duplicate['metadata'])
+        
+        if is_local_metadata_sufficient(local_metadata, confidence):
+            logger.info(f"本地元數據已足夠（置信度 {confidence:.2f}），跳過API調用: {pdf_path}")
+            _store_in_cache(pdf_path, metadata)
+            return metadata
+        
+        # 如果無法提取文本，返回本地結果
         if not text:
             logger.warning(f"無法從PDF提取文本: {pdf_path}")
             return metadata
         
-        # 使用通義千問API提取元數據
-        if USE_AI_EXTRACTION:
-            logger.info("使用通義千問API直接提取元數據...")
-            ai_metadata = ai_extractor.extract_pdf_metadata(text)
+        # 使用配置的提取後端（默認為通義千問API）提取元數據
+        extractor = get_extractor()
+        if extractor.is_available():
+            logger.info("使用提取後端提取元數據...")
+            ai_metadata = extractor.extract_pdf_metadata(
+                text, fetch_more=lambda: extract_more_text(pdf_path, text)
+            )
             
             if ai_metadata:
                 logger.info(f"成功提取元數據: {ai_metadata}")
+                ai_metadata = normalize_journal(_merge_metadata(ai_metadata, local_metadata))
+                _store_in_cache(pdf_path, ai_metadata)
                 return ai_metadata
             else:
-                logger.warning("AI提取元數據失敗，返回空值")
+                logger.warning("AI提取元數據失敗，返回本地提取結果")
         else:
-            logger.warning("未設置SiliconFlow API密鑰，無法提取元數據")
+            logger.warning("沒有可用的提取後端（如未設置SiliconFlow API密鑰），僅使用本地提取的元數據")
         
         return metadata
         
@@ -59,43 +178,473 @@ def extract_metadata_from_pdf(pdf_path):
         logger.error(f"提取元數據過程中發生錯誤: {str(e)}", exc_info=True)
         return metadata
 
-def extract_text_from_pdf(pdf_path):
+def extract_metadata_from_contents(contents):
+    """
+    批量提取多個PDF的元數據，需要調用模型的文檔共用一次API請求，成功的結果寫入緩存
+    
+    Args:
+        contents (dict): PDF文件路徑到 extract_pdf_content 結果的映射，每個結果會寫入 duplicate 字段
+        
+    Returns:
+        dict: PDF文件路徑到元數據字典的映射
+    """
+    results = {}
+    documents = {}
+    local_by_path = {}
+    for pdf_path, content in contents.items():
+        local_metadata, confidence = normalize_local_metadata(content)
+        local_by_path[pdf_path] = local_metadata
+        results[pdf_path] = _merge_metadata(_default_metadata(), local_metadata)
+        duplicate = check_duplicate(pdf_path, content)
+        if duplicate and duplicate['metadata']:
+            results[pdf_path] = dict(duplicate['metadata'])
+        elif is_local_metadata_sufficient(local_metadata, confidence):
+            logger.info(f"本地元數據已足夠，跳過API調用: {pdf_path}")
+            _store_in_cache(pdf_path, results[pdf_path])
+        elif content.get('text'):
+            documents[pdf_path] = content['text']
+        else:
+            logger.warning(f"無法從PDF提取文本: {pdf_path}")
+    
+    if not documents:
+        return results
+    extractor = get_extractor()
+    if not extractor.is_available():
+        logger.warning("沒有可用的提取後端（如未設置SiliconFlow API密鑰），僅使用本地提取的元數據")
+        return results
+    
+    try:
+        batch_metadata = extractor.extract_pdf_metadata_batch(
+            documents, fetch_more=lambda pdf_path: extract_more_text(pdf_path, documents[pdf_path])
+        )
+    except Exception as e:
+        logger.error(f"批量提取元數據過程中發生錯誤: {str(e)}", exc_info=True)
+        return results
+    
+    for pdf_path, ai_metadata in batch_metadata.items():
+        ai_metadata = normalize_journal(_merge_metadata(ai_metadata, local_by_path[pdf_path]))
+        _store_in_cache(pdf_path, ai_metadata)
+        results[pdf_path] = ai_metadata
+    
+    return results
+
+def is_local_metadata_sufficient(local_metadata, confidence):
+    """
+    判斷本地提取的元數據是否足以命名文件而無需調用語言模型
+    
+    Args:
+        local_metadata (dict): 本地提取的元數據
+        confidence (float): 本地提取的置信度
+        
+    Returns:
+        bool: 命名所需字段齊全且置信度達到閾值時返回True
+    """
+    if confidence < LOCAL_METADATA_MIN_CONFIDENCE:
+        return False
+    required_fields = ['author_lastname', 'year', 'title']
+    if local_metadata.get('doc_type') != 'book':
+        required_fields.append('journal_abbr')
+    return all(local_metadata.get(field) for field in required_fields)
+
+def normalize_journal(metadata):
+    """
+    用離線期刊索引統一期刊名稱和縮寫（按ISSN、DOI前綴或名稱查找），不調用API
+    
+    Args:
+        metadata (dict): 元數據字典（會被原地修改）
+        
+    Returns:
+        dict: 同一個元數據字典
+    """
+    if JOURNAL_INDEX_ENABLED:
+        with stage('journal_normalize'):
+            journal_index.normalize_journal_fields(metadata)
+    return metadata
+
+def normalize_local_metadata(content):
+    """
+    用期刊索引統一本地元數據的期刊字段，並重新計算置信度
+    
+    按ISSN、DOI或期刊名稱在索引中找到期刊時，期刊字段的可信度取用於查找的字段的可信度
+    （名稱模糊匹配時再乘以相似度），因此只有ISSN或DOI的論文也可以不調用API完成命名。
+    
+    Args:
+        content (dict): extract_pdf_content 的結果，不會被修改
+        
+    Returns:
+        tuple: (統一後的本地元數據字典, 置信度)
+    """
+    local_metadata = dict(content.get('local_metadata') or {})
+    confidence = content.get('confidence', 0.0)
+    if not JOURNAL_INDEX_ENABLED:
+        return local_metadata, confidence
+    with stage('journal_normalize'):
+        entry = journal_index.normalize_journal_fields(local_metadata)
+    scores = dict(content.get('local_scores') or {})
+    if entry and scores:
+        score = scores.get(entry['source'], 0.0) * entry['score']
+        for field in ('journal', 'journal_abbr'):
+            scores[field] = max(scores.get(field, 0.0), score)
+        confidence = local_confidence(scores)
+    return local_metadata, confidence
+
+def local_confidence(scores):
+    """命名所需字段中最低的來源可信度，缺少字段時為0"""
+    return min(scores.get(field, 0.0) for field in ('author_lastname', 'year', 'title', 'journal_abbr'))
+
+def _merge_metadata(metadata, fallback):
+    """用 fallback 中的值填充 metadata 中為空的字段"""
+    for field, value in fallback.items():
+        if value and not metadata.get(field):
+            metadata[field] = value
+    return metadata
+
+def _store_in_cache(pdf_path, metadata):
+    """僅緩存有實際內容的結果，失敗的文件下次仍會重試"""
+    if any(metadata.get(field) for field in ('author_lastname', 'title', 'year', 'journal')):
+        metadata_cache.store(pdf_path, metadata, extractor=get_extractor().model)
+
+def _default_metadata():
+    """返回所有字段為空的默認元數據"""
+    return {
+        'author_lastname': '',
+        'journal': '',
+        'journal_abbr': '',
+        'year': '',
+        'title': '',
+        'doc_type': 'paper'
+    }
+
+def iter_pdf_pages(document, start_page=0, max_pages=MAX_PDF_PAGES, budget=None):
+    """
+    逐頁惰性提取PDF文本的生成器，調用方停止迭代後不會再解析後續頁面
+    
+    Args:
+        document (TextDocument): 由文本引擎打開的PDF
+        start_page (int): 起始頁索引（從0開始）
+        max_pages (int): 最多讀到第幾頁為止
+        budget (ParseBudget, optional): 解析預算，超出後停止
+        
+    Yields:
+        tuple: (頁索引, 頁面文本)
     """
-    從PDF文件提取完整文本內容
+    end_page = min(max_pages, document.page_count)
+    for i in range(start_page, end_page):
+        reason = budget.exceeded() if budget else None
+        if reason:
+            logger.warning(f"{reason}，停止於第{i+1}頁")
+            return
+        yield i, document.page_text(i)
+
+def extract_pages_text(pdf_path, reader, text, start_page=0, max_pages=MAX_PDF_PAGES, budget=None, early_stop=True,
+                       char_budget=None):
+    """
+    按 PDF_TEXT_BACKENDS 的順序用文本引擎逐頁提取文本
+    
+    引擎出錯或有頁面可讀卻沒有提取到任何文本時，改用下一個引擎重新提取，
+    最後一個引擎的結果無論是否為空都會返回。
     
     Args:
         pdf_path (str): PDF文件路徑
+        reader (PyPDF2.PdfReader): 已打開的PDF，供 PyPDF2 引擎使用
+        text (str): 已提取的文本（PDF屬性），用於判斷信息是否足夠
+        start_page (int): 起始頁索引
+        max_pages (int): 最多讀到第幾頁為止
+        budget (ParseBudget, optional): 解析預算，所有引擎共用
+        early_stop (bool): 是否在信息足夠時提前停止
+        char_budget (int, optional): 字符預算（包括 text），默認為 PDF_TEXT_CHAR_BUDGET
+        
+    Returns:
+        tuple: (追加的頁面文本, 使用的引擎名稱)
+    """
+    char_budget = PDF_TEXT_CHAR_BUDGET if char_budget is None else char_budget
+    backends = get_text_backends()
+    for index, backend in enumerate(backends):
+        pages_text = ""
+        pages_read = 0
+        try:
+            with backend.open(pdf_path, reader) as document:
+                for i, page_text in iter_pdf_pages(document, start_page, max_pages, budget):
+                    pages_read += 1
+                    if page_text.strip():
+                        pages_text += f"第{i+1}頁內容:\n{page_text}\n\n"
+                    if len(text) + len(pages_text) >= char_budget:
+                        logger.debug(f"達到字符預算，停止於第{i+1}頁: {pdf_path}")
+                        break
+                    if early_stop and has_enough_signal(text + pages_text):
+                        logger.debug(f"已找到足夠信息，停止於第{i+1}頁: {pdf_path}")
+                        break
+        except Exception as e:
+            logger.warning(f"文本引擎 {backend.name} 提取失敗 {pdf_path}: {str(e)}")
+            pages_text, pages_read = "", None
+        
+        is_last = index == len(backends) - 1
+        if pages_text or pages_read == 0 or is_last or (budget and budget.exceeded()):
+            return pages_text, backend.name
+        if pages_read:
+            logger.info(f"文本引擎 {backend.name} 未提取到文本，改用 {backends[index+1].name}: {pdf_path}")
+        TEXT_FALLBACKS.inc(backend=backends[index+1].name)
+
+def has_enough_signal(text):
+    """
+    用簡單的啟發式規則判斷文本是否已經包含提取元數據所需的信息：
+    出版年份、類似標題的長行，以及類似作者姓名的片段
+    
+    Args:
+        text (str): 已提取的文本
+        
+    Returns:
+        bool: 三類信息都已出現時返回True
+    """
+    has_year = YEAR_PATTERN.search(text) is not None
+    has_title = any(20 <= len(line.strip()) <= 250 and len(line.split()) >= 3 for line in text.splitlines())
+    has_author = AUTHOR_PATTERN.search(text) is not None
+    return has_year and has_title and has_author
+
+def extract_text_from_pdf(pdf_path, start_page=0, early_stop=True):
+    """
+    從PDF文件逐頁提取文本內容
+    
+    默認在信息足夠（找到年份、標題和作者）或達到字符預算時停止，不再解析後續頁面。
+    
+    Args:
+        pdf_path (str): PDF文件路徑
+        start_page (int): 起始頁索引，大於0時不包含PDF屬性信息
+        early_stop (bool): 是否在信息足夠時提前停止
         
     Returns:
         str: 提取的文本內容
     """
-    try:
-        text = ""
-        with open(pdf_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            
-            # 提取PDF屬性信息（通常包含標題、作者等）
-            info = reader.metadata
-            if info:
-                # 嘗試從PDF屬性中獲取元數據
-                text += f"PDF標題: {info.get('/Title', '')}\n"
-                text += f"PDF作者: {info.get('/Author', '')}\n"
-                text += f"PDF主題: {info.get('/Subject', '')}\n"
-                text += f"PDF關鍵詞: {info.get('/Keywords', '')}\n\n"
+    return extract_pdf_content(pdf_path, start_page, early_stop)['text']
+
+def extract_pdf_content(pdf_path, start_page=0, early_stop=True, fingerprint=None, fulltext=None):
+    """
+    打開一次PDF，同時提取文本和本地元數據（PDF屬性、XMP、DOI/arXiv編號）
+    
+    文件以內存映射方式打開，只按需解析用到的頁面，並受單個文件的耗時和內存預算限制；
+    超過 PDF_HEADER_ONLY_MB 的文件只讀取PDF屬性、XMP和第一頁（header_only 為True）。
+    PDF屬性和XMP由 PyPDF2 讀取，頁面文本由 PDF_TEXT_BACKENDS 選擇的引擎提取。
+    
+    Args:
+        pdf_path (str): PDF文件路徑
+        start_page (int): 起始頁索引，大於0時不包含PDF屬性信息和本地元數據
+        early_stop (bool): 是否在信息足夠時提前停止
+        fingerprint (bool, optional): 是否計算重複檢測用的指紋，默認按當前進程中重複檢測是否啟用；
+            在提取進程中運行時（其中的索引未初始化）由調用方傳入主進程的設置
+        fulltext (bool, optional): 是否為全文索引繼續讀取正文（見 extract_body_text），默認與 fingerprint 相同，
+            按當前進程中全文索引是否啟用
+        
+    Returns:
+        dict: 包含 text（文本）、local_metadata（本地元數據）、confidence（置信度）、local_scores（各字段的來源可信度）、
+              content_hash（內容哈希，用於查找緩存）、fingerprint（重複檢測用的指紋）和
+              fulltext（全文索引的文本，包括提前停止之後的正文頁面）（均僅 start_page 為0時）、
+              text_backend（提取頁面文本的引擎）和 timings（各階段耗時，在提取進程中運行時由調用方併入文件的計時）的字典
+    """
+    content = {'text': '', 'local_metadata': {}, 'confidence': 0.0}
+    with collect_timings() as timings:
+        content['timings'] = timings
+        try:
+            text = ""
+            budget = ParseBudget()
+            content['header_only'] = header_only = is_header_only(pdf_path)
+            if header_only:
+                logger.info(f"文件過大，只讀取PDF屬性和第一頁: {pdf_path}")
+            with contextlib.ExitStack() as stack:
+                with stage('pdf_open'):
+                    reader = stack.enter_context(open_pdf(pdf_path))
+                    
+                    # 提取PDF屬性信息（通常包含標題、作者等）
+                    info = reader.metadata
+                if info and start_page == 0:
+                    # 嘗試從PDF屬性中獲取元數據
+                    text += f"PDF標題: {info.get('/Title', '')}\n"
+                    text += f"PDF作者: {info.get('/Author', '')}\n"
+                    text += f"PDF主題: {info.get('/Subject', '')}\n"
+                    text += f"PDF關鍵詞: {info.get('/Keywords', '')}\n\n"
+                
+                # 逐頁提取（通常前幾頁包含論文的主要信息）
+                with stage('text_extract'):
+                    max_pages = 1 if header_only else MAX_PDF_PAGES
+                    pages_text, content['text_backend'] = extract_pages_text(
+                        pdf_path, reader, text, start_page, max_pages, budget, early_stop
+                    )
+                    text += pages_text
+                
+                content['text'] = text
+                if start_page == 0:
+                    with stage('local_metadata'):
+                        content['local_scores'] = {}
+                        content['local_metadata'], content['confidence'] = extract_local_metadata(
+                            reader, text, content['local_scores']
+                        )
+                    if fulltext_index.is_enabled() if fulltext is None else fulltext:
+                        with stage('fulltext_extract'):
+                            body_text = "" if header_only else extract_body_text(pdf_path, reader, text, budget)
+                            content['fulltext'] = text + body_text
             
-            # 獲取總頁數
-            page_count = len(reader.pages)
+            if start_page == 0:
+                # 在提取進程中計算，主進程按內容查找緩存和重複時無需再讀取文件
+                with stage('content_hash'):
+                    content['content_hash'] = compute_file_hash(pdf_path)
+                if duplicate_index.is_enabled() if fingerprint is None else fingerprint:
+                    with stage('fingerprint'):
+                        content['fingerprint'] = compute_fingerprint(pdf_path, text, content['content_hash'])
             
-            # 提取前幾頁（通常包含論文的主要信息）
-            max_pages = min(10, page_count)  # 最多提取前10頁
-            for i in range(max_pages):
-                page = reader.pages[i]
-                page_text = page.extract_text()
-                if page_text:
-                    text += f"第{i+1}頁內容:\n{page_text}\n\n"
+            return content
+        
+        except Exception as e:
+            logger.error(f"提取PDF文本時發生錯誤: {str(e)}", exc_info=True)
+            return content
+
+def extract_body_text(pdf_path, reader, text, budget=None):
+    """
+    在提前停止的位置之後繼續提取正文頁面，供全文索引使用
+
+    提取元數據通常只需要前一兩頁，正文中的詞卻要整篇索引才能搜到；最多讀到第 FULLTEXT_MAX_PAGES 頁，
+    總長度不超過 FULLTEXT_MAX_CHARS，仍受同一個解析預算限制。
+    
+    Args:
+        pdf_path (str): PDF文件路徑
+        reader (PyPDF2.PdfReader): 已打開的PDF
+        text (str): 已提取的文本
+        budget (ParseBudget, optional): 解析預算
+        
+    Returns:
+        str: 追加的正文文本
+    """
+    page_numbers = PAGE_MARKER_PATTERN.findall(text)
+    start_page = int(page_numbers[-1]) if page_numbers else 0
+    if start_page >= FULLTEXT_MAX_PAGES or len(text) >= FULLTEXT_MAX_CHARS:
+        return ""
+    body_text, _ = extract_pages_text(
+        pdf_path, reader, text, start_page, FULLTEXT_MAX_PAGES, budget, early_stop=False, char_budget=FULLTEXT_MAX_CHARS
+    )
+    return body_text
+
+def extract_local_metadata(reader, text, scores=None):
+    """
+    不調用語言模型，從PDF屬性字典、XMP元數據和首頁文本中的DOI/arXiv編號提取元數據
+    
+    Args:
+        reader (PyPDF2.PdfReader): 已打開的PDF
+        text (str): 已提取的頁面文本
+        scores (dict, optional): 傳入時寫入每個字段的來源可信度，供 normalize_local_metadata 重新計算置信度
         
-        return text
+    Returns:
+        tuple: (元數據字典, 置信度)。置信度為命名所需字段中最低的來源可信度，缺少字段時為0
+    """
+    metadata = {}
+    scores = {} if scores is None else scores
+    
+    def put(field, value, score):
+        # 同一字段保留可信度最高的來源
+        value = value.strip() if isinstance(value, str) else value
+        if value and score > scores.get(field, 0):
+            metadata[field] = value
+            scores[field] = score
     
+    # XMP元數據（出版社通常會寫入 Dublin Core 和 PRISM 字段）
+    try:
+        xmp = reader.xmp_metadata
     except Exception as e:
-        logger.error(f"提取PDF文本時發生錯誤: {str(e)}", exc_info=True)
-        return ""
\ No newline at end of file
+        logger.debug(f"讀取XMP元數據時出錯: {str(e)}")
+        xmp = None
+    if xmp is not None:
+        try:
+            titles = xmp.dc_title or {}
+            title = titles.get('x-default') or next(iter(titles.values()), '')
+            if not JUNK_TITLE_PATTERN.search(title.strip()):
+                put('title', title, 0.9)
+            if xmp.dc_creator:
+                put('author_lastname', _lastname_from_author(xmp.dc_creator[0]), 0.9)
+            if xmp.dc_date:
+                put('year', str(xmp.dc_date[0].year), 0.6)
+            put('journal', _xmp_text(xmp, 'publicationName'), 0.9)
+            put('doi', _xmp_text(xmp, 'doi'), 0.9)
+            put('issn', _xmp_text(xmp, 'issn') or _xmp_text(xmp, 'eIssn'), 0.9)
+            cover_date = _xmp_text(xmp, 'coverDate') or _xmp_text(xmp, 'publicationDate')
+            if YEAR_PATTERN.search(cover_date):
+                put('year', YEAR_PATTERN.search(cover_date).group(0), 0.9)
+        except Exception as e:
+            logger.debug(f"解析XMP元數據時出錯: {str(e)}")
+    
+    # PDF屬性字典
+    info = reader.metadata
+    if info:
+        title = str(info.get('/Title', '') or '')
+        if len(title.strip()) >= 8 and not JUNK_TITLE_PATTERN.search(title.strip()):
+            put('title', title, 0.7)
+        put('author_lastname', _lastname_from_author(str(info.get('/Author', '') or '')), 0.7)
+        creation_date = str(info.get('/CreationDate', '') or '')
+        match = re.match(r'D:((?:19|20)\d{2})', creation_date)
+        if match:
+            # 創建日期不一定是出版年份
+            put('year', match.group(1), 0.5)
+    
+    # 首頁文本中的DOI、arXiv編號和版權年份
+    doi_match = DOI_PATTERN.search(text)
+    if doi_match:
+        put('doi', doi_match.group(1).rstrip('.,;)]}'), 0.8)
+    issn_match = ISSN_PATTERN.search(text)
+    if issn_match:
+        put('issn', issn_match.group(1), 0.8)
+    arxiv_match = ARXIV_PATTERN.search(text)
+    if arxiv_match:
+        put('journal', 'arXiv', 0.9)
+        put('journal_abbr', 'arXiv', 0.9)
+        put('year', f"20{arxiv_match.group(1)}", 0.9)
+        put('arxiv_id', f"{arxiv_match.group(1)}{arxiv_match.group(2)}.{arxiv_match.group(3)}", 0.9)
+    copyright_match = COPYRIGHT_YEAR_PATTERN.search(text)
+    if copyright_match:
+        put('year', copyright_match.group(1), 0.7)
+    
+    return metadata, local_confidence(scores)
+
+def _xmp_text(xmp, name):
+    """讀取任意命名空間下指定名稱的XMP字段文本（如 prism:publicationName）"""
+    for node in xmp.rdf_root.getElementsByTagNameNS('*', name):
+        # 值可能直接是文本，也可能包在 rdf:Alt/rdf:Seq 的 rdf:li 中
+        for item in node.getElementsByTagNameNS('*', 'li') or [node]:
+            value = ''.join(child.data for child in item.childNodes if child.nodeType == child.TEXT_NODE)
+            if value.strip():
+                return value.strip()
+    # 也可能以 rdf:Description 的屬性形式出現
+    for description in xmp.rdf_root.getElementsByTagNameNS('*', 'Description'):
+        for attribute in description.attributes.values():
+            if attribute.localName == name and attribute.value.strip():
+                return attribute.value.strip()
+    return ''
+
+def _lastname_from_author(author):
+    """
+    從作者字符串中提取第一作者的姓氏
+    
+    支持 "Smith, John; Doe, Jane"、"John Smith and Jane Doe"、"John Smith, Jane Doe" 和中文姓名
+    """
+    first_author = re.split(r';|\band\b|&', author.strip())[0].strip()
+    if ',' in first_author:
+        before_comma, after_comma = [part.strip() for part in first_author.split(',', 1)]
+        if len(before_comma.split()) == 1 and after_comma:
+            # "Smith, John" 形式：逗號前為姓
+            return before_comma
+        # "John Smith, Jane Doe" 形式：取第一個名字
+        first_author = before_comma
+    if re.fullmatch(r'[\u4e00-\u9fff]{2,4}', first_author):
+        return first_author[0]
+    parts = first_author.split()
+    return parts[-1] if parts else ''
+
+def extract_more_text(pdf_path, text):
+    """
+    在已提取文本之後繼續提取後續頁面，供AI提取器在首次結果缺少主要字段時調用
+    
+    Args:
+        pdf_path (str): PDF文件路徑
+        text (str): 已提取的文本
+        
+    Returns:
+        str: 追加的文本，沒有更多頁面時返回空字符串
+    """
+    page_numbers = PAGE_MARKER_PATTERN.findall(text)
+    start_page = int(page_numbers[-1]) if page_numbers else 0
+    return extract_text_from_pdf(pdf_path, start_page=start_page, early_stop=False)
@@ -0,0 +1,311 @@
+import time
+import bisect
+import threading
+import contextlib
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# 各階段耗時直方圖的桶上界（秒），覆蓋從毫秒級的解析到分鐘級的API等待
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def _escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape_label(value)}"' for key, value in labels.items()) + '}'
+
+
+class _Metric:
+    """指標基類：按標籤值保存樣本，標籤名在創建時固定"""
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} 需要標籤 {self.labelnames}，收到 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        """(指標名後綴, 標籤, 值)"""
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """只增不減的計數器"""
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        if not self.labelnames:
+            # 無標籤的計數器從0開始輸出，便於計算增長率
+            self._values[()] = 0.0
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in sorted(items):
+            yield '', dict(zip(self.labelnames, key)), value
+
+
+class Gauge(_Metric):
+    """
+    瞬時值
+
+    可以直接 set()，也可以提供回調在採集時讀取當前值（如隊列深度）。
+    有標籤時回調返回 {標籤值: 數值}，無標籤時返回數值。
+    """
+    type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 function: Optional[Callable] = None):
+        super().__init__(name, documentation, labelnames)
+        if len(self.labelnames) > 1 and function is not None:
+            raise ValueError("回調式儀表最多支持一個標籤")
+        self.function = function
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        if self.function is None:
+            with self._lock:
+                items = sorted(self._values.items())
+            for key, value in items:
+                yield '', dict(zip(self.labelnames, key)), value
+            return
+        current = self.function()
+        if self.labelnames:
+            for label_value, value in sorted(current.items()):
+                yield '', {self.labelnames[0]: label_value}, value
+        else:
+            yield '', {}, current
+
+
+class Histogram(_Metric):
+    """累積桶直方圖（Prometheus 語義：每個桶計數包含所有更小的觀測值）"""
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            state['counts'][index] += 1
+            state['sum'] += value
+            state['count'] += 1
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state['count'] if state else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, dict(state, counts=list(state['counts']))) for key, state in self._values.items())
+        for key, state in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state['counts']):
+                cumulative += count
+                yield '_bucket', dict(labels, le=_format_value(bound)), cumulative
+            yield '_sum', labels, state['sum']
+            yield '_count', labels, state['count']
+
+
+class MetricsRegistry:
+    """指標註冊表，render() 輸出 Prometheus 文本格式"""
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # 模塊重新導入或重複註冊時返回已有的指標
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              function: Optional[Callable] = None) -> Gauge:
+        gauge = self._register(Gauge(name, documentation, labelnames, function))
+        if function is not None:
+            gauge.function = function
+        return gauge
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # 某個回調出錯不影響其他指標
+                lines.append(f"# {metric.name} 採集失敗: {e}")
+        return '\n'.join(lines) + '\n'
+
+
+# 全局註冊表和流水線指標
+registry = MetricsRegistry()
+
+FILES_PROCESSED = registry.counter('pdf_files_processed_total', '已處理的文件數', ['status'])
+PROCESSING_SECONDS = registry.histogram('pdf_processing_seconds', '單個文件從提交到完成的耗時')
+STAGE_SECONDS = registry.histogram('pdf_stage_seconds', '單個文件在各處理階段的耗時', ['stage'])
+API_REQUESTS = registry.counter('pdf_api_requests_total', 'API請求次數（含重試），按狀態碼統計', ['status'])
+API_RETRIES = registry.counter('pdf_api_retries_total', 'API請求重試次數')
+API_TOKENS = registry.counter('pdf_api_tokens_total', 'API響應中報告的令牌用量', ['type'])
+API_SECONDS = registry.histogram('pdf_api_request_seconds', '單次API HTTP請求的耗時（不含退避等待）')
+CACHE_LOOKUPS = registry.counter('pdf_metadata_cache_lookups_total', '元數據緩存查找次數', ['result'])
+LOG_FLUSH_SECONDS = registry.histogram('pdf_log_flush_seconds', '批量寫入處理日誌的耗時')
+
+
+# ---- 單個文件的分階段計時和令牌用量 ----
+
+# 與耗時收集在同一個字典中的令牌用量鍵
+USAGE_KEYS = ('prompt_tokens', 'completion_tokens')
+
+_local = threading.local()
+
+
+def _timing_stack() -> List[Dict[str, float]]:
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+@contextlib.contextmanager
+def collect_timings(timings: Optional[Dict[str, float]] = None) -> Iterator[Dict[str, float]]:
+    """
+    收集當前線程中 stage() 記錄的各階段耗時和 record_usage() 記錄的令牌用量
+
+    嵌套使用時，內層退出後其耗時會併入外層，因此在同一線程中調用的
+    extract_pdf_content 等函數既能單獨返回計時，也會計入整個文件的計時。
+
+    Args:
+        timings (dict, optional): 在已有的計時上繼續累加（如提取進程返回的計時）
+
+    Yields:
+        dict: 階段名到秒數的映射，記錄過令牌用量時還包含 USAGE_KEYS 中的鍵（用 split_usage() 拆分）
+    """
+    timings = {} if timings is None else timings
+    stack = _timing_stack()
+    stack.append(timings)
+    try:
+        yield timings
+    finally:
+        stack.pop()
+        if stack:
+            merge_timings(stack[-1], timings)
+
+
+@contextlib.contextmanager
+def stage(name: str) -> Iterator[None]:
+    """記錄一個處理階段的耗時，不在 collect_timings() 中時不做任何事"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stack = _timing_stack()
+        if stack:
+            timings = stack[-1]
+            timings[name] = round(timings.get(name, 0.0) + time.perf_counter() - start, 6)
+
+
+def record_usage(usage: Optional[Dict]) -> None:
+    """
+    把API響應中的令牌用量計入當前文件，與分階段耗時一起收集
+
+    Args:
+        usage (dict, optional): 響應的 usage 字段
+    """
+    stack = _timing_stack()
+    if not stack or not usage:
+        return
+    for key in USAGE_KEYS:
+        if usage.get(key):
+            stack[-1][key] = stack[-1].get(key, 0) + int(usage[key])
+
+
+def split_usage(timings: Dict) -> Tuple[Dict[str, float], Dict[str, int]]:
+    """把收集結果拆分為 (各階段耗時, 令牌用量)"""
+    stages = {name: value for name, value in timings.items() if name not in USAGE_KEYS}
+    usage = {name: int(value) for name, value in timings.items() if name in USAGE_KEYS}
+    return stages, usage
+
+
+def divide_usage(usage: Dict[str, int], count: int) -> List[Dict[str, int]]:
+    """
+    把一次共用請求的令牌用量分攤給 count 個文件
+
+    每個文件分得整除的份額，餘數計入最後一個文件，各份之和等於原用量。
+    """
+    shares = [{name: value // count for name, value in usage.items()} for _ in range(count)]
+    if shares:
+        for name, value in usage.items():
+            shares[-1][name] += value % count
+    return shares
+
+
+def merge_timings(target: Dict[str, float], timings: Optional[Dict[str, float]]) -> Dict[str, float]:
+    """把 timings 中的耗時累加到 target"""
+    for name, seconds in (timings or {}).items():
+        target[name] = round(target.get(name, 0.0) + seconds, 6)
+    return target
+
+
+def observe_result(result: Dict) -> None:
+    """文件處理完成後把結果的總耗時和分階段耗時計入直方圖"""
+    FILES_PROCESSED.inc(status=result.get('status', 'unknown'))
+    if result.get('processing_time') is not None:
+        PROCESSING_SECONDS.observe(result['processing_time'])
+    for name, seconds in (result.get('stage_timings') or {}).items():
+        STAGE_SECONDS.observe(seconds, stage=name)
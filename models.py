@@ -1,25 +1,162 @@
 import os
 import time
+import json
+import base64
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func, or_, and_, inspect, text
 
 # Initialize SQLAlchemy without arguments - will be initialized with app later
 db = SQLAlchemy()
 
+def ensure_indexes():
+    """Create indexes declared on the models that are missing from an existing database
+    
+    db.create_all() only creates indexes together with new tables, so databases created
+    before an index was added need it created explicitly. Must run in an app context.
+    """
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+def ensure_columns():
+    """Add nullable columns declared on the models that are missing from an existing database
+    
+    Like ensure_indexes(), this covers databases created before a column was added;
+    only plain ALTER TABLE ... ADD COLUMN is attempted. Must run in an app context.
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        present = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in present or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            with db.engine.begin() as connection:
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+
 class ProcessedFile(db.Model):
     __tablename__ = 'processed_files'
     
     id = db.Column(db.Integer, primary_key=True)
-    original_path = db.Column(db.String(255), nullable=False)
+    original_path = db.Column(db.String(255), nullable=False, index=True)
     new_path = db.Column(db.String(255))
-    status = db.Column(db.String(20), nullable=False)  # success, error, skipped
+    status = db.Column(db.String(20), nullable=False, index=True)  # success, error, skipped, duplicate
     author = db.Column(db.String(100))
     journal = db.Column(db.String(100))
     year = db.Column(db.String(10))
     title = db.Column(db.Text)
     error_message = db.Column(db.Text)
     processing_time = db.Column(db.Float)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    stage_timings = db.Column(db.Text)  # JSON: seconds spent in each processing stage
+    prompt_tokens = db.Column(db.Integer)  # tokens reported by the API for this file
+    completion_tokens = db.Column(db.Integer)
+    duplicate_of = db.Column(db.String(1024))  # path of the paper this file duplicates
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    # Columns the log API can sort by
+    SORT_KEYS = ('timestamp', 'processing_time')
+    
+    @classmethod
+    def search(cls, status=None, year=None, journal=None, text=None):
+        """Build a query filtered by status, year, journal and a title/author substring"""
+        query = cls.query
+        if status:
+            query = query.filter(cls.status == status)
+        if year:
+            query = query.filter(cls.year == year)
+        if journal:
+            query = query.filter(cls.journal.ilike(cls._contains_pattern(journal), escape='\\'))
+        if text:
+            pattern = cls._contains_pattern(text)
+            query = query.filter(or_(cls.title.ilike(pattern, escape='\\'), cls.author.ilike(pattern, escape='\\')))
+        return query
+    
+    @staticmethod
+    def _contains_pattern(value):
+        """LIKE pattern matching value as a literal substring (%, _ and the escape character are escaped)"""
+        escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return f"%{escaped}%"
+    
+    @classmethod
+    def _sort_expression(cls, sort):
+        """Column expression for a sort key (NULL processing times sort as 0)"""
+        if sort == 'processing_time':
+            return func.coalesce(cls.processing_time, 0.0)
+        return cls.timestamp
+    
+    @classmethod
+    def keyset_page(cls, query, sort='timestamp', descending=True, cursor=None, limit=50):
+        """
+        Fetch one page of a query using keyset pagination on (sort key, id)
+        
+        Args:
+            query: Query returned by search()
+            sort (str): One of SORT_KEYS
+            descending (bool): Sort direction
+            cursor (str, optional): Cursor returned with the previous page
+            limit (int): Page size
+            
+        Returns:
+            tuple: (rows, next cursor or None when this is the last page)
+        """
+        if sort not in cls.SORT_KEYS:
+            raise ValueError(f"Unsupported sort key: {sort}")
+        column = cls._sort_expression(sort)
+        
+        # Timestamps may be NULL in old rows; they sort as the smallest value, as SQLite does natively
+        nullable = sort == 'timestamp'
+        if cursor:
+            value, last_id = cls.decode_cursor(cursor, sort)
+            if value is None:
+                if descending:
+                    query = query.filter(column.is_(None), cls.id < last_id)
+                else:
+                    query = query.filter(or_(column.isnot(None), cls.id > last_id))
+            elif descending:
+                after = [column < value, and_(column == value, cls.id < last_id)]
+                query = query.filter(or_(*after, column.is_(None)) if nullable else or_(*after))
+            else:
+                query = query.filter(or_(column > value, and_(column == value, cls.id > last_id)))
+        
+        if descending:
+            query = query.order_by(column.desc().nulls_last() if nullable else column.desc(), cls.id.desc())
+        else:
+            query = query.order_by(column.asc().nulls_first() if nullable else column.asc(), cls.id.asc())
+        
+        rows = query.limit(limit + 1).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = cls.encode_cursor(rows[-1], sort)
+        return rows, next_cursor
+    
+    @staticmethod
+    def encode_cursor(row, sort):
+        """Encode the sort key and id of the last row of a page as an opaque cursor"""
+        if sort == 'processing_time':
+            value = row.processing_time or 0.0
+        else:
+            value = row.timestamp.isoformat() if row.timestamp else None
+        raw = json.dumps([value, row.id]).encode()
+        return base64.urlsafe_b64encode(raw).decode()
+    
+    @staticmethod
+    def decode_cursor(cursor, sort):
+        """Decode a cursor back into (sort value, id), raising ValueError if malformed
+        
+        The sort value is None for a row with a NULL timestamp.
+        """
+        try:
+            value, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if sort == 'processing_time':
+                return float(value), int(last_id)
+            return (datetime.fromisoformat(value) if value is not None else None), int(last_id)
+        except (TypeError, ValueError, json.JSONDecodeError) as e:
+            raise ValueError(f"Invalid cursor: {cursor}") from e
     
     @classmethod
     def from_log_entry(cls, log_entry):
@@ -30,11 +167,18 @@ class ProcessedFile(db.Model):
         processed_file.status = log_entry.get('status', 'unknown')
         processed_file.processing_time = log_entry.get('processing_time', 0.0)
         processed_file.error_message = log_entry.get('error', '')
+        if log_entry.get('stage_timings'):
+            processed_file.stage_timings = json.dumps(log_entry['stage_timings'])
+        usage = log_entry.get('usage') or {}
+        processed_file.prompt_tokens = usage.get('prompt_tokens')
+        processed_file.completion_tokens = usage.get('completion_tokens')
+        processed_file.duplicate_of = log_entry.get('duplicate_of')
         
         # Extract metadata if available
         metadata = log_entry.get('metadata', {})
         if metadata:
-            processed_file.author = metadata.get('author', '')
+            # The pipeline reports the first author's last name; 'author' is kept for older entries
+            processed_file.author = metadata.get('author_lastname') or metadata.get('author', '')
             processed_file.journal = metadata.get('journal', '')
             processed_file.year = metadata.get('year', '')
             processed_file.title = metadata.get('title', '')
@@ -64,5 +208,111 @@ class ProcessedFile(db.Model):
             },
             'error': self.error_message,
             'processing_time': self.processing_time,
+            'stage_timings': json.loads(self.stage_timings) if self.stage_timings else {},
+            'usage': {
+                'prompt_tokens': self.prompt_tokens,
+                'completion_tokens': self.completion_tokens
+            },
+            'duplicate_of': self.duplicate_of,
             'timestamp': self.timestamp.strftime("%Y-%m-%d %H:%M:%S") if self.timestamp else ""
-        }
\ No newline at end of file
+        }
+
+class CachedMetadata(db.Model):
+    __tablename__ = 'metadata_cache'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(64), nullable=False, unique=True, index=True)
+    file_path = db.Column(db.String(1024), index=True)
+    file_size = db.Column(db.BigInteger)
+    file_mtime = db.Column(db.Float)
+    extractor = db.Column(db.String(100))  # model used to produce the metadata
+    metadata_json = db.Column(db.Text, nullable=False)
+    hit_count = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class IndexedFile(db.Model):
+    __tablename__ = 'file_index'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.String(1024), nullable=False, unique=True, index=True)
+    inode = db.Column(db.BigInteger)
+    size = db.Column(db.BigInteger)
+    mtime = db.Column(db.Float)
+    status = db.Column(db.String(20))  # status of the last processing run
+    indexed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    directory = db.Column(db.String(1024), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)  # queued, running, done, cancelled, interrupted
+    scan_complete = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    def to_dict(self):
+        """Convert the model to a dictionary for JSON serialization"""
+        return {
+            'id': self.id,
+            'directory': self.directory,
+            'status': self.status,
+            'scan_complete': bool(self.scan_complete),
+            'created_at': self.created_at.strftime("%Y-%m-%d %H:%M:%S") if self.created_at else "",
+            'started_at': self.started_at.strftime("%Y-%m-%d %H:%M:%S") if self.started_at else "",
+            'finished_at': self.finished_at.strftime("%Y-%m-%d %H:%M:%S") if self.finished_at else ""
+        }
+
+class Task(db.Model):
+    __tablename__ = 'tasks'
+    __table_args__ = (
+        db.UniqueConstraint('job_id', 'path', name='uq_tasks_job_path'),
+        db.Index('ix_tasks_claim', 'job_id', 'status', 'next_attempt_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('jobs.id', ondelete='CASCADE'), nullable=False)
+    path = db.Column(db.String(1024), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class PaperFingerprint(db.Model):
+    __tablename__ = 'paper_fingerprints'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.String(1024), nullable=False, unique=True, index=True)
+    content_hash = db.Column(db.String(64), index=True)  # SHA-256 of the file bytes (sampled for header-only files)
+    minhash = db.Column(db.Text)  # MinHash signature of the first-page text, hex encoded
+    metadata_json = db.Column(db.Text)  # metadata extracted for this paper, reused for its duplicates
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class FingerprintBand(db.Model):
+    __tablename__ = 'fingerprint_bands'
+    __table_args__ = (
+        db.Index('ix_fingerprint_bands_lookup', 'band', 'value'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    fingerprint_id = db.Column(
+        db.Integer, db.ForeignKey('paper_fingerprints.id', ondelete='CASCADE'), nullable=False, index=True
+    )
+    band = db.Column(db.SmallInteger, nullable=False)
+    value = db.Column(db.String(16), nullable=False)  # hash of the signature rows in this LSH band
+
+class PaperText(db.Model):
+    __tablename__ = 'paper_texts'
+    
+    id = db.Column(db.Integer, primary_key=True)  # also the rowid of the paper_text_fts row
+    path = db.Column(db.String(1024), nullable=False, unique=True, index=True)
+    title = db.Column(db.Text)
+    author = db.Column(db.String(100))
+    journal = db.Column(db.String(255))
+    year = db.Column(db.String(10))
+    text_compressed = db.Column(db.LargeBinary)  # zlib-compressed UTF-8 text extracted from the PDF
+    text_length = db.Column(db.Integer)
+    indexed_at = db.Column(db.DateTime, default=datetime.utcnow)
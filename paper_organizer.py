@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+命令行批處理入口，不依賴 Flask 和數據庫
+
+用法:
+    python -m paper_organizer scan DIR [--dry-run] [--output FILE] [--workers N]
+                                       [--api-concurrency N] [--batch-size N] [--no-recursive]
+                                       [--journal FILE | --no-journal]
+    python -m paper_organizer journal [--limit N]
+    python -m paper_organizer undo BATCH
+    python -m paper_organizer replay BATCH
+
+每處理完一個文件輸出一行JSON（與Web界面的處理日誌格式相同），匯總信息輸出到stderr。
+每次 scan 的重命名記錄為重命名日誌中的一個批次（批次id見輸出中的 journal_entry），
+可以用 undo 整批撤銷、用 replay 重新執行；上次運行中斷時未提交的重命名在下次啟動時回滾。
+重量級模塊在解析參數之後才導入，--help 等命令可以立即返回。
+"""
+import os
+import sys
+import json
+import time
+import signal
+import logging
+import argparse
+import threading
+
+
+def build_parser():
+    """構建命令行參數解析器"""
+    parser = argparse.ArgumentParser(
+        prog="paper_organizer",
+        description="提取學術PDF元數據並按命名規則重命名"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    scan = subparsers.add_parser("scan", help="處理目錄（默認包括子目錄）中的所有PDF文件")
+    scan.add_argument("directory", help="要處理的目錄")
+    scan.add_argument("--dry-run", action="store_true", help="只報告計劃的新文件名，不修改文件")
+    scan.add_argument("-o", "--output", help="JSON Lines 輸出文件，默認輸出到stdout")
+    scan.add_argument("--workers", type=int, help="文本提取進程數（默認 PDF_EXTRACT_WORKERS 或CPU核數）")
+    scan.add_argument("--api-concurrency", type=int, help="並發API請求數（默認 API_CONCURRENCY 或 4）")
+    scan.add_argument("--batch-size", type=int, help="每個API請求打包的文檔數（默認 API_BATCH_SIZE 或 1）")
+    scan.add_argument("--no-recursive", dest="recursive", action="store_false", help="不處理子目錄")
+    scan.add_argument("-v", "--verbose", action="store_true", help="輸出詳細日誌到stderr")
+    _add_journal_argument(scan)
+    scan.add_argument("--no-journal", dest="journal", action="store_false", help="不記錄重命名日誌")
+
+    journal = subparsers.add_parser("journal", help="列出重命名日誌中最近的批次")
+    journal.add_argument("--limit", type=int, default=20, help="最多列出的批次數")
+    _add_journal_argument(journal)
+
+    for command, description in (("undo", "撤銷一個批次的全部重命名"), ("replay", "重新執行一個批次中已撤銷的重命名")):
+        subparser = subparsers.add_parser(command, help=description)
+        subparser.add_argument("batch", help="批次id")
+        _add_journal_argument(subparser)
+    return parser
+
+
+def _add_journal_argument(parser):
+    parser.add_argument("--journal", default=None,
+                        help="重命名日誌文件（默認 RENAME_JOURNAL 或 instance/rename_journal.jsonl）")
+
+
+def _load_env():
+    """從.env加載環境變量（python-dotenv未安裝時忽略）"""
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return
+    load_dotenv()
+
+
+def scan(args):
+    """
+    處理目錄並逐行輸出結果
+
+    Returns:
+        int: 退出碼，全部成功為0，有文件處理失敗為1，參數錯誤為2
+    """
+    if not os.path.isdir(args.directory):
+        print(f"目錄不存在: {args.directory}", file=sys.stderr)
+        return 2
+
+    # 先加載環境變量，再導入讀取配置的模塊
+    _load_env()
+    from batch_processor import BatchProcessor
+    from file_index import scan_pdf_files
+    if args.journal is not False and not args.dry_run:
+        _open_journal(args)
+
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    write_lock = threading.Lock()
+    counts = {"success": 0, "skipped": 0, "error": 0}
+
+    def write_result(result):
+        """每個文件完成後立即寫出一行"""
+        line = json.dumps(result, ensure_ascii=False)
+        with write_lock:
+            counts[result.get("status", "error")] = counts.get(result.get("status", "error"), 0) + 1
+            output.write(line + "\n")
+            output.flush()
+
+    processor = BatchProcessor(
+        write_result,
+        extract_workers=args.workers,
+        api_concurrency=args.api_concurrency,
+        api_batch_size=args.batch_size,
+        dry_run=args.dry_run
+    )
+
+    # Ctrl+C 時取消批處理並輸出已完成的部分
+    previous_handler = signal.signal(signal.SIGINT, lambda signum, frame: processor.cancel())
+    start = time.time()
+    try:
+        processor.run(path for path, _ in scan_pdf_files(args.directory, args.recursive))
+    finally:
+        signal.signal(signal.SIGINT, previous_handler)
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.time() - start
+    summary = ", ".join(f"{status} {count}" for status, count in counts.items())
+    mode = "（試運行）" if args.dry_run else ""
+    print(f"處理完成{mode}: {summary}，耗時 {elapsed:.1f} 秒", file=sys.stderr)
+    if processor.is_cancelled():
+        return 130
+    return 1 if counts["error"] else 0
+
+
+def _open_journal(args):
+    """打開重命名日誌並回滾已退出的進程留下的未提交重命名"""
+    from rename_journal import rename_journal, rename_planner, DEFAULT_JOURNAL_PATH
+
+    rename_journal.open(args.journal or os.environ.get("RENAME_JOURNAL") or DEFAULT_JOURNAL_PATH)
+    reverted = rename_planner.recover()
+    if reverted:
+        print(f"已回滾上次中斷時未提交的 {reverted} 個重命名", file=sys.stderr)
+    return rename_journal, rename_planner
+
+
+def journal(args):
+    """列出最近的重命名批次"""
+    _load_env()
+    rename_journal, _ = _open_journal(args)
+    for batch in rename_journal.batches(args.limit):
+        counts = ", ".join(f"{state} {count}" for state, count in sorted(batch["counts"].items()))
+        started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(batch["started"]))
+        live = "（運行中）" if batch["live"] else ""
+        print(f"{batch['batch']}  {started}  {batch['directory']}  {counts}{live}")
+    return 0
+
+
+def apply_batch(args):
+    """撤銷或重新執行一個重命名批次"""
+    _load_env()
+    _, rename_planner = _open_journal(args)
+    try:
+        if args.command == "undo":
+            result = rename_planner.undo(args.batch)
+        else:
+            result = rename_planner.replay(args.batch)
+    except (KeyError, RuntimeError) as e:
+        print(e.args[0] if isinstance(e, KeyError) else str(e), file=sys.stderr)
+        return 2
+    print(json.dumps(result, ensure_ascii=False))
+    return 0
+
+
+def main(argv=None):
+    """命令行入口"""
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO if getattr(args, "verbose", False) else logging.WARNING,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        stream=sys.stderr
+    )
+    if args.command == "scan":
+        return scan(args)
+    if args.command == "journal":
+        return journal(args)
+    if args.command in ("undo", "replay"):
+        return apply_batch(args)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,6 +3,11 @@ import re
 import time
 import logging
 from metadata_extractor import extract_metadata_from_pdf
+from metadata_cache import metadata_cache
+from duplicate_index import duplicate_index
+from fulltext_index import fulltext_index
+from rename_journal import rename_planner
+from metrics import collect_timings, split_usage, stage
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -34,82 +39,156 @@ def sanitize_filename(filename):
     
     return filename
 
-def process_pdf_file(pdf_path):
+def process_pdf_file(pdf_path, journal_batch=None):
     """
     處理PDF文件：提取元數據並根據命名規則進行重命名
     
     Args:
         pdf_path (str): PDF文件路徑
+        journal_batch (str, optional): 重命名日誌的批次，結果被記錄後由調用方提交
         
     Returns:
-        dict: 處理結果信息
+        dict: 處理結果信息，stage_timings 為各處理階段的耗時（秒），
+              usage 為API報告的令牌用量（prompt_tokens、completion_tokens）
     """
     start_time = time.time()
     logger.info(f"處理PDF文件: {pdf_path}")
     
-    try:
-        # 直接使用語言模型提取元數據
-        metadata = extract_metadata_from_pdf(pdf_path)
-        
-        # 檢查是否有缺失的必要字段
-        required_fields = ['author_lastname', 'journal', 'journal_abbr', 'year', 'title', 'doc_type']
-        missing_fields = [field for field in required_fields if not metadata.get(field)]
-        
-        if missing_fields:
-            logger.warning(f"缺失元數據字段: {', '.join(missing_fields)}")
-            
-            # 為缺失字段填充默認值
-            for field in missing_fields:
-                if field == 'doc_type':
-                    metadata[field] = 'paper'  # 默認為論文
-                else:
-                    metadata[field] = 'Unknown'
-        
-        # 獲取元數據
-        author_lastname = metadata['author_lastname'] if metadata['author_lastname'] else 'Unknown'
-        year = metadata['year'] if metadata['year'] else 'Unknown'
-        title = metadata['title'] if metadata['title'] else 'Unknown'
-        doc_type = metadata.get('doc_type', 'paper').lower()
+    with collect_timings() as timings:
+        content = {}
+        try:
+            # 直接使用語言模型提取元數據（與已處理的論文重複時沿用其元數據）
+            metadata = extract_metadata_from_pdf(pdf_path, content)
+        except Exception as e:
+            logger.error(f"處理PDF文件時發生錯誤: {str(e)}", exc_info=True)
+            result = error_result(pdf_path, e, start_time)
+        else:
+            result = rename_pdf_file(
+                pdf_path, metadata, start_time,
+                fingerprint=content.get('fingerprint'), duplicate=content.get('duplicate'),
+                text=content.get('fulltext', content.get('text')),
+                journal_batch=journal_batch
+            )
+    
+    result["stage_timings"], result["usage"] = split_usage(timings)
+    return result
+
+def build_filename(metadata):
+    """
+    按命名規則生成文件名，缺失的字段會以默認值填入metadata
+    
+    Args:
+        metadata (dict): 提取的元數據
         
-        # 檢查是否為書籍
-        is_book = doc_type == 'book'
+    Returns:
+        str: 已處理非法字符的文件名
+    """
+    # 檢查是否有缺失的必要字段
+    required_fields = ['author_lastname', 'journal', 'journal_abbr', 'year', 'title', 'doc_type']
+    missing_fields = [field for field in required_fields if not metadata.get(field)]
+    
+    if missing_fields:
+        logger.warning(f"缺失元數據字段: {', '.join(missing_fields)}")
         
-        # 截斷標題（如果太長）
-        max_title_length = 100
-        if len(title) > max_title_length:
-            title = title[:max_title_length-3] + "..."
+        # 為缺失字段填充默認值
+        for field in missing_fields:
+            if field == 'doc_type':
+                metadata[field] = 'paper'  # 默認為論文
+            else:
+                metadata[field] = 'Unknown'
+    
+    # 獲取元數據
+    author_lastname = metadata['author_lastname'] if metadata['author_lastname'] else 'Unknown'
+    year = metadata['year'] if metadata['year'] else 'Unknown'
+    title = metadata['title'] if metadata['title'] else 'Unknown'
+    doc_type = metadata.get('doc_type', 'paper').lower()
+    
+    # 檢查是否為書籍
+    is_book = doc_type == 'book'
+    
+    # 截斷標題（如果太長）
+    max_title_length = 100
+    if len(title) > max_title_length:
+        title = title[:max_title_length-3] + "..."
+    
+    # 根據文檔類型創建新文件名
+    if is_book:
+        # 書籍格式: FirstAuthorLastname_年份_書名.pdf
+        new_filename = f"{author_lastname}_{year}_{title}.pdf"
+    else:
+        # 論文格式: FirstAuthorLastname_年份_期刊或會議縮寫_論文標題.pdf
+        # 優先使用語言模型提供的縮寫
+        journal_abbr = metadata['journal_abbr'] if metadata['journal_abbr'] else 'Unknown'
+        new_filename = f"{author_lastname}_{year}_{journal_abbr}_{title}.pdf"
+    
+    # 處理文件名中的非法字符
+    return sanitize_filename(new_filename)
+
+def rename_pdf_file(pdf_path, metadata, start_time=None, dry_run=False, reserved=None, fingerprint=None,
+                    duplicate=None, text=None, journal_batch=None):
+    """
+    根據已提取的元數據和命名規則重命名PDF文件
+    
+    文件與已處理的論文重複時按 DUPLICATE_POLICY 處理：report 照常重命名並在結果中記錄 duplicate_of；
+    link 保留原文件名，只記錄與原論文的關聯；move 移到重複文件目錄。後兩者的狀態為 duplicate。
+    不重複的文件重命名成功後加入重複檢測索引和全文索引。
+    目標文件名由 rename_planner 對照目錄文件名緩存分配；指定 journal_batch 時重命名前先寫入日誌，
+    結果帶 journal_entry，調用方記錄結果後應調用 rename_journal.commit(result)。
+    
+    Args:
+        pdf_path (str): PDF文件路徑
+        metadata (dict): 提取的元數據
+        start_time (float, optional): 處理開始時間，用於計算處理耗時
+        dry_run (bool): 只計算新文件名而不重命名，結果帶 dry_run 字段
+        reserved (set, optional): 試運行時已分配的目標路徑，用於在文件之間避免重名，會被更新
+        fingerprint (dict, optional): 文件指紋，用於加入重複檢測索引
+        duplicate (dict, optional): check_duplicate() 找到的原論文
+        text (str, optional): 全文索引的文本（extract_pdf_content 結果中的 fulltext），命中緩存時為None，只更新已索引文件的路徑
+        journal_batch (str, optional): 重命名日誌的批次，為None時不記錄日誌
         
-        # 根據文檔類型創建新文件名
-        if is_book:
-            # 書籍格式: FirstAuthorLastname_年份_書名.pdf
-            new_filename = f"{author_lastname}_{year}_{title}.pdf"
-        else:
-            # 論文格式: FirstAuthorLastname_年份_期刊或會議縮寫_論文標題.pdf
-            # 優先使用語言模型提供的縮寫
-            journal_abbr = metadata['journal_abbr'] if metadata['journal_abbr'] else 'Unknown'
-            new_filename = f"{author_lastname}_{year}_{journal_abbr}_{title}.pdf"
+    Returns:
+        dict: 處理結果信息
+    """
+    if start_time is None:
+        start_time = time.time()
+    if reserved is None:
+        reserved = set()
+    
+    try:
+        if duplicate and duplicate_index.policy == 'link':
+            logger.info(f"重複文件保留原名: {pdf_path}（原論文 {duplicate['path']}）")
+            return _duplicate_result(pdf_path, None, metadata, duplicate, start_time, dry_run)
         
-        # 處理文件名中的非法字符
-        new_filename = sanitize_filename(new_filename)
+        new_filename = build_filename(metadata)
         
-        # 獲取原始文件所在的目錄
+        # 獲取原始文件所在的目錄（move 策略下為重複文件目錄）
         directory = os.path.dirname(pdf_path)
+        move_duplicate = bool(duplicate) and duplicate_index.policy == 'move'
+        if move_duplicate:
+            directory = duplicate_index.duplicates_directory(pdf_path)
         
         # 創建新的文件路徑
         new_path = os.path.join(directory, new_filename)
         
-        # 如果文件已存在，不要覆蓋它
-        original_new_path = new_path
-        counter = 1
-        while os.path.exists(new_path) and os.path.abspath(pdf_path) != os.path.abspath(new_path):
-            name, ext = os.path.splitext(original_new_path)
-            new_path = f"{name}_{counter}{ext}"
-            counter += 1
+        with stage('rename'):
+            # 不覆蓋已有文件（或試運行時已分配給其他文件的路徑），重名時加序號
+            new_path, journal_entry = rename_planner.rename(
+                pdf_path, new_path, dry_run=dry_run, reserved=reserved, batch=journal_batch, make_dirs=move_duplicate
+            )
         
         # 如果文件已經有正確的名稱，跳過重命名
-        if os.path.abspath(pdf_path) == os.path.abspath(new_path):
+        already_named = os.path.abspath(pdf_path) == os.path.abspath(new_path)
+        if already_named:
             logger.info(f"文件已經有正確的名稱: {pdf_path}")
-            return {
+        
+        if not dry_run and not duplicate:
+            with stage('duplicate_index'):
+                duplicate_index.record(new_path, fingerprint, metadata, previous_path=pdf_path)
+            with stage('fulltext_index'):
+                fulltext_index.record(new_path, text, metadata, previous_path=pdf_path)
+        
+        if already_named:
+            result = {
                 "status": "skipped",
                 "original_path": pdf_path,
                 "reason": "文件已經有正確的名稱",
@@ -117,26 +196,77 @@ def process_pdf_file(pdf_path):
                 "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
                 "processing_time": round(time.time() - start_time, 2)
             }
+            if duplicate:
+                result["duplicate_of"] = duplicate['path']
+            return result
         
-        # 重命名文件
-        os.rename(pdf_path, new_path)
-        logger.info(f"重命名完成: {pdf_path} -> {new_path}")
+        if dry_run:
+            logger.info(f"試運行，計劃重命名: {pdf_path} -> {new_path}")
+        else:
+            with stage('cache_update'):
+                metadata_cache.update_path(pdf_path, new_path)
+            logger.info(f"重命名完成: {pdf_path} -> {new_path}")
         
-        return {
-            "status": "success",
-            "original_path": pdf_path,
-            "new_path": new_path,
-            "metadata": metadata,
-            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-            "processing_time": round(time.time() - start_time, 2)
-        }
+        if move_duplicate:
+            result = _duplicate_result(pdf_path, new_path, metadata, duplicate, start_time, dry_run)
+        else:
+            result = {
+                "status": "success",
+                "original_path": pdf_path,
+                "new_path": new_path,
+                "metadata": metadata,
+                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "processing_time": round(time.time() - start_time, 2)
+            }
+            if duplicate:
+                result["duplicate_of"] = duplicate['path']
+                result["similarity"] = duplicate['similarity']
+            if dry_run:
+                result["dry_run"] = True
+        if journal_entry:
+            result["journal_entry"] = journal_entry
+        return result
     
     except Exception as e:
         logger.error(f"處理PDF文件時發生錯誤: {str(e)}", exc_info=True)
-        return {
-            "status": "error",
-            "original_path": pdf_path,
-            "error": str(e),
-            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-            "processing_time": round(time.time() - start_time, 2)
-        }
\ No newline at end of file
+        return error_result(pdf_path, e, start_time)
+
+def _duplicate_result(pdf_path, new_path, metadata, duplicate, start_time, dry_run):
+    """構建 link/move 策略下重複文件的結果信息（new_path 為None表示文件未移動）"""
+    kind = "完全相同" if duplicate['exact'] else f"近似重複（相似度 {duplicate['similarity']}）"
+    result = {
+        "status": "duplicate",
+        "original_path": pdf_path,
+        "new_path": new_path or pdf_path,
+        "duplicate_of": duplicate['path'],
+        "similarity": duplicate['similarity'],
+        "reason": f"與 {duplicate['path']} {kind}",
+        "metadata": metadata,
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "processing_time": round(time.time() - start_time, 2)
+    }
+    if dry_run:
+        result["dry_run"] = True
+    return result
+
+def error_result(pdf_path, error, start_time=None):
+    """
+    構建處理失敗時的結果信息
+    
+    Args:
+        pdf_path (str): PDF文件路徑
+        error (Exception): 發生的錯誤
+        start_time (float, optional): 處理開始時間
+        
+    Returns:
+        dict: 處理結果信息
+    """
+    result = {
+        "status": "error",
+        "original_path": pdf_path,
+        "error": str(error),
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
+    }
+    if start_time is not None:
+        result["processing_time"] = round(time.time() - start_time, 2)
+    return result
\ No newline at end of file
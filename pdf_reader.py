@@ -0,0 +1,164 @@
+import os
+import re
+import mmap
+import time
+import logging
+import contextlib
+from typing import Iterator, Optional
+
+import PyPDF2
+
+# 設置日誌
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# 以內存映射方式打開文件：頁面由操作系統按需載入，屬於可回收的文件頁，不計入進程的匿名內存
+PDF_USE_MMAP = os.environ.get("PDF_USE_MMAP", "1").lower() not in ("0", "false", "no")
+# 超過此大小的文件只讀取PDF屬性、XMP和第一頁，不逐頁解析
+PDF_HEADER_ONLY_MB = float(os.environ.get("PDF_HEADER_ONLY_MB", 200))
+# 單個文件的解析預算：耗時和匿名內存增長，超出後不再解析後續頁面
+PDF_PARSE_TIME_BUDGET = float(os.environ.get("PDF_PARSE_TIME_BUDGET", 30))
+PDF_PARSE_MEMORY_MB = float(os.environ.get("PDF_PARSE_MEMORY_MB", 512))
+# 內容流超過此大小的頁面（通常是掃描頁或矢量圖）不提取文本，解碼會佔用同等大小的內存
+PDF_MAX_PAGE_CONTENT_MB = float(os.environ.get("PDF_MAX_PAGE_CONTENT_MB", 32))
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+# 對象頭部（stream 關鍵字之前）最多讀取的字節數
+OBJECT_HEADER_BYTES = 4096
+LENGTH_PATTERN = re.compile(rb'/Length\s+(\d+)(?:\s+(\d+)\s+R)?')
+
+
+def anonymous_memory() -> Optional[int]:
+    """
+    當前進程的匿名常駐內存（字節），不包括內存映射的文件頁
+
+    Returns:
+        Optional[int]: 無法讀取（非Linux）時返回None
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            fields = statm.read().split()
+        # resident - shared：shared 為文件頁和共享內存
+        return (int(fields[1]) - int(fields[2])) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+class ParseBudget:
+    """
+    單個文件的解析預算
+
+    在解析每一頁之前調用 exceeded() 檢查，屬於協作式限制：正在解析的一頁不會被中斷，
+    但超出預算後不再解析後續頁面。
+
+    內存增長按整個進程的匿名內存計算，無法區分線程。批處理的提取進程每次只解析一個文件，
+    因此增長都屬於當前文件；同一進程中多個線程同時解析時（如文件監控的處理線程池），
+    其他線程的分配也會計入，預算應理解為進程級的上限。
+    """
+    def __init__(self, seconds: Optional[float] = None, memory_mb: Optional[float] = None):
+        self.seconds = PDF_PARSE_TIME_BUDGET if seconds is None else seconds
+        self.memory_bytes = (PDF_PARSE_MEMORY_MB if memory_mb is None else memory_mb) * MB
+        self.started = time.monotonic()
+        self.baseline = anonymous_memory()
+
+    def exceeded(self) -> Optional[str]:
+        """
+        Returns:
+            Optional[str]: 超出預算時返回原因，否則返回None
+        """
+        elapsed = time.monotonic() - self.started
+        if self.seconds and elapsed > self.seconds:
+            return f"解析耗時 {elapsed:.1f} 秒超出預算 {self.seconds:g} 秒"
+        if self.memory_bytes and self.baseline is not None:
+            current = anonymous_memory()
+            if current is not None and current - self.baseline > self.memory_bytes:
+                return f"解析佔用內存 {(current - self.baseline) / MB:.0f} MB 超出預算 {self.memory_bytes / MB:g} MB"
+        return None
+
+
+def is_header_only(pdf_path: str) -> bool:
+    """文件是否大到只能讀取頭部信息（PDF屬性、XMP和第一頁）"""
+    return bool(PDF_HEADER_ONLY_MB) and os.path.getsize(pdf_path) > PDF_HEADER_ONLY_MB * MB
+
+
+def _stream_length(reader: PyPDF2.PdfReader, reference) -> int:
+    """
+    從對象頭部讀取流的 /Length，不載入流數據
+
+    PyPDF2 解析流對象時會把整個流讀入內存，因此先按交叉引用表中的偏移只讀取對象頭部。
+    """
+    if not isinstance(reference, PyPDF2.generic.IndirectObject):
+        return len(getattr(reference, '_data', b'') or b'')
+    offset = reader.xref.get(reference.generation, {}).get(reference.idnum)
+    if offset is None:
+        # 壓縮在對象流中的對象不可能是流
+        return 0
+    reader.stream.seek(offset)
+    header = reader.stream.read(OBJECT_HEADER_BYTES).split(b'stream', 1)[0]
+    match = LENGTH_PATTERN.search(header)
+    if not match:
+        return 0
+    if match.group(2) is None:
+        return int(match.group(1))
+    # 長度本身是間接對象
+    return int(reader.get_object(PyPDF2.generic.IndirectObject(int(match.group(1)), int(match.group(2)), reader)))
+
+
+def page_content_size(reader: PyPDF2.PdfReader, page) -> int:
+    """
+    頁面內容流的總長度（按 /Length 計算，不讀取也不解碼流數據）
+
+    Args:
+        reader (PyPDF2.PdfReader): 頁面所在的PDF
+        page (PyPDF2.PageObject): 頁面
+
+    Returns:
+        int: 字節數，無法讀取時返回0
+    """
+    try:
+        # 直接取字典中的原始值，避免 PyPDF2 自動解析間接引用
+        contents = dict.get(page, '/Contents')
+        if contents is None:
+            return 0
+        if isinstance(contents, PyPDF2.generic.IndirectObject):
+            length = _stream_length(reader, contents)
+            if length:
+                return length
+            # 間接引用的也可能是內容流數組
+            contents = reader.get_object(contents)
+        if isinstance(contents, PyPDF2.generic.ArrayObject):
+            return sum(_stream_length(reader, item) for item in list.__iter__(contents))
+        return _stream_length(reader, contents)
+    except Exception as e:
+        logger.debug(f"讀取頁面內容長度時出錯: {str(e)}")
+        return 0
+
+
+@contextlib.contextmanager
+def open_pdf(pdf_path: str) -> Iterator[PyPDF2.PdfReader]:
+    """
+    打開PDF，只解析交叉引用表和尾部字典，頁面在訪問時才解析
+
+    默認以只讀內存映射作為輸入流，退出上下文後關閉映射，不能再訪問返回的 reader。
+
+    Args:
+        pdf_path (str): PDF文件路徑
+
+    Yields:
+        PyPDF2.PdfReader: 已打開的PDF
+    """
+    with open(pdf_path, 'rb') as file:
+        mapped = None
+        if PDF_USE_MMAP:
+            try:
+                mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError) as e:
+                # 空文件或不支持映射的文件系統
+                logger.debug(f"無法內存映射 {pdf_path}，改為普通讀取: {str(e)}")
+        try:
+            yield PyPDF2.PdfReader(mapped if mapped is not None else file)
+        finally:
+            if mapped is not None:
+                mapped.close()
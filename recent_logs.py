@@ -0,0 +1,79 @@
+import os
+import threading
+from collections import deque
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
+
+# 內存中保留的最近日誌條數
+RECENT_LOG_SIZE = int(os.environ.get("RECENT_LOG_SIZE", 1000))
+
+
+class RecentLogStore:
+    """
+    線程安全的最近日誌環形緩衝
+
+    每條日誌分配一個單調遞增的序號，讀取方可以用 since(N) 取得序號N之後的條目，
+    開銷只與返回的條數成正比。超出容量時丟棄最舊的條目，內存佔用保持恆定；
+    完整歷史以數據庫為準。
+    """
+    def __init__(self, maxlen: int = RECENT_LOG_SIZE):
+        """初始化緩衝"""
+        self._entries = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+        self._last_seq = 0
+
+    def append(self, entry: Dict) -> Dict:
+        """
+        追加一條日誌
+
+        Args:
+            entry (Dict): 日誌字典
+
+        Returns:
+            Dict: 帶 seq 字段的日誌副本
+        """
+        with self._lock:
+            self._last_seq += 1
+            stored = dict(entry, seq=self._last_seq)
+            self._entries.append(stored)
+        return stored
+
+    @property
+    def last_seq(self) -> int:
+        """最新條目的序號，沒有條目時為0"""
+        with self._lock:
+            return self._last_seq
+
+    def since(self, seq: int, limit: Optional[int] = None) -> Tuple[List[Dict], bool]:
+        """
+        返回序號大於seq的條目（按序號升序）
+
+        Args:
+            seq (int): 讀取方已有的最新序號
+            limit (int, optional): 最多返回的條數（返回最舊的那些）
+
+        Returns:
+            Tuple[List[Dict], bool]: 條目列表，以及是否有條目已被淘汰而缺失。
+            seq 大於最新序號（如服務重啟後序號從頭開始）時同樣視為缺失，返回緩衝中的全部條目
+        """
+        with self._lock:
+            stale = seq > self._last_seq
+            if stale:
+                seq = 0
+            missing = self._last_seq - max(seq, 0)
+            if missing <= 0:
+                return [], stale
+            available = min(missing, len(self._entries))
+            newest_first = list(islice(reversed(self._entries), available))
+        entries = newest_first[::-1]
+        if limit is not None:
+            entries = entries[:limit]
+        return entries, stale or available < missing
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+# 全局最近日誌實例
+recent_logs = RecentLogStore()
@@ -0,0 +1,554 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import contextlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from metrics import registry
+from metadata_cache import metadata_cache
+from file_index import file_index
+from duplicate_index import duplicate_index
+from fulltext_index import fulltext_index
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# 設置日誌
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+# 與 Flask 應用的 instance 目錄相同，命令行模式和網頁服務共用同一個日誌
+DEFAULT_JOURNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'rename_journal.jsonl')
+# 目錄文件名緩存最多保留的目錄數
+MAX_CACHED_DIRECTORIES = 256
+
+OPERATIONS = registry.counter('pdf_rename_journal_total', '重命名日誌記錄的操作數', ['op'])
+
+# 日誌記錄的操作和之後條目所處的狀態
+STATES = {'plan': 'planned', 'commit': 'committed', 'abort': 'aborted', 'undo': 'undone', 'replay': 'committed'}
+# 寫入後需要 fsync 的操作：plan 必須在重命名之前落盤，其餘操作丟失會使恢復時誤判狀態
+DURABLE_OPERATIONS = {'plan', 'commit', 'undo', 'replay'}
+
+
+def _mtime(directory: str) -> Optional[int]:
+    try:
+        return os.stat(directory).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _process_alive(pid: int) -> bool:
+    """進程是否仍在運行"""
+    if os.name == 'nt':
+        # Windows 上 os.kill 不能用於探測，保守地視為仍在運行，不回滾其他進程的批次
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class DirectoryListing:
+    """
+    目錄中已有文件名的緩存，分配目標文件名時代替逐個候選名調用 os.path.exists
+
+    每個目錄第一次使用時用 os.scandir 讀取一次；之後只比較目錄的修改時間，其他程序增刪文件後重新讀取，
+    本程序的重命名直接更新緩存。文件名按 casefold 比較，在不區分大小寫的文件系統上也不會與已有文件衝突。
+    不是線程安全的，由 RenamePlanner 的鎖保護。
+    """
+    def __init__(self, max_directories: int = MAX_CACHED_DIRECTORIES):
+        self.max_directories = max_directories
+        self._directories: 'OrderedDict[str, list]' = OrderedDict()
+
+    def names(self, directory: str, refresh: bool = False) -> Set[str]:
+        """
+        目錄中文件名（casefold）的集合，調用方可以直接修改
+
+        Args:
+            directory (str): 目錄路徑，不存在時返回空集合
+            refresh (bool): 忽略緩存重新讀取
+        """
+        directory = os.path.abspath(directory)
+        mtime = _mtime(directory)
+        cached = self._directories.get(directory)
+        if refresh or cached is None or cached[0] != mtime:
+            names = set()
+            if mtime is not None:
+                with os.scandir(directory) as entries:
+                    names = {entry.name.casefold() for entry in entries}
+            cached = self._directories[directory] = [mtime, names]
+            while len(self._directories) > self.max_directories:
+                self._directories.popitem(last=False)
+        self._directories.move_to_end(directory)
+        return cached[1]
+
+    def renamed(self, source: str, target: str) -> None:
+        """本程序完成重命名後更新兩個目錄的緩存"""
+        for path, present in ((source, False), (target, True)):
+            directory, name = os.path.split(os.path.abspath(path))
+            cached = self._directories.get(directory)
+            if cached is None:
+                continue
+            if present:
+                cached[1].add(name.casefold())
+            else:
+                cached[1].discard(name.casefold())
+            cached[0] = _mtime(directory)
+
+    def clear(self) -> None:
+        self._directories.clear()
+
+
+class RenameJournal:
+    """
+    重命名的預寫日誌（JSON Lines，只追加）
+
+    每個批次先寫 begin（含進程id），每個文件重命名之前寫入 plan 並 fsync，結果被調用方記錄
+    （文件索引、作業隊列或命令行輸出）之後寫入 commit。進程崩潰後，沒有 commit 的條目可以據此回滾，
+    整個批次也可以撤銷（undo）或重新執行（replay）。用法與 Flask 擴展相同：先創建實例，再調用 init_app(app)；
+    命令行模式調用 open(path)。未啟用時重命名照常執行，只是不記錄日誌。
+    """
+    def __init__(self, app=None):
+        """初始化日誌，未綁定應用前日誌處於停用狀態"""
+        self.app = None
+        self.path = None
+        self.max_bytes = 0
+        self._fd = None
+        # 與日誌同目錄的鎖文件：寫入時持有共享鎖，輪換時持有排他鎖，其他進程不會寫入已輪換的文件
+        self._lock_fd = None
+        self._lock = threading.Lock()
+        # 本進程中尚未結束的批次：batch id -> [是否已寫入 begin, 下一個序號]
+        self._open_batches: Dict[str, list] = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        綁定Flask應用並打開日誌文件
+
+        環境變量:
+            RENAME_JOURNAL_ENABLED: 設為 0/false 可停用重命名日誌（默認啟用）
+            RENAME_JOURNAL: 日誌文件路徑（默認 instance/rename_journal.jsonl）
+            RENAME_JOURNAL_MAX_MB: 啟動時日誌超過此大小且沒有未完成的條目則輪換為 .1 文件（默認 64）
+        """
+        self.app = app
+        if os.environ.get("RENAME_JOURNAL_ENABLED", "1").lower() in ("0", "false", "no"):
+            return
+        self.open(os.environ.get("RENAME_JOURNAL") or os.path.join(app.instance_path, 'rename_journal.jsonl'))
+
+    def open(self, path: str) -> None:
+        """打開（必要時創建）日誌文件"""
+        self.close()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.max_bytes = float(os.environ.get("RENAME_JOURNAL_MAX_MB", 64)) * MB
+        with self._lock:
+            self.path = path
+            self._reopen()
+            if fcntl is not None:
+                self._lock_fd = os.open(path + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+
+    def _reopen(self) -> None:
+        """按路徑重新打開日誌文件，調用方持有 self._lock"""
+        if self._fd is not None:
+            os.close(self._fd)
+        # O_APPEND 使多個進程（網頁服務和命令行）的整行寫入不會交錯
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def close(self) -> None:
+        with self._lock:
+            for fd in (self._fd, self._lock_fd):
+                if fd is not None:
+                    os.close(fd)
+            self._fd = self._lock_fd = None
+            self.path = None
+
+    @contextlib.contextmanager
+    def _file_lock(self, exclusive: bool = False):
+        """持有跨進程的文件鎖，調用方持有 self._lock；不支持 fcntl 的平台上不加鎖"""
+        if self._lock_fd is None:
+            yield
+            return
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _rotated(self) -> bool:
+        """打開的文件是否已被其他進程輪換（路徑指向了新文件或已不存在）"""
+        try:
+            current = os.stat(self.path)
+        except FileNotFoundError:
+            return True
+        opened = os.fstat(self._fd)
+        return (current.st_dev, current.st_ino) != (opened.st_dev, opened.st_ino)
+
+    def is_enabled(self) -> bool:
+        """日誌是否可用"""
+        return self._fd is not None
+
+    def _append(self, record: Dict) -> None:
+        """寫入一條記錄，調用方持有 self._lock"""
+        record['time'] = round(time.time(), 3)
+        with self._file_lock():
+            if self._rotated():
+                self._reopen()
+            os.write(self._fd, (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+            if record['op'] in DURABLE_OPERATIONS:
+                os.fsync(self._fd)
+        OPERATIONS.inc(op=record['op'])
+
+    def begin_batch(self) -> Optional[str]:
+        """
+        開始一個批次，begin 記錄在第一次重命名時才寫入，沒有重命名的批次不佔用日誌
+
+        Returns:
+            Optional[str]: 批次id，日誌未啟用時返回None
+        """
+        if not self.is_enabled():
+            return None
+        batch = time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:8]
+        with self._lock:
+            self._open_batches[batch] = [False, 1]
+        return batch
+
+    def end_batch(self, batch: Optional[str]) -> None:
+        """結束批次，之後不能再向其中添加重命名"""
+        if batch is None:
+            return
+        with self._lock:
+            state = self._open_batches.pop(batch, None)
+            if state and state[0] and self._fd is not None:
+                self._append({'op': 'end', 'batch': batch})
+
+    def plan(self, batch: str, source: str, target: str) -> Dict:
+        """
+        在重命名之前記錄並落盤
+
+        Returns:
+            Dict: 條目標識 {'batch', 'seq'}，之後用於 commit 或 abort
+        """
+        with self._lock:
+            state = self._open_batches.setdefault(batch, [False, 1])
+            if not state[0]:
+                self._append({'op': 'begin', 'batch': batch, 'pid': os.getpid()})
+                state[0] = True
+            seq = state[1]
+            state[1] += 1
+            self._append({
+                'op': 'plan', 'batch': batch, 'seq': seq,
+                'src': os.path.abspath(source), 'dst': os.path.abspath(target)
+            })
+        return {'batch': batch, 'seq': seq}
+
+    def record(self, op: str, entry: Optional[Dict]) -> None:
+        """為條目寫入 commit、abort、undo 或 replay 記錄"""
+        if not entry or not self.is_enabled():
+            return
+        with self._lock:
+            self._append({'op': op, 'batch': entry['batch'], 'seq': entry['seq']})
+
+    def commit(self, result: Dict) -> None:
+        """
+        處理結果已被調用方記錄後提交其重命名
+
+        Args:
+            result (Dict): rename_pdf_file 的結果，沒有 journal_entry 時不做任何事
+        """
+        self.record('commit', result.get('journal_entry'))
+
+    def read(self) -> 'OrderedDict[str, Dict]':
+        """
+        讀取日誌中所有批次的當前狀態
+
+        Returns:
+            OrderedDict: 批次id -> {batch, pid, started, ended, entries（序號 -> {seq, src, dst, state}）}
+        """
+        batches = OrderedDict()
+        if not self.path or not os.path.exists(self.path):
+            return batches
+        with open(self.path, encoding='utf-8') as journal:
+            for line in journal:
+                try:
+                    record = json.loads(line)
+                    op, batch = record['op'], record['batch']
+                except (ValueError, KeyError, TypeError):
+                    # 寫入中途崩潰留下的不完整行
+                    continue
+                info = batches.setdefault(batch, {
+                    'batch': batch, 'pid': None, 'started': record.get('time'), 'ended': None,
+                    'entries': OrderedDict()
+                })
+                if op == 'begin':
+                    info['pid'] = record.get('pid')
+                elif op == 'end':
+                    info['ended'] = record.get('time')
+                elif op == 'plan':
+                    info['entries'][record['seq']] = {
+                        'seq': record['seq'], 'src': record['src'], 'dst': record['dst'], 'state': 'planned'
+                    }
+                elif op in STATES and record.get('seq') in info['entries']:
+                    info['entries'][record['seq']]['state'] = STATES[op]
+        return batches
+
+    def is_live(self, info: Dict) -> bool:
+        """批次是否屬於仍在運行的進程（本進程中未結束的批次，或其他仍在運行的進程）"""
+        with self._lock:
+            return self._is_live(info)
+
+    def _is_live(self, info: Dict) -> bool:
+        """同 is_live，調用方持有 self._lock"""
+        if info['pid'] == os.getpid():
+            return info['batch'] in self._open_batches
+        return info['ended'] is None and info['pid'] is not None and _process_alive(info['pid'])
+
+    def batches(self, limit: int = 20) -> List[Dict]:
+        """
+        最近的批次及各狀態的條目數，最新的在前
+
+        Returns:
+            List[Dict]: batch、started、ended、live、directory（第一個文件所在目錄）、files、counts
+        """
+        summaries = []
+        for info in reversed(self.read().values()):
+            entries = list(info['entries'].values())
+            if not entries:
+                continue
+            counts = {}
+            for entry in entries:
+                counts[entry['state']] = counts.get(entry['state'], 0) + 1
+            summaries.append({
+                'batch': info['batch'],
+                'started': info['started'],
+                'ended': info['ended'],
+                'live': self.is_live(info),
+                'directory': os.path.dirname(entries[0]['src']),
+                'files': len(entries),
+                'counts': counts,
+            })
+            if len(summaries) >= limit:
+                break
+        return summaries
+
+    def rotate_if_needed(self) -> bool:
+        """
+        日誌超過大小上限且沒有運行中的批次和未提交的條目時，輪換為 .1 文件
+
+        檢查和輪換都在排他鎖中進行，期間其他進程不能寫入；它們之後寫入時發現文件已輪換，按路徑重新打開。
+        """
+        if not self.max_bytes or not self.path:
+            return False
+        try:
+            if os.path.getsize(self.path) <= self.max_bytes:
+                return False
+        except OSError:
+            return False
+        with self._lock, self._file_lock(exclusive=True):
+            for info in self.read().values():
+                if self._is_live(info) or any(entry['state'] == 'planned' for entry in info['entries'].values()):
+                    return False
+            os.replace(self.path, self.path + '.1')
+            self._reopen()
+        logger.info(f"重命名日誌已輪換: {self.path}.1")
+        return True
+
+
+class RenamePlanner:
+    """
+    為重命名的文件分配目標路徑並按日誌執行重命名
+
+    目標文件名在內存中對照目錄文件名緩存和本批次已分配的文件名分配，重名時依次嘗試 _1、_2 ……，
+    只在執行前用一次 lexists 確認（緩存過期時重新讀取目錄）。分配和重命名在同一把鎖中完成，
+    並行處理的文件不會搶佔同一個文件名。
+    """
+    def __init__(self, journal: RenameJournal, listing: Optional[DirectoryListing] = None):
+        self.journal = journal
+        self.listing = listing or DirectoryListing()
+        self._lock = threading.Lock()
+
+    def _allocate(self, pdf_path: str, target: str, reserved: Optional[Set[str]]) -> str:
+        """分配不重名的目標路徑，調用方持有 self._lock"""
+        source_directory, source_name = os.path.split(os.path.abspath(pdf_path))
+        directory = os.path.dirname(os.path.abspath(target))
+        names = self.listing.names(directory)
+
+        def is_free(candidate):
+            name = os.path.basename(candidate).casefold()
+            # 與源文件同名（包括只有大小寫不同）時，重命名會釋放這個文件名
+            if directory == source_directory and name == source_name.casefold():
+                return True
+            return name not in names and not (reserved and candidate in reserved)
+
+        base, ext = os.path.splitext(target)
+        candidate, counter = target, 1
+        while not is_free(candidate):
+            candidate = f"{base}_{counter}{ext}"
+            counter += 1
+        return candidate
+
+    def rename(self, pdf_path: str, target: str, dry_run: bool = False, reserved: Optional[Set[str]] = None,
+               batch: Optional[str] = None, make_dirs: bool = False) -> Tuple[str, Optional[Dict]]:
+        """
+        分配目標路徑並重命名
+
+        Args:
+            pdf_path (str): 要重命名的文件
+            target (str): 按命名規則生成的目標路徑，重名時會加上序號
+            dry_run (bool): 只分配路徑並加入 reserved，不重命名
+            reserved (set, optional): 試運行時已分配的目標路徑
+            batch (str, optional): 日誌批次，為None時不記錄日誌
+            make_dirs (bool): 目標目錄不存在時創建
+
+        Returns:
+            Tuple[str, Optional[Dict]]: 最終路徑（與 pdf_path 相同表示無需重命名）和日誌條目標識
+        """
+        with self._lock:
+            new_path = self._allocate(pdf_path, target, reserved)
+            if os.path.abspath(new_path) == os.path.abspath(pdf_path):
+                return new_path, None
+            if dry_run:
+                if reserved is not None:
+                    reserved.add(new_path)
+                return new_path, None
+            if os.path.lexists(new_path):
+                # 緩存之後其他程序創建了同名文件（目錄修改時間的精度不足以發現）
+                self.listing.names(os.path.dirname(os.path.abspath(new_path)), refresh=True)
+                new_path = self._allocate(pdf_path, target, reserved)
+            if make_dirs:
+                os.makedirs(os.path.dirname(os.path.abspath(new_path)), exist_ok=True)
+            entry = self.journal.plan(batch, pdf_path, new_path) if batch and self.journal.is_enabled() else None
+            try:
+                os.rename(pdf_path, new_path)
+            except Exception:
+                self.journal.record('abort', entry)
+                raise
+            self.listing.renamed(pdf_path, new_path)
+        return new_path, entry
+
+    def _move(self, source: str, target: str) -> bool:
+        """撤銷或重新執行時移動文件，目標已存在時不覆蓋"""
+        with self._lock:
+            if not os.path.exists(source) or os.path.lexists(target):
+                return False
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.rename(source, target)
+            self.listing.renamed(source, target)
+        return True
+
+    def _get_batch(self, batch: str) -> Dict:
+        info = self.journal.read().get(batch)
+        if info is None:
+            raise KeyError(f"重命名批次不存在: {batch}")
+        if self.journal.is_live(info):
+            raise RuntimeError(f"重命名批次 {batch} 仍在運行中")
+        return info
+
+    def _revert(self, batch: str, entry: Dict, move_file_index: bool) -> bool:
+        """把一個條目的文件移回原路徑"""
+        identity = {'batch': batch, 'seq': entry['seq']}
+        if os.path.exists(entry['src']) and not os.path.lexists(entry['dst']):
+            # 重命名沒有執行（或已經撤銷）
+            self.journal.record('abort' if entry['state'] == 'planned' else 'undo', identity)
+            return False
+        if not self._move(entry['dst'], entry['src']):
+            logger.warning(f"無法撤銷重命名 {entry['dst']} -> {entry['src']}：文件已不在或原路徑已被佔用")
+            return False
+        _update_index_paths(entry['dst'], entry['src'], move_file_index)
+        self.journal.record('undo', identity)
+        return True
+
+    def undo(self, batch: str) -> Dict:
+        """
+        撤銷一個批次：按相反順序把已重命名的文件移回原路徑，並更新各索引中的路徑
+
+        撤銷後的文件在文件索引中保持已處理狀態，重新掃描時不會再次重命名。
+
+        Returns:
+            Dict: batch、reverted（移回的文件數）和 skipped（無法撤銷的文件數）
+
+        Raises:
+            KeyError: 批次不存在
+            RuntimeError: 批次仍在運行中
+        """
+        info = self._get_batch(batch)
+        reverted = skipped = 0
+        for entry in reversed(list(info['entries'].values())):
+            if entry['state'] not in ('planned', 'committed'):
+                continue
+            if self._revert(batch, entry, move_file_index=True):
+                reverted += 1
+            elif os.path.lexists(entry['dst']):
+                skipped += 1
+        logger.info(f"已撤銷重命名批次 {batch}: 移回 {reverted} 個文件，跳過 {skipped} 個")
+        return {'batch': batch, 'reverted': reverted, 'skipped': skipped}
+
+    def replay(self, batch: str) -> Dict:
+        """
+        重新執行一個批次中已撤銷或被回滾的重命名，目標路徑已被佔用的文件跳過
+
+        Returns:
+            Dict: batch、renamed（重命名的文件數）和 skipped（跳過的文件數）
+
+        Raises:
+            KeyError: 批次不存在
+            RuntimeError: 批次仍在運行中
+        """
+        info = self._get_batch(batch)
+        renamed = skipped = 0
+        for entry in info['entries'].values():
+            if entry['state'] == 'committed':
+                continue
+            if self._move(entry['src'], entry['dst']):
+                _update_index_paths(entry['src'], entry['dst'], move_file_index=True)
+                self.journal.record('replay', {'batch': batch, 'seq': entry['seq']})
+                renamed += 1
+            else:
+                skipped += 1
+        logger.info(f"已重新執行重命名批次 {batch}: 重命名 {renamed} 個文件，跳過 {skipped} 個")
+        return {'batch': batch, 'renamed': renamed, 'skipped': skipped}
+
+    def recover(self) -> int:
+        """
+        啟動時調用：回滾已退出的進程留下的未提交重命名，使文件名與數據庫一致
+
+        回滾的文件不在文件索引中，下次掃描或恢復作業時重新處理（元數據緩存仍然有效）。
+
+        Returns:
+            int: 移回原路徑的文件數
+        """
+        if not self.journal.is_enabled():
+            return 0
+        batches = self.journal.read()
+        reverted = 0
+        for batch, info in batches.items():
+            pending = [entry for entry in info['entries'].values() if entry['state'] == 'planned']
+            if not pending or self.journal.is_live(info):
+                continue
+            for entry in reversed(pending):
+                if self._revert(batch, entry, move_file_index=False):
+                    reverted += 1
+            logger.info(f"重命名批次 {batch} 中斷，已回滾 {len(pending)} 個未提交的條目")
+        self.journal.rotate_if_needed()
+        return reverted
+
+def _update_index_paths(old_path: str, new_path: str, move_file_index: bool) -> None:
+    """文件被移動後更新元數據緩存、重複檢測索引和全文索引中的路徑"""
+    metadata_cache.update_path(old_path, new_path)
+    duplicate_index.update_path(old_path, new_path)
+    fulltext_index.update_path(old_path, new_path)
+    if move_file_index:
+        file_index.update_path(old_path, new_path)
+
+
+# 全局實例，由 app.py 調用 init_app 綁定（命令行模式調用 rename_journal.open）
+rename_journal = RenameJournal()
+rename_planner = RenamePlanner(rename_journal)
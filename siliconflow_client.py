@@ -0,0 +1,405 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import weakref
+import threading
+from typing import Dict, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import API_REQUESTS, API_RETRIES, API_SECONDS, API_TOKENS
+from token_budget import estimate_tokens
+
+# 設置日誌
+logger = logging.getLogger(__name__)
+
+# 需要重試的HTTP狀態碼：限流和服務端錯誤
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class SiliconFlowAPIError(Exception):
+    """API請求在重試後仍然失敗"""
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class TokenBucket:
+    """
+    線程安全的令牌桶
+
+    桶容量為每分鐘額度，令牌按固定速率補充。reserve() 立即扣除額度並返回需要等待的秒數，
+    因此同步線程和事件循環都可以共用同一個桶。
+    """
+    def __init__(self, per_minute: float):
+        """
+        Args:
+            per_minute (float): 每分鐘允許的額度，0 表示不限制
+        """
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1.0) -> float:
+        """
+        預留額度
+
+        Args:
+            amount (float): 需要的額度，超過桶容量時按容量計算
+
+        Returns:
+            float: 需要等待的秒數，0 表示可以立即執行
+        """
+        if self.capacity <= 0:
+            return 0.0
+        amount = min(float(amount), self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= amount
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+
+class RateLimiter:
+    """按每分鐘請求數（RPM）和每分鐘令牌數（TPM）限流"""
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0):
+        """
+        Args:
+            requests_per_minute (float): 每分鐘請求數上限，0 表示不限制
+            tokens_per_minute (float): 每分鐘令牌數上限，0 表示不限制
+        """
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    def reserve(self, tokens: int) -> float:
+        """預留一個請求和相應令牌數，返回需要等待的秒數"""
+        return max(self.requests.reserve(1), self.tokens.reserve(tokens))
+
+    def wait(self, tokens: int) -> None:
+        """同步等待直到可以發送請求"""
+        delay = self.reserve(tokens)
+        if delay > 0:
+            logger.debug(f"觸發限流，等待 {delay:.2f} 秒")
+            time.sleep(delay)
+
+    async def wait_async(self, tokens: int) -> None:
+        """在事件循環中等待直到可以發送請求"""
+        delay = self.reserve(tokens)
+        if delay > 0:
+            logger.debug(f"觸發限流，等待 {delay:.2f} 秒")
+            await asyncio.sleep(delay)
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0, retry_after: Optional[str] = None) -> float:
+    """
+    計算帶抖動的指數退避等待時間
+
+    Args:
+        attempt (int): 已失敗的次數（從0開始）
+        base (float): 基礎等待秒數
+        cap (float): 最大等待秒數
+        retry_after (str, optional): 服務器返回的 Retry-After 頭
+
+    Returns:
+        float: 等待秒數
+    """
+    if retry_after:
+        try:
+            return min(cap, float(retry_after))
+        except ValueError:
+            pass
+    # Full jitter: 在 [0, base * 2^attempt] 之間隨機取值
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def estimate_request_tokens(payload: Dict) -> int:
+    """
+    粗略估算請求消耗的令牌數（用於TPM限流）
+
+    中日韓字符按每字1個令牌計算，其他字符按每4個字符1個令牌計算，再加上最大輸出令牌數。
+    """
+    text = ''.join(message.get('content', '') for message in payload.get('messages', []))
+    return estimate_tokens(text) + int(payload.get('max_tokens', 0))
+
+
+def record_response(status, elapsed: float, response_data: Optional[Dict] = None) -> None:
+    """
+    記錄一次HTTP請求的指標：按狀態碼計數、耗時以及響應中報告的令牌用量
+
+    Args:
+        status: HTTP狀態碼，網絡錯誤時為 'error'
+        elapsed (float): 請求耗時（秒）
+        response_data (Dict, optional): 成功時的響應JSON
+    """
+    API_REQUESTS.inc(status=status)
+    API_SECONDS.observe(elapsed)
+    usage = (response_data or {}).get('usage') or {}
+    for kind in ('prompt_tokens', 'completion_tokens'):
+        if usage.get(kind):
+            API_TOKENS.inc(usage[kind], type=kind.split('_')[0])
+
+
+class SiliconFlowClient:
+    """
+    同步SiliconFlow客戶端
+
+    使用 requests.Session 保持長連接，支持請求超時、限流以及對429/5xx的退避重試。
+    """
+    def __init__(self, api_key: str, api_base_url: str, timeout: float = None, max_retries: int = None,
+                 rate_limiter: RateLimiter = None, pool_size: int = None):
+        """
+        Args:
+            api_key (str): API密鑰
+            api_base_url (str): chat/completions 接口地址
+            timeout (float, optional): 單次請求超時秒數，默認讀取 SILICONFLOW_TIMEOUT 或 60
+            max_retries (int, optional): 最大重試次數，默認讀取 SILICONFLOW_MAX_RETRIES 或 5
+            rate_limiter (RateLimiter, optional): 限流器，默認按環境變量創建
+            pool_size (int, optional): 連接池大小，默認讀取 API_CONCURRENCY 或 4
+        """
+        self.api_key = api_key
+        self.api_base_url = api_base_url
+        self.timeout = timeout or float(os.environ.get("SILICONFLOW_TIMEOUT", 60))
+        self.max_retries = max_retries if max_retries is not None else int(os.environ.get("SILICONFLOW_MAX_RETRIES", 5))
+        self.rate_limiter = rate_limiter or default_rate_limiter()
+        self.pool_size = pool_size or int(os.environ.get("API_CONCURRENCY", 4))
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    def _get_session(self) -> requests.Session:
+        """延遲創建共享的 Session"""
+        with self._session_lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update({
+                    "Content-Type": "application/json",
+                    "Authorization": f"Bearer {self.api_key}"
+                })
+                self._session = session
+            return self._session
+
+    def chat_completion(self, payload: Dict) -> Dict:
+        """
+        發送 chat/completions 請求
+
+        Args:
+            payload (Dict): 請求體
+
+        Returns:
+            Dict: 響應JSON
+
+        Raises:
+            SiliconFlowAPIError: 不可重試的錯誤或重試次數用盡
+        """
+        session = self._get_session()
+        tokens = estimate_request_tokens(payload)
+
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.wait(tokens)
+            retry_after = None
+            started = time.perf_counter()
+            try:
+                response = session.post(self.api_base_url, json=payload, timeout=self.timeout)
+                if response.status_code == 200:
+                    response_data = response.json()
+                    record_response(200, time.perf_counter() - started, response_data)
+                    return response_data
+                record_response(response.status_code, time.perf_counter() - started)
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    raise SiliconFlowAPIError(
+                        f"API請求失敗，狀態碼: {response.status_code}, 回應: {response.text}",
+                        response.status_code
+                    )
+                error = SiliconFlowAPIError(f"API返回狀態碼 {response.status_code}", response.status_code)
+                retry_after = response.headers.get("Retry-After")
+            except (requests.ConnectionError, requests.Timeout) as e:
+                record_response('error', time.perf_counter() - started)
+                error = SiliconFlowAPIError(f"API請求超時或連接失敗: {e}")
+
+            if attempt == self.max_retries:
+                raise error
+            API_RETRIES.inc()
+            delay = backoff_delay(attempt, retry_after=retry_after)
+            logger.warning(f"{error}，{delay:.1f} 秒後重試（第 {attempt + 1}/{self.max_retries} 次）")
+            time.sleep(delay)
+
+    def close(self) -> None:
+        """關閉連接池"""
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+class AsyncSiliconFlowClient:
+    """
+    基於 httpx 的異步SiliconFlow客戶端
+
+    在 asyncio 中直接 await chat_completion_async()；同步線程（例如批處理的API線程池）可調用
+    chat_completion()，請求會提交到客戶端自己的後台事件循環，所有線程共用同一個長連接池。
+    """
+    def __init__(self, api_key: str, api_base_url: str, timeout: float = None, max_retries: int = None,
+                 rate_limiter: RateLimiter = None, pool_size: int = None):
+        """參數含義與 SiliconFlowClient 相同"""
+        import httpx
+
+        self._httpx = httpx
+        self.api_key = api_key
+        self.api_base_url = api_base_url
+        self.timeout = timeout or float(os.environ.get("SILICONFLOW_TIMEOUT", 60))
+        self.max_retries = max_retries if max_retries is not None else int(os.environ.get("SILICONFLOW_MAX_RETRIES", 5))
+        self.rate_limiter = rate_limiter or default_rate_limiter()
+        self.pool_size = pool_size or int(os.environ.get("API_CONCURRENCY", 4))
+        # 事件循環被回收後對應的客戶端也隨之釋放，每次 asyncio.run() 不會遺留連接池
+        self._clients = weakref.WeakKeyDictionary()
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    def _get_client(self):
+        """按事件循環創建 httpx.AsyncClient（AsyncClient 不能跨事件循環共用）"""
+        loop = asyncio.get_running_loop()
+        # 已關閉的事件循環上的連接無法再使用，即使循環對象仍被引用也丟棄其客戶端
+        for closed in [other for other in list(self._clients.keys()) if other.is_closed()]:
+            self._clients.pop(closed, None)
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=self._httpx.Limits(
+                    max_connections=self.pool_size,
+                    max_keepalive_connections=self.pool_size
+                ),
+                headers={
+                    "Content-Type": "application/json",
+                    "Authorization": f"Bearer {self.api_key}"
+                }
+            )
+            self._clients[loop] = client
+        return client
+
+    async def chat_completion_async(self, payload: Dict) -> Dict:
+        """
+        異步發送 chat/completions 請求
+
+        Args:
+            payload (Dict): 請求體
+
+        Returns:
+            Dict: 響應JSON
+
+        Raises:
+            SiliconFlowAPIError: 不可重試的錯誤或重試次數用盡
+        """
+        client = self._get_client()
+        tokens = estimate_request_tokens(payload)
+
+        for attempt in range(self.max_retries + 1):
+            await self.rate_limiter.wait_async(tokens)
+            retry_after = None
+            started = time.perf_counter()
+            try:
+                response = await client.post(self.api_base_url, json=payload)
+                if response.status_code == 200:
+                    response_data = response.json()
+                    record_response(200, time.perf_counter() - started, response_data)
+                    return response_data
+                record_response(response.status_code, time.perf_counter() - started)
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    raise SiliconFlowAPIError(
+                        f"API請求失敗，狀態碼: {response.status_code}, 回應: {response.text}",
+                        response.status_code
+                    )
+                error = SiliconFlowAPIError(f"API返回狀態碼 {response.status_code}", response.status_code)
+                retry_after = response.headers.get("Retry-After")
+            except (self._httpx.TransportError, self._httpx.TimeoutException) as e:
+                record_response('error', time.perf_counter() - started)
+                error = SiliconFlowAPIError(f"API請求超時或連接失敗: {e!r}")
+
+            if attempt == self.max_retries:
+                raise error
+            API_RETRIES.inc()
+            delay = backoff_delay(attempt, retry_after=retry_after)
+            logger.warning(f"{error}，{delay:.1f} 秒後重試（第 {attempt + 1}/{self.max_retries} 次）")
+            await asyncio.sleep(delay)
+
+    def chat_completion(self, payload: Dict) -> Dict:
+        """在後台事件循環中執行請求並阻塞等待結果，供同步代碼調用"""
+        future = asyncio.run_coroutine_threadsafe(self.chat_completion_async(payload), self._get_loop())
+        return future.result()
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        """延遲啟動後台事件循環線程"""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=self._loop.run_forever, name="siliconflow-loop", daemon=True)
+                thread.start()
+            return self._loop
+
+    async def aclose(self) -> None:
+        """關閉當前事件循環的連接池，在 asyncio.run() 的協程結束前調用可以立即釋放連接"""
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    def close(self) -> None:
+        """關閉後台事件循環中的連接池並停止事件循環"""
+        with self._loop_lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        client = self._clients.pop(loop, None)
+        if client is not None:
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+
+_default_rate_limiter = None
+_default_rate_limiter_lock = threading.Lock()
+
+
+def default_rate_limiter() -> RateLimiter:
+    """
+    返回進程內共享的限流器，使所有客戶端共用同一份額度
+
+    環境變量:
+        SILICONFLOW_RPM: 每分鐘請求數上限，0 表示不限制（默認）
+        SILICONFLOW_TPM: 每分鐘令牌數上限，0 表示不限制（默認）
+    """
+    global _default_rate_limiter
+    with _default_rate_limiter_lock:
+        if _default_rate_limiter is None:
+            _default_rate_limiter = RateLimiter(
+                requests_per_minute=float(os.environ.get("SILICONFLOW_RPM", 0)),
+                tokens_per_minute=float(os.environ.get("SILICONFLOW_TPM", 0))
+            )
+        return _default_rate_limiter
+
+
+def create_client(api_key: str, api_base_url: str, mode: str = None, rate_limiter: RateLimiter = None):
+    """
+    按配置創建客戶端
+
+    Args:
+        api_key (str): API密鑰
+        api_base_url (str): chat/completions 接口地址
+        mode (str, optional): "sync" 或 "async"，默認讀取 SILICONFLOW_CLIENT_MODE 或 "sync"
+        rate_limiter (RateLimiter, optional): 限流器，默認使用 SiliconFlow 的共享限流器
+
+    Returns:
+        SiliconFlowClient | AsyncSiliconFlowClient: 客戶端實例
+    """
+    mode = (mode or os.environ.get("SILICONFLOW_CLIENT_MODE", "sync")).lower()
+    if mode == "async":
+        try:
+            return AsyncSiliconFlowClient(api_key, api_base_url, rate_limiter=rate_limiter)
+        except ImportError:
+            logger.warning("httpx未安裝，無法使用異步客戶端，改用同步客戶端")
+    return SiliconFlowClient(api_key, api_base_url, rate_limiter=rate_limiter)
@@ -1,4 +1,16 @@
+// Logs currently shown in the table, keyed by id for the details modal
+const logsById = new Map();
+// Cursor for the next page of the current query, null when all rows are loaded
+let nextCursor = null;
+// Sequence number of the newest live log received from the server
+let lastSeq = 0;
+
 document.addEventListener('DOMContentLoaded', function() {
+    const initialPage = window.initialLogPage || {items: [], next_cursor: null, total: 0};
+    initialPage.items.forEach(log => logsById.set(String(log.id), log));
+    nextCursor = initialPage.next_cursor;
+    lastSeq = initialPage.seq || 0;
+    
     // Setup buttons for viewing file details
     setupDetailsButtons();
     
@@ -7,79 +19,259 @@ document.addEventListener('DOMContentLoaded', function() {
         refreshLogs();
     });
     
-    // Auto-refresh logs if monitoring is active
-    if (document.querySelector('.monitoring-status')) {
-        setInterval(refreshLogs, 10000); // Refresh every 10 seconds
+    // Setup paging and filters
+    document.getElementById('load-more').addEventListener('click', loadMoreLogs);
+    const filters = document.getElementById('log-filters');
+    filters.addEventListener('change', refreshLogs);
+    filters.addEventListener('submit', function(event) {
+        event.preventDefault();
+        refreshLogs();
+    });
+    
+    // Full-text search, re-run shortly after the user stops typing
+    let searchTimer = null;
+    const searchForm = document.getElementById('search-form');
+    document.getElementById('search-input').addEventListener('input', function() {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(searchPapers, 250);
+    });
+    searchForm.addEventListener('submit', function(event) {
+        event.preventDefault();
+        clearTimeout(searchTimer);
+        searchPapers();
+    });
+    
+    // Receive new logs and progress over SSE, falling back to polling
+    if (window.EventSource) {
+        connectLogStream();
+    } else if (document.querySelector('.monitoring-status')) {
+        setInterval(pollRecentLogs, 10000); // Poll every 10 seconds
     }
 });
 
+function connectLogStream() {
+    // Reconnects resume from the last event id automatically
+    const source = new EventSource(`/stream?since=${lastSeq}`);
+    
+    source.addEventListener('log', function(event) {
+        showLiveLog(JSON.parse(event.data));
+    });
+    
+    source.addEventListener('progress', function(event) {
+        updateProgress(JSON.parse(event.data));
+    });
+    
+    // The server dropped us for falling behind: reload the page of logs, EventSource reconnects by itself
+    source.addEventListener('reset', refreshLogs);
+}
+
+// Query the full-text index and list the ranked matches
+function searchPapers() {
+    const query = document.getElementById('search-input').value.trim();
+    const results = document.getElementById('search-results');
+    const stats = document.getElementById('search-stats');
+    if (!query) {
+        results.innerHTML = '';
+        stats.textContent = '';
+        return;
+    }
+    fetch(`/search?q=${encodeURIComponent(query)}`)
+        .then(response => response.json())
+        .then(data => {
+            if (data.error) {
+                results.innerHTML = `<div class="list-group-item text-muted">${escapeHtml(data.error)}</div>`;
+                stats.textContent = '';
+                return;
+            }
+            stats.textContent = `${data.results.length} 個結果，${data.elapsed_ms} ms`;
+            results.innerHTML = data.results.map(result => `
+                <div class="list-group-item">
+                    <div class="fw-bold">${escapeHtml(result.title || result.path.split('/').pop())}</div>
+                    <small class="text-muted">
+                        ${escapeHtml([result.author, result.journal, result.year].filter(Boolean).join(' · '))}
+                    </small>
+                    <div class="small mt-1">${escapeHtml(result.snippet)}</div>
+                    <small class="text-muted text-truncate d-block">${escapeHtml(result.path)}</small>
+                </div>
+            `).join('') || '<div class="list-group-item text-muted">沒有找到匹配的論文</div>';
+        })
+        .catch(error => console.error('Error searching papers:', error));
+}
+
+// Fetch only the logs newer than the last one seen
+function pollRecentLogs() {
+    fetch(`/recent_logs?since=${lastSeq}`)
+        .then(response => response.json())
+        .then(data => {
+            if (data.truncated) {
+                lastSeq = data.seq;
+                refreshLogs();
+                return;
+            }
+            data.items.forEach(showLiveLog);
+        })
+        .catch(error => console.error('Error fetching logs:', error));
+}
+
+function showLiveLog(log) {
+    lastSeq = Math.max(lastSeq, log.seq || 0);
+    // Rows arriving live are the newest, so they only belong at the top of the default view
+    if (!isDefaultView() || logsById.has(String(log.id))) {
+        return;
+    }
+    const counter = document.getElementById('file-count');
+    counter.textContent = `${(parseInt(counter.textContent, 10) || 0) + 1} 個文件`;
+    const emptyRow = document.querySelector('#logs-table tbody td[colspan]');
+    if (emptyRow) {
+        emptyRow.parentElement.remove();
+    }
+    insertLogRows([log], 'afterbegin');
+}
+
+// Whether the table shows unfiltered logs, newest first
+function isDefaultView() {
+    const form = document.getElementById('log-filters');
+    const filtered = ['status', 'year', 'journal', 'q'].some(name => form.elements[name].value.trim());
+    return !filtered && form.elements['sort'].value === 'timestamp:desc';
+}
+
+function updateProgress(progress) {
+    const bar = document.getElementById(`job-${progress.job_id}-progress-bar`);
+    const text = document.getElementById(`job-${progress.job_id}-progress-text`);
+    if (!bar || !text) {
+        return;
+    }
+    const percent = progress.total ? Math.round(progress.done * 100 / progress.total) : 0;
+    bar.style.width = `${percent}%`;
+    let status = `${progress.done} / ${progress.total}，${progress.rate} 個/秒`;
+    if (!progress.active) {
+        status += '，已結束';
+    } else if (progress.eta !== null) {
+        status += `，預計剩餘 ${Math.ceil(progress.eta)} 秒`;
+    }
+    text.textContent = status;
+}
+
 function setupDetailsButtons() {
-    document.querySelectorAll('.view-details').forEach(button => {
+    document.querySelectorAll('.view-details:not([data-bound])').forEach(button => {
+        button.setAttribute('data-bound', '1');
         button.addEventListener('click', function() {
-            const logIndex = this.getAttribute('data-log');
-            showFileDetails(logIndex);
+            showFileDetails(this.getAttribute('data-log'));
         });
     });
 }
 
-function refreshLogs() {
-    fetch('/get_logs')
+function buildLogsQuery(cursor) {
+    const form = document.getElementById('log-filters');
+    const params = new URLSearchParams();
+    ['status', 'year', 'journal', 'q'].forEach(name => {
+        const value = form.elements[name].value.trim();
+        if (value) {
+            params.set(name, value);
+        }
+    });
+    const [sort, order] = form.elements['sort'].value.split(':');
+    params.set('sort', sort);
+    params.set('order', order);
+    if (cursor) {
+        params.set('cursor', cursor);
+    }
+    return params.toString();
+}
+
+function fetchLogsPage(cursor) {
+    return fetch(`/get_logs?${buildLogsQuery(cursor)}`)
         .then(response => response.json())
-        .then(data => {
-            // Update the global variable
-            window.processedFiles = data;
-            
-            // Update the file count
-            document.getElementById('file-count').textContent = `${data.length} Files`;
+        .then(page => {
+            if (page.error) {
+                throw new Error(page.error);
+            }
+            nextCursor = page.next_cursor;
+            document.getElementById('load-more').classList.toggle('d-none', !nextCursor);
+            return page;
+        });
+}
+
+// Reload the first page for the current filters
+function refreshLogs() {
+    fetchLogsPage(null)
+        .then(page => {
+            logsById.clear();
+            document.getElementById('file-count').textContent = `${page.total} 個文件`;
             
-            // Update the table
             const tbody = document.querySelector('#logs-table tbody');
-            if (data.length === 0) {
+            if (page.items.length === 0) {
                 tbody.innerHTML = `
                     <tr>
-                        <td colspan="4" class="text-center">No files processed yet</td>
+                        <td colspan="4" class="text-center">尚未處理任何文件</td>
                     </tr>
                 `;
                 return;
             }
-            
-            // Build the new table contents
-            let html = '';
-            data.slice().reverse().forEach((log, index) => {
-                const fileName = log.original_path.split('/').pop();
-                const statusClass = log.status === 'success' ? 'table-success' : 
-                                   (log.status === 'skipped' ? 'table-warning' : 'table-danger');
-                const statusBadge = log.status === 'success' ? 'bg-success' : 
-                                   (log.status === 'skipped' ? 'bg-warning' : 'bg-danger');
-                const statusText = log.status.charAt(0).toUpperCase() + log.status.slice(1);
-                
-                html += `
-                    <tr class="${statusClass}">
-                        <td>${log.timestamp}</td>
-                        <td class="text-truncate" style="max-width: 200px;">${fileName}</td>
-                        <td><span class="badge ${statusBadge}">${statusText}</span></td>
-                        <td>
-                            <button class="btn btn-sm btn-info view-details" 
-                                    data-bs-toggle="modal" 
-                                    data-bs-target="#detailsModal"
-                                    data-log="${index}">
-                                <i class="fas fa-info-circle"></i> Details
-                            </button>
-                        </td>
-                    </tr>
-                `;
-            });
-            
-            tbody.innerHTML = html;
-            
-            // Re-attach event listeners
-            setupDetailsButtons();
+            tbody.innerHTML = '';
+            insertLogRows(page.items, 'beforeend');
         })
         .catch(error => console.error('Error fetching logs:', error));
 }
 
-function showFileDetails(index) {
-    const log = window.processedFiles.slice().reverse()[index];
+// Append the next page below the rows already shown
+function loadMoreLogs() {
+    if (!nextCursor) {
+        return;
+    }
+    fetchLogsPage(nextCursor)
+        .then(page => insertLogRows(page.items, 'beforeend'))
+        .catch(error => console.error('Error fetching logs:', error));
+}
+
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text == null ? '' : String(text);
+    return div.innerHTML;
+}
+
+function insertLogRows(logs, position) {
+    const statusLabels = {success: '成功', skipped: '已跳過', duplicate: '重複', error: '錯誤'};
+    let html = '';
+    logs.forEach(log => {
+        logsById.set(String(log.id), log);
+        const fileName = log.original_path.split('/').pop();
+        const statusClass = log.status === 'success' ? 'table-success' : 
+                           (log.status === 'skipped' ? 'table-warning' :
+                           (log.status === 'duplicate' ? 'table-info' : 'table-danger'));
+        const statusBadge = log.status === 'success' ? 'bg-success' : 
+                           (log.status === 'skipped' ? 'bg-warning' :
+                           (log.status === 'duplicate' ? 'bg-info' : 'bg-danger'));
+        const statusText = statusLabels[log.status] || statusLabels.error;
+        
+        html += `
+            <tr class="${statusClass}">
+                <td>${log.timestamp}</td>
+                <td class="text-truncate" style="max-width: 200px;">${escapeHtml(fileName)}</td>
+                <td><span class="badge ${statusBadge}">${statusText}</span></td>
+                <td>
+                    <button class="btn btn-sm btn-info view-details" 
+                            data-bs-toggle="modal" 
+                            data-bs-target="#detailsModal"
+                            data-log="${log.id}">
+                        <i class="fas fa-info-circle"></i> 詳情
+                    </button>
+                </td>
+            </tr>
+        `;
+    });
+    
+    document.querySelector('#logs-table tbody').insertAdjacentHTML(position, html);
+    
+    // Attach event listeners to the new rows
+    setupDetailsButtons();
+}
+
+function showFileDetails(id) {
+    const log = logsById.get(String(id));
+    if (!log) {
+        return;
+    }
     const modalContent = document.getElementById('modal-content');
     
     // Format the details based on status
@@ -191,6 +383,30 @@ function showFileDetails(index) {
                 </div>
             </div>
         `;
+    } else if (log.status === 'duplicate') {
+        detailsHtml = `
+            <div class="alert alert-info">
+                <i class="fas fa-clone me-2"></i> Duplicate of an already processed paper
+            </div>
+            
+            <div class="card mb-3">
+                <div class="card-header">File Information</div>
+                <div class="card-body">
+                    <div class="row mb-2">
+                        <div class="col-4 fw-bold">Filename:</div>
+                        <div class="col-8">${escapeHtml(log.original_path.split('/').pop())}</div>
+                    </div>
+                    <div class="row mb-2">
+                        <div class="col-4 fw-bold">Current Path:</div>
+                        <div class="col-8 text-truncate">${escapeHtml(log.new_path || log.original_path)}</div>
+                    </div>
+                    <div class="row">
+                        <div class="col-4 fw-bold">Processing Time:</div>
+                        <div class="col-8">${log.processing_time} seconds</div>
+                    </div>
+                </div>
+            </div>
+        `;
     } else {
         detailsHtml = `
             <div class="alert alert-danger">
@@ -224,5 +440,45 @@ function showFileDetails(index) {
         `;
     }
     
-    modalContent.innerHTML = detailsHtml;
+    modalContent.innerHTML = detailsHtml + duplicateOfHtml(log) + stageTimingsHtml(log.stage_timings, log.usage);
+}
+
+// The original paper a duplicate was matched against
+function duplicateOfHtml(log) {
+    if (!log.duplicate_of) {
+        return '';
+    }
+    return `
+        <div class="card mt-3">
+            <div class="card-header">Duplicate Of</div>
+            <div class="card-body text-truncate">${escapeHtml(log.duplicate_of)}</div>
+        </div>
+    `;
+}
+
+// Per-stage timing breakdown and token usage for the details modal
+function stageTimingsHtml(timings, usage) {
+    const stages = Object.entries(timings || {}).sort((a, b) => b[1] - a[1]);
+    if (stages.length === 0) {
+        return '';
+    }
+    let rows = stages.map(([stage, seconds]) => `
+                    <div class="row mb-1">
+                        <div class="col-4 fw-bold">${escapeHtml(stage)}:</div>
+                        <div class="col-8">${seconds.toFixed(3)} seconds</div>
+                    </div>`).join('');
+    if (usage && (usage.prompt_tokens || usage.completion_tokens)) {
+        rows += `
+                    <div class="row mt-2">
+                        <div class="col-4 fw-bold">Tokens:</div>
+                        <div class="col-8">${usage.prompt_tokens || 0} prompt / ${usage.completion_tokens || 0} completion</div>
+                    </div>`;
+    }
+    return `
+            <div class="card mt-3">
+                <div class="card-header">Stage Timings</div>
+                <div class="card-body">${rows}
+                </div>
+            </div>
+        `;
 }
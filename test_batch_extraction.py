@@ -0,0 +1,63 @@
+"""
+測試多文檔打包提取：結果按文檔編號拆分，缺失或不完整的文檔單獨重試
+"""
+import json
+import logging
+from ai_metadata_extractor import SiliconFlowQwenExtractor
+
+# 設置日誌
+logging.basicConfig(level=logging.INFO, 
+                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class RecordingClient:
+    """記錄請求並按順序返回預設回應的客戶端"""
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.prompts = []
+    
+    def chat_completion(self, payload):
+        self.prompts.append(payload["messages"][0]["content"])
+        return {"choices": [{"message": {"content": self.replies.pop(0)}}]}
+
+def _metadata(author, title):
+    return {"author_lastname": author, "journal": "Nature", "journal_abbr": "Nature",
+            "year": "2020", "title": title, "doc_type": "paper"}
+
+def test_batch_split_and_retry(monkeypatch):
+    """一次請求覆蓋多個文檔，未返回的文檔單獨重試"""
+    monkeypatch.setenv("SILICONFLOW_API_KEY", "test")
+    extractor = SiliconFlowQwenExtractor()
+    batch_reply = "結果如下：\n" + json.dumps([
+        dict(_metadata("Smith", "Paper A"), id="doc1"),
+        dict(_metadata("Li", "Paper C"), id="doc3"),
+    ])
+    single_reply = json.dumps(_metadata("Wang", "Paper B"))
+    extractor.client = RecordingClient([batch_reply, single_reply])
+    
+    documents = {
+        "a.pdf": "第1頁內容:\nPaper A\n\n第2頁內容:\nintro\n\n第3頁內容:\n" + "x" * 10000,
+        "b.pdf": "第1頁內容:\nPaper B",
+        "c.pdf": "第1頁內容:\nPaper C",
+    }
+    results = extractor.extract_pdf_metadata_batch(documents)
+    
+    assert results["a.pdf"]["author_lastname"] == "Smith"
+    assert results["b.pdf"]["author_lastname"] == "Wang"
+    assert results["c.pdf"]["title"] == "Paper C"
+    assert len(extractor.client.prompts) == 2
+    # 批量請求只包含前兩頁
+    assert "第3頁內容" not in extractor.client.prompts[0]
+
+def test_pack_documents_respects_budget():
+    """超出令牌預算時拆分為多個請求（每篇約750個令牌）"""
+    extractor = SiliconFlowQwenExtractor()
+    extractor.prompt_token_budget = 1250
+    documents = {f"{i}.pdf": "y" * 3000 for i in range(4)}
+    assert extractor._pack_documents(documents) == [["0.pdf"], ["1.pdf"], ["2.pdf"], ["3.pdf"]]
+    extractor.prompt_token_budget = 1500
+    assert extractor._pack_documents(documents) == [["0.pdf", "1.pdf"], ["2.pdf", "3.pdf"]]
+
+if __name__ == "__main__":
+    import pytest
+    pytest.main([__file__, "-v"])
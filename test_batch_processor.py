@@ -0,0 +1,157 @@
+"""
+測試兩級流水線：文本提取和API調用分級執行，在途文件數不超過上限，取消後不再提交新文件
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import batch_processor
+from batch_processor import BatchProcessor
+
+class FakePipeline:
+    """用線程代替提取進程，記錄每個文件經過的階段和提取開始時的在途文件數"""
+    def __init__(self, monkeypatch, api_delay=0.0):
+        self.api_delay = api_delay
+        self.lock = threading.Lock()
+        self.started = 0
+        self.completed = 0
+        self.max_in_flight = 0
+        self.stages = {}
+        monkeypatch.setattr(batch_processor, "get_cached_metadata", lambda pdf_path, **kwargs: None)
+        monkeypatch.setattr(batch_processor, "extract_pdf_content", self.extract)
+        monkeypatch.setattr(batch_processor, "extract_metadata_from_content", self.extract_metadata)
+        monkeypatch.setattr(batch_processor, "rename_pdf_file", self.rename)
+
+    def extract(self, pdf_path, **kwargs):
+        with self.lock:
+            self.started += 1
+            self.max_in_flight = max(self.max_in_flight, self.started - self.completed)
+            self.stages[pdf_path] = ['extract']
+        return {'text': f"第1頁內容:\n{pdf_path}", 'timings': {}}
+
+    def extract_metadata(self, pdf_path, content):
+        time.sleep(self.api_delay)
+        self.stages[pdf_path].append('api')
+        return {'title': content['text']}
+
+    def rename(self, pdf_path, metadata, start_time, **kwargs):
+        self.stages[pdf_path].append('rename')
+        result = {'original_path': pdf_path, 'new_path': pdf_path, 'status': 'success', 'metadata': metadata}
+        if kwargs.get('duplicate'):
+            result['duplicate_of'] = kwargs['duplicate']['path']
+        return result
+
+    def callback(self, result):
+        with self.lock:
+            self.completed += 1
+
+@pytest.fixture
+def extract_pool():
+    pool = ThreadPoolExecutor(max_workers=4)
+    yield pool
+    pool.shutdown(wait=True, cancel_futures=True)
+
+def test_backpressure_bounds_in_flight_files(monkeypatch, extract_pool):
+    """API較慢時文本提取暫停等待，在途文件數不超過 max_pending"""
+    pipeline = FakePipeline(monkeypatch, api_delay=0.01)
+    processor = BatchProcessor(pipeline.callback, extract_workers=4, api_concurrency=1, max_pending=3,
+                               extract_pool=extract_pool)
+    paths = [f"paper_{i}.pdf" for i in range(20)]
+    processor.run(iter(paths))
+
+    assert processor.progress()['done'] == processor.total == 20
+    assert all(pipeline.stages[path] == ['extract', 'api', 'rename'] for path in paths)
+    assert pipeline.max_in_flight <= 3
+
+def test_cancel_stops_further_submissions(monkeypatch, extract_pool):
+    """取消後不再從輸入中取出文件，run() 不等待未完成的文件即返回"""
+    pipeline = FakePipeline(monkeypatch, api_delay=0.01)
+    consumed = []
+
+    def paths():
+        for i in range(100):
+            consumed.append(i)
+            yield f"paper_{i}.pdf"
+
+    def callback(result):
+        pipeline.callback(result)
+        if pipeline.completed == 2:
+            processor.cancel()
+
+    processor = BatchProcessor(callback, extract_workers=2, api_concurrency=1, max_pending=2,
+                               extract_pool=extract_pool)
+    runner = threading.Thread(target=processor.run, args=(paths(),))
+    runner.start()
+    runner.join(5)
+
+    assert not runner.is_alive() and processor.is_cancelled()
+    # 最多再取出在途上限內的文件
+    assert len(consumed) <= 2 + 2 + 1
+    submitted = processor.total
+    time.sleep(0.1)
+    assert processor.total == submitted and pipeline.started <= submitted
+
+def test_content_hash_lookup_in_api_stage(monkeypatch, extract_pool):
+    """提交線程不讀取文件計算哈希，提取進程算出的哈希命中緩存時跳過API調用"""
+    pipeline = FakePipeline(monkeypatch)
+    lookups = []
+
+    def lookup(pdf_path, content_hash=None, hash_file=True):
+        lookups.append((content_hash, hash_file))
+        return {'title': 'cached'} if content_hash == 'copy' else None
+
+    def extract(pdf_path, **kwargs):
+        content = FakePipeline.extract(pipeline, pdf_path)
+        content['content_hash'] = 'copy' if pdf_path == 'copy.pdf' else 'new'
+        return content
+
+    monkeypatch.setattr(batch_processor, "get_cached_metadata", lookup)
+    monkeypatch.setattr(batch_processor, "extract_pdf_content", extract)
+    monkeypatch.setattr(batch_processor, "check_duplicate", lambda pdf_path, content: None)
+    processor = BatchProcessor(pipeline.callback, extract_workers=2, api_concurrency=1, extract_pool=extract_pool)
+    processor.run(["copy.pdf", "new.pdf"])
+
+    assert pipeline.stages == {'copy.pdf': ['extract', 'rename'], 'new.pdf': ['extract', 'api', 'rename']}
+    assert sorted(lookups, key=str) == [('copy', True), ('new', True), (None, False), (None, False)]
+
+@pytest.mark.parametrize("api_batch_size", [1, 2])
+def test_identical_files_in_one_batch_share_api_call(monkeypatch, extract_pool, api_batch_size):
+    """同一批中內容相同的副本等待第一個副本完成並沿用其元數據，只調用一次API"""
+    pipeline = FakePipeline(monkeypatch, api_delay=0.05)
+    api_calls = []
+
+    def extract(pdf_path, **kwargs):
+        content = FakePipeline.extract(pipeline, pdf_path)
+        content['text'] = "第1頁內容:\n同一篇論文"
+        content['content_hash'] = 'same'
+        return content
+
+    def extract_metadata(pdf_path, content):
+        api_calls.append(pdf_path)
+        return pipeline.extract_metadata(pdf_path, content)
+
+    def extract_metadata_batch(contents):
+        return {pdf_path: extract_metadata(pdf_path, content) for pdf_path, content in contents.items()}
+
+    results = {}
+
+    def callback(result):
+        results[result['original_path']] = result
+
+    monkeypatch.setattr(batch_processor, "extract_pdf_content", extract)
+    monkeypatch.setattr(batch_processor, "extract_metadata_from_content", extract_metadata)
+    monkeypatch.setattr(batch_processor, "extract_metadata_from_contents", extract_metadata_batch)
+    monkeypatch.setattr(batch_processor.duplicate_index, "is_enabled", lambda: True)
+    processor = BatchProcessor(callback, extract_workers=2, api_concurrency=2, api_batch_size=api_batch_size,
+                               extract_pool=extract_pool)
+    processor.run(["a.pdf", "b.pdf", "c.pdf"])
+
+    assert len(api_calls) == 1
+    original = api_calls[0]
+    copies = [path for path in results if path != original]
+    assert len(results) == 3 and len(copies) == 2
+    assert 'duplicate_of' not in results[original]
+    for path in copies:
+        assert results[path]['duplicate_of'] == original
+        assert results[path]['metadata'] == results[original]['metadata']
+        assert pipeline.stages[path] == ['extract', 'rename']
@@ -0,0 +1,47 @@
+"""
+測試基準測試工具的合成語料和模擬服務器
+"""
+import json
+import requests
+from benchmarks.corpus import generate_corpus
+from benchmarks.mock_server import MockSiliconFlowServer
+from benchmarks.run import percentile
+from metadata_extractor import extract_text_from_pdf
+
+def test_corpus_is_readable_and_deterministic(tmp_path):
+    """相同種子生成相同的文本，且可被文本提取解析"""
+    first = generate_corpus(str(tmp_path / "a"), 3, max_pages=3, seed=7)
+    second = generate_corpus(str(tmp_path / "b"), 3, max_pages=3, seed=7)
+    assert len(first) == 3
+    for a, b in zip(first, second):
+        text = extract_text_from_pdf(a)
+        assert text and text == extract_text_from_pdf(b)
+
+def test_mock_server_answers_single_and_batch_prompts(tmp_path):
+    """單篇提示返回對象，批量提示返回帶id的數組"""
+    paths = generate_corpus(str(tmp_path), 1, max_pages=1)
+    text = extract_text_from_pdf(paths[0])
+    with MockSiliconFlowServer() as server:
+        single = requests.post(server.url, json={"messages": [{"role": "user", "content": f"PDF文本內容：\n{text}"}]})
+        metadata = json.loads(single.json()["choices"][0]["message"]["content"])
+        assert metadata["year"] and metadata["author_lastname"] and metadata["title"]
+
+        batch_prompt = f"=== 文檔 doc0 ===\n{text}\n\n=== 文檔 doc1 ===\n{text}"
+        batch = requests.post(server.url, json={"messages": [{"role": "user", "content": batch_prompt}]})
+        items = json.loads(batch.json()["choices"][0]["message"]["content"])
+        assert [item["id"] for item in items] == ["doc0", "doc1"]
+        assert server.stats() == {"requests": 2, "errors": 0}
+
+def test_mock_server_injects_errors():
+    """錯誤率為1時每個請求都返回錯誤狀態碼"""
+    with MockSiliconFlowServer(error_rate=1.0) as server:
+        response = requests.post(server.url, json={"messages": [{"role": "user", "content": "x"}]})
+        assert response.status_code in (429, 500, 503)
+        assert server.stats()["errors"] == 1
+
+def test_percentile():
+    """最近秩百分位數"""
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([], 50) is None
@@ -0,0 +1,133 @@
+"""
+測試 MinHash 指紋、LSH 重複檢測索引和重複文件的處理策略
+"""
+import os
+from flask import Flask
+from models import db
+import pdf_processor
+from duplicate_index import DuplicateIndex, compute_minhash, estimate_similarity, first_page_text
+
+ABSTRACT = (
+    "We study the convergence of stochastic gradient descent on overparameterized neural networks "
+    "and show that with a suitable learning rate schedule the training loss decreases linearly. "
+    "Our analysis relies on the neural tangent kernel and extends prior results to deep residual "
+    "architectures with batch normalization, and we validate the theory with experiments on image data."
+)
+
+def _create_index(monkeypatch, policy="report"):
+    """創建使用內存數據庫的索引實例"""
+    monkeypatch.setenv("DUPLICATE_POLICY", policy)
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return DuplicateIndex(app)
+
+def _touch(path, content):
+    path.write_bytes(content)
+    return str(path)
+
+def _fingerprint(content_hash, text):
+    return {'content_hash': content_hash, 'minhash': compute_minhash(text)}
+
+def test_minhash_estimates_similarity():
+    """近似文本的估計相似度高，無關文本的估計相似度低，太短的文本不計算簽名"""
+    preprint = compute_minhash("arXiv preprint\n" + ABSTRACT)
+    published = compute_minhash("Journal of Machine Learning Research 2021\n" + ABSTRACT)
+    unrelated = compute_minhash(
+        "A survey of protein folding methods covering homology modelling, threading, molecular dynamics "
+        "and recent deep learning approaches such as attention based structure prediction networks."
+    )
+    assert estimate_similarity(preprint, published) >= 0.8
+    assert estimate_similarity(preprint, unrelated) < 0.2
+    assert compute_minhash("too short") is None
+    assert first_page_text("PDF標題: x\n\n第1頁內容:\nfirst\n\n第2頁內容:\nsecond") == "first\n"
+
+def test_find_exact_and_near_duplicates(tmp_path, monkeypatch):
+    """按內容哈希找到完全相同的文件，按 LSH 候選找到近似文件，同一路徑和已刪除的文件不算重複"""
+    index = _create_index(monkeypatch)
+    original = _touch(tmp_path / "Smith_2021_JMLR_Convergence.pdf", b"%PDF original")
+    index.record(original, _fingerprint("hash-a", ABSTRACT), {'title': 'Convergence'})
+
+    exact = index.find(str(tmp_path / "copy.pdf"), _fingerprint("hash-a", ""))
+    assert exact == {'path': original, 'metadata': {'title': 'Convergence'}, 'similarity': 1.0, 'exact': True}
+
+    near = index.find(str(tmp_path / "preprint.pdf"), _fingerprint("hash-b", "arXiv preprint " + ABSTRACT))
+    assert near['path'] == original and not near['exact'] and near['similarity'] >= 0.8
+
+    assert index.find(original, _fingerprint("hash-a", ABSTRACT)) is None
+    assert index.find(str(tmp_path / "other.pdf"), _fingerprint("hash-c", "unrelated " * 3 + "words in a row " * 5)) is None
+
+    os.remove(original)
+    assert index.find(str(tmp_path / "copy.pdf"), _fingerprint("hash-a", ABSTRACT)) is None
+
+def test_record_follows_renames(tmp_path, monkeypatch):
+    """重命名後更新記錄的路徑，只有字節哈希時保留已有的簽名"""
+    index = _create_index(monkeypatch)
+    old_path = _touch(tmp_path / "download.pdf", b"%PDF")
+    index.record(old_path, _fingerprint("hash-a", ABSTRACT), {'title': 'Convergence'})
+    new_path = str(tmp_path / "Smith_2021_JMLR_Convergence.pdf")
+    os.rename(old_path, new_path)
+    index.record(new_path, {'content_hash': 'hash-a', 'minhash': None}, {'title': 'Convergence'}, previous_path=old_path)
+
+    near = index.find(str(tmp_path / "preprint.pdf"), _fingerprint("hash-b", "arXiv preprint " + ABSTRACT))
+    assert near['path'] == new_path
+    assert index.clear() == 1
+
+def test_duplicate_policies(tmp_path, monkeypatch):
+    """link 保留重複文件原名，move 移到重複文件目錄，report 照常重命名並記錄原論文"""
+    metadata = {'author_lastname': 'Smith', 'journal': 'JMLR', 'journal_abbr': 'JMLR', 'year': '2021',
+                'title': 'Convergence', 'doc_type': 'paper'}
+    original = str(tmp_path / "Smith_2021_JMLR_Convergence.pdf")
+    duplicate = {'path': original, 'metadata': metadata, 'similarity': 0.9, 'exact': False}
+    monkeypatch.setattr(pdf_processor.duplicate_index, "duplicates_dir", "duplicates")
+
+    monkeypatch.setattr(pdf_processor.duplicate_index, "policy", "link")
+    linked = _touch(tmp_path / "linked.pdf", b"%PDF")
+    result = pdf_processor.rename_pdf_file(linked, dict(metadata), duplicate=duplicate)
+    assert result['status'] == 'duplicate' and result['duplicate_of'] == original
+    assert os.path.exists(linked)
+
+    monkeypatch.setattr(pdf_processor.duplicate_index, "policy", "move")
+    moved = _touch(tmp_path / "moved.pdf", b"%PDF")
+    result = pdf_processor.rename_pdf_file(moved, dict(metadata), duplicate=duplicate)
+    assert result['status'] == 'duplicate'
+    assert result['new_path'] == str(tmp_path / "duplicates" / "Smith_2021_JMLR_Convergence.pdf")
+    assert os.path.exists(result['new_path']) and not os.path.exists(moved)
+
+    monkeypatch.setattr(pdf_processor.duplicate_index, "policy", "report")
+    reported = _touch(tmp_path / "reported.pdf", b"%PDF")
+    result = pdf_processor.rename_pdf_file(reported, dict(metadata), duplicate=duplicate)
+    assert result['status'] == 'success' and result['duplicate_of'] == original
+    assert result['new_path'] == original
+
+def test_candidates_ranked_by_shared_bands(tmp_path, monkeypatch):
+    """候選超出上限時優先比較共享帶最多的記錄"""
+    import duplicate_index
+    monkeypatch.setattr(duplicate_index, "MAX_CANDIDATES", 1)
+    index = _create_index(monkeypatch)
+    signature = list(range(1, duplicate_index.NUM_PERMUTATIONS + 1))
+    # 先記錄只共享第一個帶的文件，再記錄只有最後一個值不同的文件
+    weak = _touch(tmp_path / "weak.pdf", b"%PDF weak")
+    index.record(weak, {'content_hash': 'weak', 'minhash': signature[:4] + [0] * 60}, {'title': 'Weak'})
+    close = _touch(tmp_path / "close.pdf", b"%PDF close")
+    index.record(close, {'content_hash': 'close', 'minhash': signature[:-1] + [0]}, {'title': 'Close'})
+
+    match = index.find(str(tmp_path / "new.pdf"), {'content_hash': 'new', 'minhash': signature})
+    assert match['path'] == close and match['similarity'] >= 0.9
+
+def test_fingerprint_skipped_when_disabled(tmp_path, monkeypatch):
+    """未啟用重複檢測時（如命令行）提取不計算指紋，指紋沿用已計算的內容哈希"""
+    import metadata_extractor
+    from benchmarks.corpus import build_pdf
+    path = _touch(tmp_path / "paper.pdf", build_pdf([[ABSTRACT]], {'Title': 'Convergence'}))
+    calls = []
+    monkeypatch.setattr(metadata_extractor, "compute_file_hash", lambda pdf_path: calls.append(pdf_path) or "hash")
+
+    content = metadata_extractor.extract_pdf_content(path)
+    assert 'fingerprint' not in content and calls == [path]
+
+    content = metadata_extractor.extract_pdf_content(path, fingerprint=True)
+    assert content['fingerprint']['content_hash'] == "hash" and content['fingerprint']['minhash']
+    assert calls == [path, path]
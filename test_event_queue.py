@@ -0,0 +1,75 @@
+"""
+測試監控事件的防抖與合併
+"""
+import os
+import time
+import threading
+from folder_monitor import DebouncedEventQueue
+
+def _wait_for(predicate, timeout=5.0):
+    """輪詢直到條件成立或超時"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+def test_events_coalesced_until_file_stable(tmp_path):
+    """寫入過程中的多次事件只在文件穩定後處理一次"""
+    processed = []
+    queue = DebouncedEventQueue(lambda path: processed.append(path) or {}, debounce_seconds=0.3, workers=2)
+    pdf_path = str(tmp_path / "download.pdf")
+    try:
+        with open(pdf_path, "wb") as f:
+            for _ in range(5):
+                f.write(b"x" * 1024)
+                f.flush()
+                queue.put(pdf_path)
+                time.sleep(0.1)
+        assert processed == []
+        assert _wait_for(lambda: processed)
+        time.sleep(0.5)
+        assert processed == [pdf_path]
+    finally:
+        queue.stop()
+
+def test_own_rename_is_ignored(tmp_path):
+    """自身重命名產生的新路徑事件被忽略"""
+    processed = []
+    done = threading.Event()
+    src = str(tmp_path / "paper.pdf")
+    dst = str(tmp_path / "Zhang_2024_Title.pdf")
+    with open(src, "wb") as f:
+        f.write(b"%PDF-1.4")
+
+    def process(path):
+        processed.append(path)
+        os.rename(path, dst)
+        done.set()
+        return {"status": "success", "new_path": dst}
+
+    queue = DebouncedEventQueue(process, debounce_seconds=0.1, workers=1)
+    try:
+        queue.put(src)
+        assert done.wait(5)
+        assert _wait_for(lambda: queue.pending_count() == 0)
+        queue.put(dst)
+        time.sleep(0.4)
+        assert processed == [src]
+    finally:
+        queue.stop()
+
+def test_deleted_file_dropped(tmp_path):
+    """穩定前被刪除的文件不會被處理"""
+    processed = []
+    queue = DebouncedEventQueue(lambda path: processed.append(path) or {}, debounce_seconds=0.2, workers=1)
+    pdf_path = tmp_path / "temp.pdf"
+    pdf_path.write_bytes(b"%PDF")
+    try:
+        queue.put(str(pdf_path))
+        pdf_path.unlink()
+        assert _wait_for(lambda: queue.pending_count() == 0)
+        assert processed == []
+    finally:
+        queue.stop()
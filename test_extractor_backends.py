@@ -0,0 +1,88 @@
+"""
+測試提取後端註冊表、規則提取器、OpenAI兼容後端和逐級升級
+"""
+import pytest
+from extractor_backends import ExtractorRouter, HeuristicExtractor, MetadataExtractor, get_extractor, reset_extractor
+from ai_metadata_extractor import OpenAICompatibleExtractor, SiliconFlowQwenExtractor
+from benchmarks.mock_server import MockSiliconFlowServer
+
+SAMPLE_TEXT = """第1頁內容:
+Deep Residual Learning for Image Recognition
+Kaiming He, Xiangyu Zhang, Shaoqing Ren
+IEEE Conference on Computer Vision and Pattern Recognition, 2016
+Abstract
+Deeper neural networks are more difficult to train.
+"""
+
+class FakeBackend(MetadataExtractor):
+    """返回預設結果並記錄調用次數"""
+    def __init__(self, name, result):
+        self.name = self.model = name
+        self.result = result
+        self.calls = 0
+    
+    def extract_pdf_metadata(self, text, fetch_more=None):
+        self.calls += 1
+        return dict(self._empty_metadata(), **self.result)
+
+def test_heuristic_extractor_reads_first_page_layout():
+    """按首頁版式提取標題、第一作者姓氏、會議和年份"""
+    metadata = HeuristicExtractor().extract_pdf_metadata(SAMPLE_TEXT)
+    assert metadata["title"] == "Deep Residual Learning for Image Recognition"
+    assert metadata["author_lastname"] == "He"
+    assert metadata["journal"] == "IEEE Conference on Computer Vision and Pattern Recognition"
+    assert metadata["year"] == "2016"
+
+def test_router_escalates_only_when_fields_missing():
+    """前一級缺少主要字段時升級，並保留前一級已提取的字段"""
+    cheap = FakeBackend("cheap", {"title": "A Title", "journal": "Nature"})
+    big = FakeBackend("big", {"title": "A Title", "author_lastname": "Smith", "year": "2020"})
+    router = ExtractorRouter([cheap, big])
+    assert router.model == "cheap>big"
+    
+    result = router.extract_pdf_metadata("text")
+    assert (cheap.calls, big.calls) == (1, 1)
+    assert result["author_lastname"] == "Smith" and result["journal"] == "Nature"
+    
+    complete = FakeBackend("complete", {"title": "T", "author_lastname": "Li", "year": "2021"})
+    router = ExtractorRouter([complete, big])
+    router.extract_pdf_metadata_batch({"a": "x", "b": "y"})
+    assert big.calls == 1
+
+def test_get_extractor_builds_configured_chain(monkeypatch):
+    """按 EXTRACTOR_BACKENDS 組合後端，未知名稱報錯"""
+    monkeypatch.setenv("EXTRACTOR_BACKENDS", "heuristic")
+    reset_extractor()
+    try:
+        extractor = get_extractor()
+        assert [backend.name for backend in extractor.backends] == ["heuristic"]
+        assert extractor is get_extractor()
+        
+        monkeypatch.setenv("EXTRACTOR_BACKENDS", "heuristic,nope")
+        reset_extractor()
+        with pytest.raises(ValueError):
+            get_extractor()
+    finally:
+        reset_extractor()
+
+def test_openai_compatible_backend_against_local_server(monkeypatch):
+    """OpenAI兼容後端使用本地接口，不需要密鑰"""
+    monkeypatch.delenv("LOCAL_LLM_BASE_URL", raising=False)
+    assert not OpenAICompatibleExtractor().is_available()
+    with MockSiliconFlowServer() as server:
+        extractor = OpenAICompatibleExtractor(api_base_url=server.url, model="qwen2.5-1.5b")
+        assert extractor.is_available()
+        metadata = extractor.extract_pdf_metadata(SAMPLE_TEXT)
+        assert metadata["title"] == "Deep Residual Learning for Image Recognition"
+        assert server.stats()["requests"] == 1
+
+def test_openai_backend_has_its_own_rate_limiter(monkeypatch):
+    """本地後端按 LOCAL_LLM_RPM 單獨限流，不共用 SiliconFlow 的限流器；空密鑰視為未配置"""
+    from siliconflow_client import default_rate_limiter
+    monkeypatch.setenv("LOCAL_LLM_RPM", "30")
+    extractor = OpenAICompatibleExtractor(api_base_url="http://localhost:1/v1/chat/completions")
+    assert extractor.client.rate_limiter is not default_rate_limiter()
+    assert extractor.client.rate_limiter.requests.rate == 0.5
+
+    monkeypatch.setenv("SILICONFLOW_API_KEY", "")
+    assert not SiliconFlowQwenExtractor().is_available()
@@ -0,0 +1,60 @@
+"""
+測試遞歸目錄掃描和持久化文件索引
+"""
+import os
+from flask import Flask
+from models import db
+from file_index import FileIndex, scan_pdf_files
+
+def _create_index():
+    """創建使用內存數據庫的索引實例"""
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return FileIndex(app)
+
+def _touch(path, content=b"%PDF-1.4"):
+    """創建文件及其父目錄"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return str(path)
+
+def test_scan_is_recursive(tmp_path):
+    """遞歸掃描子目錄，跳過非PDF文件和隱藏目錄"""
+    expected = {
+        _touch(tmp_path / "a.pdf"),
+        _touch(tmp_path / "sub" / "b.PDF"),
+        _touch(tmp_path / "sub" / "deeper" / "c.pdf"),
+    }
+    _touch(tmp_path / "notes.txt")
+    _touch(tmp_path / ".trash" / "d.pdf")
+
+    assert {path for path, _ in scan_pdf_files(str(tmp_path))} == expected
+    assert [path for path, _ in scan_pdf_files(str(tmp_path), recursive=False)] == [str(tmp_path / "a.pdf")]
+
+def test_rescan_skips_unchanged_files(tmp_path):
+    """已記錄的文件在重新掃描時被跳過，修改或新增的文件重新處理"""
+    index = _create_index()
+    first = _touch(tmp_path / "a.pdf")
+    second = _touch(tmp_path / "sub" / "b.pdf")
+    renamed = str(tmp_path / "sub" / "Zhang_2024_Title.pdf")
+
+    assert sorted(index.filter_changed(scan_pdf_files(str(tmp_path)))) == [first, second]
+
+    index.record({'status': 'skipped', 'original_path': first})
+    os.rename(second, renamed)
+    index.record({'status': 'success', 'original_path': second, 'new_path': renamed})
+    assert list(index.filter_changed(scan_pdf_files(str(tmp_path)))) == []
+
+    _touch(tmp_path / "a.pdf", b"%PDF-1.4 changed")
+    third = _touch(tmp_path / "c.pdf")
+    assert sorted(index.filter_changed(scan_pdf_files(str(tmp_path)))) == [first, third]
+
+def test_errors_are_retried(tmp_path):
+    """處理失敗的文件不寫入索引"""
+    index = _create_index()
+    path = _touch(tmp_path / "broken.pdf")
+    index.record({'status': 'error', 'original_path': path, 'error': 'boom'})
+    assert list(index.filter_changed(scan_pdf_files(str(tmp_path)))) == [path]
@@ -0,0 +1,80 @@
+"""
+測試全文索引的增量更新、排序和查詢轉換
+"""
+import pytest
+from flask import Flask
+from models import db, PaperText
+from fulltext_index import FullTextIndex, build_match_query, decompress_text
+
+def _create_index():
+    """創建使用內存數據庫的索引實例"""
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return FullTextIndex(app)
+
+def _paths(result):
+    return [item['path'] for item in result['results']]
+
+def test_build_match_query_ignores_fts_syntax():
+    """引號和運算符不會被當作FTS5語法，中文按單字短語匹配，最後一個英文詞按前綴匹配"""
+    assert build_match_query('graph "neural') == '"graph" "neural"*'
+    assert build_match_query('深度學習 NOT') == '"深 度 學 習" "NOT"*'
+    assert build_match_query('圖神經網絡') == '"圖 神 經 網 絡"'
+    assert build_match_query('  -*( ') == ''
+
+def test_search_ranks_title_matches_first(tmp_path):
+    """標題中的匹配排在只在正文中出現的匹配之前，結果帶正文片段"""
+    index = _create_index()
+    index.record(str(tmp_path / "a.pdf"), "第1頁內容:\nWe apply transformers to protein folding.",
+                 {'title': 'Protein structure prediction', 'author_lastname': 'Lee', 'year': '2022'})
+    index.record(str(tmp_path / "b.pdf"), "第1頁內容:\nA study of graph transformers.",
+                 {'title': 'Transformers for graphs', 'author_lastname': 'Wang', 'year': '2021'})
+    index.record(str(tmp_path / "c.pdf"), "第1頁內容:\n本文研究圖神經網絡的訓練方法。",
+                 {'title': '圖神經網絡', 'author_lastname': '張', 'year': '2020'})
+
+    result = index.search("transformer")
+    assert _paths(result) == [str(tmp_path / "b.pdf"), str(tmp_path / "a.pdf")]
+    assert 'protein folding' in result['results'][1]['snippet']
+    assert _paths(index.search("神經網絡 訓練")) == [str(tmp_path / "c.pdf")]
+    assert index.search("nothing matches this")['results'] == []
+    with pytest.raises(ValueError):
+        index.search("  ")
+
+def test_record_follows_renames_and_replaces_text(tmp_path):
+    """重命名時沒有新文本則保留已索引的文本，重新提取時替換舊文本"""
+    index = _create_index()
+    old_path, new_path = str(tmp_path / "download.pdf"), str(tmp_path / "Lee_2022_Protein.pdf")
+    index.record(old_path, "第1頁內容:\nprotein folding", {'title': 'Protein'})
+    index.record(new_path, None, {'title': 'Protein'}, previous_path=old_path)
+    assert _paths(index.search("folding")) == [new_path]
+
+    index.record(new_path, "第1頁內容:\nmolecular dynamics", {'title': 'Protein'})
+    assert index.search("folding")['results'] == []
+    assert _paths(index.search("dynamics")) == [new_path]
+    with index.app.app_context():
+        entry = PaperText.query.one()
+        assert decompress_text(entry.text_compressed) == "第1頁內容:\nmolecular dynamics"
+
+    index.record(str(tmp_path / "cached.pdf"), None, {'title': 'Unknown'})
+    with index.app.app_context():
+        assert PaperText.query.count() == 1
+
+def test_body_pages_indexed_past_early_stop(tmp_path, monkeypatch):
+    """提取元數據在首頁提前停止時，全文索引的文本仍包含後續正文頁面，頁數受 FULLTEXT_MAX_PAGES 限制"""
+    import metadata_extractor
+    from benchmarks.corpus import build_pdf
+    header = ["Sparse Attention for Long Documents", "Jane Doe, John Roe", "Journal of Testing, vol. 1, 2020"]
+    path = tmp_path / "paper.pdf"
+    path.write_bytes(build_pdf([header] + [[f"Body section {i} on kernel methods"] for i in range(2, 6)], {}))
+
+    content = metadata_extractor.extract_pdf_content(str(path), fulltext=True)
+    assert "第2頁內容:" not in content['text']
+    assert content['fulltext'].startswith(content['text']) and "Body section 5 on kernel methods" in content['fulltext']
+
+    monkeypatch.setattr(metadata_extractor, "FULLTEXT_MAX_PAGES", 3)
+    content = metadata_extractor.extract_pdf_content(str(path), fulltext=True)
+    assert "第3頁內容:" in content['fulltext'] and "第4頁內容:" not in content['fulltext']
+    assert 'fulltext' not in metadata_extractor.extract_pdf_content(str(path))
@@ -0,0 +1,62 @@
+"""
+測試多作業之間的公平調度
+"""
+import threading
+import time
+from job_manager import FairScheduler
+
+def test_slots_alternate_between_jobs():
+    """名額用盡後按等待先後輪流授予各作業"""
+    scheduler = FairScheduler(capacity=1)
+    assert scheduler.acquire('warmup')
+    granted = []
+
+    def feed(job, count):
+        for _ in range(count):
+            assert scheduler.acquire(job, timeout=5)
+            granted.append(job)
+
+    threads = [threading.Thread(target=feed, args=(job, 3)) for job in ('big', 'small')]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)  # 確定排隊順序
+    for _ in range(6):
+        time.sleep(0.05)
+        scheduler.release()
+    for thread in threads:
+        thread.join(5)
+    assert granted == ['big', 'small'] * 3
+
+def test_timeout_keeps_queue_position():
+    """等待超時的作業不阻擋其他作業，重新等待時保留位置"""
+    scheduler = FairScheduler(capacity=1)
+    assert scheduler.acquire('a')
+    assert not scheduler.acquire('b', timeout=0.05)
+
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(scheduler.acquire('c', timeout=5)))
+    waiter.start()
+    time.sleep(0.05)
+    scheduler.release()
+    waiter.join(5)
+    assert result == [True]
+
+    # b 仍排在隊列中，未等待時不佔用名額；forget 後隊列清空
+    scheduler.forget('b')
+    scheduler.release()
+    assert scheduler.acquire('d', timeout=0.1)
+
+def test_finished_callback_without_job_record():
+    """作業記錄已不在表中時，結束回調仍以監視器的目錄報告最終進度"""
+    from types import SimpleNamespace
+    from job_manager import JobManager
+
+    finished = []
+    manager = JobManager(lambda result: None, on_job_finished=lambda job_id, progress: finished.append(progress))
+    monitor = SimpleNamespace(
+        directory="/papers",
+        _process_existing_files=lambda: None,
+        batch_processor=SimpleNamespace(progress=lambda: {'total': 2, 'done': 2}),
+    )
+    manager._run(7, monitor)
+    assert finished == [{'total': 2, 'done': 2, 'job_id': 7, 'directory': "/papers", 'active': False}]
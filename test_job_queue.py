@@ -0,0 +1,76 @@
+"""
+測試持久化作業隊列
+"""
+import pytest
+from flask import Flask
+from models import db
+from job_queue import JobQueue
+
+@pytest.fixture
+def queue(monkeypatch):
+    """使用內存數據庫、無退避等待的作業隊列"""
+    monkeypatch.setenv("JOB_MAX_ATTEMPTS", "2")
+    monkeypatch.setenv("JOB_RETRY_BASE_SECONDS", "0")
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return JobQueue(app)
+
+def _success(path):
+    return {'status': 'success', 'original_path': path}
+
+def _error(path):
+    return {'status': 'error', 'original_path': path, 'error': 'API timeout'}
+
+def test_tasks_are_processed_once_and_job_drains(queue):
+    """每個文件只入隊一次，全部完成後生成器結束"""
+    job_id = queue.create_job('/papers')
+    queue.start_job(job_id)
+    assert queue.enqueue(job_id, ['/papers/a.pdf', '/papers/b.pdf', '/papers/a.pdf']) == 2
+    queue.mark_scanned(job_id)
+
+    processed = []
+    for path in queue.iter_tasks(job_id):
+        processed.append(path)
+        queue.complete(job_id, _success(path))
+    assert processed == ['/papers/a.pdf', '/papers/b.pdf']
+    assert queue.get_job(job_id)['progress']['done'] == 2
+
+def test_failed_tasks_retry_until_max_attempts(queue):
+    """失敗的任務重新排隊，達到次數上限後記為failed"""
+    job_id = queue.create_job('/papers')
+    queue.start_job(job_id)
+    queue.enqueue(job_id, ['/papers/bad.pdf'])
+    queue.mark_scanned(job_id)
+
+    attempts = []
+    for path in queue.iter_tasks(job_id):
+        attempts.append(path)
+        queue.complete(job_id, _error(path))
+    assert attempts == ['/papers/bad.pdf', '/papers/bad.pdf']
+    progress = queue.get_job(job_id)['progress']
+    assert progress['failed'] == 1 and progress['queued'] == 0
+
+def test_interrupted_job_resumes_remaining_tasks(queue):
+    """中斷時處理中的任務在恢復後重新處理，已完成的不再處理"""
+    job_id = queue.create_job('/papers')
+    queue.start_job(job_id)
+    queue.enqueue(job_id, ['/papers/a.pdf', '/papers/b.pdf', '/papers/c.pdf'])
+    tasks = queue.iter_tasks(job_id)
+    queue.complete(job_id, _success(next(tasks)))
+    next(tasks)  # 處理 b.pdf 時進程崩潰
+
+    assert queue.recover() == [job_id]
+    assert queue.get_job(job_id)['status'] == 'interrupted'
+
+    queue.start_job(job_id)
+    assert queue.enqueue(job_id, ['/papers/a.pdf', '/papers/b.pdf', '/papers/c.pdf']) == 0
+    queue.mark_scanned(job_id)
+    remaining = []
+    for path in queue.iter_tasks(job_id):
+        remaining.append(path)
+        queue.complete(job_id, _success(path))
+    assert remaining == ['/papers/b.pdf', '/papers/c.pdf']
+    assert queue.get_job(job_id)['progress']['done'] == 3
@@ -0,0 +1,51 @@
+"""
+測試離線期刊索引的ISSN、DOI和名稱查找，以及按索引結果完成本地命名
+"""
+import pytest
+import metadata_extractor
+from benchmarks.corpus import build_pdf
+from journal_index import JournalIndex, BUNDLED_DUMP_PATH
+from metadata_extractor import extract_pdf_content, normalize_local_metadata, is_local_metadata_sufficient
+
+@pytest.fixture
+def index(tmp_path):
+    """使用內置數據、索引文件放在臨時目錄的期刊索引"""
+    return JournalIndex(index_path=str(tmp_path / "journal_index.db"), dump_path=BUNDLED_DUMP_PATH)
+
+def test_lookup_issn_and_doi(index):
+    """印刷版和電子版ISSN都能查到，DOI取最長的匹配前綴"""
+    assert index.lookup_issn("0028-0836") == {'title': 'Nature', 'iso4': 'Nature'}
+    assert index.lookup_issn("14764687")['iso4'] == 'Nature'
+    assert index.lookup_issn("not an issn") is None
+    assert index.lookup_issn("0000-0000") is None
+
+    assert index.lookup_doi("10.1103/PhysRevLett.123.456")['iso4'] == 'Phys. Rev. Lett.'
+    assert index.lookup_doi("10.1038/s41467-020-1234-5")['iso4'] == 'Nat. Commun.'
+    assert index.lookup_doi("10.9999/unknown.1") is None
+
+def test_lookup_name(index):
+    """全稱和縮寫精確匹配，拼寫差異可以模糊匹配，相近但不同的期刊被拒絕"""
+    assert index.lookup_name("The Physical Review Letters") == {
+        'title': 'Physical Review Letters', 'iso4': 'Phys. Rev. Lett.', 'score': 1.0
+    }
+    assert index.lookup_name("Nat. Commun.")['title'] == 'Nature Communications'
+    assert index.lookup_name("Nature Comunications")['iso4'] == 'Nat. Commun.'
+    # 內置數據中只有 Physical Review E，不能把 A 匹配過去
+    assert index.lookup_name("Physical Review E")['iso4'] == 'Phys. Rev. E'
+    assert index.lookup_name("Physical Review A") is None
+
+def test_issn_completes_local_metadata(tmp_path, index, monkeypatch):
+    """只有ISSN沒有期刊名稱時，索引補全的期刊字段按ISSN的可信度計入置信度，無需調用API"""
+    monkeypatch.setattr(metadata_extractor, "journal_index", index)
+    path = tmp_path / "paper.pdf"
+    path.write_bytes(build_pdf(
+        [["Protein folding at atomic resolution", "ISSN 0028-0836", "© 2021 Springer Nature Limited"]],
+        {'Title': 'Protein folding at atomic resolution', 'Author': 'Jane Lee'}
+    ))
+    content = extract_pdf_content(str(path))
+    assert content['confidence'] == 0.0
+
+    local_metadata, confidence = normalize_local_metadata(content)
+    assert local_metadata['journal_abbr'] == 'Nature' and local_metadata['author_lastname'] == 'Lee'
+    assert confidence == pytest.approx(0.7)
+    assert is_local_metadata_sufficient(local_metadata, confidence)
@@ -0,0 +1,107 @@
+"""
+測試逐頁惰性提取：信息足夠時提前停止、按需讀取後續頁面，以及重試時提示詞包含新頁面
+"""
+import json
+from ai_metadata_extractor import SiliconFlowQwenExtractor
+from benchmarks.corpus import build_pdf
+from metadata_extractor import iter_pdf_pages, has_enough_signal, extract_pdf_content, extract_more_text
+from text_backends import TextDocument
+
+HEADER = ["Sparse Attention for Long Documents", "Jane Doe, John Roe", "Journal of Testing, vol. 1, 2020"]
+
+class CountingDocument(TextDocument):
+    """記錄被解析過的頁面"""
+    page_count = 5
+
+    def __init__(self):
+        self.parsed = []
+
+    def page_text(self, index):
+        self.parsed.append(index)
+        return f"page {index + 1}"
+
+class StopAfter:
+    """第 limit 次檢查起報告超出預算"""
+    def __init__(self, limit):
+        self.checks = 0
+        self.limit = limit
+
+    def exceeded(self):
+        self.checks += 1
+        return "超出預算" if self.checks > self.limit else None
+
+def _write_pdf(tmp_path, pages):
+    path = tmp_path / "paper.pdf"
+    path.write_bytes(build_pdf(pages, {'Title': HEADER[0]}))
+    return str(path)
+
+def test_has_enough_signal():
+    """年份、標題行和作者都出現時才認為信息足夠"""
+    assert has_enough_signal("\n".join(HEADER))
+    assert not has_enough_signal("Sparse Attention for Long Documents\nJournal of Testing, 2020")
+    assert not has_enough_signal("Sparse Attention for Long Documents\nJane Doe, John Roe")
+    assert not has_enough_signal("Jane Doe, 2020")
+
+def test_iter_pdf_pages_is_lazy():
+    """停止迭代後不再解析後續頁面，超出解析預算或頁數上限時停止"""
+    document = CountingDocument()
+    pages = iter_pdf_pages(document, start_page=1)
+    assert next(pages) == (1, "page 2")
+    pages.close()
+    assert document.parsed == [1]
+
+    document = CountingDocument()
+    assert [index for index, _ in iter_pdf_pages(document, max_pages=3)] == [0, 1, 2]
+    document = CountingDocument()
+    assert [index for index, _ in iter_pdf_pages(document, budget=StopAfter(2))] == [0, 1]
+
+def test_early_stop_and_extract_more_text(tmp_path):
+    """首頁信息足夠時只解析第一頁，extract_more_text 從下一頁繼續讀取"""
+    path = _write_pdf(tmp_path, [HEADER] + [[f"Section {i} of the body text"] for i in range(2, 6)])
+
+    text = extract_pdf_content(path)['text']
+    assert "第1頁內容:" in text and "第2頁內容:" not in text
+    full_text = extract_pdf_content(path, early_stop=False)['text']
+    assert "第5頁內容:\nSection 5 of the body text" in full_text
+
+    more_text = extract_more_text(path, text)
+    assert more_text.startswith("第2頁內容:\nSection 2") and "第5頁內容:" in more_text
+    assert "PDF標題" not in more_text
+    assert extract_more_text(path, full_text) == ""
+
+class RecordingClient:
+    """記錄請求並按順序返回預設回應的客戶端"""
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.prompts = []
+
+    def chat_completion(self, payload):
+        self.prompts.append(payload["messages"][0]["content"])
+        return {"choices": [{"message": {"content": json.dumps(self.replies.pop(0))}}]}
+
+def test_retry_prompt_contains_new_pages(monkeypatch):
+    """首次文本已佔滿令牌預算時，重試的提示詞保留首頁頁眉並換入新讀取的頁面"""
+    monkeypatch.setenv("SILICONFLOW_API_KEY", "test")
+    extractor = SiliconFlowQwenExtractor()
+    extractor.prompt_token_budget = 1000
+    extractor.client = RecordingClient([
+        {"title": "Sparse Attention for Long Documents"},
+        {"author_lastname": "Doe", "journal": "Journal of Testing", "year": "2020"},
+    ])
+    text = "第1頁內容:\n" + "\n".join(HEADER) + "\n" + "body " * 2000
+    more_text = "第2頁內容:\nJournal of Testing is edited by the Testing Society\n\n"
+
+    result = extractor.extract_pdf_metadata(text, fetch_more=lambda: more_text)
+    first, retry = extractor.client.prompts
+    assert retry != first
+    assert "Sparse Attention for Long Documents" in retry and "edited by the Testing Society" in retry
+    assert result["author_lastname"] == "Doe" and result["title"] == "Sparse Attention for Long Documents"
+
+def test_retry_skipped_when_prompt_unchanged(monkeypatch):
+    """追加的頁面沒有改變提示詞時不再發送相同的請求"""
+    monkeypatch.setenv("SILICONFLOW_API_KEY", "test")
+    extractor = SiliconFlowQwenExtractor()
+    extractor.client = RecordingClient([{"title": "Short"}])
+    monkeypatch.setattr(extractor, "_build_prompt", lambda text: "same prompt")
+    assert extractor.extract_pdf_metadata("第1頁內容:\nShort", fetch_more=lambda: "第2頁內容:\nmore")["title"] == "Short"
+    assert len(extractor.client.prompts) == 1
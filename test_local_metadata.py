@@ -0,0 +1,59 @@
+"""
+測試不調用語言模型的本地元數據提取（PDF屬性、DOI/arXiv編號）
+"""
+import io
+import logging
+from PyPDF2 import PdfReader, PdfWriter
+from metadata_extractor import extract_local_metadata, is_local_metadata_sufficient
+
+# 設置日誌
+logging.basicConfig(level=logging.INFO, 
+                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def _reader_with_info(info):
+    """創建帶有指定屬性字典的單頁PDF"""
+    writer = PdfWriter()
+    writer.add_blank_page(612, 792)
+    writer.add_metadata(info)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    buffer.seek(0)
+    return PdfReader(buffer)
+
+def test_arxiv_paper_is_complete_without_llm():
+    """PDF屬性加上arXiv編號即可完成命名"""
+    reader = _reader_with_info({
+        "/Title": "Attention Is All You Need",
+        "/Author": "Ashish Vaswani; Noam Shazeer",
+        "/CreationDate": "D:20170612000000Z",
+    })
+    text = "第1頁內容:\narXiv:1706.03762v5 [cs.CL] 6 Dec 2017\nAttention Is All You Need\n"
+    metadata, confidence = extract_local_metadata(reader, text)
+    
+    assert metadata["author_lastname"] == "Vaswani"
+    assert metadata["title"] == "Attention Is All You Need"
+    assert metadata["year"] == "2017"
+    assert metadata["journal_abbr"] == "arXiv"
+    assert metadata["arxiv_id"] == "1706.03762"
+    assert is_local_metadata_sufficient(metadata, confidence)
+
+def test_junk_title_and_missing_venue_need_llm():
+    """無效標題會被忽略；缺少期刊縮寫時仍需調用語言模型"""
+    reader = _reader_with_info({
+        "/Title": "Microsoft Word - draft_v3.docx",
+        "/Author": "Smith, John",
+    })
+    text = "第1頁內容:\nhttps://doi.org/10.1038/s41586-020-2649-2.\n© 2020 Springer Nature\n"
+    metadata, confidence = extract_local_metadata(reader, text)
+    
+    assert "title" not in metadata
+    assert metadata["author_lastname"] == "Smith"
+    assert metadata["doi"] == "10.1038/s41586-020-2649-2"
+    assert metadata["year"] == "2020"
+    assert confidence == 0
+    assert not is_local_metadata_sufficient(metadata, confidence)
+
+if __name__ == "__main__":
+    import pytest
+    pytest.main([__file__, "-v"])
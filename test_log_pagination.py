@@ -0,0 +1,106 @@
+"""
+測試處理日誌的過濾與鍵集分頁
+"""
+from datetime import datetime, timedelta
+import pytest
+from flask import Flask
+from models import db, ProcessedFile
+
+def _create_app(count=25):
+    """創建使用內存數據庫的應用並寫入測試日誌"""
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    db.init_app(app)
+    start = datetime(2024, 1, 1)
+    with app.app_context():
+        db.create_all()
+        for i in range(count):
+            db.session.add(ProcessedFile(
+                original_path=f"/papers/{i}.pdf",
+                status='error' if i % 5 == 0 else 'success',
+                author='Zhang' if i % 2 else 'Smith',
+                journal='Nature' if i % 3 == 0 else 'Science',
+                year='2023' if i < 10 else '2024',
+                title=f"Paper {i}",
+                processing_time=float(i % 4),
+                # 每兩條共用一個時間戳，驗證同值時按id打破平局
+                timestamp=start + timedelta(minutes=i // 2)
+            ))
+        db.session.commit()
+    return app
+
+def _collect(query, **kwargs):
+    """逐頁讀取全部結果"""
+    ids, cursor = [], None
+    while True:
+        rows, cursor = ProcessedFile.keyset_page(query, cursor=cursor, limit=7, **kwargs)
+        ids.extend(row.id for row in rows)
+        if not cursor:
+            return ids
+
+def test_pages_cover_all_rows_in_order():
+    """分頁結果不重不漏，順序與一次性排序一致"""
+    app = _create_app()
+    with app.app_context():
+        expected = [row.id for row in ProcessedFile.query.order_by(
+            ProcessedFile.timestamp.desc(), ProcessedFile.id.desc())]
+        assert _collect(ProcessedFile.search()) == expected
+        
+        ascending = _collect(ProcessedFile.search(), sort='processing_time', descending=False)
+        assert sorted(ascending) == sorted(expected)
+        times = [db.session.get(ProcessedFile, i).processing_time for i in ascending]
+        assert times == sorted(times)
+
+def test_filters():
+    """狀態、年份、期刊和標題/作者搜索可以組合"""
+    app = _create_app()
+    with app.app_context():
+        assert ProcessedFile.search(status='error').count() == 5
+        assert ProcessedFile.search(year='2024', journal='nat').count() == 5
+        assert ProcessedFile.search(text='zhang').count() == 12
+        assert ProcessedFile.search(text='Paper 1', status='success').count() == 9
+
+def test_search_escapes_like_wildcards():
+    """搜索詞中的 % 和 _ 按字面匹配"""
+    app = _create_app(0)
+    with app.app_context():
+        for title in ("100% recall", "1000 recall", "snake_case names", "snakeXcase names"):
+            db.session.add(ProcessedFile(original_path=f"/papers/{title}.pdf", status='success', title=title))
+        db.session.commit()
+        assert [row.title for row in ProcessedFile.search(text='0% r')] == ["100% recall"]
+        assert [row.title for row in ProcessedFile.search(text='e_c')] == ["snake_case names"]
+
+def test_null_timestamps_are_paginated():
+    """時間戳為空的舊日誌排在最後（升序時最前），游標落在這些行上時仍可繼續翻頁"""
+    app = _create_app(10)
+    with app.app_context():
+        for i in range(10):
+            db.session.add(ProcessedFile(original_path=f"/old/{i}.pdf", status='success'))
+        db.session.commit()
+        # 列的默認值會在插入時填入時間戳，直接清空以模擬舊數據
+        ProcessedFile.query.filter(ProcessedFile.original_path.like('/old/%')).update({'timestamp': None})
+        db.session.commit()
+        expected = [row.id for row in ProcessedFile.query.order_by(
+            ProcessedFile.timestamp.desc().nulls_last(), ProcessedFile.id.desc())]
+        assert _collect(ProcessedFile.search()) == expected
+        assert _collect(ProcessedFile.search(), descending=False) == expected[::-1]
+
+def test_log_entry_author():
+    """流水線輸出的 author_lastname 寫入作者欄，可以按作者搜索"""
+    app = _create_app(0)
+    with app.app_context():
+        db.session.add(ProcessedFile.from_log_entry({
+            'original_path': '/papers/a.pdf', 'new_path': '/papers/Lee_2022_Nature.pdf', 'status': 'success',
+            'metadata': {'author_lastname': 'Lee', 'journal': 'Nature', 'year': '2022', 'title': 'Protein folding'},
+            'timestamp': '2024-01-01 00:00:00'
+        }))
+        db.session.commit()
+        [row] = ProcessedFile.search(text='lee').all()
+        assert row.to_dict()['metadata']['author'] == 'Lee'
+
+def test_invalid_cursor():
+    """格式錯誤的游標拋出ValueError"""
+    app = _create_app(1)
+    with app.app_context():
+        with pytest.raises(ValueError):
+            ProcessedFile.keyset_page(ProcessedFile.search(), cursor='not-a-cursor')
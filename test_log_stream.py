@@ -0,0 +1,38 @@
+"""
+測試SSE日誌推送
+"""
+import json
+from log_stream import LogBroadcaster, format_event
+
+def _parse(message):
+    """解析一條SSE消息為 (事件類型, 數據)"""
+    fields = dict(line.split(": ", 1) for line in message.strip().split("\n"))
+    return fields["event"], json.loads(fields["data"])
+
+def test_subscriber_receives_events_in_order():
+    """訂閱後先收到初始狀態，再按順序收到發布的事件"""
+    broadcaster = LogBroadcaster()
+    stream = broadcaster.stream(lambda: [format_event('progress', {'done': 0})], heartbeat=0.05)
+    assert next(stream).startswith("retry:")
+    assert _parse(next(stream)) == ('progress', {'done': 0})
+
+    broadcaster.publish('log', {'id': 1})
+    broadcaster.publish('log', {'id': 2})
+    assert _parse(next(stream)) == ('log', {'id': 1})
+    assert _parse(next(stream)) == ('log', {'id': 2})
+    assert next(stream).startswith(": keep-alive")
+
+    stream.close()
+    assert broadcaster.subscriber_count() == 0
+
+def test_slow_subscriber_is_reset():
+    """隊列寫滿的連接在取完緩衝事件後收到reset並斷開"""
+    broadcaster = LogBroadcaster(max_queue=2)
+    stream = broadcaster.stream(heartbeat=0.05)
+    next(stream)
+    for i in range(5):
+        broadcaster.publish('log', {'id': i})
+
+    events = [_parse(message) for message in stream]
+    assert events == [('log', {'id': 0}), ('log', {'id': 1}), ('reset', {})]
+    assert broadcaster.subscriber_count() == 0
@@ -0,0 +1,72 @@
+"""
+測試處理日誌的寫後批量持久化
+"""
+import time
+from flask import Flask
+from models import db, ProcessedFile
+from log_writer import LogWriter
+
+def _create_writer(monkeypatch, batch_size, interval_ms):
+    """創建使用內存數據庫的寫入器"""
+    monkeypatch.setenv("LOG_FLUSH_BATCH", str(batch_size))
+    monkeypatch.setenv("LOG_FLUSH_INTERVAL_MS", str(interval_ms))
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    flushed = []
+    writer = LogWriter(app, on_flush=flushed.append)
+    return app, writer, flushed
+
+def _entry(i):
+    return {'status': 'success', 'original_path': f'/papers/{i}.pdf', 'metadata': {'title': f'Paper {i}'}}
+
+def _row_count(app):
+    with app.app_context():
+        return ProcessedFile.query.count()
+
+def test_full_batch_is_written_in_one_flush(monkeypatch):
+    """湊滿一批時立即整批寫入，並回調帶id的條目"""
+    app, writer, flushed = _create_writer(monkeypatch, batch_size=3, interval_ms=60000)
+    try:
+        for i in range(3):
+            writer.add(_entry(i))
+        deadline = time.time() + 5
+        while not flushed and time.time() < deadline:
+            time.sleep(0.02)
+        assert [len(batch) for batch in flushed] == [3]
+        assert all(entry['id'] for entry in flushed[0])
+        assert _row_count(app) == 3
+    finally:
+        writer.close()
+
+def test_partial_batch_written_on_close(monkeypatch):
+    """未湊滿的緩衝在關閉時寫入"""
+    app, writer, flushed = _create_writer(monkeypatch, batch_size=100, interval_ms=60000)
+    writer.add(_entry(1))
+    writer.add(_entry(2))
+    assert _row_count(app) == 0
+    writer.close()
+    assert _row_count(app) == 2
+    assert writer.pending_count() == 0
+
+def test_poison_row_does_not_block_others(monkeypatch):
+    """整批寫入失敗時逐條寫入，無法寫入的條目重試幾次後丟棄"""
+    monkeypatch.setenv("LOG_FLUSH_MAX_ATTEMPTS", "2")
+    app, writer, flushed = _create_writer(monkeypatch, batch_size=100, interval_ms=60000)
+    try:
+        poison = dict(_entry(1), status=None)  # 違反 NOT NULL 約束
+        for entry in (_entry(0), poison, _entry(2)):
+            writer.add(entry)
+        assert writer.flush() == 2
+        assert _row_count(app) == 2 and writer.pending_count() == 1
+
+        writer.add(_entry(3))
+        assert writer.flush() == 1
+        assert writer.pending_count() == 0
+        assert [entry['original_path'] for batch in flushed for entry in batch] == [
+            '/papers/0.pdf', '/papers/2.pdf', '/papers/3.pdf'
+        ]
+    finally:
+        writer.close()
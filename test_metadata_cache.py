@@ -0,0 +1,120 @@
+"""
+測試基於內容哈希的元數據緩存
+"""
+import os
+import logging
+from flask import Flask
+from models import db
+from metadata_cache import MetadataCache
+
+# 設置日誌
+logging.basicConfig(level=logging.INFO, 
+                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SAMPLE_METADATA = {
+    'author_lastname': 'Zhang',
+    'journal': 'IEEE Transactions on Information Technology',
+    'journal_abbr': 'IEEE Trans. Inf. Technol.',
+    'year': '2024',
+    'title': 'Enhanced Metadata Extraction',
+    'doc_type': 'paper'
+}
+
+def _create_cache(max_entries=None):
+    """創建使用內存數據庫的緩存實例"""
+    if max_entries is not None:
+        os.environ["METADATA_CACHE_MAX_ENTRIES"] = str(max_entries)
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    cache = MetadataCache(app)
+    os.environ.pop("METADATA_CACHE_MAX_ENTRIES", None)
+    return cache
+
+def test_cache_hit_after_rename(tmp_path):
+    """重命名後的文件仍然通過內容哈希命中緩存"""
+    cache = _create_cache()
+    pdf_path = tmp_path / "paper.pdf"
+    pdf_path.write_bytes(b"%PDF-1.4 sample content")
+    
+    assert cache.lookup(str(pdf_path), extractor="qwen") is None
+    cache.store(str(pdf_path), SAMPLE_METADATA, extractor="qwen")
+    assert cache.lookup(str(pdf_path), extractor="qwen") == SAMPLE_METADATA
+    
+    # 換用其他模型時視為未命中
+    assert cache.lookup(str(pdf_path), extractor="other-model") is None
+    
+    renamed_path = tmp_path / "Zhang_2024.pdf"
+    os.rename(pdf_path, renamed_path)
+    assert cache.lookup(str(renamed_path), extractor="qwen") == SAMPLE_METADATA
+
+def test_cache_invalidation(tmp_path):
+    """invalidate 和 clear 會刪除緩存條目"""
+    cache = _create_cache()
+    paths = []
+    for i in range(3):
+        pdf_path = tmp_path / f"paper_{i}.pdf"
+        pdf_path.write_bytes(f"%PDF-1.4 content {i}".encode())
+        cache.store(str(pdf_path), SAMPLE_METADATA, extractor="qwen")
+        paths.append(str(pdf_path))
+    
+    assert cache.invalidate(paths[0]) == 1
+    assert cache.lookup(paths[0], extractor="qwen") is None
+    assert cache.clear() == 2
+    assert cache.lookup(paths[1], extractor="qwen") is None
+
+def test_cache_eviction(tmp_path):
+    """條目數超出上限時立即淘汰最久未使用的條目"""
+    cache = _create_cache(max_entries=2)
+    assert cache.max_entries == 2
+    paths = []
+    for i in range(3):
+        pdf_path = tmp_path / f"paper_{i}.pdf"
+        pdf_path.write_bytes(f"%PDF-1.4 content {i}".encode())
+        paths.append(str(pdf_path))
+    
+    cache.store(paths[0], SAMPLE_METADATA, extractor="qwen")
+    cache.store(paths[1], SAMPLE_METADATA, extractor="qwen")
+    # 使用過的條目不會被淘汰，更新已有條目不計入新增
+    assert cache.lookup(paths[0], extractor="qwen") == SAMPLE_METADATA
+    cache.store(paths[0], SAMPLE_METADATA, extractor="qwen")
+    cache.store(paths[2], SAMPLE_METADATA, extractor="qwen")
+    
+    assert cache.lookup(paths[1], extractor="qwen") is None
+    assert cache.lookup(paths[0], extractor="qwen") == SAMPLE_METADATA
+    assert cache.lookup(paths[2], extractor="qwen") == SAMPLE_METADATA
+
+if __name__ == "__main__":
+    import pytest
+    pytest.main([__file__, "-v"])
+
+def test_header_only_files_use_sampled_hash(tmp_path, monkeypatch):
+    """只讀取頭部信息的大文件按頭、中、尾樣本計算哈希，樣本之外的字節不影響哈希"""
+    import hashlib
+    import pdf_reader
+    import metadata_cache
+    from metadata_cache import compute_file_hash
+    monkeypatch.setattr(pdf_reader, "PDF_HEADER_ONLY_MB", 0.1)
+    monkeypatch.setattr(metadata_cache, "HASH_SAMPLE_MB", 0.01)
+    data = bytearray(os.urandom(200 * 1024))
+    path = tmp_path / "large.pdf"
+    path.write_bytes(bytes(data))
+    sampled = compute_file_hash(str(path))
+    assert sampled != hashlib.sha256(bytes(data)).hexdigest()
+
+    # 修改樣本之外的字節（大小不變）不改變哈希，修改尾部則改變
+    data[20 * 1024] ^= 0xFF
+    other = tmp_path / "other.pdf"
+    other.write_bytes(bytes(data))
+    assert compute_file_hash(str(other)) == sampled
+    data[-1] ^= 0xFF
+    other.write_bytes(bytes(data))
+    os.utime(other, (1, 1))
+    assert compute_file_hash(str(other)) != sampled
+
+    small = tmp_path / "small.pdf"
+    small.write_bytes(b"%PDF small")
+    assert compute_file_hash(str(small)) == hashlib.sha256(b"%PDF small").hexdigest()
@@ -0,0 +1,71 @@
+"""
+測試指標註冊表、分階段計時和舊數據庫的列遷移
+"""
+import sqlite3
+from flask import Flask
+from metrics import MetricsRegistry, collect_timings, stage, merge_timings
+from models import db, ProcessedFile, ensure_columns
+
+def test_histogram_renders_cumulative_buckets():
+    """直方圖輸出累積桶、總和與次數"""
+    registry = MetricsRegistry()
+    histogram = registry.histogram('test_seconds', '測試', ['stage'], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, stage='api')
+    text = registry.render()
+    assert 'test_seconds_bucket{stage="api",le="0.1"} 1.0' in text
+    assert 'test_seconds_bucket{stage="api",le="1.0"} 2.0' in text
+    assert 'test_seconds_bucket{stage="api",le="+Inf"} 3.0' in text
+    assert 'test_seconds_count{stage="api"} 3.0' in text
+
+def test_counter_and_callback_gauge():
+    """計數器按標籤累加，回調式儀表在採集時取值"""
+    registry = MetricsRegistry()
+    counter = registry.counter('test_requests_total', '測試', ['status'])
+    counter.inc(status=200)
+    counter.inc(2, status=200)
+    registry.gauge('test_depth', '測試', ['status'], function=lambda: {'queued': 4})
+    text = registry.render()
+    assert '# TYPE test_requests_total counter' in text
+    assert 'test_requests_total{status="200"} 3.0' in text
+    assert 'test_depth{status="queued"} 4.0' in text
+    assert registry.counter('test_requests_total', '測試', ['status']) is counter
+
+def test_nested_timings_merge_into_outer():
+    """內層收集的耗時併入外層，不在收集範圍內時 stage() 不記錄"""
+    with stage('ignored'):
+        pass
+    with collect_timings() as outer:
+        with stage('api_wait'):
+            pass
+        with collect_timings() as inner:
+            with stage('text_extract'):
+                pass
+        assert set(inner) == {'text_extract'}
+    assert set(outer) == {'api_wait', 'text_extract'}
+    assert merge_timings({'a': 1.0}, {'a': 0.5, 'b': 1.0}) == {'a': 1.5, 'b': 1.0}
+
+def test_ensure_columns_adds_stage_timings(tmp_path):
+    """舊數據庫缺少 stage_timings 列時自動添加"""
+    path = tmp_path / "old.db"
+    connection = sqlite3.connect(path)
+    connection.execute(
+        "CREATE TABLE processed_files (id INTEGER PRIMARY KEY, original_path VARCHAR(255) NOT NULL, "
+        "new_path VARCHAR(255), status VARCHAR(20) NOT NULL, author VARCHAR(100), journal VARCHAR(100), "
+        "year VARCHAR(10), title TEXT, error_message TEXT, processing_time FLOAT, timestamp DATETIME)"
+    )
+    connection.commit()
+    connection.close()
+    
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{path}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        ensure_columns()
+        row = ProcessedFile.from_log_entry({
+            'original_path': '/a.pdf', 'status': 'success', 'stage_timings': {'api_wait': 0.5}
+        })
+        db.session.add(row)
+        db.session.commit()
+        assert ProcessedFile.query.one().to_dict()['stage_timings'] == {'api_wait': 0.5}
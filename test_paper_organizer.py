@@ -0,0 +1,50 @@
+"""
+測試命令行批處理模式
+"""
+import json
+from PyPDF2 import PdfWriter
+import paper_organizer
+
+def _write_blank_pdf(path):
+    writer = PdfWriter()
+    writer.add_blank_page(200, 200)
+    with open(path, "wb") as f:
+        writer.write(f)
+
+def test_dry_run_streams_plans_without_renaming(tmp_path, monkeypatch):
+    """試運行為每個文件輸出一行計劃，不修改文件，重名的計劃帶序號"""
+    monkeypatch.delenv("SILICONFLOW_API_KEY", raising=False)
+    (tmp_path / "sub").mkdir()
+    paths = [tmp_path / "a.pdf", tmp_path / "b.pdf", tmp_path / "sub" / "c.pdf"]
+    for path in paths:
+        _write_blank_pdf(path)
+    output = tmp_path / "results.jsonl"
+
+    exit_code = paper_organizer.main([
+        "scan", str(tmp_path), "--dry-run", "--output", str(output), "--workers", "1"
+    ])
+
+    assert exit_code == 0
+    results = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+    assert sorted(result["original_path"] for result in results) == sorted(map(str, paths))
+    assert all(result["dry_run"] for result in results)
+    planned = [result["new_path"] for result in results]
+    assert len(set(planned)) == len(planned)
+    assert all(path.exists() for path in paths)
+
+def test_missing_directory(tmp_path):
+    """目錄不存在時返回參數錯誤"""
+    assert paper_organizer.main(["scan", str(tmp_path / "missing")]) == 2
+
+def test_scan_does_not_load_database():
+    """命令行批處理用到的模塊不導入 Flask 和 SQLAlchemy"""
+    import os
+    import subprocess
+    import sys
+    code = (
+        "import sys, paper_organizer, batch_processor, pdf_processor, rename_journal;"
+        "print(sorted(name for name in ('flask', 'sqlalchemy') if name in sys.modules))"
+    )
+    completed = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert completed.stdout.strip() == "[]"
@@ -0,0 +1,60 @@
+"""
+測試內存映射讀取、解析預算和大文件的頭部快速路徑
+"""
+import time
+import pdf_reader
+import metadata_extractor
+from benchmarks.corpus import build_pdf
+from pdf_reader import ParseBudget, open_pdf, page_content_size
+from text_backends import PyPDF2Backend
+
+PAGES = [
+    ["Sparse Attention for Long Documents", "Jane Doe, John Roe", "Journal of Testing, vol. 1, 2020"],
+    ["Introduction and related work on attention"],
+    ["Experiments on long document benchmarks"],
+]
+
+def _write_pdf(tmp_path, padding=0):
+    path = tmp_path / "paper.pdf"
+    path.write_bytes(build_pdf(PAGES, {'Title': 'Sparse Attention for Long Documents'}, padding))
+    return str(path)
+
+def test_open_pdf_with_mmap(tmp_path, monkeypatch):
+    """內存映射和普通讀取得到相同的頁面文本"""
+    path = _write_pdf(tmp_path)
+    with open_pdf(path) as reader:
+        mapped = [page.extract_text() for page in reader.pages]
+        assert page_content_size(reader, reader.pages[0]) > 0
+    monkeypatch.setattr(pdf_reader, "PDF_USE_MMAP", False)
+    with open_pdf(path) as reader:
+        assert [page.extract_text() for page in reader.pages] == mapped
+
+def test_budget_stops_parsing(tmp_path):
+    """超出時間預算後不再解析後續頁面"""
+    path = _write_pdf(tmp_path)
+    budget = ParseBudget(seconds=0.01, memory_mb=0)
+    assert budget.exceeded() is None
+    time.sleep(0.02)
+    assert "秒" in budget.exceeded()
+    with open_pdf(path) as reader, PyPDF2Backend().open(path, reader) as document:
+        assert list(metadata_extractor.iter_pdf_pages(document, budget=budget)) == []
+
+def test_oversized_pages_are_skipped(tmp_path, monkeypatch):
+    """內容流超出上限的頁面不解碼"""
+    path = _write_pdf(tmp_path)
+    monkeypatch.setattr(pdf_reader, "PDF_MAX_PAGE_CONTENT_MB", 1e-6)
+    with open_pdf(path) as reader, PyPDF2Backend().open(path, reader) as document:
+        assert [text for _, text in metadata_extractor.iter_pdf_pages(document)] == ["", "", ""]
+
+def test_header_only_fast_path(tmp_path, monkeypatch):
+    """超過大小上限的文件只讀取PDF屬性和第一頁"""
+    path = _write_pdf(tmp_path, padding=64 * 1024)
+    full = metadata_extractor.extract_pdf_content(path, early_stop=False)
+    assert not full['header_only'] and "第3頁內容" in full['text']
+
+    monkeypatch.setattr(pdf_reader, "PDF_HEADER_ONLY_MB", 0.01)
+    header = metadata_extractor.extract_pdf_content(path, early_stop=False)
+    assert header['header_only']
+    assert "PDF標題: Sparse Attention for Long Documents" in header['text']
+    assert "第1頁內容" in header['text'] and "第2頁內容" not in header['text']
+    assert metadata_extractor.extract_more_text(path, header['text']) == ""
@@ -0,0 +1,48 @@
+"""
+測試最近日誌環形緩衝
+"""
+import threading
+from recent_logs import RecentLogStore
+
+def test_since_returns_newer_entries_in_order():
+    """since(N) 按序號升序返回N之後的條目"""
+    store = RecentLogStore(maxlen=10)
+    for i in range(5):
+        store.append({'id': i})
+    entries, truncated = store.since(2)
+    assert [entry['seq'] for entry in entries] == [3, 4, 5]
+    assert not truncated
+    assert store.since(5) == ([], False)
+    assert [entry['seq'] for entry in store.since(0, limit=2)[0]] == [1, 2]
+
+def test_memory_is_bounded():
+    """超出容量時丟棄最舊條目，並標記缺失"""
+    store = RecentLogStore(maxlen=3)
+    for i in range(10):
+        store.append({'id': i})
+    assert len(store) == 3
+    entries, truncated = store.since(5)
+    assert [entry['seq'] for entry in entries] == [8, 9, 10]
+    assert truncated
+    assert not store.since(7)[1]
+
+def test_concurrent_appends_get_unique_sequence_numbers():
+    """多線程追加時序號唯一且連續"""
+    store = RecentLogStore(maxlen=10000)
+    threads = [threading.Thread(target=lambda: [store.append({}) for _ in range(500)]) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    entries, _ = store.since(0)
+    assert [entry['seq'] for entry in entries] == list(range(1, 4001))
+
+def test_sequence_ahead_of_buffer_is_a_gap():
+    """客戶端序號大於最新序號（服務已重啟）時返回全部條目並標記缺失"""
+    store = RecentLogStore(maxlen=10)
+    assert store.since(42) == ([], True)
+    for i in range(3):
+        store.append({'id': i})
+    entries, truncated = store.since(42)
+    assert [entry['seq'] for entry in entries] == [1, 2, 3]
+    assert truncated
@@ -0,0 +1,156 @@
+"""
+測試重命名規劃、預寫日誌的崩潰恢復以及整批撤銷和重新執行
+"""
+import os
+import pytest
+import pdf_processor
+from rename_journal import RenameJournal, RenamePlanner
+
+METADATA = {
+    'author_lastname': 'Lee', 'journal': 'Nature', 'journal_abbr': 'Nature',
+    'year': '2022', 'title': 'Protein folding', 'doc_type': 'paper'
+}
+TARGET = "Lee_2022_Nature_Protein_folding.pdf"
+
+def _touch(path, content=b"%PDF-1.4\n"):
+    path.write_bytes(content)
+    return str(path)
+
+def _planner(journal_path):
+    """創建使用指定日誌文件的規劃器（相當於一次新的進程啟動）"""
+    journal = RenameJournal()
+    journal.open(str(journal_path))
+    return RenamePlanner(journal)
+
+def _papers(tmp_path, *names):
+    directory = tmp_path / "papers"
+    directory.mkdir(exist_ok=True)
+    return directory, [_touch(directory / name) for name in names]
+
+def test_allocates_unique_names_without_overwriting(tmp_path):
+    """重名時按目錄緩存加序號，試運行只預留文件名，緩存之後其他程序創建的文件不會被覆蓋"""
+    planner = _planner(tmp_path / "journal.jsonl")
+    papers, (_, _, a, b, c) = _papers(tmp_path, TARGET, "Lee_2022_Nature_Protein_folding_1.pdf", "a.pdf", "b.pdf", "c.pdf")
+    target = str(papers / TARGET)
+
+    assert planner.rename(a, target) == (str(papers / "Lee_2022_Nature_Protein_folding_2.pdf"), None)
+    reserved = set()
+    planned, _ = planner.rename(b, target, dry_run=True, reserved=reserved)
+    assert planned == str(papers / "Lee_2022_Nature_Protein_folding_3.pdf") and os.path.exists(b)
+
+    _touch(papers / "Lee_2022_Nature_Protein_folding_3.pdf", b"other")
+    new_path, _ = planner.rename(c, target)
+    assert new_path == str(papers / "Lee_2022_Nature_Protein_folding_4.pdf")
+    assert (papers / "Lee_2022_Nature_Protein_folding_3.pdf").read_bytes() == b"other"
+
+    # 只有大小寫不同時重命名源文件本身，不加序號
+    lower = _touch(tmp_path / TARGET.lower())
+    assert planner.rename(lower, str(tmp_path / TARGET))[0] == str(tmp_path / TARGET)
+
+def test_recover_rolls_back_uncommitted_renames(tmp_path, monkeypatch):
+    """進程中斷後，已記錄的重命名保留，結果未被記錄的重命名回滾到原文件名"""
+    journal_path = tmp_path / "journal.jsonl"
+    planner = _planner(journal_path)
+    monkeypatch.setattr(pdf_processor, "rename_planner", planner)
+    papers, (first, second) = _papers(tmp_path, "first.pdf", "second.pdf")
+
+    assert "journal_entry" not in pdf_processor.rename_pdf_file(first, dict(METADATA), dry_run=True)
+    batch = planner.journal.begin_batch()
+    committed = pdf_processor.rename_pdf_file(first, dict(METADATA), journal_batch=batch)
+    planner.journal.commit(committed)
+    crashed = pdf_processor.rename_pdf_file(second, dict(METADATA), journal_batch=batch)
+    assert crashed['journal_entry'] == {'batch': batch, 'seq': 2}
+    assert not os.path.exists(second)
+
+    # 模擬崩潰後重新啟動：批次沒有結束，新進程中也不存在
+    recovered = _planner(journal_path)
+    assert recovered.recover() == 1
+    assert os.path.exists(second) and not os.path.exists(crashed['new_path'])
+    assert os.path.exists(committed['new_path'])
+    [summary] = recovered.journal.batches()
+    assert summary['counts'] == {'committed': 1, 'undone': 1} and not summary['live']
+    assert recovered.recover() == 0
+
+def test_undo_and_replay_whole_batch(tmp_path):
+    """整批撤銷按相反順序移回原文件名，重新執行恢復新文件名，運行中的批次不能撤銷"""
+    planner = _planner(tmp_path / "journal.jsonl")
+    papers, paths = _papers(tmp_path, "a.pdf", "b.pdf")
+    batch = planner.journal.begin_batch()
+    renamed = []
+    for path in paths:
+        new_path, entry = planner.rename(path, str(papers / TARGET), batch=batch)
+        planner.journal.record('commit', entry)
+        renamed.append(new_path)
+    with pytest.raises(RuntimeError):
+        planner.undo(batch)
+    planner.journal.end_batch(batch)
+
+    assert planner.undo(batch) == {'batch': batch, 'reverted': 2, 'skipped': 0}
+    assert all(os.path.exists(path) for path in paths)
+    assert not any(os.path.exists(path) for path in renamed)
+
+    assert planner.replay(batch) == {'batch': batch, 'renamed': 2, 'skipped': 0}
+    assert all(os.path.exists(path) for path in renamed)
+    assert planner.journal.batches()[0]['counts'] == {'committed': 2}
+    with pytest.raises(KeyError):
+        planner.undo("missing")
+
+def test_file_created_without_mtime_change_is_not_overwritten(tmp_path):
+    """緩存之後出現的同名文件即使目錄修改時間未變（精度不足），重命名前的 lexists 檢查也會發現並重新分配"""
+    planner = _planner(tmp_path / "journal.jsonl")
+    papers, (source,) = _papers(tmp_path, "a.pdf")
+    planner.listing.names(str(papers))
+    mtime = os.stat(papers).st_mtime_ns
+    _touch(papers / TARGET, b"other")
+    os.utime(papers, ns=(mtime, mtime))
+
+    new_path, _ = planner.rename(source, str(papers / TARGET))
+    assert new_path == str(papers / "Lee_2022_Nature_Protein_folding_1.pdf")
+    assert (papers / TARGET).read_bytes() == b"other"
+
+def test_rotation_by_another_process(tmp_path, monkeypatch):
+    """其他進程輪換日誌後，本進程按路徑重新打開，之後的記錄寫入新文件"""
+    journal_path = tmp_path / "journal.jsonl"
+    monkeypatch.setenv("RENAME_JOURNAL_MAX_MB", "0.0001")
+    writer = _planner(journal_path)
+    papers, (first, second) = _papers(tmp_path, "first.pdf", "second.pdf")
+    batch = writer.journal.begin_batch()
+    writer.journal.record('commit', writer.rename(first, str(papers / TARGET), batch=batch)[1])
+    writer.journal.end_batch(batch)
+
+    rotator = _planner(journal_path)
+    assert rotator.journal.rotate_if_needed()
+    assert os.path.exists(str(journal_path) + ".1")
+
+    batch = writer.journal.begin_batch()
+    _, entry = writer.rename(second, str(papers / "second_renamed.pdf"), batch=batch)
+    writer.journal.record('commit', entry)
+    assert list(rotator.journal.read()) == [batch]
+
+def test_log_writer_commits_after_saving(tmp_path, monkeypatch):
+    """網頁服務中重命名在處理日誌寫入數據庫之後才提交，寫入之前崩潰的重命名在啟動時回滾"""
+    import log_writer
+    from flask import Flask
+    from models import db
+    planner = _planner(tmp_path / "journal.jsonl")
+    monkeypatch.setattr(log_writer, "rename_journal", planner.journal)
+    monkeypatch.setattr(pdf_processor, "rename_planner", planner)
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    writer = log_writer.LogWriter(app)
+    try:
+        _, (path,) = _papers(tmp_path, "paper.pdf")
+        batch = planner.journal.begin_batch()
+        result = pdf_processor.rename_pdf_file(path, dict(METADATA), journal_batch=batch)
+        writer.add(result)
+        [info] = planner.journal.read().values()
+        assert info['entries'][1]['state'] == 'planned'
+
+        assert writer.flush() == 1
+        [info] = planner.journal.read().values()
+        assert info['entries'][1]['state'] == 'committed'
+    finally:
+        writer.close()
@@ -0,0 +1,112 @@
+"""
+使用本地模擬服務器測試SiliconFlow客戶端的重試、限流和異步模式
+"""
+import gc
+import json
+import asyncio
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from siliconflow_client import (
+    SiliconFlowClient, AsyncSiliconFlowClient, SiliconFlowAPIError, RateLimiter, TokenBucket
+)
+
+# 設置日誌
+logging.basicConfig(level=logging.INFO, 
+                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SAMPLE_RESPONSE = {
+    "choices": [{"message": {"content": '{"author_lastname": "Zhang", "year": "2024"}'}}],
+    "usage": {"prompt_tokens": 10, "completion_tokens": 5}
+}
+
+class StubHandler(BaseHTTPRequestHandler):
+    """按預設的狀態碼序列返回響應，序列用完後一直返回200"""
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+            status = server.statuses.pop(0) if server.statuses else 200
+        body = json.dumps(SAMPLE_RESPONSE if status == 200 else {"error": "busy"}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 429:
+            self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def stub_server():
+    """啟動本地模擬服務器"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.lock = threading.Lock()
+    server.statuses = []
+    server.request_count = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+    yield server
+    server.shutdown()
+
+PAYLOAD = {"model": "test", "messages": [{"role": "user", "content": "hello"}], "max_tokens": 10}
+
+def test_sync_client_retries_on_429_and_5xx(stub_server):
+    """同步客戶端遇到429和5xx時重試"""
+    stub_server.statuses = [429, 503]
+    client = SiliconFlowClient("key", stub_server.url, max_retries=3, rate_limiter=RateLimiter())
+    assert client.chat_completion(PAYLOAD) == SAMPLE_RESPONSE
+    assert stub_server.request_count == 3
+
+def test_sync_client_gives_up(stub_server):
+    """重試次數用盡或遇到不可重試的錯誤時拋出異常"""
+    stub_server.statuses = [500, 500]
+    client = SiliconFlowClient("key", stub_server.url, max_retries=1, rate_limiter=RateLimiter())
+    with pytest.raises(SiliconFlowAPIError):
+        client.chat_completion(PAYLOAD)
+    
+    stub_server.statuses = [401]
+    with pytest.raises(SiliconFlowAPIError) as error:
+        client.chat_completion(PAYLOAD)
+    assert error.value.status_code == 401
+
+def test_async_client(stub_server):
+    """異步客戶端支持 await 和同步線程調用"""
+    pytest.importorskip("httpx")
+    stub_server.statuses = [429]
+    client = AsyncSiliconFlowClient("key", stub_server.url, max_retries=2, rate_limiter=RateLimiter())
+    
+    async def run_concurrently():
+        return await asyncio.gather(*(client.chat_completion_async(PAYLOAD) for _ in range(5)))
+    
+    assert asyncio.run(run_concurrently()) == [SAMPLE_RESPONSE] * 5
+    assert client.chat_completion(PAYLOAD) == SAMPLE_RESPONSE
+    
+    # 每次 asyncio.run() 使用新的事件循環，結束後不保留其連接池
+    async def run_and_close():
+        response = await client.chat_completion_async(PAYLOAD)
+        await client.aclose()
+        return response
+    
+    for _ in range(3):
+        assert asyncio.run(client.chat_completion_async(PAYLOAD)) == SAMPLE_RESPONSE
+    assert asyncio.run(run_and_close()) == SAMPLE_RESPONSE
+    gc.collect()
+    assert list(client._clients.keys()) == [client._loop]
+    client.close()
+
+def test_token_bucket():
+    """令牌桶在額度用盡後返回需要等待的時間"""
+    bucket = TokenBucket(per_minute=60)
+    assert bucket.reserve(60) == 0
+    assert bucket.reserve(1) == pytest.approx(1.0, abs=0.05)
+    assert TokenBucket(per_minute=0).reserve(1000) == 0
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,112 @@
+"""
+測試文本引擎的選擇和出錯或提取不到文本時的回退
+"""
+import contextlib
+import pytest
+import metadata_extractor
+import text_backends
+from benchmarks.corpus import build_pdf
+from text_backends import TextBackend, TextDocument, get_text_backends, reset_text_backends
+
+PAGES = [
+    ["Sparse Attention for Long Documents", "Jane Doe, John Roe", "Journal of Testing, vol. 1, 2020"],
+    ["Introduction and related work on attention"],
+]
+
+class _BlankDocument(TextDocument):
+    page_count = len(PAGES)
+
+    def page_text(self, index):
+        return "  \n"
+
+class BrokenBackend(TextBackend):
+    name = 'broken'
+
+    def open(self, pdf_path, reader):
+        raise RuntimeError("cannot open")
+
+class BlankBackend(TextBackend):
+    name = 'blank'
+
+    @contextlib.contextmanager
+    def open(self, pdf_path, reader):
+        yield _BlankDocument()
+
+class MissingBackend(TextBackend):
+    name = 'missing'
+
+    def is_available(self):
+        return False
+
+@pytest.fixture
+def backends(monkeypatch):
+    """註冊測試用引擎，按給定配置重新選擇引擎"""
+    for backend in (BrokenBackend, BlankBackend, MissingBackend):
+        monkeypatch.setitem(text_backends.BACKENDS, backend.name, backend)
+
+    def configure(setting):
+        monkeypatch.setenv("PDF_TEXT_BACKENDS", setting)
+        reset_text_backends()
+        return [backend.name for backend in get_text_backends()]
+
+    yield configure
+    reset_text_backends()
+
+def _write_pdf(tmp_path):
+    path = tmp_path / "paper.pdf"
+    path.write_bytes(build_pdf(PAGES, {'Title': 'Sparse Attention for Long Documents'}))
+    return str(path)
+
+def test_chain_skips_missing_backends(backends):
+    """未安裝的引擎被跳過，全部不可用時使用 PyPDF2，未知名稱報錯"""
+    assert backends("missing, blank, pypdf2") == ['blank', 'pypdf2']
+    assert backends("missing") == ['pypdf2']
+    assert backends("auto")[-1] == 'pypdf2'
+    with pytest.raises(ValueError):
+        backends("nonexistent")
+
+def test_falls_back_when_backend_fails_or_returns_nothing(tmp_path, backends):
+    """引擎出錯或沒有提取到文本時改用下一個引擎"""
+    path = _write_pdf(tmp_path)
+    fallbacks = text_backends.FALLBACKS.value(backend='pypdf2')
+    backends("broken,blank,pypdf2")
+    content = metadata_extractor.extract_pdf_content(path, early_stop=False)
+    assert content['text_backend'] == 'pypdf2'
+    assert "第2頁內容:\nIntroduction and related work on attention" in content['text']
+    assert text_backends.FALLBACKS.value(backend='blank') >= 1
+    assert text_backends.FALLBACKS.value(backend='pypdf2') == fallbacks + 1
+
+    # 最後一個引擎的結果即使為空也直接返回
+    backends("broken,blank")
+    content = metadata_extractor.extract_pdf_content(path, early_stop=False)
+    assert content['text_backend'] == 'blank'
+    assert "頁內容" not in content['text']
+
+def test_no_fallback_past_last_page(tmp_path, backends):
+    """起始頁超出頁數時沒有可讀的頁面，不需要回退"""
+    path = _write_pdf(tmp_path)
+    fallbacks = text_backends.FALLBACKS.value(backend='pypdf2')
+    backends("blank,pypdf2")
+    assert metadata_extractor.extract_pdf_content(path, start_page=5)['text_backend'] == 'blank'
+    assert text_backends.FALLBACKS.value(backend='pypdf2') == fallbacks
+
+def test_pdftotext_extracts_page_ranges(tmp_path, monkeypatch):
+    """pdftotext 每次提取一段頁面並按分頁符拆分，提取的頁數逐次翻倍"""
+    from types import SimpleNamespace
+    from pdf_reader import open_pdf
+    calls = []
+
+    def run(args, **kwargs):
+        first, last = int(args[args.index('-f') + 1]), int(args[args.index('-l') + 1])
+        calls.append((first, last))
+        text = ''.join(f"page {page}\f" for page in range(first, last + 1))
+        return SimpleNamespace(stdout=text.encode('utf-8'))
+
+    monkeypatch.setattr(text_backends.subprocess, "run", run)
+    path = tmp_path / "paper.pdf"
+    path.write_bytes(build_pdf([[f"Page {page}"] for page in range(1, 7)], {}))
+    with open_pdf(str(path)) as reader, text_backends.PdftotextBackend().open(str(path), reader) as document:
+        assert [document.page_text(index) for index in range(document.page_count)] == [
+            f"page {page}" for page in range(1, 7)
+        ]
+    assert calls == [(1, 1), (2, 3), (4, 6)]
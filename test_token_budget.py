@@ -0,0 +1,56 @@
+"""
+測試令牌估算和按預算裁剪提示詞文本
+"""
+from token_budget import estimate_tokens, truncate_to_tokens, fit_to_budget
+from metrics import collect_timings, divide_usage, record_usage, split_usage
+
+def test_estimate_tokens_counts_cjk_per_character():
+    """中文每字一個令牌，其他字符每四個一個令牌"""
+    assert estimate_tokens("abcd" * 10) == 10
+    assert estimate_tokens("中文" * 10) == 20
+
+def test_truncate_to_tokens():
+    """截斷到預算以內且盡量長"""
+    text = "中文abcd" * 100
+    truncated = truncate_to_tokens(text, 50)
+    assert estimate_tokens(truncated) <= 50
+    assert estimate_tokens(text[:len(truncated) + 1]) > 50
+
+def test_fit_to_budget_keeps_high_value_regions():
+    """超出預算時保留PDF屬性、首頁頁眉、摘要和版權行"""
+    text = (
+        "PDF標題: Sample\nPDF作者: Smith\n\n"
+        "第1頁內容:\nA Study of Things\nJohn Smith\n" + "filler " * 1000 +
+        "\nAbstract\nWe study things. " + "body " * 1000 +
+        "\n© 2021 Elsevier Ltd. All rights reserved.\n" + "第2頁內容:\n" + "tail " * 3000
+    )
+    trimmed = fit_to_budget(text, 1500)
+    assert estimate_tokens(trimmed) <= 1500
+    assert trimmed.startswith("PDF標題: Sample")
+    assert "A Study of Things" in trimmed
+    assert "Abstract\nWe study things." in trimmed
+    assert "© 2021 Elsevier" in trimmed
+
+def test_fit_to_budget_leaves_short_text_unchanged():
+    """未超出預算時原樣返回"""
+    text = "第1頁內容:\nShort paper"
+    assert fit_to_budget(text, 100) == text
+
+def test_usage_collected_with_timings():
+    """令牌用量與耗時一起收集，再拆分"""
+    with collect_timings() as timings:
+        record_usage({"prompt_tokens": 100, "completion_tokens": 20})
+        record_usage({"prompt_tokens": 50})
+    stages, usage = split_usage(timings)
+    assert stages == {}
+    assert usage == {"prompt_tokens": 150, "completion_tokens": 20}
+
+def test_divide_usage_keeps_total():
+    """分攤共用請求的用量時餘數計入最後一個文件，總量不變"""
+    shares = divide_usage({"prompt_tokens": 100, "completion_tokens": 2}, 3)
+    assert shares == [
+        {"prompt_tokens": 33, "completion_tokens": 0},
+        {"prompt_tokens": 33, "completion_tokens": 0},
+        {"prompt_tokens": 34, "completion_tokens": 2},
+    ]
+    assert sum(share["prompt_tokens"] for share in shares) == 100
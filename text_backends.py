@@ -0,0 +1,246 @@
+import os
+import shutil
+import logging
+import threading
+import contextlib
+import subprocess
+from typing import Callable, Dict, List
+
+import pdf_reader
+from metrics import registry
+
+# 設置日誌
+logger = logging.getLogger(__name__)
+
+# 自動選擇時按此順序使用已安裝的引擎，PyPDF2 總是可用，作為最後的回退
+AUTO_ORDER = ('pymupdf', 'pypdfium2', 'pdftotext', 'pypdf2')
+
+FALLBACKS = registry.counter(
+    'pdf_text_backend_fallbacks_total', '文本引擎出錯或未提取到文本時回退到下一個引擎的次數', ['backend']
+)
+
+
+class TextDocument:
+    """已打開的PDF，按頁提取文本"""
+    page_count = 0
+
+    def page_text(self, index: int) -> str:
+        raise NotImplementedError
+
+
+class TextBackend:
+    """
+    文本提取引擎的公共接口
+
+    open() 返回上下文管理器，退出時釋放引擎持有的資源。PyPDF2 的 reader 已由調用方打開
+    （用於讀取PDF屬性和XMP），其他引擎按路徑自行打開文件。
+    """
+    name = ''
+
+    def is_available(self) -> bool:
+        """引擎是否已安裝"""
+        return True
+
+    def open(self, pdf_path: str, reader) -> 'contextlib.AbstractContextManager[TextDocument]':
+        raise NotImplementedError
+
+
+def _content_too_large(reader, index: int) -> bool:
+    """
+    頁面內容流是否超過 PDF_MAX_PAGE_CONTENT_MB（按對象頭部的長度判斷，不讀取流數據）
+
+    在本進程中解碼的引擎（PyPDF2、PyMuPDF、PDFium）都會佔用與內容流同等大小的內存，
+    因此提取前先檢查；pdftotext 在子進程中解碼，內存不計入本進程，由超時限制。
+    """
+    if not pdf_reader.PDF_MAX_PAGE_CONTENT_MB:
+        return False
+    content_size = pdf_reader.page_content_size(reader, reader.pages[index])
+    if content_size > pdf_reader.PDF_MAX_PAGE_CONTENT_MB * pdf_reader.MB:
+        logger.warning(f"第{index+1}頁內容流 {content_size / pdf_reader.MB:.0f} MB，跳過文本提取")
+        return True
+    return False
+
+
+class _PyPDF2Document(TextDocument):
+    def __init__(self, reader):
+        self.reader = reader
+        self.page_count = len(reader.pages)
+
+    def page_text(self, index: int) -> str:
+        if _content_too_large(self.reader, index):
+            return ""
+        return self.reader.pages[index].extract_text() or ""
+
+
+class PyPDF2Backend(TextBackend):
+    """純Python實現，無需額外安裝，但速度最慢"""
+    name = 'pypdf2'
+
+    @contextlib.contextmanager
+    def open(self, pdf_path, reader):
+        yield _PyPDF2Document(reader)
+
+
+class _PyMuPDFDocument(TextDocument):
+    def __init__(self, document, reader):
+        self.document = document
+        self.reader = reader
+        self.page_count = document.page_count
+
+    def page_text(self, index: int) -> str:
+        if _content_too_large(self.reader, index):
+            return ""
+        return self.document.load_page(index).get_text() or ""
+
+
+class PyMuPDFBackend(TextBackend):
+    """基於 MuPDF（pip install pymupdf），通常最快"""
+    name = 'pymupdf'
+
+    def is_available(self) -> bool:
+        return _importable('fitz')
+
+    @contextlib.contextmanager
+    def open(self, pdf_path, reader):
+        import fitz
+        document = fitz.open(pdf_path)
+        try:
+            yield _PyMuPDFDocument(document, reader)
+        finally:
+            document.close()
+
+
+class _PdfiumDocument(TextDocument):
+    def __init__(self, document, reader, lock):
+        self.document = document
+        self.reader = reader
+        self.lock = lock
+        self.page_count = len(document)
+
+    def page_text(self, index: int) -> str:
+        if _content_too_large(self.reader, index):
+            return ""
+        with self.lock:
+            page = self.document[index]
+            textpage = page.get_textpage()
+            try:
+                return textpage.get_text_range() or ""
+            finally:
+                textpage.close()
+                page.close()
+
+
+class PdfiumBackend(TextBackend):
+    """基於 PDFium（pip install pypdfium2）"""
+    name = 'pypdfium2'
+    # PDFium 不是線程安全的，每次調用時持有鎖，多個文件可以交替提取而不必等整個文件處理完
+    _lock = threading.Lock()
+
+    def is_available(self) -> bool:
+        return _importable('pypdfium2')
+
+    @contextlib.contextmanager
+    def open(self, pdf_path, reader):
+        import pypdfium2
+        with self._lock:
+            document = pypdfium2.PdfDocument(pdf_path)
+        try:
+            yield _PdfiumDocument(document, reader, self._lock)
+        finally:
+            with self._lock:
+                document.close()
+
+
+class _PdftotextDocument(TextDocument):
+    """
+    一次調用 pdftotext 提取一段連續的頁面，按分頁符拆分後逐頁返回
+
+    頁面通常在讀到足夠信息後就不再需要，因此第一次只提取一頁，之後每次提取的頁數翻倍，
+    讀完 n 頁只需啟動約 log2(n) 個子進程。
+    """
+    def __init__(self, pdf_path, reader):
+        self.pdf_path = pdf_path
+        self.page_count = len(reader.pages)
+        self._pages = {}
+        self._window = 1
+
+    def page_text(self, index: int) -> str:
+        if index not in self._pages:
+            last = min(self.page_count, index + self._window)
+            self._pages = dict(zip(range(index, last), self._extract(index + 1, last)))
+            self._window *= 2
+        return self._pages.pop(index, "")
+
+    def _extract(self, first: int, last: int) -> List[str]:
+        completed = subprocess.run(
+            ['pdftotext', '-f', str(first), '-l', str(last), '-enc', 'UTF-8', self.pdf_path, '-'],
+            capture_output=True, check=True, timeout=pdf_reader.PDF_PARSE_TIME_BUDGET or None
+        )
+        # 每頁以分頁符結束
+        return completed.stdout.decode('utf-8', errors='replace').split('\f')
+
+
+class PdftotextBackend(TextBackend):
+    """調用 Poppler 的 pdftotext 命令行工具（需安裝 poppler-utils）"""
+    name = 'pdftotext'
+
+    def is_available(self) -> bool:
+        return shutil.which('pdftotext') is not None
+
+    @contextlib.contextmanager
+    def open(self, pdf_path, reader):
+        yield _PdftotextDocument(pdf_path, reader)
+
+
+def _importable(module: str) -> bool:
+    try:
+        __import__(module)
+        return True
+    except ImportError:
+        return False
+
+
+BACKENDS: Dict[str, Callable[[], TextBackend]] = {
+    'pymupdf': PyMuPDFBackend,
+    'pypdfium2': PdfiumBackend,
+    'pdftotext': PdftotextBackend,
+    'pypdf2': PyPDF2Backend,
+}
+
+_lock = threading.Lock()
+_chain = None
+
+
+def get_text_backends() -> List[TextBackend]:
+    """
+    按 PDF_TEXT_BACKENDS 配置返回可用的文本引擎，首次調用時檢查安裝情況
+
+    默認 "auto" 按 AUTO_ORDER 使用所有已安裝的引擎；也可以指定逗號分隔的列表，
+    如 "pdftotext,pypdf2"。未安裝的引擎會被跳過，全部不可用時使用 PyPDF2。
+    """
+    global _chain
+    if _chain is None:
+        setting = os.environ.get("PDF_TEXT_BACKENDS", "auto").strip().lower()
+        names = AUTO_ORDER if setting in ('', 'auto') else [name.strip() for name in setting.split(',') if name.strip()]
+        chain = []
+        for name in names:
+            if name not in BACKENDS:
+                raise ValueError(f"未知的文本引擎: {name}（可選 {', '.join(BACKENDS)}）")
+            backend = BACKENDS[name]()
+            if backend.is_available():
+                chain.append(backend)
+            else:
+                logger.info(f"文本引擎 {name} 未安裝，已跳過")
+        chain = chain or [PyPDF2Backend()]
+        logger.info(f"PDF文本引擎: {' > '.join(backend.name for backend in chain)}")
+        with _lock:
+            if _chain is None:
+                _chain = chain
+    return _chain
+
+
+def reset_text_backends() -> None:
+    """丟棄已選擇的引擎，下次 get_text_backends() 時按當前配置重新選擇"""
+    global _chain
+    with _lock:
+        _chain = None
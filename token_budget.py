@@ -0,0 +1,178 @@
+import re
+import logging
+from typing import List, Tuple
+
+# 設置日誌
+logger = logging.getLogger(__name__)
+
+# 各高價值區域保留的最大字符數
+FIRST_PAGE_HEADER_CHARS = 1500
+ABSTRACT_CHARS = 2000
+
+# 被省略的文本用此標記代替，提示模型文本不連續
+ELISION_MARKER = "\n...\n"
+
+PAGE_MARKER_PATTERN = re.compile(r'第(\d+)頁內容:')
+ABSTRACT_PATTERN = re.compile(r'^\s*(?:abstract|summary|摘\s*要)\b', re.IGNORECASE | re.MULTILINE)
+# 版權、出版和收稿信息所在的行通常包含年份、期刊和出版社
+COPYRIGHT_LINE_PATTERN = re.compile(
+    r'^.*(?:©|\(c\)\s*(?:19|20)\d{2}|copyright|all rights reserved|published|received|accepted|'
+    r'\bdoi\b|\bissn\b|版權|出版|收稿).*$',
+    re.IGNORECASE | re.MULTILINE
+)
+
+
+def _is_cjk(char: str) -> bool:
+    return '⺀' <= char <= '鿿' or '가' <= char <= '힯'
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    在本地粗略估算文本的令牌數
+
+    中日韓字符按每字1個令牌計算，其他字符按每4個字符1個令牌計算。
+    同樣字符數的中文文本消耗的令牌約為英文的四倍，因此按令牌而不是字符截斷。
+
+    Args:
+        text (str): 文本
+
+    Returns:
+        int: 估算的令牌數
+    """
+    cjk_chars = sum(1 for char in text if _is_cjk(char))
+    return cjk_chars + (len(text) - cjk_chars) // 4
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """
+    保留文本開頭不超過 budget 個令牌的部分
+
+    Args:
+        text (str): 文本
+        budget (int): 令牌預算
+
+    Returns:
+        str: 截斷後的文本
+    """
+    if budget <= 0:
+        return ''
+    if estimate_tokens(text) <= budget:
+        return text
+    # 令牌數隨前綴長度單調遞增，二分查找最長的前綴
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle]) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
+
+
+def _priority_spans(text: str) -> List[Tuple[int, int]]:
+    """
+    按重要性排列的高價值區域 (起始, 結束)：PDF屬性、首頁頁眉、摘要、版權和出版信息行
+    """
+    spans = []
+    first_page = PAGE_MARKER_PATTERN.search(text)
+    first_page_start = first_page.start() if first_page else 0
+    # extract_pdf_content 把PDF屬性放在第一頁之前
+    if first_page_start > 0:
+        spans.append((0, first_page_start))
+    spans.append((first_page_start, min(len(text), first_page_start + FIRST_PAGE_HEADER_CHARS)))
+
+    abstract = ABSTRACT_PATTERN.search(text)
+    if abstract:
+        spans.append((abstract.start(), min(len(text), abstract.start() + ABSTRACT_CHARS)))
+
+    for match in COPYRIGHT_LINE_PATTERN.finditer(text):
+        spans.append((match.start(), match.end()))
+    return spans
+
+
+def _merge_spans(spans: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _join_spans(text: str, spans: List[Tuple[int, int]]) -> str:
+    return ELISION_MARKER.join(text[start:end] for start, end in spans)
+
+
+def _span_tokens(text: str, spans: List[Tuple[int, int]]) -> int:
+    return estimate_tokens(_join_spans(text, spans))
+
+
+def first_page_header(text: str) -> str:
+    """
+    文本開頭的PDF屬性和首頁頁眉（標題、作者、期刊通常在此）
+
+    Args:
+        text (str): extract_pdf_content 返回的文本
+
+    Returns:
+        str: 第一頁標記之後不超過 FIRST_PAGE_HEADER_CHARS 個字符為止的前綴
+    """
+    first_page = PAGE_MARKER_PATTERN.search(text)
+    first_page_start = first_page.start() if first_page else 0
+    return text[:first_page_start + FIRST_PAGE_HEADER_CHARS]
+
+
+def fit_to_budget(text: str, budget: int) -> str:
+    """
+    將文本裁剪到令牌預算以內，優先保留對提取元數據最有價值的區域
+
+    先依次保留PDF屬性、首頁頁眉（標題、作者、期刊通常在此）、摘要開頭以及包含版權、
+    DOI或出版日期的行，剩餘預算按原文順序填入其他文本。保留的片段按原文順序拼接，
+    中間用省略標記分隔。
+
+    Args:
+        text (str): extract_pdf_content 返回的文本
+        budget (int): 令牌預算
+
+    Returns:
+        str: 裁剪後的文本，未超出預算時原樣返回
+    """
+    if estimate_tokens(text) <= budget:
+        return text
+
+    selected = []
+    for start, end in _priority_spans(text) + [(0, len(text))]:
+        candidate = _merge_spans(selected + [(start, end)])
+        if _span_tokens(text, candidate) <= budget:
+            selected = candidate
+            continue
+        # 放不下整個區域時保留其中能放下的開頭部分（從已選片段之後開始）
+        for gap_start, gap_end in _gaps(selected, start, end):
+            # 多留1個令牌：分段估算時的取整誤差
+            remaining = budget - _span_tokens(text, selected) - estimate_tokens(ELISION_MARKER) - 1
+            piece = truncate_to_tokens(text[gap_start:gap_end], remaining)
+            if not piece:
+                break
+            selected = _merge_spans(selected + [(gap_start, gap_start + len(piece))])
+        if _span_tokens(text, selected) >= budget:
+            break
+
+    trimmed = _join_spans(text, selected)
+    logger.info(f"文本約 {estimate_tokens(text)} 個令牌，超出預算 {budget}，保留 {estimate_tokens(trimmed)} 個令牌")
+    return trimmed
+
+
+def _gaps(spans: List[Tuple[int, int]], start: int, end: int) -> List[Tuple[int, int]]:
+    """[start, end) 中尚未被 spans 覆蓋的部分"""
+    gaps = []
+    cursor = start
+    for span_start, span_end in spans:
+        if span_end <= cursor or span_start >= end:
+            continue
+        if span_start > cursor:
+            gaps.append((cursor, span_start))
+        cursor = max(cursor, span_end)
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps